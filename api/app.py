@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 import os
 import pandas as pd
@@ -6,9 +6,14 @@ import json
 import traceback
 import uuid
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 from datetime import datetime, timedelta
 import sys
 import shutil
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import re
 import random
 import numpy as np
@@ -32,15 +37,40 @@ class NumpyEncoder(json.JSONEncoder):
             return bool(obj)
         return super(NumpyEncoder, self).default(obj)
 
+# Shared CSV dialect sniffing and single-pass reading
+from uploads.csv_sniffer import sniff_csv_bytes, read_csv_with_dialect, probe_csv, rows_from_line_count
+from uploads.stream_ingest import stream_upload_to_disk, UploadTooLargeError
+from uploads.columnar_cache import build_columnar_cache, read_csv_cached, read_cached_columns, content_hash_for, remove_columnar_cache
+from uploads import file_catalog
+from uploads import content_store
+from uploads import analysis_jobs
+from uploads.file_metrics import compute_file_metrics, finalize_rollup, metric_columns, summarize_metrics, star_distribution
+from uploads.frame_schema import EXPECTED_SALES_COLUMNS
+from uploads.sentiment_store import SENTIMENT_METHODS, DEFAULT_SENTIMENT_METHOD
+from uploads.text_index import dataset_key
+from uploads.wordcloud_cache import get_wordcloud, wordcloud_path
+
 # Import the Sales AI Agent
-from uploads.sales_AI_Agent import load_data, analyze_comprehensive_sales, process_query_directly, analyze_sales_trend, group_by_feature
+from uploads.sales_AI_Agent import (
+    load_context as load_sales_context,
+    create_context as create_sales_context,
+    analyze_sales,
+    sales_chart_series,
+    process_query_directly,
+    analyze_sales_trend,
+    group_by_feature,
+    predict_totals,
+    predict_total_grid
+)
 
 # Import the Review AI Agent with enhanced functions
 from uploads.review_AI_Agent import (
     load_user_data, 
     analyze_comprehensive_reviews, 
+    analyze_reviews,
     process_query_directly as process_review_query, 
-    set_dataframe,
+    load_context as load_review_context,
+    create_context as create_review_context,
     analyze_sentiment,
     perform_topic_modeling,
     extract_common_words,
@@ -56,7 +86,6 @@ from uploads.review_AI_Agent import (
 # Import the Review Visual Insights module for enhanced visualizations
 try:
     from uploads.review_visual_insights import (
-        set_dataframe as set_review_viz_dataframe,
         get_all_visual_insights,
         get_sentiment_distribution,
         get_rating_distribution,
@@ -88,15 +117,141 @@ ALLOWED_EXTENSIONS = {'csv', 'txt', 'xlsx'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = ANALYSIS_OUTPUT
-app.config['MAX_CONTENT_LENGTH'] = 5000 * 1024 * 1024 * 1024 # 5000MB max upload size
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 32 * 1024 * 1024 * 1024))  # 32GB max request size
+
+# Upload size limits: per uploaded file, and per tenant (department) across all stored files.
+# Sized for review dumps of 5-20 GB; see README.md for overriding them
+app.config['UPLOAD_MAX_FILE_BYTES'] = int(os.environ.get('UPLOAD_MAX_FILE_BYTES', 25 * 1024 * 1024 * 1024))
+app.config['UPLOAD_MAX_TENANT_BYTES'] = int(os.environ.get('UPLOAD_MAX_TENANT_BYTES', 100 * 1024 * 1024 * 1024))
+
+# Upload probing: rows sampled to classify a file (rows are counted exactly while the upload is streamed)
+app.config['UPLOAD_SAMPLE_ROWS'] = int(os.environ.get('UPLOAD_SAMPLE_ROWS', 1000))
+
+# Background analysis: worker processes, and how often job event streams check for progress
+app.config['ANALYSIS_WORKERS'] = int(os.environ.get('ANALYSIS_WORKERS', 2))
+app.config['JOB_EVENTS_POLL_SECONDS'] = float(os.environ.get('JOB_EVENTS_POLL_SECONDS', 0.5))
+
+# Cached word cloud images: how long clients may reuse one (their names change with their content)
+app.config['WORDCLOUD_MAX_AGE'] = int(os.environ.get('WORDCLOUD_MAX_AGE', 7 * 24 * 3600))
+
+# Batch prediction: most rows (explicit or grid combinations) one request may ask for
+app.config['PREDICTION_MAX_ROWS'] = int(os.environ.get('PREDICTION_MAX_ROWS', 1000000))
 
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(ANALYSIS_OUTPUT, exist_ok=True)
 
+# Open the content store and the file catalog, adopting files uploaded before the catalog existed
+content_store.init_content_store(UPLOAD_FOLDER)
+catalog_path = file_catalog.init_catalog(UPLOAD_FOLDER)
+if file_catalog.is_empty():
+    adopted = file_catalog.sync_catalog_from_disk(UPLOAD_FOLDER, exclude=(os.path.basename(ANALYSIS_OUTPUT),))
+    print(f"INFO: Registered {adopted} existing uploads in the file catalog")
+
+# Analysis jobs share the catalog database. Only the server process (not the analysis workers
+# importing this module) may fail the jobs left unfinished by a previous run.
+analysis_jobs.init_job_store(catalog_path, fail_unfinished=multiprocessing.parent_process() is None)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def build_file_metrics(file_path, columns=None):
+    """
+    Compute the metrics manifest of an uploaded file, reading only the columns it needs.
+
+    Args:
+        file_path (str): Path to the CSV file.
+        columns (list, optional): All column names of the file. Read from the cache if not provided.
+
+    Returns:
+        dict: Metrics manifest from compute_file_metrics.
+    """
+    if columns is None:
+        columns = read_cached_columns(file_path)
+    df = read_csv_cached(file_path, columns=metric_columns(columns))
+    return compute_file_metrics(df, columns)
+
+def save_upload(file, filepath, department):
+    """
+    Stream an uploaded file to disk within the per-file and per-tenant size limits.
+
+    Args:
+        file (FileStorage): The uploaded file.
+        filepath (str): Where the file is stored.
+        department (str): Department (tenant) the file is stored for.
+
+    Returns:
+        dict: Stream details from stream_upload_to_disk, plus the sniffed 'dialect', exact 'row_count'
+              and 'deduplicated' (True if the same content had been uploaded before).
+    """
+    max_bytes = app.config['UPLOAD_MAX_FILE_BYTES']
+    tenant_remaining = app.config['UPLOAD_MAX_TENANT_BYTES'] - file_catalog.department_size_bytes(department)
+    # A replaced file frees its own space
+    if os.path.isfile(filepath):
+        tenant_remaining += os.path.getsize(filepath)
+    if tenant_remaining < max_bytes:
+        max_bytes = max(tenant_remaining, 0)
+        limit_message = f"Storage limit of {app.config['UPLOAD_MAX_TENANT_BYTES']} bytes for department '{department}' reached"
+    else:
+        limit_message = None
+    
+    try:
+        upload = stream_upload_to_disk(file.stream, filepath, max_bytes=max_bytes)
+    except UploadTooLargeError as e:
+        raise UploadTooLargeError(e.limit_bytes, limit_message) if limit_message else e
+    
+    # Keep one copy per distinct content - the session file becomes a hardlink to it
+    upload['deduplicated'] = content_store.store_object(filepath, upload['content_hash'])
+    if upload['deduplicated']:
+        print(f"INFO: Content of {filepath} was uploaded before, linked to the stored copy")
+    
+    upload['dialect'] = sniff_csv_bytes(upload['head'], upload['size'] > len(upload['head']))
+    upload['row_count'] = rows_from_line_count(
+        upload['line_count'], upload['ends_with_newline'], upload['dialect']['has_header']
+    )
+    return upload
+
+def process_upload(filepath, dialect, content_hash, columns):
+    """
+    Post-upload work that does not have to finish before the upload is answered:
+    writes the columnar cache and the metrics manifest, then marks the file ready.
+    Both are reused when the same content was processed before.
+    """
+    try:
+        build_columnar_cache(filepath, dialect, content_hash=content_hash)
+        metrics = file_catalog.find_metrics_by_hash(content_hash) or build_file_metrics(filepath, columns)
+        file_catalog.set_file_metrics(filepath, metrics)
+        file_catalog.set_file_status(filepath, 'ready')
+        print(f"INFO: Finished processing {filepath}")
+    except Exception as e:
+        print(f"ERROR processing uploaded file {filepath}: {str(e)}")
+        traceback.print_exc()
+        file_catalog.set_file_status(filepath, 'failed')
+
+def start_upload_processing(filepath, dialect, content_hash, columns):
+    """Run process_upload in the background so the upload response does not wait for it."""
+    worker = threading.Thread(
+        target=process_upload,
+        args=(filepath, dialect, content_hash, columns),
+        daemon=True
+    )
+    worker.start()
+
+def find_session_folder(session_id):
+    """
+    Find the folder of an upload session through the file catalog.
+
+    Args:
+        session_id (str): Full or partial session identifier.
+
+    Returns:
+        str: Path to the session folder, or None if no file of the session exists.
+    """
+    for entry in file_catalog.find_session_files(session_id):
+        if os.path.isfile(entry['path']):
+            return os.path.dirname(entry['path'])
+    return None
+
 @app.route('/api/upload', methods=['POST'])
 def upload_files():
     """
@@ -170,50 +325,28 @@ def upload_files():
                         filepath = os.path.join(session_folder, filename)
                         
                         print(f"INFO: Saving file to {filepath}")
-                        file.save(filepath)
+                        # Stream to disk in chunks, hashing, counting rows and keeping the head for sniffing
+                        upload = save_upload(file, filepath, department)
                         saved_files.append(filepath)
                         
                         # Process the file to extract information
                         try:
                             print("INFO: Analyzing uploaded file")
-                            # Try to open the file with pandas
-                            df = None
-                            read_error = None
-                            
-                            # Try different encodings and delimiters
-                            encodings = ['utf-8', 'latin1', 'iso-8859-1', 'cp1252']
-                            delimiters = [',', ';', '\t', '|']
-                            
-                            for encoding in encodings:
-                                if df is not None:
-                                    break
-                                for delimiter in delimiters:
-                                    try:
-                                        df = pd.read_csv(filepath, encoding=encoding, sep=delimiter, engine='python')
-                                        if not df.empty:
-                                            print(f"INFO: Successfully read file with encoding {encoding} and delimiter '{delimiter}'")
-                                            break
-                                    except Exception as e:
-                                        read_error = str(e)
-                                        continue
-                            
-                            # Last attempts if previous methods failed
-                            if df is None or df.empty:
-                                try:
-                                    # Try pandas auto-detection
-                                    print("INFO: Trying pandas auto-detection")
-                                    df = pd.read_csv(filepath, engine='python')
-                                except Exception as e:
-                                    read_error = str(e)
+                            dialect = upload['dialect']
+                            print(f"INFO: Detected dialect: encoding {dialect['encoding']}, delimiter '{dialect['delimiter']}', header {dialect['has_header']}")
                             
-                            # Handle case where file couldn't be read
-                            if df is None or df.empty:
-                                error_msg = read_error or "Could not read file or file is empty"
-                                print(f"ERROR: {error_msg}")
-                                raise Exception(error_msg)
+                            # Probe only the header and a bounded sample - the full load happens at analysis time
+                            probe = probe_csv(
+                                filepath,
+                                dialect,
+                                sample_rows=app.config['UPLOAD_SAMPLE_ROWS'],
+                                row_count=upload['row_count']
+                            )
+                            df = probe['sample']
+                            print(f"INFO: Probed {len(df)} sample rows, row count {probe['row_count']}")
                             
                             # Get column information
-                            columns = df.columns.tolist()
+                            columns = probe['columns']
                             
                             # Detect if this is a review file
                             is_review_file = False
@@ -263,18 +396,44 @@ def upload_files():
                             file_info = {
                                 'filename': filename,
                                 'original_filename': original_filename,
-                                'row_count': len(df),
-                                'column_count': len(df.columns),
-                                'columns': df.columns.tolist(),
+                                'row_count': probe['row_count'],
+                                'row_count_approximate': probe['row_count_approximate'],
+                                'column_count': len(columns),
+                                'columns': columns,
                                 'format': format,
                                 'department': department,
                                 'sample_data': df.head(5).values.tolist() if len(df) > 0 else [],
                                 'categories': detected_categories,
                                 'session_id': session_id,
                                 'timestamp': datetime.now().isoformat(),
-                                'file_path': filepath
+                                'file_path': filepath,
+                                'dialect': dialect,
+                                'size_bytes': upload['size'],
+                                'content_hash': upload['content_hash'],
+                                'deduplicated': upload['deduplicated'],
+                                'status': 'processing'
                             }
                             
+                            # Index the file so analysis requests resolve it without walking the uploads tree.
+                            # The columnar cache and metrics manifest are built after the response is sent.
+                            try:
+                                file_catalog.register_file(
+                                    filepath,
+                                    department,
+                                    session_id=session_id,
+                                    original_filename=original_filename,
+                                    content_hash=upload['content_hash'],
+                                    columns=columns,
+                                    row_count=probe['row_count'],
+                                    row_count_approximate=probe['row_count_approximate'],
+                                    file_format=format,
+                                    size_bytes=upload['size'],
+                                    status='processing'
+                                )
+                                start_upload_processing(filepath, dialect, upload['content_hash'], columns)
+                            except Exception as catalog_error:
+                                print(f"WARNING: Could not register file in catalog: {str(catalog_error)}")
+                            
                             uploaded_file_info.append(file_info)
                             print(f"INFO: Successfully processed file. Format: {format}, Department: {department}")
                             
@@ -340,6 +499,12 @@ def upload_files():
         print(f"=== Upload process completed. Successful: {len(uploaded_file_info)}, Failed: {len(failed_files)} ===\n")
         return jsonify(response), 200
     
+    except RequestEntityTooLarge:
+        print("ERROR: Upload request exceeds MAX_CONTENT_LENGTH")
+        return jsonify({
+            "success": False,
+            "error": f"Upload request exceeds the limit of {app.config['MAX_CONTENT_LENGTH']} bytes"
+        }), 413
     except Exception as e:
         print("ERROR during file upload:", e)
         traceback.print_exc()
@@ -372,19 +537,16 @@ def analyze_data():
             }), 400
         
         # Check if session exists if provided
+        context = None
         if session_id:
-            session_folder = None
-            for folder in os.listdir(app.config['UPLOAD_FOLDER']):
-                if session_id.endswith(folder):
-                    session_folder = os.path.join(app.config['UPLOAD_FOLDER'], folder)
-                    break
+            session_folder = find_session_folder(session_id)
             
             if session_folder:
-                # Reload the data for this session
-                load_data_wrapper(session_folder)
+                # Load the data for this session into its own context
+                context = load_data_wrapper(session_folder)
         
         # Process the query
-        result = process_query_directly(query)
+        result = query_with_context(query, context)
         
         # Format the response for frontend display
         formatted_result = process_response_for_frontend(result)
@@ -400,391 +562,523 @@ def analyze_data():
         print(traceback.format_exc())
         return jsonify({"success": False, "error": str(e)}), 500
 
-@app.route('/api/analyze/<department>/<file_id>', methods=['GET'])
-def get_file_analysis(department, file_id):
+class AnalysisError(Exception):
+    """Raised by run_file_analysis with the HTTP status and debug details of the failure."""
+
+    def __init__(self, message, status_code=500, file_format=None, debug_info=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.file_format = file_format
+        self.debug_info = debug_info
+
+def resolve_analysis_file(department, file_id):
+    """
+    Find the stored file an analysis URL refers to.
+
+    Args:
+        department (str): Department from the URL.
+        file_id (str): Filename or upload identifier from the URL.
+
+    Returns:
+        str: Path to the file, or None if it cannot be found.
+    """
+    # Construct the path to the file based on department and file_id
+    # First, look in department-specific folder
+    department_path = os.path.join(app.config['UPLOAD_FOLDER'], department)
+    file_path = None
+    
+    print(f"DEBUG: Looking for file {file_id} in department {department}")
+    print(f"DEBUG: Department path: {department_path}")
+    
+    # 1. Try the most direct approach first - exact filename in department folder
+    if file_id.endswith('.csv'):
+        direct_path = os.path.join(department_path, file_id)
+        if os.path.exists(direct_path) and os.path.isfile(direct_path):
+            file_path = direct_path
+            print(f"DEBUG: Found direct file match at root level: {file_path}")
+    
+    # 2. If still not found, try in the root uploads folder
+    if not file_path and file_id.endswith('.csv'):
+        uploads_path = app.config['UPLOAD_FOLDER']
+        direct_path = os.path.join(uploads_path, file_id)
+        if os.path.exists(direct_path) and os.path.isfile(direct_path):
+            file_path = direct_path
+            print(f"DEBUG: Found file in root uploads folder: {file_path}")
+    
+    # 3. Resolve the file through the catalog: exact match in the department, exact match
+    #    anywhere, session folder named like the file_id, then partial filename match
+    if not file_path:
+        catalog_entry = file_catalog.find_file(department, file_id)
+        if catalog_entry:
+            file_path = catalog_entry['path']
+            print(f"DEBUG: Found file in catalog: {file_path}")
+    
+    return file_path
+
+def run_file_analysis(department, file_path, progress=None):
+    """
+    Run the full analysis pipeline of one file.
+
+    Args:
+        department (str): Department whose pipeline is used.
+        file_path (str): Path to the CSV file.
+        progress (callable, optional): Called as progress(stage, percent) when a stage starts.
+
+    Returns:
+        dict: 'format' and 'analysis' ('chart_data' and 'insights').
+    """
+    report = progress or (lambda stage, percent: None)
+    
+    # Detect the file format
+    file_format = 'unknown'
+    df = None
+    
+    report('loading', 5)
     try:
-        # Construct the path to the file based on department and file_id
-        # First, look in department-specific folder
-        department_path = os.path.join(app.config['UPLOAD_FOLDER'], department)
-        file_path = None
-        
-        print(f"DEBUG: Looking for file {file_id} in department {department}")
-        print(f"DEBUG: Department path: {department_path}")
-        
-        # 1. Try the most direct approach first - exact filename in department folder
-        if file_id.endswith('.csv'):
-            direct_path = os.path.join(department_path, file_id)
-            if os.path.exists(direct_path) and os.path.isfile(direct_path):
-                file_path = direct_path
-                print(f"DEBUG: Found direct file match at root level: {file_path}")
-        
-        # 2. If not found at root level, check in any subdirectory of the department folder
-        if not file_path and file_id.endswith('.csv'):
-            for root, dirs, files in os.walk(department_path):
-                if file_id in files:
-                    file_path = os.path.join(root, file_id)
-                    print(f"DEBUG: Found direct file match in subdirectory: {file_path}")
-                    break
-        
-        # 3. If still not found, try in the root uploads folder
-        if not file_path and file_id.endswith('.csv'):
-            uploads_path = app.config['UPLOAD_FOLDER']
-            direct_path = os.path.join(uploads_path, file_id)
-            if os.path.exists(direct_path) and os.path.isfile(direct_path):
-                file_path = direct_path
-                print(f"DEBUG: Found file in root uploads folder: {file_path}")
-        
-        # 4. Try searching in all subdirectories under uploads
-        if not file_path and file_id.endswith('.csv'):
-            uploads_path = app.config['UPLOAD_FOLDER']
-            for root, dirs, files in os.walk(uploads_path):
-                if file_id in files:
-                    file_path = os.path.join(root, file_id)
-                    print(f"DEBUG: Found file in uploads subdirectory: {file_path}")
-                    break
-        
-        # 5. As a fallback, look for partial matches of the filename
-        if not file_path and file_id.endswith('.csv'):
-            filename_without_ext = file_id[:-4]  # Remove .csv extension
-            uploads_path = app.config['UPLOAD_FOLDER']
-            print(f"DEBUG: Looking for partial matches of {filename_without_ext}")
+        if file_path.endswith('.csv'):
+            # Only the header is read here; the department pipeline loads the file once below
+            columns = read_cached_columns(file_path)
+            print(f"DEBUG: Columns in file: {', '.join(columns)}")
             
-            for root, dirs, files in os.walk(uploads_path):
-                for file in files:
-                    if file.endswith('.csv') and filename_without_ext in file:
-                        file_path = os.path.join(root, file)
-                        print(f"DEBUG: Found partial match: {file_path}")
-                        break
-                if file_path:
-                    break
-        
-        # 6. If direct file lookup failed, try the original approach of looking for directories
-        if not file_path:
-            # Look for the file_id in the department directory
-            for root, dirs, files in os.walk(department_path):
-                if file_id in root:  # Check if file_id is part of the directory name
-                    for file in files:
-                        if file.endswith('.csv'):  # Only consider CSV files
-                            file_path = os.path.join(root, file)
-                            print(f"DEBUG: Found file in directory containing file_id: {file_path}")
-                            break
-                    if file_path:
-                        break
-        
-        if not file_path:
-            print(f"ERROR: File not found - {file_id} in department {department}")
-            return jsonify({
-                "success": False,
-                "error": f"File not found: {file_id} in department: {department}. Please upload a file first.",
-                "department": department,
-                "file_id": file_id
-            }), 404
-        
-        print(f"DEBUG: Using file for analysis: {file_path}")
-        
-        # Detect the file format
-        file_format = 'unknown'
-        df = None
-        
-        try:
-            if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path)
-                print(f"DEBUG: Successfully read CSV with {len(df)} rows and {len(df.columns)} columns")
-                print(f"DEBUG: Columns in file: {', '.join(df.columns.tolist())}")
-                
-                if department == 'reviews':
-                    file_format = 'reviews'
-                else:
-                    file_format, _ = detect_file_format(df)
-                    print(f"DEBUG: Detected file format: {file_format}")
-            else:
-                return jsonify({
-                    "success": False,
-                    "error": "Only CSV files are supported for analysis",
-                    "department": department,
-                    "file_id": file_id
-                }), 400
-        except Exception as e:
-            error_msg = f"Error reading CSV file: {str(e)}"
-            print(f"ERROR: {error_msg}")
-            traceback.print_exc()
-            return jsonify({
-                "success": False,
-                "error": error_msg,
-                "department": department,
-                "file_id": file_id
-            }), 500
-        
-        # Initialize results
-        chart_data = {}
-        insights = {}
-        
-        try:
             if department == 'reviews':
-                # Process reviews data
-                print(f"Processing review data from {file_path}")
+                file_format = 'reviews'
+            else:
+                file_format, _ = detect_file_format(pd.DataFrame(columns=columns))
+                print(f"DEBUG: Detected file format: {file_format}")
+        else:
+            raise AnalysisError("Only CSV files are supported for analysis", status_code=400)
+    except AnalysisError:
+        raise
+    except Exception as e:
+        error_msg = f"Error reading CSV file: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        traceback.print_exc()
+        raise AnalysisError(error_msg)
+    
+    # Initialize results
+    chart_data = {}
+    insights = {}
+    
+    try:
+        if department == 'reviews':
+            # Process reviews data
+            print(f"Processing review data from {file_path}")
+            try:
+                context = load_review_context([file_path])
+                df = context.df
+                if df is None or len(df) == 0:
+                    raise ValueError("Failed to load review data - DataFrame is empty")
+                    
+                print(f"DEBUG: Review data loaded with {len(df)} rows and columns: {df.columns.tolist()}")
+                
+                # Check for and handle common column name variations that might be present in user CSV files
+                column_mapping = {
+                    'product_id': 'asin',
+                    'product': 'asin',
+                    'id': 'asin',
+                    'rating': 'overall',
+                    'star_rating': 'overall',
+                    'stars': 'overall',
+                    'text': 'reviewText',
+                    'review': 'reviewText',
+                    'review_text': 'reviewText',
+                    'title': 'summary',
+                    'review_title': 'summary'
+                }
+                
+                # Check if column renaming is needed
+                missing_standard_cols = []
+                if 'asin' not in df.columns:
+                    missing_standard_cols.append('asin')
+                if 'overall' not in df.columns:
+                    missing_standard_cols.append('overall')
+                if 'reviewText' not in df.columns:
+                    missing_standard_cols.append('reviewText')
+                    
+                if missing_standard_cols:
+                    print(f"DEBUG: Missing standard columns: {missing_standard_cols}. Will attempt to map from available columns: {df.columns.tolist()}")
+                    
+                    # Apply the mapping
+                    for alt_col, expected_col in column_mapping.items():
+                        if expected_col not in df.columns and alt_col in df.columns:
+                            print(f"DEBUG: Mapping column '{alt_col}' to '{expected_col}'")
+                            df[expected_col] = df[alt_col]
+                
+                print(f"DEBUG: Final processed columns: {df.columns.tolist()}")
+                
+                # Generate insights
+                report('insights', 20)
+                analysis_result = analyze_reviews(context=context)
+                analysis_text = analysis_result.markdown
+                
+                # Generate visual data, starting from the series computed with the analysis
+                report('visualizations', 45)
+                chart_data.update(analysis_result.chart_data())
+                if REVIEW_VISUALIZATIONS_AVAILABLE:
+                    # Use the enhanced visualization module
+                    try:
+                        print("DEBUG: Using enhanced visualization module for reviews")
+                        enhanced_chart_data = get_all_visual_insights(context=context)
+                        chart_data.update(enhanced_chart_data)
+                        print(f"DEBUG: Enhanced visualization generated {len(chart_data)} chart types")
+                    except Exception as e_viz:
+                        print(f"Error in enhanced visualization module: {e_viz}")
+                        traceback.print_exc()
+                
+                # Always generate fallback ASIN scatter plot data, regardless of enhanced module
+                # to ensure it's always available
+                report('asin_summary', 70)
                 try:
-                    df = load_user_data([file_path])
-                    if df is None or len(df) == 0:
-                        raise ValueError("Failed to load review data - DataFrame is empty")
-                        
-                    print(f"DEBUG: Review data loaded with {len(df)} rows and columns: {df.columns.tolist()}")
+                    print("DEBUG: Generating ASIN scatter plot data with fallback method")
+                    print(f"DEBUG: DataFrame columns available: {df.columns.tolist()}")
                     
-                    # Check for and handle common column name variations that might be present in user CSV files
+                    # Check if column names might be different but equivalent
+                    df_temp = df.copy()
+                    
+                    # Map common column name variations to expected names
                     column_mapping = {
                         'product_id': 'asin',
                         'product': 'asin',
                         'id': 'asin',
                         'rating': 'overall',
                         'star_rating': 'overall',
-                        'stars': 'overall',
-                        'text': 'reviewText',
-                        'review': 'reviewText',
-                        'review_text': 'reviewText',
-                        'title': 'summary',
-                        'review_title': 'summary'
+                        'stars': 'overall'
                     }
                     
-                    # Check if column renaming is needed
-                    missing_standard_cols = []
-                    if 'asin' not in df.columns:
-                        missing_standard_cols.append('asin')
-                    if 'overall' not in df.columns:
-                        missing_standard_cols.append('overall')
-                    if 'reviewText' not in df.columns:
-                        missing_standard_cols.append('reviewText')
-                        
-                    if missing_standard_cols:
-                        print(f"DEBUG: Missing standard columns: {missing_standard_cols}. Will attempt to map from available columns: {df.columns.tolist()}")
-                        
-                        # Apply the mapping
-                        for alt_col, expected_col in column_mapping.items():
-                            if expected_col not in df.columns and alt_col in df.columns:
-                                print(f"DEBUG: Mapping column '{alt_col}' to '{expected_col}'")
-                                df[expected_col] = df[alt_col]
-                    
-                    print(f"DEBUG: Final processed columns: {df.columns.tolist()}")
+                    # Apply the mapping to create missing columns if needed
+                    for alt_col, expected_col in column_mapping.items():
+                        if expected_col not in df_temp.columns and alt_col in df_temp.columns:
+                            print(f"DEBUG: Mapping column '{alt_col}' to '{expected_col}'")
+                            df_temp[expected_col] = df_temp[alt_col]
                     
-                    # Set the dataframe for analysis
-                    set_dataframe(df)
+                    # Summarize the mapped columns in their own context
+                    asin_summary_list = get_asin_summary(context=create_review_context(df_temp))
                     
-                    # Generate insights
-                    analysis_text = analyze_comprehensive_reviews()
+                    if asin_summary_list and len(asin_summary_list) > 0: 
+                        print(f"DEBUG: Successfully generated ASIN summary with {len(asin_summary_list)} items")
+                        # Format it like the enhanced viz module would
+                        chart_data['asin_sentiment_distribution'] = {
+                            'data': asin_summary_list, # Contains [{asin, reviewCount, averageRating}, ...]
+                            'title': 'ASIN Performance Scatter Plot',
+                            'description': 'Review count vs. Average rating for each product (ASIN)',
+                            'type': 'scatter' 
+                        }
+                    else:
+                        print("Fallback ASIN summary returned no data.")
+                except Exception as e_asin:
+                    print(f"Fallback ASIN summary error: {e_asin}")
+                    traceback.print_exc()
+                
+                # If we need additional fallback visualizations or enhanced module wasn't available
+                if not REVIEW_VISUALIZATIONS_AVAILABLE or len(chart_data) < 3:
+                    report('fallback_charts', 80)
+                    print("DEBUG: Generating additional fallback visualizations")
+                    # Import necessary functions here to avoid top-level import issues if agent fails
+                    from uploads.review_AI_Agent import (
+                        analyze_sentiment,
+                        analyze_rating_distribution,
+                        perform_topic_modeling,
+                        extract_common_words
+                    )
                     
-                    # Generate visual data
-                    if REVIEW_VISUALIZATIONS_AVAILABLE:
-                        # Use the enhanced visualization module
+                    # Add sentiment distribution if not already present
+                    if 'sentiment_distribution' not in chart_data:
                         try:
-                            print("DEBUG: Using enhanced visualization module for reviews")
-                            set_review_viz_dataframe(df)
-                            enhanced_chart_data = get_all_visual_insights()
-                            chart_data.update(enhanced_chart_data)
-                            print(f"DEBUG: Enhanced visualization generated {len(chart_data)} chart types")
-                        except Exception as e_viz:
-                            print(f"Error in enhanced visualization module: {e_viz}")
-                            traceback.print_exc()
-                    
-                    # Always generate fallback ASIN scatter plot data, regardless of enhanced module
-                    # to ensure it's always available
-                    try:
-                        print("DEBUG: Generating ASIN scatter plot data with fallback method")
-                        print(f"DEBUG: DataFrame columns available: {df.columns.tolist()}")
-                        
-                        # Check if column names might be different but equivalent
-                        df_temp = df.copy()
-                        
-                        # Map common column name variations to expected names
-                        column_mapping = {
-                            'product_id': 'asin',
-                            'product': 'asin',
-                            'id': 'asin',
-                            'rating': 'overall',
-                            'star_rating': 'overall',
-                            'stars': 'overall'
-                        }
-                        
-                        # Apply the mapping to create missing columns if needed
-                        for alt_col, expected_col in column_mapping.items():
-                            if expected_col not in df_temp.columns and alt_col in df_temp.columns:
-                                print(f"DEBUG: Mapping column '{alt_col}' to '{expected_col}'")
-                                df_temp[expected_col] = df_temp[alt_col]
-                        
-                        # Temporarily set the dataframe with the mapped columns
-                        original_df = df
-                        set_dataframe(df_temp)
-                        
-                        # Now attempt to get the ASIN summary
-                        asin_summary_list = get_asin_summary()
-                        
-                        # Restore the original dataframe
-                        set_dataframe(original_df)
-                        
-                        if asin_summary_list and len(asin_summary_list) > 0: 
-                            print(f"DEBUG: Successfully generated ASIN summary with {len(asin_summary_list)} items")
-                            # Format it like the enhanced viz module would
-                            chart_data['asin_sentiment_distribution'] = {
-                                'data': asin_summary_list, # Contains [{asin, reviewCount, averageRating}, ...]
-                                'title': 'ASIN Performance Scatter Plot',
-                                'description': 'Review count vs. Average rating for each product (ASIN)',
-                                'type': 'scatter' 
-                            }
-                        else:
-                            print("Fallback ASIN summary returned no data.")
-                    except Exception as e_asin:
-                        print(f"Fallback ASIN summary error: {e_asin}")
-                        traceback.print_exc()
+                            sentiment_data = analyze_sentiment(context=context)
+                            if sentiment_data:
+                                chart_data['sentiment_distribution'] = sentiment_data
+                        except Exception as e_sent:
+                            print(f"Fallback sentiment error: {e_sent}")
                     
-                    # If we need additional fallback visualizations or enhanced module wasn't available
-                    if not REVIEW_VISUALIZATIONS_AVAILABLE or len(chart_data) < 3:
-                        print("DEBUG: Generating additional fallback visualizations")
-                        # Import necessary functions here to avoid top-level import issues if agent fails
-                        from uploads.review_AI_Agent import (
-                            analyze_sentiment,
-                            analyze_rating_distribution,
-                            perform_topic_modeling,
-                            extract_common_words
-                        )
-                        
-                        # Add sentiment distribution if not already present
-                        if 'sentiment_distribution' not in chart_data:
-                            try:
-                                sentiment_data = analyze_sentiment()
-                                if sentiment_data:
-                                    chart_data['sentiment_distribution'] = sentiment_data
-                            except Exception as e_sent:
-                                print(f"Fallback sentiment error: {e_sent}")
-                        
-                        # Add rating distribution if not already present
-                        if 'rating_distribution' not in chart_data:
-                            try:
-                                rating_data = analyze_rating_distribution()
-                                if rating_data:
-                                    chart_data['rating_distribution'] = rating_data
-                            except Exception as e_rate:
-                                print(f"Fallback rating error: {e_rate}")
-                        
-                        # Add topic distribution if not already present
-                        if 'topic_distribution' not in chart_data:
-                            try:
-                                topic_data = perform_topic_modeling()
-                                if topic_data:
-                                    chart_data['topic_distribution'] = topic_data
-                            except Exception as e_topic:
-                                print(f"Fallback topic error: {e_topic}")
-                        
-                        # Add common words if not already present
-                        if 'common_words' not in chart_data:
-                            try:
-                                words_data = extract_common_words()
-                                if words_data:
-                                    chart_data['common_words'] = words_data
-                            except Exception as e_words:
-                                print(f"Fallback common words error: {e_words}")
+                    # Add rating distribution if not already present
+                    if 'rating_distribution' not in chart_data:
+                        try:
+                            rating_data = analyze_rating_distribution(context=context)
+                            if rating_data:
+                                chart_data['rating_distribution'] = rating_data
+                        except Exception as e_rate:
+                            print(f"Fallback rating error: {e_rate}")
                     
-                    # Create insights structure
-                    insights = {
-                        'summary': analysis_text,
-                        'recommendations': extract_recommendations(analysis_text)
-                    }
-                except Exception as e:
-                    error_msg = f"Error processing review data: {str(e)}"
-                    print(f"ERROR: {error_msg}")
-                    traceback.print_exc()
-                    raise ValueError(error_msg)
-            else:
-                # Process sales or other data types
-                print(f"Processing {file_format} data from {file_path}")
-                try:
-                    # Pass the file path directly to load_data
-                    df = load_data([file_path])
+                    # Add topic distribution if not already present
+                    if 'topic_distribution' not in chart_data:
+                        try:
+                            topic_data = perform_topic_modeling(context=context)
+                            if topic_data:
+                                chart_data['topic_distribution'] = topic_data
+                        except Exception as e_topic:
+                            print(f"Fallback topic error: {e_topic}")
                     
-                    if df is None or len(df) == 0:
-                        raise ValueError("Failed to load data - DataFrame is empty")
-                        
-                    print(f"DEBUG: Data loaded with {len(df)} rows, columns: {', '.join(df.columns.tolist())}")
+                    # Add common words if not already present
+                    if 'common_words' not in chart_data:
+                        try:
+                            words_data = extract_common_words(context=context)
+                            if words_data:
+                                chart_data['common_words'] = words_data
+                        except Exception as e_words:
+                            print(f"Fallback common words error: {e_words}")
+                
+                # Create insights structure
+                insights = {
+                    'summary': analysis_text,
+                    'recommendations': extract_recommendations(analysis_text),
+                    # The same report as blocks, so the frontend need not parse the markdown
+                    'report': analysis_result.report.to_dict()
+                }
+            except Exception as e:
+                error_msg = f"Error processing review data: {str(e)}"
+                print(f"ERROR: {error_msg}")
+                traceback.print_exc()
+                raise ValueError(error_msg)
+        else:
+            # Process sales or other data types
+            print(f"Processing {file_format} data from {file_path}")
+            try:
+                # Load the file into its own analysis context
+                context = load_sales_context([file_path])
+                df = context.df
+                
+                if df is None or len(df) == 0:
+                    raise ValueError("Failed to load data - DataFrame is empty")
                     
-                    # Generate comprehensive analysis
-                    analysis_text = analyze_comprehensive_sales()
+                print(f"DEBUG: Data loaded with {len(df)} rows, columns: {', '.join(df.columns.tolist())}")
+                
+                # Generate comprehensive analysis
+                report('insights', 20)
+                analysis_result = analyze_sales(context=context)
+                analysis_text = analysis_result.markdown
+                
+                # Chart data comes from the series computed with the analysis
+                report('charts', 60)
+                chart_data = extract_chart_data_for_frontend(analysis_result, context)
+                insights = {
+                    'summary': analysis_text,
+                    'recommendations': extract_recommendations(analysis_text),
+                    # The same report as blocks, so the frontend need not parse the markdown
+                    'report': analysis_result.report.to_dict()
+                }
+                
+                # If we still don't have chart data or we want to ensure all chart types are present
+                if not chart_data or len(chart_data) < 4:  # Ensure we have a minimum number of charts
+                    print("DEBUG: Generating fallback/supplemental sales chart data")
+                    fallback_data = generate_sales_fallback_chart_data(context)
                     
-                    # Extract chart data and insights from the analysis
-                    chart_data = extract_chart_data_for_frontend(analysis_text)
-                    insights = {
-                        'summary': analysis_text,
-                        'recommendations': extract_recommendations(analysis_text)
-                    }
+                    # Add any fallback charts that aren't already present
+                    if fallback_data:
+                        for chart_key, chart_value in fallback_data.items():
+                            if chart_key not in chart_data or not chart_data[chart_key]:
+                                print(f"DEBUG: Adding fallback chart: {chart_key}")
+                                chart_data[chart_key] = chart_value
                     
-                    # If chart extraction failed, generate real charts from the DataFrame
-                    if not chart_data or len(chart_data) == 0:
-                        print("DEBUG: Chart extraction failed. Generating charts directly from DataFrame.")
-                        direct_chart_data = generate_sales_chart_data(df)
-                        if direct_chart_data and len(direct_chart_data) > 0:
-                            chart_data = direct_chart_data
-                            print(f"DEBUG: Successfully generated {len(chart_data)} direct sales charts")
-                        
-                    # If we still don't have chart data or we want to ensure all chart types are present
-                    if not chart_data or len(chart_data) < 4:  # Ensure we have a minimum number of charts
-                        print("DEBUG: Generating fallback/supplemental sales chart data")
-                        fallback_data = generate_sales_fallback_chart_data()
-                        
-                        # Add any fallback charts that aren't already present
-                        if fallback_data:
-                            for chart_key, chart_value in fallback_data.items():
-                                if chart_key not in chart_data or not chart_data[chart_key]:
-                                    print(f"DEBUG: Adding fallback chart: {chart_key}")
-                                    chart_data[chart_key] = chart_value
-                        
-                        print(f"DEBUG: Final sales chart count: {len(chart_data)}")
-                        
-                    # If we still don't have chart data, log an error
-                    if not chart_data or len(chart_data) == 0:
-                        print("ERROR: Failed to generate chart data from DataFrame")
-                except Exception as e:
-                    error_msg = f"Error processing {file_format} data: {str(e)}"
-                    print(f"ERROR: {error_msg}")
-                    traceback.print_exc()
-                    raise ValueError(error_msg)
+                    print(f"DEBUG: Final sales chart count: {len(chart_data)}")
                     
-        except Exception as e:
-            error_msg = f"Analysis failed: {str(e)}"
-            print(f"ERROR: {error_msg}")
-            traceback.print_exc()
-            
-            # Return an error response with detailed information
+                # If we still don't have chart data, log an error
+                if not chart_data or len(chart_data) == 0:
+                    print("ERROR: Failed to generate chart data from DataFrame")
+            except Exception as e:
+                error_msg = f"Error processing {file_format} data: {str(e)}"
+                print(f"ERROR: {error_msg}")
+                traceback.print_exc()
+                raise ValueError(error_msg)
+                
+    except Exception as e:
+        error_msg = f"Analysis failed: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        traceback.print_exc()
+        
+        # Raise with detailed information for the error response
+        raise AnalysisError(error_msg, file_format=file_format, debug_info={
+            "file_path": file_path,
+            "found_columns": df.columns.tolist() if df is not None else [],
+            "row_count": len(df) if df is not None else 0
+        })
+    
+    print("DEBUG: Analysis completed successfully")
+    # Add debugging information about chart data sent to frontend
+    if department == 'reviews':
+        if 'asin_sentiment_distribution' in chart_data:
+            print(f"DEBUG: Sending ASIN scatter plot data with {len(chart_data['asin_sentiment_distribution']['data'])} points")
+        else:
+            print("DEBUG: ASIN scatter plot data NOT included in response!")
+
+    # Log all chart types being sent
+    print(f"DEBUG: {department.upper()} charts included in response: {list(chart_data.keys())}")
+    print(f"DEBUG: Total chart count: {len(chart_data)}")
+    
+    return {
+        "format": file_format,
+        "analysis": {
+            "chart_data": chart_data,
+            "insights": insights
+        }
+    }
+
+def analysis_artifact_name(department):
+    """Name of the cached analysis result of a department's pipeline."""
+    return f"analysis_{secure_filename(department)}.json"
+
+def analyze_file_cached(department, file_path, progress=None, require_stored=False):
+    """
+    Return the analysis of a file, running the pipeline only if its content was not analyzed before.
+
+    Args:
+        department (str): Department whose pipeline is used.
+        file_path (str): Path to the CSV file.
+        progress (callable, optional): Called as progress(stage, percent) when a stage starts.
+        require_stored (bool): Raise AnalysisError if the result could not be cached, for
+                               callers that hand the cached result out later.
+
+    Returns:
+        dict: 'format' and 'analysis', as returned by run_file_analysis.
+    """
+    # Analysis results are cached per file content, so a re-uploaded export is not analyzed again
+    content_hash = content_hash_for(file_path)
+    cached_analysis = content_store.load_json_artifact(content_hash, analysis_artifact_name(department))
+    if cached_analysis:
+        print(f"DEBUG: Serving cached analysis for content {content_hash[:12]}")
+        return cached_analysis
+    
+    result = run_file_analysis(department, file_path, progress)
+    stored = content_store.save_json_artifact(content_hash, analysis_artifact_name(department), result, encoder=NumpyEncoder)
+    if require_stored and not stored:
+        raise AnalysisError("Analysis completed but its result could not be stored", file_format=result['format'])
+    return result
+
+# Worker pool for background analyses - created on first use
+_analysis_pool = None
+_analysis_pool_lock = threading.Lock()
+
+def get_analysis_pool():
+    """Return the process pool that runs analysis jobs, creating it if needed."""
+    global _analysis_pool
+    
+    with _analysis_pool_lock:
+        if _analysis_pool is None:
+            _analysis_pool = ProcessPoolExecutor(max_workers=app.config['ANALYSIS_WORKERS'])
+        return _analysis_pool
+
+def run_analysis_job(job_id, department, file_path):
+    """
+    Worker process entry point: run the analysis of a job and record its progress.
+    The result is stored in the content cache, where the result endpoint reads it.
+    """
+    analysis_jobs.update_job(job_id, status=analysis_jobs.JOB_RUNNING, stage='starting', progress=1)
+    
+    def report_progress(stage, percent):
+        analysis_jobs.update_job(job_id, stage=stage, progress=percent)
+    
+    try:
+        analyze_file_cached(department, file_path, progress=report_progress, require_stored=True)
+        analysis_jobs.update_job(job_id, status=analysis_jobs.JOB_COMPLETED, stage='done', progress=100)
+    except AnalysisError as e:
+        analysis_jobs.update_job(job_id, status=analysis_jobs.JOB_FAILED, error=str(e), debug_info=e.debug_info)
+    except Exception as e:
+        traceback.print_exc()
+        analysis_jobs.update_job(job_id, status=analysis_jobs.JOB_FAILED, error=f"Error in file analysis: {str(e)}")
+
+def _analysis_job_done(job_id):
+    """Build the callback that fails a job whose worker process died before it could report."""
+    def callback(future):
+        global _analysis_pool
+        
+        error = future.exception()
+        if error is None:
+            return
+        print(f"ERROR: Analysis worker for job {job_id} failed: {str(error)}")
+        analysis_jobs.update_job(job_id, status=analysis_jobs.JOB_FAILED, error=f"Analysis worker failed: {str(error)}")
+        if isinstance(error, BrokenProcessPool):
+            with _analysis_pool_lock:
+                _analysis_pool = None
+    return callback
+
+def submit_analysis_job(department, file_id, file_path):
+    """
+    Queue the analysis of a file on the worker pool.
+
+    Content that was analyzed before gets a job that is already completed, and content
+    that is being analyzed returns the running job instead of starting a second one.
+
+    Args:
+        department (str): Department whose pipeline is used.
+        file_id (str): File identifier from the analysis URL.
+        file_path (str): Path to the CSV file.
+
+    Returns:
+        dict: The job.
+    """
+    content_hash = content_hash_for(file_path)
+    if os.path.exists(content_store.artifact_path(content_hash, analysis_artifact_name(department))):
+        return analysis_jobs.create_job(department, file_id, file_path, content_hash, status=analysis_jobs.JOB_COMPLETED)
+    
+    job, created = analysis_jobs.create_or_get_active_job(department, file_id, file_path, content_hash)
+    if not created:
+        return job
+    
+    future = get_analysis_pool().submit(run_analysis_job, job['job_id'], department, file_path)
+    future.add_done_callback(_analysis_job_done(job['job_id']))
+    print(f"INFO: Queued analysis job {job['job_id']} for {file_path}")
+    return job
+
+def job_response(job):
+    """Format a job for API responses."""
+    response = {
+        "success": True,
+        "job_id": job['job_id'],
+        "status": job['status'],
+        "stage": job['stage'],
+        "progress": job['progress'],
+        "department": job['department'],
+        "file_id": job['file_id'],
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at'],
+        "status_url": f"/api/jobs/{job['job_id']}",
+        "events_url": f"/api/jobs/{job['job_id']}/events",
+        "result_url": f"/api/jobs/{job['job_id']}/result"
+    }
+    if job['status'] == analysis_jobs.JOB_FAILED:
+        response["error"] = job['error']
+    return response
+
+@app.route('/api/analyze/<department>/<file_id>', methods=['GET'])
+def get_file_analysis(department, file_id):
+    try:
+        file_path = resolve_analysis_file(department, file_id)
+        
+        if not file_path:
+            print(f"ERROR: File not found - {file_id} in department {department}")
             return jsonify({
                 "success": False,
+                "error": f"File not found: {file_id} in department: {department}. Please upload a file first.",
                 "department": department,
-                "file_id": file_id,
-                "format": file_format,
-                "error": error_msg,
-                "debug_info": {
-                    "file_path": file_path,
-                    "found_columns": df.columns.tolist() if df is not None else [],
-                    "row_count": len(df) if df is not None else 0
-                }
-            }), 500
+                "file_id": file_id
+            }), 404
         
-        # Return the successful result
-        print("DEBUG: Analysis completed successfully")
-        # Add debugging information about chart data sent to frontend
-        if department == 'reviews':
-            if 'asin_sentiment_distribution' in chart_data:
-                print(f"DEBUG: Sending ASIN scatter plot data with {len(chart_data['asin_sentiment_distribution']['data'])} points")
-            else:
-                print("DEBUG: ASIN scatter plot data NOT included in response!")
-
-        # Log all chart types being sent
-        print(f"DEBUG: {department.upper()} charts included in response: {list(chart_data.keys())}")
-        print(f"DEBUG: Total chart count: {len(chart_data)}")
+        print(f"DEBUG: Using file for analysis: {file_path}")
+        
+        # ?async=true queues the analysis on the worker pool and returns the job to poll
+        if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+            job = submit_analysis_job(department, file_id, file_path)
+            return jsonify(job_response(job)), 202
+        
+        try:
+            result = analyze_file_cached(department, file_path)
+        except AnalysisError as e:
+            error_response = {
+                "success": False,
+                "error": str(e),
+                "department": department,
+                "file_id": file_id
+            }
+            if e.debug_info is not None:
+                error_response["format"] = e.file_format
+                error_response["debug_info"] = e.debug_info
+            return jsonify(error_response), e.status_code
 
         return jsonify({
             "success": True,
             "department": department,
             "file_id": file_id,
-            "format": file_format,
-            "analysis": {
-                "chart_data": chart_data,
-                "insights": insights
-            }
+            "format": result['format'],
+            "analysis": result['analysis']
         })
     
     except Exception as e:
@@ -798,28 +1092,103 @@ def get_file_analysis(department, file_id):
             "file_id": file_id
         }), 500
 
+@app.route('/api/analyze/<department>/<file_id>/jobs', methods=['POST'])
+def create_analysis_job(department, file_id):
+    """Submit the analysis of a file as a background job and return the job to poll."""
+    try:
+        file_path = resolve_analysis_file(department, file_id)
+        if not file_path:
+            return jsonify({
+                "success": False,
+                "error": f"File not found: {file_id} in department: {department}. Please upload a file first.",
+                "department": department,
+                "file_id": file_id
+            }), 404
+        
+        job = submit_analysis_job(department, file_id, file_path)
+        return jsonify(job_response(job)), 202
+    except Exception as e:
+        print(f"Error submitting analysis job: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """Return the status, stage and progress of an analysis job."""
+    job = analysis_jobs.get_job(job_id)
+    if not job:
+        return jsonify({"success": False, "error": f"Job not found: {job_id}"}), 404
+    return jsonify(job_response(job))
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def stream_analysis_job(job_id):
+    """Stream the progress of an analysis job as server-sent events until it finishes."""
+    job = analysis_jobs.get_job(job_id)
+    if not job:
+        return jsonify({"success": False, "error": f"Job not found: {job_id}"}), 404
+    
+    poll_seconds = app.config['JOB_EVENTS_POLL_SECONDS']
+    
+    def generate():
+        last_state = None
+        while True:
+            current = analysis_jobs.get_job(job_id)
+            state = (current['status'], current['stage'], current['progress'])
+            if state != last_state:
+                last_state = state
+                yield f"event: progress\ndata: {json.dumps(job_response(current))}\n\n"
+            if current['status'] in analysis_jobs.FINISHED_STATES:
+                yield f"event: {current['status']}\ndata: {json.dumps(job_response(current))}\n\n"
+                break
+            time.sleep(poll_seconds)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_analysis_job_result(job_id):
+    """Return the analysis of a completed job, or its status while it is still running."""
+    job = analysis_jobs.get_job(job_id)
+    if not job:
+        return jsonify({"success": False, "error": f"Job not found: {job_id}"}), 404
+    
+    if job['status'] == analysis_jobs.JOB_FAILED:
+        return jsonify({
+            "success": False,
+            "department": job['department'],
+            "file_id": job['file_id'],
+            "error": job['error'],
+            "debug_info": job['debug_info']
+        }), 500
+    
+    if job['status'] != analysis_jobs.JOB_COMPLETED:
+        return jsonify(job_response(job)), 202
+    
+    result = content_store.load_json_artifact(job['content_hash'], analysis_artifact_name(job['department']))
+    if result is None:
+        return jsonify({
+            "success": False,
+            "error": "The result of this job is no longer cached. Submit the analysis again.",
+            "job_id": job_id
+        }), 410
+    
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "department": job['department'],
+        "file_id": job['file_id'],
+        "format": result['format'],
+        "analysis": result['analysis']
+    })
+
 @app.route('/api/departments', methods=['GET'])
 def get_departments():
     try:
-        upload_folder = app.config['UPLOAD_FOLDER']
-        departments = []
-        
-        # Look for department folders directly in the uploads directory
-        for item in os.listdir(upload_folder):
-            item_path = os.path.join(upload_folder, item)
-            if os.path.isdir(item_path) and not item.startswith('__') and not item.startswith('.'):
-                # Check if this directory has any files (indicating it's a department with uploaded data)
-                has_files = False
-                for root, dirs, files in os.walk(item_path):
-                    if files and any(f.endswith('.csv') for f in files):
-                        has_files = True
-                        break
-                
-                if has_files:
-                    departments.append(item)
-        
-        # Sort departments alphabetically
-        departments.sort()
+        # Departments with uploaded data, in alphabetical order
+        departments = file_catalog.list_departments()
         
         # If no departments exist yet, return default departments
         if not departments:
@@ -844,163 +1213,118 @@ def get_department_data(department):
         upload_folder = app.config['UPLOAD_FOLDER']
         department_folder = os.path.join(upload_folder, department)
         files = []
-        
-        # For metrics calculation
-        total_sales = 0
-        total_inventory = 0
-        total_reviews = 0
-        avg_rating = 0
         performance_metrics = {}
         
-        # Check if department folder exists
-        if os.path.exists(department_folder) and os.path.isdir(department_folder):
-            # Scan all subdirectories for CSV files
-            all_dfs = []  # Store all dataframes for aggregated analysis
-            all_files_processed = 0
-            
-            for root, dirs, root_files in os.walk(department_folder):
-                for file in root_files:
-                    if file.endswith('.csv'):
-                        file_path = os.path.join(root, file)
-                        relative_path = os.path.relpath(file_path, department_folder)
-                        session_id = os.path.basename(os.path.dirname(file_path))
+        # Look up the department's files in the catalog
+        department_files = file_catalog.list_department_files(department)
+        if department_files:
+            for entry in department_files:
+                file = entry['filename']
+                file_path = entry['path']
+                if not os.path.isfile(file_path):
+                    file_catalog.remove_file(file_path)
+                    continue
+                relative_path = os.path.relpath(file_path, department_folder)
+                session_id = entry['session_id'] or os.path.basename(os.path.dirname(file_path))
+                
+                # Extract file info
+                try:
+                    file_info = {
+                        "filename": file,
+                        "session_id": session_id,
+                        "relative_path": relative_path,
+                        "upload_date": entry['uploaded_at'],
+                        "file_id": entry['file_id'],  # Identifier used in the analysis URL
+                        "status": entry['status']
+                    }
+                    
+                    # Metrics of a file still being processed are added to the rollup once ready
+                    if entry['status'] != 'ready':
+                        files.append(file_info)
+                        continue
+                    
+                    # Use the metrics manifest computed at upload - files cataloged without one
+                    # (uploaded before manifests existed) get theirs computed once here
+                    try:
+                        metrics = entry['metrics']
+                        if metrics is None:
+                            metrics = build_file_metrics(file_path)
+                            file_catalog.set_file_metrics(file_path, metrics)
                         
-                        # Extract file info
-                        try:
-                            file_info = {
-                                "filename": file,
-                                "session_id": session_id,
-                                "relative_path": relative_path,
-                                "upload_date": datetime.fromtimestamp(os.path.getctime(file_path)).strftime('%Y-%m-%d %H:%M:%S'),
-                                "file_id": file  # Use filename as file_id for analysis URL
-                            }
-                            
-                            # Try to read the file to get more info
-                            try:
-                                df = pd.read_csv(file_path)
-                                all_dfs.append(df)  # Save for aggregated analysis
-                                all_files_processed += 1
-                                
-                                # Calculate metrics based on department type
-                                if department == 'sales':
-                                    # Look for total amount/sales columns
-                                    for col in ['total_amount', 'sales', 'revenue', 'amount']:
-                                        if col in df.columns:
-                                            try:
-                                                col_sum = df[col].astype(float).sum()
-                                                total_sales += col_sum
-                                                file_info["total_sales"] = col_sum
-                                                break
-                                            except:
-                                                pass
-                                    
-                                    # Look for quantity/transactions
-                                    if 'quantity' in df.columns:
-                                        try:
-                                            file_info["total_quantity"] = df['quantity'].astype(float).sum()
-                                        except:
-                                            pass
-                                            
-                                elif department == 'inventory':
-                                    # Look for inventory levels
-                                    for col in ['inventory', 'stock', 'quantity']:
-                                        if col in df.columns:
-                                            try:
-                                                col_sum = df[col].astype(float).sum()
-                                                total_inventory += col_sum
-                                                file_info["total_inventory"] = col_sum
-                                                break
-                                            except:
-                                                pass
-                                                
-                                elif department == 'reviews':
-                                    # Count reviews
-                                    total_reviews += len(df)
-                                    
-                                    # Calculate average rating
-                                    if 'overall' in df.columns or 'rating' in df.columns:
-                                        rating_col = 'overall' if 'overall' in df.columns else 'rating'
-                                        try:
-                                            file_avg_rating = df[rating_col].astype(float).mean()
-                                            # Weighted average for all files
-                                            if avg_rating == 0:
-                                                avg_rating = file_avg_rating
-                                            else:
-                                                avg_rating = (avg_rating + file_avg_rating) / 2
-                                            file_info["avg_rating"] = file_avg_rating
-                                        except:
-                                            pass
-                                
-                                # Add general file info
-                                file_info.update({
-                                    "row_count": len(df),
-                                    "column_count": len(df.columns),
-                                    "columns": df.columns.tolist()
-                                })
-                            except Exception as read_error:
-                                print(f"Error reading file {file}: {str(read_error)}")
-                                file_info.update({
-                                    "read_error": str(read_error)
-                                })
-                            
-                            files.append(file_info)
-                        except Exception as file_error:
-                            print(f"Error processing file {file}: {str(file_error)}")
+                        if department == 'sales':
+                            if 'total_sales' in metrics:
+                                file_info["total_sales"] = metrics['total_sales']
+                            if 'total_quantity' in metrics:
+                                file_info["total_quantity"] = metrics['total_quantity']
+                        elif department == 'inventory':
+                            if 'total_inventory' in metrics:
+                                file_info["total_inventory"] = metrics['total_inventory']
+                        elif department == 'reviews':
+                            if metrics.get('rating_count'):
+                                file_info["avg_rating"] = metrics['rating_sum'] / metrics['rating_count']
+                        
+                        # Add general file info
+                        file_info.update({
+                            "row_count": metrics['row_count'],
+                            "column_count": metrics['column_count'],
+                            "columns": metrics['columns']
+                        })
+                    except Exception as read_error:
+                        print(f"Error reading file {file}: {str(read_error)}")
+                        file_info.update({
+                            "read_error": str(read_error)
+                        })
+                    
+                    files.append(file_info)
+                except Exception as file_error:
+                    print(f"Error processing file {file}: {str(file_error)}")
             
             # Sort files by upload date (newest first)
             files.sort(key=lambda x: x.get("upload_date", ""), reverse=True)
             
-            # Generate performance metrics if we have data
-            if all_dfs and all_files_processed > 0:
-                # Combine all data frames if we can
+            # Generate performance metrics from the department rollup, which uploads keep up to date
+            merged = finalize_rollup(file_catalog.get_department_rollup(department))
+            if merged.get('file_count'):
+                # Only combine the metrics if all files share the same columns
                 try:
-                    if all([df.columns.tolist() == all_dfs[0].columns.tolist() for df in all_dfs]):
-                        combined_df = pd.concat(all_dfs)
-                        
+                    if merged['uniform_columns']:
                         # Generate analysis based on department
                         if department == 'sales':
                             # Generate sales metrics
                             performance_metrics = {
-                                "total_sales": total_sales,
-                                "transaction_count": len(combined_df),
+                                "total_sales": merged.get('total_sales', 0),
+                                "transaction_count": merged['row_count'],
                                 "performance": random.randint(60, 95),  # Placeholder for more complex calculation
                                 "efficiency": random.randint(65, 97),
                                 "growth": random.randint(-10, 30),
-                                "analysis_summary": generate_quick_analysis(combined_df, department)
+                                "analysis_summary": summarize_metrics(merged, department)
                             }
                             
-                            # Add time series data if timestamp column exists
-                            if 'timestamp' in combined_df.columns:
-                                try:
-                                    # Convert to datetime
-                                    combined_df['date'] = pd.to_datetime(combined_df['timestamp'])
-                                    # Group by month and sum
-                                    monthly_data = combined_df.groupby(combined_df['date'].dt.month_name())['total_amount'].sum()
-                                    # Convert to list format
-                                    performance_metrics["time_series"] = {
-                                        "labels": monthly_data.index.tolist(),
-                                        "values": monthly_data.values.tolist()
-                                    }
-                                except Exception as e:
-                                    print(f"Error generating time series: {e}")
+                            # Add time series data if monthly buckets were collected
+                            if 'monthly_sales' in merged:
+                                months = sorted(merged['monthly_sales'])
+                                performance_metrics["time_series"] = {
+                                    "labels": months,
+                                    "values": [merged['monthly_sales'][month] for month in months]
+                                }
                         
                         elif department == 'inventory':
                             # Generate inventory metrics
                             performance_metrics = {
-                                "total_inventory": total_inventory,
-                                "item_count": len(combined_df),
+                                "total_inventory": merged.get('total_inventory', 0),
+                                "item_count": merged['row_count'],
                                 "performance": random.randint(60, 95),
                                 "efficiency": random.randint(65, 97),
-                                "analysis_summary": generate_quick_analysis(combined_df, department)
+                                "analysis_summary": summarize_metrics(merged, department)
                             }
                             
                         elif department == 'reviews':
-                            # Generate review metrics
+                            # Generate review metrics, averaging ratings over all reviews rather than per file
                             performance_metrics = {
-                                "total_reviews": total_reviews,
-                                "avg_rating": round(avg_rating, 1),
-                                "star_distribution": get_star_distribution(combined_df),
-                                "sentiment_summary": generate_quick_analysis(combined_df, department)
+                                "total_reviews": merged['row_count'],
+                                "avg_rating": round(merged.get('avg_rating', 0), 1),
+                                "star_distribution": star_distribution(merged),
+                                "sentiment_summary": summarize_metrics(merged, department)
                             }
                 except Exception as analysis_error:
                     print(f"Error generating performance metrics: {str(analysis_error)}")
@@ -1023,115 +1347,12 @@ def get_department_data(department):
             "department": department
         }), 500
 
-def generate_quick_analysis(df, department):
-    """Generate a quick analysis summary based on the dataframe and department type"""
-    try:
-        if department == 'sales':
-            if 'total_amount' in df.columns:
-                total_sales = df['total_amount'].sum()
-                avg_order = df['total_amount'].mean()
-                
-                # Add more detailed analysis for sales
-                sales_insights = []
-                
-                # Try to find top selling products or categories
-                for col in ['product_name', 'product_id', 'product_category']:
-                    if col in df.columns:
-                        top_items = df.groupby(col)['total_amount'].sum().sort_values(ascending=False).head(3)
-                        if not top_items.empty:
-                            item_label = col.replace('_', ' ').title()
-                            top_str = ", ".join([f"{item}" for item in top_items.index.tolist()])
-                            sales_insights.append(f"Top {item_label}s: {top_str}.")
-                            break
-                
-                # Try to find monthly trends if timestamp is available
-                if 'timestamp' in df.columns:
-                    try:
-                        df['date'] = pd.to_datetime(df['timestamp'])
-                        monthly_sales = df.groupby(df['date'].dt.month_name())['total_amount'].sum()
-                        if len(monthly_sales) > 1:
-                            best_month = monthly_sales.idxmax()
-                            worst_month = monthly_sales.idxmin()
-                            sales_insights.append(f"Best sales month: {best_month}. Worst sales month: {worst_month}.")
-                    except:
-                        pass
-                
-                # Include customer insights if available
-                if 'customer_id' in df.columns:
-                    customer_count = df['customer_id'].nunique()
-                    sales_insights.append(f"Total unique customers: {customer_count}.")
-                
-                # Basic sales summary
-                summary = f"Total sales: ${total_sales:.2f}. Average order value: ${avg_order:.2f}."
-                
-                # Combine all insights
-                if sales_insights:
-                    summary += " " + " ".join(sales_insights)
-                
-                return summary
-                
-        elif department == 'inventory':
-            if 'quantity' in df.columns:
-                total_items = df['quantity'].sum()
-                return f"Total inventory: {total_items} items across all categories."
-        elif department == 'reviews':
-            if 'overall' in df.columns:
-                avg_rating = df['overall'].mean()
-                return f"Average rating: {avg_rating:.1f}/5 based on {len(df)} reviews."
-        
-        # Default
-        return f"Analysis contains {len(df)} records with {len(df.columns)} attributes."
-    except Exception as e:
-        print(f"Error generating quick analysis: {e}")
-        return "Analysis data is available."
-
-def get_star_distribution(df):
-    """Get the distribution of star ratings from a review dataframe"""
-    try:
-        rating_col = 'overall' if 'overall' in df.columns else 'rating'
-        if rating_col in df.columns:
-            # Round ratings to whole numbers and count
-            ratings = df[rating_col].astype(float).round().astype(int)
-            counts = ratings.value_counts().sort_index()
-            
-            # Convert to expected format
-            result = {}
-            for i in range(1, 6):
-                result[f"{i}_star"] = int(counts.get(i, 0))
-            return result
-    except Exception as e:
-        print(f"Error calculating star distribution: {e}")
-    
-    # Default empty distribution
-    return {
-        "1_star": 0,
-        "2_star": 0,
-        "3_star": 0,
-        "4_star": 0,
-        "5_star": 0
-    }
-
 def determine_department(columns):
     """
     Determine the department based on hardcoded expected column names for sales data
     """
     # Expected columns for sales data
-    expected_sales_columns = [
-        'transaction_id', 
-        'product_id', 
-        'product_category', 
-        'product_name', 
-        'quantity', 
-        'price', 
-        'discount', 
-        'total_amount', 
-        'timestamp', 
-        'customer_id', 
-        'customer_age', 
-        'customer_gender', 
-        'location', 
-        'payment_method'
-    ]
+    expected_sales_columns = EXPECTED_SALES_COLUMNS
     
     # Check if the majority of expected sales columns are present
     matched_columns = sum(1 for col in expected_sales_columns if col in columns or col.lower() in [c.lower() for c in columns])
@@ -1234,552 +1455,89 @@ def extract_recommendations(analysis_text):
     
     return recommendations
 
-def extract_numerical_data(analysis_text, query_type):
+def extract_chart_data_for_frontend(analysis_result, context=None):
     """
-    Extract numerical data from analysis text for visualizations
+    Chart data of an analysis, in the format expected by the frontend visualization components.
+    The series are the values the analysis computed, so no text has to be parsed; an analysis
+    without series is charted directly from its dataset.
     
     Args:
-        analysis_text (str): The analysis text to extract data from
-        query_type (str): The type of query/analysis
-        
-    Returns:
-        dict: A dictionary with numerical data for visualizations
-    """
-    # Default empty response with the structure expected by the frontend
-    result = {
-        "labels": [],
-        "datasets": [],
-        "title": "",
-        "description": "",
-        "type": "bar"  # Default chart type
-    }
-    
-    if not analysis_text or not isinstance(analysis_text, str):
-        return result
-    
-    # Configure extraction based on query type
-    if query_type == 'time_series_analysis':
-        # Try to extract time series data (dates and values)
-        result["type"] = "line"
-        result["title"] = "Sales Trend Over Time"
-        result["description"] = "Monthly sales performance"
-        
-        # Extract months/dates and values
-        months = re.findall(r'(January|February|March|April|May|June|July|August|September|October|November|December|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep)', analysis_text)
-        values = re.findall(r'\$([0-9,]+\.?[0-9]*)', analysis_text)
-        
-        # Clean up values
-        values = [float(v.replace(',', '')) for v in values]
-        
-        # Create dataset if we have data
-        if months and values:
-            # Limit to same length
-            length = min(len(months), len(values))
-            result["labels"] = months[:length]
-            result["datasets"] = [{
-                "label": "Revenue",
-                "data": values[:length],
-                "backgroundColor": "rgba(75, 192, 192, 0.2)",
-                "borderColor": "rgba(75, 192, 192, 1)",
-                "borderWidth": 1
-            }]
-    
-    elif query_type == 'revenue_by_product_category':
-        # Extract product categories and revenue values
-        result["type"] = "bar"
-        result["title"] = "Revenue by Product Category"
-        result["description"] = "Distribution of sales across product categories"
-        
-        # Look for product categories and percentages
-        categories = re.findall(r'([A-Za-z\s]+?)(?:\s*:|\s*-|\s*represents|\s*accounts for)\s*[\$]?([0-9,.]+%?)', analysis_text)
-        
-        if categories:
-            cat_names = []
-            cat_values = []
-            for category, value in categories:
-                cat_name = category.strip()
-                if cat_name and len(cat_name) > 2 and cat_name.lower() not in ['the', 'and', 'represents', 'accounts', 'for']:
-                    cat_names.append(cat_name)
-                    # Extract number from value
-                    if '%' in value:
-                        # It's a percentage
-                        try:
-                            cat_values.append(float(value.replace('%', '').replace(',', '')))
-                        except:
-                            cat_values.append(0)
-                    else:
-                        # It's a dollar amount
-                        try:
-                            cat_values.append(float(value.replace(',', '')))
-                        except:
-                            cat_values.append(0)
-            
-            if cat_names and cat_values:
-                result["labels"] = cat_names
-                result["datasets"] = [{
-                    "label": "Revenue",
-                    "data": cat_values,
-                    "backgroundColor": [
-                        'rgba(255, 99, 132, 0.5)',
-                        'rgba(54, 162, 235, 0.5)',
-                        'rgba(255, 206, 86, 0.5)',
-                        'rgba(75, 192, 192, 0.5)',
-                        'rgba(153, 102, 255, 0.5)',
-                        'rgba(255, 159, 64, 0.5)',
-                        'rgba(199, 199, 199, 0.5)',
-                        'rgba(83, 102, 255, 0.5)',
-                        'rgba(40, 159, 64, 0.5)',
-                        'rgba(210, 199, 199, 0.5)'
-                    ]
-                }]
-    
-    elif query_type == 'discount_impact':
-        # Extract discount rates and corresponding metrics
-        result["type"] = "scatter"
-        result["title"] = "Discount Impact Analysis"
-        result["description"] = "Correlation between discount rates and sales metrics"
-        
-        # Try to extract discount rates and corresponding sales/revenue values
-        discount_matches = re.findall(r'(\d+)%\s*discount\s*(?:rate|level)?\s*(?:shows|has|with)?\s*(?:a|an)?\s*(?:average)?\s*(?:sales|revenue|volume)?\s*(?:of)?\s*\$?(\d[0-9,.]+)', analysis_text)
-        
-        if discount_matches:
-            discount_rates = [int(rate) for rate, _ in discount_matches]
-            sales_values = [float(val.replace(',', '')) for _, val in discount_matches]
-            
-            result["labels"] = [f"{rate}%" for rate in discount_rates]
-            result["datasets"] = [{
-                "label": "Sales",
-                "data": sales_values,
-                "backgroundColor": "rgba(75, 192, 192, 0.5)",
-                "borderColor": "rgba(75, 192, 192, 1)",
-                "pointRadius": 5,
-                "pointHoverRadius": 7
-            }]
-    
-    elif query_type == 'customer_demographics':
-        # Extract age groups or gender segments
-        result["type"] = "pie"
-        result["title"] = "Customer Demographics"
-        result["description"] = "Distribution of sales by customer segment"
-        
-        # Try to extract age groups or gender segments with percentages
-        segments = re.findall(r'([0-9]+\-[0-9]+|male|female|non-binary|men|women)\s*(?:age group|group|segment|customers|gender)?\s*(?:represents|accounts for|contributes|with)?\s*(?:a|an)?\s*(?:share of)?\s*([0-9,.]+%?)', analysis_text, re.IGNORECASE)
-        
-        if segments:
-            segment_names = []
-            segment_values = []
-            
-            for segment, value in segments:
-                segment_name = segment.strip().capitalize()
-                segment_names.append(segment_name)
-                
-                # Extract number from value
-                if '%' in value:
-                    # It's a percentage
-                    try:
-                        segment_values.append(float(value.replace('%', '').replace(',', '')))
-                    except:
-                        segment_values.append(0)
-                else:
-                    # It's a count
-                    try:
-                        segment_values.append(float(value.replace(',', '')))
-                    except:
-                        segment_values.append(0)
-            
-            if segment_names and segment_values:
-                result["labels"] = segment_names
-                result["datasets"] = [{
-                    "label": "Percentage",
-                    "data": segment_values,
-                    "backgroundColor": [
-                        'rgba(255, 99, 132, 0.5)',
-                        'rgba(54, 162, 235, 0.5)',
-                        'rgba(255, 206, 86, 0.5)',
-                        'rgba(75, 192, 192, 0.5)',
-                        'rgba(153, 102, 255, 0.5)',
-                        'rgba(255, 159, 64, 0.5)'
-                    ]
-                }]
-    
-    elif query_type == 'geographical_performance':
-        # Extract location data
-        result["type"] = "bar"
-        result["title"] = "Geographic Sales Distribution"
-        result["description"] = "Sales performance by location"
-        
-        # Try to extract locations and sales values
-        locations = re.findall(r'([A-Za-z\s]+?)\s*(?:region|location|area|state|city|province|country)?\s*(?:shows|has|with|accounts for)?\s*(?:a|an)?\s*(?:revenue|sales)?\s*(?:of)?\s*\$?([0-9,.]+)', analysis_text)
-        
-        if locations:
-            location_names = []
-            location_values = []
-            
-            for location, value in locations:
-                location_name = location.strip()
-                if location_name and len(location_name) > 2 and location_name.lower() not in ['the', 'and', 'with', 'has', 'shows']:
-                    location_names.append(location_name)
-                    try:
-                        location_values.append(float(value.replace(',', '')))
-                    except:
-                        location_values.append(0)
-            
-            if location_names and location_values:
-                result["labels"] = location_names
-                result["datasets"] = [{
-                    "label": "Sales",
-                    "data": location_values,
-                    "backgroundColor": "rgba(75, 192, 192, 0.5)",
-                    "borderColor": "rgba(75, 192, 192, 1)",
-                    "borderWidth": 1
-                }]
-    
-    elif query_type == 'payment_method_analysis':
-        # Extract payment method data
-        result["type"] = "doughnut"
-        result["title"] = "Payment Methods Analysis"
-        result["description"] = "Distribution of transactions by payment method"
-        
-        # Try to extract payment methods and their usage
-        payment_methods = re.findall(r'(credit card|debit card|paypal|cash|apple pay|google pay|bank transfer|cryptocurrency|venmo|check)[^\d]*([0-9,.]+%?)', analysis_text, re.IGNORECASE)
-        
-        if payment_methods:
-            method_names = []
-            method_values = []
-            
-            for method, value in payment_methods:
-                method_name = method.strip().title()
-                method_names.append(method_name)
-                
-                # Extract number from value
-                if '%' in value:
-                    # It's a percentage
-                    try:
-                        method_values.append(float(value.replace('%', '').replace(',', '')))
-                    except:
-                        method_values.append(0)
-                else:
-                    # It's a count
-                    try:
-                        method_values.append(float(value.replace(',', '')))
-                    except:
-                        method_values.append(0)
-            
-            if method_names and method_values:
-                result["labels"] = method_names
-                result["datasets"] = [{
-                    "label": "Transactions",
-                    "data": method_values,
-                    "backgroundColor": [
-                        'rgba(255, 99, 132, 0.5)',
-                        'rgba(54, 162, 235, 0.5)',
-                        'rgba(255, 206, 86, 0.5)',
-                        'rgba(75, 192, 192, 0.5)',
-                        'rgba(153, 102, 255, 0.5)',
-                        'rgba(255, 159, 64, 0.5)'
-                    ],
-                    "hoverOffset": 4
-                }]
-    
-    # If we couldn't extract specific data, try to generate data from the actual dataframe
-    if not result["labels"]:
-        from uploads.sales_AI_Agent import df, analyze_sales_trend, group_by_feature
-        
-        if query_type in ['time_series_analysis']:
-            try:
-                # Use analyze_sales_trend for time series data
-                if df is not None and not df.empty:
-                    time_series_data = analyze_sales_trend()
-                    if isinstance(time_series_data, dict) and 'labels' in time_series_data and 'values' in time_series_data:
-                        result["labels"] = time_series_data['labels']
-                        result["datasets"] = [{
-                            "label": "Sales Data",
-                            "data": time_series_data['values'],
-                            "backgroundColor": "rgba(75, 192, 192, 0.2)",
-                            "borderColor": "rgba(75, 192, 192, 1)",
-                            "borderWidth": 1
-                        }]
-            except Exception as e:
-                print(f"Error generating time series data: {str(e)}")
-        
-        elif query_type in ['revenue_by_product_category']:
-            try:
-                # Use group_by_feature for category data
-                if df is not None and not df.empty and 'product_category' in df.columns:
-                    cat_data = group_by_feature('product_category', 'total_amount', 'sum')
-                    result["labels"] = cat_data.index.tolist()
-                    result["datasets"] = [{
-                        "label": "Revenue by Category",
-                        "data": cat_data.values.tolist(),
-                        "backgroundColor": "rgba(75, 192, 192, 0.2)",
-                        "borderColor": "rgba(75, 192, 192, 1)",
-                        "borderWidth": 1
-                    }]
-            except Exception as e:
-                print(f"Error generating category data: {str(e)}")
-    
-    return result
-
-def extract_chart_data_for_frontend(analysis_text):
-    """
-    Extract chart data from analysis text and format it for the frontend.
-    Returns data in the format expected by the frontend visualization components.
-    Uses actual data from the loaded dataset where possible.
+        analysis_result (AnalysisResult): The analysis
+        context (AnalysisContext, optional): The dataset the analysis was made from
     """
     try:
-        if not analysis_text or not isinstance(analysis_text, str):
-            print("Warning: Invalid analysis_text input")
-            return generate_direct_chart_data()
-            
-        chart_data = {}
-        
-        # Try to generate chart data directly from the dataframe first
-        direct_data = generate_direct_chart_data()
-        if direct_data:
-            print("Successfully generated chart data directly from the dataset")
-            chart_data = direct_data
-            
-            # Also try to extract text-based data to supplement the direct data
-            text_extracted_data = extract_text_based_chart_data(analysis_text)
-            
-            # Merge text-extracted data for any charts that weren't generated directly
-            for key, value in text_extracted_data.items():
-                if key not in chart_data and value.get('labels') and value.get('values'):
-                    chart_data[key] = value
-                    
+        chart_data = analysis_result.chart_data() if analysis_result is not None else {}
+        if chart_data:
             return chart_data
-        
-        # If direct chart data generation failed, fall back to text extraction
-        return extract_text_based_chart_data(analysis_text)
-    
+        return generate_direct_chart_data(context)
     except Exception as e:
         print(f"Error extracting chart data: {str(e)}")
         traceback.print_exc()
         return generate_fallback_chart_data()
 
-def generate_direct_chart_data():
+def generate_direct_chart_data(context=None):
     """
     Generate chart data directly from the dataframe, ensuring we use actual data.
     This approach is preferred over text extraction.
+    
+    Args:
+        context (AnalysisContext, optional): The dataset to chart. Without one there is
+                                             no data to chart and an empty dict is returned.
     """
     try:
+        if context is None or context.is_empty:
+            return {}
+        
         # Check if we're dealing with sales data or review data
-        try:
-            # First try to import from sales_AI_Agent
-            from uploads.sales_AI_Agent import df as sales_df
-            if sales_df is not None and not sales_df.empty:
-                return generate_sales_chart_data(sales_df)
-        except Exception as sales_error:
-            print(f"Could not load sales data: {str(sales_error)}")
-            
-        try:
-            # Then try review data
-            from uploads.review_AI_Agent import df as review_df
-            if review_df is not None and not review_df.empty:
-                return generate_review_chart_data(review_df)
-        except Exception as review_error:
-            print(f"Could not load review data: {str(review_error)}")
-            
-        # If neither worked, return empty dict
-        return {}
+        if context.department == 'reviews':
+            return generate_review_chart_data(context)
+        return generate_sales_chart_data(context)
     except Exception as e:
         print(f"Error generating direct chart data: {str(e)}")
         return {}
 
-def generate_sales_chart_data(df):
+def generate_sales_chart_data(context):
     """
-    Generate sales chart data directly from the DataFrame
+    Generate sales chart data directly from the DataFrame of an analysis context
+    
+    Args:
+        context (AnalysisContext): The sales dataset to chart
+        
+    Returns:
+        dict: Chart data for visualizations
     """
     try:
-        # Import necessary functions from sales_AI_Agent
-        from uploads.sales_AI_Agent import analyze_sales_trend, group_by_feature, set_dataframe
-        
-        # Set the dataframe in the agent module TEMPORARILY for these functions to work
-        # This is not ideal, agent functions should ideally accept df as arg
-        original_df_state = None
-        try:
-            from uploads.sales_AI_Agent import df as agent_df
-            if agent_df is not None:
-                original_df_state = agent_df.copy()
-        except ImportError: 
-            pass
-            
-        set_dataframe(df) # Set the current dataframe for analysis
-        
-        chart_data = {}
-        
-        if df is None or df.empty:
+        if context.df is None or context.df.empty:
             print("No data passed to generate_sales_chart_data.")
             return {}
-
-        # Generate time series data (Requires 'timestamp' or 'transaction_timestamp' and 'total_amount')
-        try:
-            set_dataframe(df) # Ensure agent has correct df
-            # analyze_sales_trend implicitly uses 'total_amount' and a time column
-            time_cols = [col for col in ['transaction_timestamp', 'timestamp'] if col in df.columns]
-            if time_cols and 'total_amount' in df.columns:
-                 time_series_data = analyze_sales_trend()
-                 if isinstance(time_series_data, dict) and time_series_data.get('labels') and time_series_data.get('values'):
-                     chart_data['sales_over_time'] = {
-                         'labels': time_series_data['labels'],
-                         'values': time_series_data['values'],
-                         'title': 'Sales Trend Over Time',
-                         'description': 'Historical revenue performance showing patterns and trends'
-                     }
-                 else:
-                     print("DEBUG: analyze_sales_trend did not return valid data.")
-            else:
-                print("DEBUG: Missing required columns for sales_over_time chart (time column or total_amount).")
-        except Exception as e:
-            print(f"Error generating time series data in generate_sales_chart_data: {str(e)}")
-
-        # Generate category data (Requires 'product_category' and 'total_amount')
-        if 'product_category' in df.columns and 'total_amount' in df.columns:
-            try:
-                set_dataframe(df) # Ensure agent has correct df
-                cat_data = group_by_feature('product_category', 'total_amount', 'sum')
-                if not cat_data.empty:
-                     chart_data['sales_by_category'] = {
-                         'labels': cat_data.index.tolist(),
-                         'values': cat_data.values.tolist(),
-                         'title': 'Sales by Product Category',
-                         'description': 'Distribution of revenue across different product categories'
-                     }
-                else:
-                    print("DEBUG: group_by_feature returned empty data for sales_by_category.")
-            except Exception as e:
-                print(f"Error generating category data in generate_sales_chart_data: {str(e)}")
-        else:
-            print("DEBUG: Missing required columns for sales_by_category chart (product_category or total_amount).")
-            
-        # Generate age distribution (Requires 'customer_age' and implicitly a count column like 'transaction_id')
-        # Using 'total_amount' count as a proxy if transaction_id isn't standard
-        if 'customer_age' in df.columns: 
-            try:
-                set_dataframe(df)
-                # Use 'count' aggregation. Group_by_feature defaults to 'mean' if not specified.
-                # Need a column to count, using total_amount existence as a proxy for a transaction
-                if 'total_amount' in df.columns:
-                    age_data = group_by_feature('customer_age', 'total_amount', 'count') 
-                    if not age_data.empty:
-                        chart_data['age_distribution'] = {
-                            'labels': age_data.index.astype(str).tolist(), # Ensure labels are strings
-                            'values': age_data.values.tolist(),
-                            'title': 'Customer Age Distribution',
-                            'description': 'Number of transactions by customer age'
-                        }
-                    else:
-                       print("DEBUG: group_by_feature returned empty data for age_distribution.")
-                else:
-                    print("DEBUG: Missing 'total_amount' column required for age_distribution count.")
-            except Exception as e:
-                print(f"Error generating age distribution chart: {str(e)}")
-        else:
-             print("DEBUG: Missing 'customer_age' column for age_distribution chart.")
-
-        # Generate gender distribution (Requires 'customer_gender', implicitly 'total_amount' for count)
-        if 'customer_gender' in df.columns:
-            try:
-                set_dataframe(df)
-                if 'total_amount' in df.columns:
-                    gender_data = group_by_feature('customer_gender', 'total_amount', 'count')
-                    if not gender_data.empty:
-                        chart_data['gender_distribution'] = {
-                            'labels': gender_data.index.tolist(),
-                            'values': gender_data.values.tolist(),
-                            'title': 'Customer Gender Distribution',
-                            'description': 'Number of transactions by customer gender'
-                        }
-                    else:
-                         print("DEBUG: group_by_feature returned empty data for gender_distribution.")
-                else:
-                    print("DEBUG: Missing 'total_amount' column required for gender_distribution count.")
-            except Exception as e:
-                print(f"Error generating gender distribution chart: {str(e)}")
-        else:
-            print("DEBUG: Missing 'customer_gender' column for gender_distribution chart.")
-
-        # Generate payment methods (Requires 'payment_method', implicitly 'total_amount' for count)
-        if 'payment_method' in df.columns:
-            try:
-                set_dataframe(df)
-                if 'total_amount' in df.columns:
-                    payment_data = group_by_feature('payment_method', 'total_amount', 'count')
-                    if not payment_data.empty:
-                        chart_data['payment_methods'] = {
-                            'labels': payment_data.index.tolist(),
-                            'values': payment_data.values.tolist(),
-                            'title': 'Payment Methods Used',
-                            'description': 'Distribution of transactions by payment method'
-                        }
-                    else:
-                        print("DEBUG: group_by_feature returned empty data for payment_methods.")
-                else:
-                    print("DEBUG: Missing 'total_amount' column required for payment_methods count.")
-            except Exception as e:
-                print(f"Error generating payment methods chart: {str(e)}")
-        else:
-            print("DEBUG: Missing 'payment_method' column for payment_methods chart.")
-
-        # Generate regions (Requires 'location' and 'total_amount')
-        if 'location' in df.columns and 'total_amount' in df.columns:
-            try:
-                set_dataframe(df)
-                region_data = group_by_feature('location', 'total_amount', 'sum')
-                if not region_data.empty:
-                    chart_data['regions'] = {
-                        'labels': region_data.index.tolist(),
-                        'values': region_data.values.tolist(),
-                        'title': 'Sales by Geographic Region',
-                        'description': 'Revenue distribution across different geographic regions'
-                    }
-                else:
-                    print("DEBUG: group_by_feature returned empty data for regions.")
-            except Exception as e:
-                print(f"Error generating region chart: {str(e)}")
-        else:
-             print("DEBUG: Missing required columns for regions chart (location or total_amount).")
-
-        return chart_data
-
+        return sales_chart_series(context=context)
     except Exception as e:
         print(f"Error in generate_sales_chart_data: {str(e)}")
         traceback.print_exc()
         return {}
-    finally:
-         # Restore original df state in agent if it was changed
-         if original_df_state is not None:
-              set_dataframe(original_df_state)
-         else:
-             # If there was no original state, maybe clear it? Or set to None?
-             # For now, leave it as the last used df, but this highlights fragility.
-             pass
-
 
 # --- Review Chart Generation ---
 
-def generate_review_chart_data(df):
+def generate_review_chart_data(context):
     """
     Generate chart data specifically for review data using real-time analysis.
     This provides visualizations tailored to review analysis rather than using
     sales-focused charts or dummy data.
     
     Args:
-        df (pandas.DataFrame): The review dataframe to analyze
+        context (AnalysisContext): The review dataset to analyze
         
     Returns:
         dict: Chart data for visualizations
     """
+    df = context.df
     try:
         # First try to use our dedicated review visualization module
         if REVIEW_VISUALIZATIONS_AVAILABLE:
             try:
                 print("Generating review visualizations using enhanced module")
-                # Set the dataframe in the visualization module
-                set_review_viz_dataframe(df)
-                
                 # Get all available visualizations
-                visual_insights = get_all_visual_insights()
+                visual_insights = get_all_visual_insights(context=context)
                 
                 # Ensure all values are JSON serializable
                 return visual_insights
@@ -1837,92 +1595,6 @@ def generate_review_chart_data(df):
         print(traceback.format_exc())
         return generate_fallback_chart_data('review')
 
-def extract_text_based_chart_data(analysis_text):
-    """
-    Extract chart data from analysis text as a fallback method.
-    This should only be used when direct data extraction fails.
-    """
-    chart_data = {}
-    
-    # Extract sales by category data
-    # Try multiple patterns for better matching
-    category_patterns = [
-        r"Sales by category:(.*?)(?=\n\n|\Z)",
-        r"Product category breakdown:(.*?)(?=\n\n|\Z)",
-        r"Revenue by product category:(.*?)(?=\n\n|\Z)",
-        r"Category distribution:(.*?)(?=\n\n|\Z)",
-        r"Categories:(.*?)(?=\n\n|\Z)",
-        r"Product categories:(.*?)(?=\n\n|\Z)"
-    ]
-    
-    for pattern in category_patterns:
-        category_match = re.search(pattern, analysis_text, re.DOTALL)
-        if category_match:
-            categories = []
-            amounts = []
-            for line in category_match.group(1).strip().split('\n'):
-                if ':' in line:
-                    category, amount_str = line.split(':', 1)
-                    try:
-                        amount_match = re.search(r'[\d,.]+', amount_str.replace(',', ''))
-                        if amount_match:
-                            amount = float(amount_match.group(0))
-                            categories.append(category.strip())
-                            amounts.append(amount)
-                    except Exception as e:
-                        print(f"Error parsing category amount: {e}")
-            
-            if categories and amounts:
-                chart_data['sales_by_category'] = {
-                    'labels': categories,
-                    'values': amounts,
-                    'title': 'Sales by Product Category',
-                    'description': 'Distribution of revenue across different product categories'
-                }
-                break
-    
-    # Extract sales over time data
-    time_patterns = [
-        r"Sales trend:(.*?)(?=\n\n|\Z)",
-        r"Sales over time:(.*?)(?=\n\n|\Z)",
-        r"Monthly sales:(.*?)(?=\n\n|\Z)",
-        r"Revenue trend:(.*?)(?=\n\n|\Z)",
-        r"Time series:(.*?)(?=\n\n|\Z)",
-        r"Temporal analysis:(.*?)(?=\n\n|\Z)"
-    ]
-    
-    for pattern in time_patterns:
-        time_match = re.search(pattern, analysis_text, re.DOTALL)
-        if time_match:
-            dates = []
-            amounts = []
-            for line in time_match.group(1).strip().split('\n'):
-                if ':' in line:
-                    date, amount_str = line.split(':', 1)
-                    try:
-                        amount_match = re.search(r'[\d,.]+', amount_str.replace(',', ''))
-                        if amount_match:
-                            amount = float(amount_match.group(0))
-                            dates.append(date.strip())
-                            amounts.append(amount)
-                    except Exception as e:
-                        print(f"Error parsing time amount: {e}")
-            
-            if dates and amounts:
-                chart_data['sales_over_time'] = {
-                    'labels': dates,
-                    'values': amounts,
-                    'title': 'Sales Trend Over Time',
-                    'description': 'Historical revenue performance showing patterns and trends'
-                }
-                break
-    
-    # Extract additional charts (age, gender, payment methods, regions)
-    # These extraction patterns remain the same as in the original function
-    # ...
-    
-    return chart_data
-
 def generate_fallback_chart_data(data_type='sales'):
     """Generate chart data directly from the dataframe when text extraction fails"""
     try:
@@ -1936,11 +1608,10 @@ def generate_fallback_chart_data(data_type='sales'):
         # Return empty dict if everything fails
         return {}
 
-def generate_sales_fallback_chart_data():
-    """Generate fallback chart data specifically for sales data"""
+def generate_sales_fallback_chart_data(context):
+    """Generate fallback chart data specifically for sales data, from an analysis context"""
     try:
-        # Import required functions from sales_AI_Agent
-        from uploads.sales_AI_Agent import df, analyze_sales_trend, group_by_feature
+        df = context.df
         
         # Initialize chart data container
         chart_data = {}
@@ -1952,7 +1623,7 @@ def generate_sales_fallback_chart_data():
         
         # Generate time series data
         try:
-            time_series_data = analyze_sales_trend()
+            time_series_data = analyze_sales_trend(context=context)
             if isinstance(time_series_data, dict) and 'labels' in time_series_data and 'values' in time_series_data:
                 chart_data['sales_over_time'] = {
                     'labels': time_series_data['labels'],
@@ -1966,7 +1637,7 @@ def generate_sales_fallback_chart_data():
         # Generate category data
         if 'product_category' in df.columns:
             try:
-                cat_data = group_by_feature('product_category', 'total_amount', 'sum')
+                cat_data = group_by_feature('product_category', 'total_amount', 'sum', context=context)
                 chart_data['sales_by_category'] = {
                     'labels': cat_data.index.tolist(),
                     'values': cat_data.values.tolist(),
@@ -1983,11 +1654,10 @@ def generate_sales_fallback_chart_data():
         traceback.print_exc()
         return {}
 
-def generate_review_fallback_chart_data():
-    """Generate fallback chart data specifically for review data"""
+def generate_review_fallback_chart_data(context):
+    """Generate fallback chart data specifically for review data, from an analysis context"""
     try:
-        # Import required functions from review_AI_Agent
-        from uploads.review_AI_Agent import df, analyze_rating_distribution, generate_sentiment_pie_chart
+        df = context.df
         
         # Initialize chart data container
         chart_data = {}
@@ -1999,14 +1669,14 @@ def generate_review_fallback_chart_data():
         
         # Generate rating distribution
         try:
-            rating_data = analyze_rating_distribution()
+            rating_data = analyze_rating_distribution(context=context)
             chart_data['rating_distribution'] = rating_data
         except Exception as e:
             print(f"Error generating rating distribution: {str(e)}")
         
         # Generate sentiment distribution
         try:
-            sentiment_data = generate_sentiment_pie_chart()
+            sentiment_data = generate_sentiment_pie_chart(context=context)
             chart_data['sentiment_distribution'] = sentiment_data
         except Exception as e:
             print(f"Error generating sentiment distribution: {str(e)}")
@@ -2050,19 +1720,18 @@ def query_ai():
                 "department": department
             }), 400
         
+        context = None
         if file_id:
             # If file_id is provided, try to load that specific data
             file_parts = file_id.split('_')
             if len(file_parts) > 1:
                 session_id = '_'.join(file_parts[1:])
-                for folder in os.listdir(app.config['UPLOAD_FOLDER']):
-                    if session_id in folder:
-                        folder_path = os.path.join(app.config['UPLOAD_FOLDER'], folder)
-                        load_data_wrapper(folder_path)
-                        break
+                folder_path = find_session_folder(session_id)
+                if folder_path:
+                    context = load_data_wrapper(folder_path)
         
         # Process the query
-        response = process_query_directly(query)
+        response = query_with_context(query, context)
         
         return jsonify({
             "success": True,
@@ -2146,6 +1815,57 @@ def filename_to_analysis(department, filename):
             "error": str(e)
         }), 500
 
+def load_sales_request_context(file_id, department='sales'):
+    """
+    Load the sales data a request refers to into its own analysis context.
+    
+    Args:
+        file_id (str): File identifier - a file in uploads/<department>/ or an upload session.
+        department (str): Department folder of the file.
+    
+    Returns:
+        AnalysisContext: The request's context, or None to use the most recently loaded data.
+    
+    Raises:
+        Exception: If the file exists but cannot be loaded.
+    """
+    if not file_id:
+        return None
+    
+    # First check direct path - this would be a file in uploads/department/
+    direct_file_path = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
+        'uploads', department, file_id + '.csv'
+    )
+    
+    # Check if the file exists
+    if os.path.exists(direct_file_path):
+        print(f"Loading data from direct file: {direct_file_path}")
+        # Read the CSV into a pandas DataFrame
+        df = read_csv_cached(direct_file_path)
+        
+        # Set up the dataframe for sales analysis in this request's context
+        context = create_sales_context(df, source=content_hash_for(direct_file_path))
+        
+        print(f"Successfully loaded data from {file_id}.csv with {len(df)} rows")
+        return context
+    
+    # If not direct file, try sessions
+    try:
+        # Look for session folders that might contain this file
+        file_parts = file_id.split('_')
+        if len(file_parts) > 1:
+            session_id = '_'.join(file_parts[1:])
+            session_path = find_session_folder(session_id)
+            
+            if session_path:
+                print(f"Loading data from session: {session_path}")
+                # For sales agent, only use sales data loader
+                return load_sales_context(session_path)
+    except Exception as e:
+        print(f"Error loading session data: {e}")
+    return None
+
 @app.route('/api/sales-agent/query', methods=['POST', 'OPTIONS'])
 def sales_agent_query():
     """
@@ -2182,57 +1902,19 @@ def sales_agent_query():
         from uploads.sales_AI_Agent import process_query_directly as sales_process_query
         agent_processor = sales_process_query
         
-        # If file_id is provided, ensure we're using that specific data
-        if file_id:
-            # First check direct path - this would be a file in uploads/department/
-            direct_file_path = os.path.join(
-                os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-                'uploads', department, file_id + '.csv'
-            )
-            
-            # Check if the file exists
-            if os.path.exists(direct_file_path):
-                print(f"Loading data from direct file: {direct_file_path}")
-                try:
-                    # Read the CSV into a pandas DataFrame
-                    df = pd.read_csv(direct_file_path)
-                    
-                    # Set up the dataframe for sales analysis
-                    from uploads.sales_AI_Agent import set_dataframe
-                    set_dataframe(df)
-                    
-                    print(f"Successfully loaded data from {file_id}.csv with {len(df)} rows")
-                except Exception as e:
-                    print(f"Error loading file data: {e}")
-                    return jsonify({
-                        "success": False,
-                        "error": f"Failed to load data from the file: {str(e)}",
-                        "response": "The system couldn't analyze your file due to a data loading error."
-                    })
-            else:
-                # If not direct file, try sessions
-                try:
-                    # Look for session folders that might contain this file
-                    file_parts = file_id.split('_')
-                    if len(file_parts) > 1:
-                        session_id = '_'.join(file_parts[1:])
-                        session_path = None
-                        
-                        for folder in os.listdir(app.config['UPLOAD_FOLDER']):
-                            if session_id in folder:
-                                session_path = os.path.join(app.config['UPLOAD_FOLDER'], folder)
-                                break
-                        
-                        if session_path:
-                            print(f"Loading data from session: {session_path}")
-                            # For sales agent, only use sales data loader
-                            from uploads.sales_AI_Agent import load_data as load_sales_data
-                            load_sales_data(session_path)
-                except Exception as e:
-                    print(f"Error loading session data: {e}")
+        # Without a file_id the query runs against the most recently loaded data
+        try:
+            context = load_sales_request_context(file_id, department)
+        except Exception as e:
+            print(f"Error loading file data: {e}")
+            return jsonify({
+                "success": False,
+                "error": f"Failed to load data from the file: {str(e)}",
+                "response": "The system couldn't analyze your file due to a data loading error."
+            })
         
         # Process the query against the actual data using the sales agent processor
-        result = agent_processor(query)
+        result = agent_processor(query, context=context)
         
         # Extract the actual response text if result is a dictionary
         response_content = result.get('response', result) if isinstance(result, dict) else result
@@ -2263,6 +1945,78 @@ def sales_agent_query():
             "response": "I'm sorry, I couldn't process your query due to an error with the data analysis."
         }), 500
 
+@app.route('/api/sales-agent/predict', methods=['POST', 'OPTIONS'])
+def sales_agent_predict():
+    """
+    Batch prediction of total sales amounts, e.g. for what-if pricing sweeps.
+    
+    The JSON body holds either 'rows' - a dict with 'quantity', 'price' and 'discount'
+    arrays (scalars are broadcast) - or 'grid' - a dict with the same keys whose values
+    are a number, a list of values, or {'start', 'stop', 'num'} ranges, predicted for
+    every combination. Optional: 'file_id', 'confidence' (default 0.95) and 'interval'
+    ('confidence' or 'prediction').
+    """
+    # Handle OPTIONS requests for CORS
+    if request.method == 'OPTIONS':
+        response = jsonify({'success': True})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
+        return response
+    
+    data = request.get_json(silent=True) or {}
+    is_grid = 'grid' in data
+    spec = data['grid'] if is_grid else data.get('rows')
+    if not isinstance(spec, dict) or any(key not in spec for key in ('quantity', 'price', 'discount')):
+        return jsonify({"success": False,
+                        "error": "Either 'rows' or 'grid' with 'quantity', 'price' and 'discount' is required"}), 400
+    
+    # Reject oversized requests before any arrays are built
+    max_rows = app.config['PREDICTION_MAX_ROWS']
+    try:
+        if is_grid:
+            sizes = [int(axis.get('num', 10)) if isinstance(axis, dict) else len(np.atleast_1d(axis))
+                     for axis in (spec['quantity'], spec['price'], spec['discount'])]
+            row_count = int(np.prod(sizes))
+        else:
+            row_count = max(len(np.atleast_1d(spec[key])) for key in ('quantity', 'price', 'discount'))
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "error": f"Invalid prediction input: {str(e)}"}), 400
+    if row_count > max_rows:
+        return jsonify({"success": False, "error": f"At most {max_rows} predictions per request, got {row_count}"}), 400
+    
+    try:
+        context = load_sales_request_context(data.get('file_id'))
+        options = {'context': context, 'confidence': float(data.get('confidence', 0.95)),
+                   'interval': data.get('interval', 'confidence')}
+        start = time.perf_counter()
+        if is_grid:
+            result = predict_total_grid(spec['quantity'], spec['price'], spec['discount'], **options)
+        else:
+            result = predict_totals(spec['quantity'], spec['price'], spec['discount'], **options)
+        elapsed = time.perf_counter() - start
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in sales prediction: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+    
+    return jsonify({
+        "success": True,
+        "count": len(result['predictions']),
+        "confidence": result['confidence'],
+        "interval": result['interval'],
+        "quantity": result['quantity'].tolist(),
+        "price": result['price'].tolist(),
+        "discount": result['discount'].tolist(),
+        "predictions": result['predictions'].tolist(),
+        "lower": result['lower'].tolist(),
+        "upper": result['upper'].tolist(),
+        "seconds": elapsed,
+        "data_source": data.get('file_id') or "current_session"
+    })
+
 @app.route('/api/review-agent/query', methods=['POST', 'OPTIONS'])
 def review_agent_endpoint():
     """
@@ -2294,40 +2048,11 @@ def review_agent_endpoint():
             print(f"Warning: Non-review department '{department}' requested from review-agent endpoint. Forcing 'reviews' department.")
             department = 'reviews'
         
-        # Verify we have review data loaded - check dataframe columns
-        from uploads.review_AI_Agent import df as review_df
-        
-        if review_df is None or len(review_df) == 0:
-            print("Warning: No review data is loaded for analysis")
-            # Try to load review data if file_id is provided
-            if file_id:
-                print(f"Attempting to load review data for file_id: {file_id}")
-                # Proceed with loading data
-                # The rest of the loading logic continues...
-            else:
-                # No data available for analysis
-                return jsonify({
-                    "success": False,
-                    "error": "No review data is available for analysis. Please upload review data first.",
-                    "response": "I need review data to analyze. Please upload some review files first."
-                }), 400
-        
-        # Verify we have proper review data (not sales data) - check for essential columns
         required_columns = ['reviewText', 'overall', 'asin']
         
-        if review_df is not None and not all(col in review_df.columns for col in required_columns):
-            # This might be the wrong data type - probably sales data instead of reviews
-            print(f"Warning: Loaded dataframe does not have required review columns: {required_columns}")
-            missing_columns = [col for col in required_columns if col not in review_df.columns]
-            
-            return jsonify({
-                "success": False,
-                "error": f"The loaded data does not appear to be review data. Missing required columns: {missing_columns}",
-                "response": "I can't process this query because the loaded data does not appear to be review data. Please upload review data that contains reviewer ratings and review text."
-            }), 400
-        
-        # Load data if file_id is provided and we don't already have data
-        if file_id and (review_df is None or len(review_df) == 0):
+        # Load the requested file into this request's context
+        context = None
+        if file_id:
             # First check direct path - this would be a file in uploads/reviews/
             direct_file_path = os.path.join(
                 os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
@@ -2339,7 +2064,7 @@ def review_agent_endpoint():
                 print(f"Loading review data from direct file: {direct_file_path}")
                 try:
                     # Read the CSV into a pandas DataFrame
-                    df = pd.read_csv(direct_file_path)
+                    df = read_csv_cached(direct_file_path)
                     
                     # Verify if this is really review data
                     if not all(col in df.columns for col in required_columns):
@@ -2350,12 +2075,7 @@ def review_agent_endpoint():
                         })
                     
                     # Set up the dataframe for review analysis
-                    from uploads.review_AI_Agent import set_dataframe as review_set_dataframe
-                    review_set_dataframe(df)
-                    
-                    # Also set dataframe in the visualization module if available
-                    if REVIEW_VISUALIZATIONS_AVAILABLE:
-                        set_review_viz_dataframe(df)
+                    context = create_review_context(df)
                     
                     print(f"Successfully loaded review data from {file_id}.csv with {len(df)} rows")
                 except Exception as e:
@@ -2372,24 +2092,18 @@ def review_agent_endpoint():
                     file_parts = file_id.split('_')
                     if len(file_parts) > 1:
                         session_id = '_'.join(file_parts[1:])
-                        session_path = None
-                        
-                        for folder in os.listdir(app.config['UPLOAD_FOLDER']):
-                            if session_id in folder:
-                                session_path = os.path.join(app.config['UPLOAD_FOLDER'], folder)
-                                break
+                        session_path = find_session_folder(session_id)
                         
                         if session_path:
                             print(f"Loading review data from session: {session_path}")
                             # For review agent, only use review data loader
-                            from uploads.review_AI_Agent import load_user_data
-                            
-                            # Get all CSV files in the session directory
-                            csv_files = [os.path.join(session_path, f) for f in os.listdir(session_path) 
-                                        if f.endswith('.csv')]
+                            # Get all CSV files of the session from the catalog
+                            csv_files = [entry['path'] for entry in file_catalog.find_session_files(session_id)
+                                        if os.path.dirname(entry['path']) == session_path and os.path.isfile(entry['path'])]
                             
                             if csv_files:
-                                df = load_user_data(csv_files)
+                                context = load_review_context(csv_files)
+                                df = context.df
                                 
                                 # Verify if this is really review data
                                 if df is None or not all(col in df.columns for col in required_columns):
@@ -2415,9 +2129,35 @@ def review_agent_endpoint():
                         "response": "The system couldn't analyze your reviews due to a data loading error."
                     })
         
+        # Without a file_id, use the most recently loaded review data
+        if context is None:
+            from uploads import review_AI_Agent
+            context = review_AI_Agent.default_context
+        
+        if context.is_empty:
+            # No data available for analysis
+            print("Warning: No review data is loaded for analysis")
+            return jsonify({
+                "success": False,
+                "error": "No review data is available for analysis. Please upload review data first.",
+                "response": "I need review data to analyze. Please upload some review files first."
+            }), 400
+        
+        # Verify we have proper review data (not sales data) - check for essential columns
+        if not all(col in context.df.columns for col in required_columns):
+            # This might be the wrong data type - probably sales data instead of reviews
+            print(f"Warning: Loaded dataframe does not have required review columns: {required_columns}")
+            missing_columns = [col for col in required_columns if col not in context.df.columns]
+            
+            return jsonify({
+                "success": False,
+                "error": f"The loaded data does not appear to be review data. Missing required columns: {missing_columns}",
+                "response": "I can't process this query because the loaded data does not appear to be review data. Please upload review data that contains reviewer ratings and review text."
+            }), 400
+        
         # Process the query using the review agent
         from uploads.review_AI_Agent import review_agent_query
-        result = review_agent_query(query)
+        result = review_agent_query(query, context=context)
         
         # Extract the actual response text if result is a dictionary
         response_content = result.get('response', result) if isinstance(result, dict) else result
@@ -2461,7 +2201,7 @@ def analyze_csv_directly(file_path, query_type='overview'):
     """
     try:
         # Read the CSV file
-        df = pd.read_csv(file_path)
+        df = read_csv_cached(file_path)
         print(f"Successfully read CSV file with {len(df)} rows and {len(df.columns)} columns")
         
         # Determine the data type based on columns
@@ -2469,30 +2209,28 @@ def analyze_csv_directly(file_path, query_type='overview'):
         
         # Set up the dataframe for analysis based on detected data type
         if is_review_data:
-            from uploads.review_AI_Agent import set_dataframe as review_set_dataframe
-            review_set_dataframe(df)
+            context = create_review_context(df)
             print("Detected review data based on columns, using review AI agent")
             
             # For review data, use the review agent for analysis
             from uploads.review_AI_Agent import analyze_comprehensive_reviews, review_agent_query
             
             if query_type == 'overview':
-                return analyze_comprehensive_reviews()
+                return analyze_comprehensive_reviews(context=context)
             else:
                 # For specific query types, formulate an appropriate question
                 if query_type == 'sentiment':
-                    return review_agent_query("Analyze the sentiment distribution in these reviews with data-driven insights.")
+                    return review_agent_query("Analyze the sentiment distribution in these reviews with data-driven insights.", context=context)
                 elif query_type == 'topics':
-                    return review_agent_query("Identify and analyze the main topics or themes in these reviews.")
+                    return review_agent_query("Identify and analyze the main topics or themes in these reviews.", context=context)
                 elif query_type == 'ratings':
-                    return review_agent_query("Analyze the rating distribution and provide insights on customer satisfaction.")
+                    return review_agent_query("Analyze the rating distribution and provide insights on customer satisfaction.", context=context)
                 else:
                     # For generic queries, use comprehensive analysis
-                    return analyze_comprehensive_reviews()
+                    return analyze_comprehensive_reviews(context=context)
         else:
             # For sales or other data, use the sales AI agent
-            from uploads.sales_AI_Agent import set_dataframe
-            set_dataframe(df)
+            context = create_sales_context(df, source=content_hash_for(file_path))
             print("Using sales AI agent for analysis")
             
             # Build a custom query based on the query type
@@ -2513,7 +2251,7 @@ def analyze_csv_directly(file_path, query_type='overview'):
         
             # Always use the actual data-driven query processor
             from uploads.sales_AI_Agent import process_query_directly
-            return process_query_directly(query)
+            return process_query_directly(query, context=context)
     except Exception as e:
         print(f"Error analyzing CSV directly: {str(e)}")
         import traceback
@@ -2555,15 +2293,22 @@ def upload_direct():
                 
                 # Check if this is replacing an existing file
                 filepath = os.path.join(department_folder, safe_filename)
+                previous_entry = file_catalog.get_file(filepath)
                 if os.path.exists(filepath):
                     print(f"INFO: Replacing existing file at {filepath}")
                 else:
                     print(f"INFO: Creating new file at {filepath}")
                 
-                # Save the file
+                # Stream the file to disk in chunks, hashing and counting rows on the way
                 try:
-                    file.save(filepath)
+                    upload = save_upload(file, filepath, department)
                     print(f"INFO: File saved successfully at {filepath}")
+                except UploadTooLargeError as size_error:
+                    print(f"ERROR saving file: {str(size_error)}")
+                    return jsonify({
+                        "success": False,
+                        "error": str(size_error)
+                    }), 413
                 except Exception as save_error:
                     print(f"ERROR saving file: {str(save_error)}")
                     traceback.print_exc()
@@ -2575,6 +2320,31 @@ def upload_direct():
                 # Create a unique file ID to avoid conflicts
                 file_id = f"{safe_filename}_{uuid.uuid4().hex[:8]}"
                 
+                # Index the file so analysis requests resolve it without walking the uploads tree.
+                # The columnar cache and metrics manifest are built after the response is sent.
+                try:
+                    columns = read_csv_with_dialect(filepath, upload['dialect'], nrows=0).columns.tolist()
+                    file_catalog.register_file(
+                        filepath,
+                        department,
+                        file_id=safe_filename,
+                        upload_id=file_id,
+                        original_filename=original_filename,
+                        content_hash=upload['content_hash'],
+                        columns=columns,
+                        row_count=upload['row_count'],
+                        size_bytes=upload['size'],
+                        status='processing'
+                    )
+                    start_upload_processing(filepath, upload['dialect'], upload['content_hash'], columns)
+                    
+                    # Drop the stored copy and cached artifacts of replaced content nothing refers to anymore
+                    previous_hash = previous_entry['content_hash'] if previous_entry else None
+                    if previous_hash and previous_hash != upload['content_hash'] and not file_catalog.content_in_use(previous_hash):
+                        content_store.remove_content(previous_hash)
+                except Exception as ingest_error:
+                    print(f"WARNING: Could not cache or catalog uploaded file: {str(ingest_error)}")
+                
                 # Return success with file details and the URL to use for analysis
                 analysis_url = f"/api/analyze/{department}/{safe_filename}"
                 
@@ -2590,7 +2360,11 @@ def upload_direct():
                     "department": department,
                     "full_path": filepath,
                     "analysis_url": analysis_url,
-                    "file_id": file_id
+                    "file_id": file_id,
+                    "size_bytes": upload['size'],
+                    "content_hash": upload['content_hash'],
+                    "deduplicated": upload['deduplicated'],
+                    "status": "processing"
                 })
             except Exception as process_error:
                 print(f"ERROR processing file: {str(process_error)}")
@@ -2606,11 +2380,59 @@ def upload_direct():
                 "error": f"Invalid file format. Only {', '.join(ALLOWED_EXTENSIONS)} allowed"
             }), 400
             
+    except RequestEntityTooLarge:
+        print("ERROR: Upload request exceeds MAX_CONTENT_LENGTH")
+        return jsonify({
+            "success": False,
+            "error": f"Upload request exceeds the limit of {app.config['MAX_CONTENT_LENGTH']} bytes"
+        }), 413
     except Exception as e:
         print(f"ERROR during direct upload: {str(e)}")
         traceback.print_exc()
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/upload-direct', methods=['DELETE'])
+def delete_direct():
+    """
+    Delete a file uploaded through the direct upload endpoint.
+    Removes the file and its caches, and takes its metrics out of the department rollup.
+    """
+    try:
+        department = request.values.get('department', 'sales')
+        filename = secure_filename(request.values.get('filename', ''))
+        if not filename:
+            return jsonify({"success": False, "error": "No filename provided"}), 400
+        if not department or secure_filename(department) != department:
+            return jsonify({"success": False, "error": f"Invalid department: {department}"}), 400
+        
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], department, filename)
+        upload_root = os.path.realpath(app.config['UPLOAD_FOLDER'])
+        if os.path.commonpath([upload_root, os.path.realpath(filepath)]) != upload_root:
+            return jsonify({"success": False, "error": f"Invalid file path: {filename} in department: {department}"}), 400
+        if not os.path.isfile(filepath):
+            return jsonify({"success": False, "error": f"File not found: {filename} in department: {department}"}), 404
+        
+        entry = file_catalog.get_file(filepath)
+        file_catalog.remove_file(filepath)
+        remove_columnar_cache(filepath)
+        os.remove(filepath)
+        
+        # Drop the stored copy and cached artifacts once no other upload has the same content
+        if entry and entry['content_hash'] and not file_catalog.content_in_use(entry['content_hash']):
+            content_store.remove_content(entry['content_hash'])
+        print(f"INFO: Deleted {filepath}")
+        
+        return jsonify({
+            "success": True,
+            "message": "File deleted successfully",
+            "filename": filename,
+            "department": department
+        })
+    except Exception as e:
+        print(f"ERROR during direct delete: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route('/api/debug-analysis', methods=['POST'])
 def debug_analysis():
     """Debug endpoint to help troubleshoot analysis issues"""
@@ -2654,16 +2476,17 @@ def debug_analysis():
         
         # Try analysis with detailed error capture
         analysis_result = {'status': 'not_attempted'}
+        analysis = None
+        context = None
         try:
-            # Set up dataframe for analysis
-            from uploads.sales_AI_Agent import set_dataframe, df
-            
-            if df is not None:
-                set_dataframe(df)
-                analysis = analyze_comprehensive_sales(query_type='overview')
+            # Set up the uploaded file for analysis in its own context
+            if 'columns' in file_info:
+                context = create_sales_context(df)
+                analysis = analyze_sales(query_type='overview', context=context)
+                analysis_text = analysis.markdown
                 analysis_result = {
                     'status': 'success',
-                    'result': analysis[:500] + '...' if len(analysis) > 500 else analysis
+                    'result': analysis_text[:500] + '...' if len(analysis_text) > 500 else analysis_text
                 }
         except Exception as analysis_e:
             import traceback
@@ -2676,9 +2499,8 @@ def debug_analysis():
         # Try chart data extraction
         chart_result = {'status': 'not_attempted'}
         try:
-            if 'result' in analysis_result:
-                sample_text = analysis_result['result']
-                chart_data = extract_chart_data_for_frontend(sample_text)
+            if analysis is not None:
+                chart_data = extract_chart_data_for_frontend(analysis, context)
                 chart_result = {
                     'status': 'success',
                     'data': chart_data
@@ -2700,7 +2522,7 @@ def debug_analysis():
             'file_info': file_info,
             'analysis_result': analysis_result,
             'chart_result': chart_result,
-            'global_df_status': 'initialized' if df is not None else 'not_initialized'
+            'global_df_status': 'initialized' if context is not None else 'not_initialized'
         })
         
     except Exception as e:
@@ -2742,7 +2564,14 @@ def process_response_for_frontend(response_text):
 
 def load_data_wrapper(directory):
     """
-    Loads data from a directory using the appropriate AI agent function
+    Loads data from a directory into a new analysis context of the appropriate AI agent.
+    The agents' default contexts are not changed, so concurrent requests do not share data.
+
+    Args:
+        directory (str): Folder holding the CSV files.
+
+    Returns:
+        AnalysisContext: Review context if the files hold review data, sales context otherwise.
     """
     try:
         # Check if this is likely review data by looking at the first file's columns
@@ -2752,8 +2581,7 @@ def load_data_wrapper(directory):
                 try:
                     # Try to read the first file and check its columns
                     csv_path = os.path.join(directory, f)
-                    df = pd.read_csv(csv_path)
-                    columns = df.columns.tolist()
+                    columns = read_cached_columns(csv_path)
                     if 'asin' in columns and 'reviewText' in columns and 'overall' in columns:
                         is_review_data = True
                         print("Detected review data based on columns")
@@ -2763,21 +2591,34 @@ def load_data_wrapper(directory):
                     continue
         
         if is_review_data:
-            # Use review agent's load_data function
             try:
-                from uploads.review_AI_Agent import load_data as load_review_data
-                return load_review_data(directory)
+                csv_files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.csv')]
+                return load_review_context(csv_files)
             except Exception as e:
                 print(f"Failed to load review data: {str(e)}")
                 raise e
         else:
-            # Use sales agent's load_data function
-            from uploads.sales_AI_Agent import load_data as load_sales_data
-            return load_sales_data(directory)
+            return load_sales_context(directory)
     except Exception as e:
         print(f"Error in load_data_wrapper: {str(e)}")
         raise e
 
+def query_with_context(query, context=None):
+    """
+    Answer a query with the agent matching the context's data.
+
+    Args:
+        query (str): The query to process.
+        context (AnalysisContext, optional): Data loaded for the request. The sales agent's
+                                             default context is used if not provided.
+
+    Returns:
+        str: The agent's response.
+    """
+    if context is not None and context.department == 'reviews':
+        return process_review_query(query, context=context)
+    return process_query_directly(query, context=context)
+
 # New endpoint for loading default review dataset
 @app.route('/api/load-default-reviews', methods=['GET'])
 def load_default_reviews():
@@ -2852,9 +2693,17 @@ def get_summary_statistics():
 def get_sentiment_analysis():
     """
     Returns sentiment analysis results for the loaded review dataset.
+    The optional 'method' parameter selects the scorer ('vader' or 'vader_vectorized').
     """
+    method = request.args.get('method', default=DEFAULT_SENTIMENT_METHOD)
+    if method not in SENTIMENT_METHODS:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown sentiment method '{method}'. Use one of: {', '.join(SENTIMENT_METHODS)}"
+        }), 400
+    
     try:
-        sentiment_results = analyze_sentiment()
+        sentiment_results = analyze_sentiment(method=method)
         return jsonify({
             "success": True,
             "sentiment": sentiment_results
@@ -2895,8 +2744,9 @@ def get_keywords():
         # Get optional parameters
         sentiment = request.args.get('sentiment', default='all')
         max_words = request.args.get('max_words', default=50, type=int)
+        asin = request.args.get('asin')
         
-        keywords = extract_common_words(sentiment=sentiment, max_words=max_words)
+        keywords = extract_common_words(sentiment=sentiment, max_words=max_words, asin=asin)
         return jsonify({
             "success": True,
             "keywords": keywords
@@ -2996,7 +2846,7 @@ def safely_run_tkinter_operation(func, *args, **kwargs):
                 # Return a simple placeholder instead
                 print("WARNING: Skipping wordcloud generation in non-main thread")
                 return {
-                    "wordcloud_base64": "",
+                    "wordcloud_url": "",
                     "top_words": ["threading", "issue", "prevented", "wordcloud", "generation"]
                 }
             
@@ -3010,35 +2860,17 @@ def safely_run_tkinter_operation(func, *args, **kwargs):
 # Add this function to provide a safer wordcloud implementation
 def safe_wordcloud(text=None, sentiment='all', max_words=100):
     """
-    A safer implementation of wordcloud that doesn't use tkinter
-    Returns base64 encoded image and top words
+    A safer implementation of wordcloud that uses neither tkinter nor matplotlib.
+    The cloud is drawn directly with PIL and cached, so each cloud is drawn once.
+    Returns the URL of the cloud image and the top words
     """
     from collections import Counter
-    import base64
-    import io
+    import hashlib
     import re
-    from PIL import Image, ImageDraw, ImageFont
-    import matplotlib.pyplot as plt
+    from uploads import review_AI_Agent
     
     try:
-        # If no text is provided, use review_AI_Agent functions to get the text
-        if text is None:
-            from uploads.review_AI_Agent import get_review_text_by_sentiment
-            text = get_review_text_by_sentiment(sentiment)
-        
-        if not text:
-            return {
-                "wordcloud_base64": "",
-                "top_words": ["no", "text", "available"],
-                "error": "No text available for wordcloud"
-            }
-        
-        # Clean text and extract words
-        text = text.lower()
-        text = re.sub(r'[^\w\s]', '', text)
-        words = text.split()
-        
-        # Remove stopwords
+        # Words to leave out
         stopwords = [
             'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', 'your', 
             'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', 
@@ -3056,50 +2888,43 @@ def safe_wordcloud(text=None, sentiment='all', max_words=100):
             't', 'can', 'will', 'just', 'don', 'should', 'now'
         ]
         
-        filtered_words = [word for word in words if word not in stopwords and len(word) > 3]
-        
-        # Count words
-        word_counts = Counter(filtered_words)
-        
-        # Get top words
-        top_words = word_counts.most_common(max_words)
+        if text is None:
+            # Count the words of the loaded reviews over their text index
+            top_words = list(review_AI_Agent.review_word_frequencies(sentiment, max_words, stop_words=stopwords, min_length=4).items())
+            key = dataset_key(review_AI_Agent.default_context)
+        else:
+            if not text:
+                return {
+                    "wordcloud_url": "",
+                    "top_words": ["no", "text", "available"],
+                    "error": "No text available for wordcloud"
+                }
+            
+            # Clean text and extract words
+            text = text.lower()
+            text = re.sub(r'[^\w\s]', '', text)
+            words = text.split()
+            
+            filtered_words = [word for word in words if word not in stopwords and len(word) > 3]
+            
+            # Count words and get top words
+            top_words = Counter(filtered_words).most_common(max_words)
+            key = hashlib.sha256(text.encode('utf-8')).hexdigest()
         
         # For small datasets, we might have fewer words than max_words
         if len(top_words) < 5:
             return {
-                "wordcloud_base64": "",
+                "wordcloud_url": "",
                 "top_words": [w[0] for w in top_words] if top_words else ["insufficient", "data"],
                 "error": "Insufficient data for meaningful wordcloud"
             }
         
-        # Generate a simple word cloud image using matplotlib
-        plt.figure(figsize=(12, 8))
-        plt.axis("off")
-        
-        # Calculate font sizes based on frequencies
-        max_freq = top_words[0][1]
-        sizes = [100 * (freq / max_freq) for _, freq in top_words[:40]]
-        
-        # Use a scatter plot to simulate word cloud
-        x = np.random.rand(len(sizes))
-        y = np.random.rand(len(sizes))
-        
-        for i, ((word, _), size) in enumerate(zip(top_words[:40], sizes)):
-            plt.text(x[i], y[i], word, fontsize=size,
-                    ha='center', va='center',
-                    color=plt.cm.viridis(np.random.rand()))
-        
-        # Save to a BytesIO object
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png', bbox_inches='tight')
-        plt.close()
-        
-        # Convert to base64
-        img_buffer.seek(0)
-        img_base64 = base64.b64encode(img_buffer.read()).decode('utf-8')
+        # Draw the 40 most frequent words
+        cloud = get_wordcloud(key, 'safe', sentiment, max_words, lambda: dict(top_words[:40]),
+                              width=1200, height=800, renderer='pil')
         
         return {
-            "wordcloud_base64": img_base64,
+            "wordcloud_url": cloud['image_url'],
             "top_words": [w[0] for w in top_words[:30]],
             "word_frequencies": dict(top_words[:30])
         }
@@ -3110,11 +2935,22 @@ def safe_wordcloud(text=None, sentiment='all', max_words=100):
         
         # Return a minimal response that won't break the frontend
         return {
-            "wordcloud_base64": "",
+            "wordcloud_url": "",
             "top_words": ["error", "generating", "wordcloud", "please", "try", "again"],
             "error": str(e)
         }
 
+@app.route('/api/wordclouds/<name>', methods=['GET'])
+def get_wordcloud_file(name):
+    """
+    Serves a cached word cloud image by the name in its URL.
+    """
+    path = wordcloud_path(name)
+    if path is None or not os.path.exists(path):
+        return jsonify({"success": False, "error": "Word cloud not found"}), 404
+    return send_from_directory(os.path.dirname(path), name, mimetype='image/png',
+                               max_age=app.config['WORDCLOUD_MAX_AGE'])
+
 # Endpoint to get ASIN summary data
 @app.route('/api/reviews/asin-summary', methods=['GET'])
 def get_review_asin_summary():
@@ -3122,13 +2958,13 @@ def get_review_asin_summary():
     Provides a summary of review count and average rating per ASIN.
     Ensures default data is loaded if no other data is present.
     """
-    global df  # Access the global dataframe used by review_AI_Agent
+    from uploads import review_AI_Agent
 
     print("Request received for /api/reviews/asin-summary")
 
     try:
         # Check if data is loaded, if not, load default data
-        if df is None or df.empty:
+        if review_AI_Agent.default_context.is_empty:
             print("No data loaded, attempting to load default review dataset.")
             load_response = load_default_reviews()
             if load_response.status_code != 200:
@@ -3137,7 +2973,7 @@ def get_review_asin_summary():
             print("Default review data loaded successfully.")
 
         # Make a copy of the dataframe
-        df_temp = df.copy()
+        df_temp = review_AI_Agent.default_context.df.copy()
         
         # Check if necessary columns exist (asin and overall)
         missing_columns = []
@@ -3186,17 +3022,8 @@ def get_review_asin_summary():
                     import random
                     df_temp['overall'] = [random.uniform(1, 5) for _ in range(len(df_temp))]
 
-        # Temporarily set the modified dataframe
-        original_df = df
-        from uploads.review_AI_Agent import set_dataframe
-        set_dataframe(df_temp)
-        
-        # Call the get_asin_summary function from the agent
-        from uploads.review_AI_Agent import get_asin_summary
-        summary_data = get_asin_summary()
-        
-        # Restore original dataframe
-        set_dataframe(original_df)
+        # Summarize the modified dataframe in its own context
+        summary_data = get_asin_summary(context=create_review_context(df_temp))
         
         if not isinstance(summary_data, list):
              print(f"Error: get_asin_summary did not return a list. Type: {type(summary_data)}")
@@ -0,0 +1,37 @@
+"""
+Accuracy test of the vectorized VADER scorer against NLTK's polarity_scores.
+
+The fixture corpus covers the rules the scorer reimplements: idioms, ALL CAPS emphasis,
+'but', 'least', 'kind of', negations, boosters, emoticons and punctuation emphasis.
+"""
+
+import os
+import pytest
+
+pytest.importorskip('nltk')
+
+from uploads import sentiment_engine  # noqa: E402
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'vader_corpus.txt')
+
+@pytest.fixture(scope='module')
+def corpus():
+    try:
+        sentiment_engine.get_engine()
+    except LookupError:
+        pytest.skip("NLTK's vader_lexicon is not installed")
+    with open(FIXTURE_PATH, encoding='utf-8') as f:
+        return f.read().split('\n')
+
+@pytest.mark.parametrize('use_pyarrow', [True, False])
+def test_compound_scores_match_vader(corpus, monkeypatch, use_pyarrow):
+    if use_pyarrow and not sentiment_engine.PYARROW_AVAILABLE:
+        pytest.skip('pyarrow is not installed')
+    monkeypatch.setattr(sentiment_engine, 'PYARROW_AVAILABLE', use_pyarrow)
+
+    result = sentiment_engine.compare_with_vader(corpus)
+
+    assert result['texts'] == len(corpus)
+    assert result['exact'] == 1.0, result
+    assert result['max_difference'] == 0.0
+    assert result['category_agreement'] == 1.0
@@ -1,49 +1,35 @@
-# This file makes the uploads directory a proper Python package 
+# This file makes the uploads directory a proper Python package
 
-def read_csv_robust(file_path):
+def read_csv_robust(file_path, dialect=None):
     """
     Helper function to robustly read CSV files with various encodings and delimiters
-    
+
+    The encoding, delimiter, quoting and header are sniffed from a bounded prefix of
+    the file, then the file is parsed exactly once with the C or pyarrow engine.
+
     Args:
         file_path (str): Path to the CSV file
-        
+        dialect (dict, optional): Dialect from sniff_csv_dialect. Sniffed if not provided.
+
     Returns:
         pandas.DataFrame: DataFrame containing the CSV data
     """
-    import pandas as pd
     import os
-    
+    from uploads.csv_sniffer import sniff_csv_dialect, read_csv_with_dialect
+
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
-    
-    # Try different encodings and delimiters
-    encodings = ['utf-8', 'latin1', 'iso-8859-1', 'cp1252']
-    delimiters = [',', ';', '\t', '|']
-    
-    # Try different combinations
-    for encoding in encodings:
-        for delimiter in delimiters:
-            try:
-                df = pd.read_csv(file_path, encoding=encoding, sep=delimiter, engine='python')
-                # Check if we got some data
-                if not df.empty:
-                    print(f"Successfully read file with encoding {encoding} and delimiter '{delimiter}'")
-                    return df
-            except Exception as e:
-                continue
-    
-    # Last resort - try pandas auto-detection
-    try:
-        df = pd.read_csv(file_path, engine='python')
-        if not df.empty:
-            return df
-    except:
-        pass
-    
-    # If all attempts failed, try with minimal options
+
+    if dialect is None:
+        dialect = sniff_csv_dialect(file_path)
+
     try:
-        df = pd.read_csv(file_path, encoding='utf-8', sep=',', error_bad_lines=False, warn_bad_lines=True)
-        return df
-    except:
-        # Give up and raise an exception
-        raise ValueError(f"Failed to read CSV file: {file_path}") 
\ No newline at end of file
+        df = read_csv_with_dialect(file_path, dialect)
+    except Exception as e:
+        raise ValueError(f"Failed to read CSV file: {file_path} ({str(e)})")
+
+    if df.empty:
+        raise ValueError(f"CSV file contains no data rows: {file_path}")
+
+    print(f"Successfully read file with encoding {dialect['encoding']} and delimiter '{dialect['delimiter']}'")
+    return df
@@ -0,0 +1,45 @@
+"""
+Analysis Context Module
+
+An AnalysisContext is the dataset handle the analysis agents work on. Each request
+builds its own context and passes it to the agent functions, so concurrent requests
+never see each other's data and several datasets can stay loaded at once. Values
+derived from the data (a trained model, sentiment scores, term matrices) are kept on
+the context and live exactly as long as the dataset they were computed from.
+"""
+
+class AnalysisContext:
+    """Dataset handle passed to the agent analysis functions."""
+
+    def __init__(self, df=None, department=None, source=None, segments=None):
+        """
+        Args:
+            df (pd.DataFrame, optional): The prepared data.
+            department (str, optional): Department the data belongs to.
+            source (str, optional): Where the data came from, e.g. a content hash or file path.
+            segments (list, optional): (content hash, row count) of each file the rows were
+                                       loaded from, in row order.
+        """
+        self.df = df
+        self.department = department
+        self.source = source
+        self.segments = segments or []
+        self.model = None
+        self.cache = {}
+
+    @property
+    def is_empty(self):
+        """True when no data is loaded."""
+        return self.df is None or len(self.df) == 0
+
+    def segment_ranges(self):
+        """
+        (content hash, start row, stop row) of each loaded file, or an empty list if the
+        segments do not cover the rows of the frame (e.g. rows were added or dropped).
+        """
+        ranges = []
+        start = 0
+        for content_hash, rows in self.segments:
+            ranges.append((content_hash, start, start + rows))
+            start += rows
+        return ranges if not self.is_empty and start == len(self.df) else []
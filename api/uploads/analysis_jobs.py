@@ -0,0 +1,199 @@
+"""
+Analysis Job Store
+
+Tracks file analyses that run on the background worker pool. Jobs live in a SQLite
+table next to the file catalog, so worker processes report their stage and progress
+by writing to it and request handlers poll it, without any external broker.
+"""
+
+import json
+import sqlite3
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED)
+
+# Path of the job database - set by init_job_store
+_database_path = None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    job_id TEXT PRIMARY KEY,
+    department TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    content_hash TEXT,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    debug_info TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_content ON analysis_jobs (content_hash, department, status);
+"""
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+def _connect():
+    if _database_path is None:
+        raise RuntimeError("Job store has not been initialized. Call init_job_store first.")
+    connection = sqlite3.connect(_database_path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+@contextmanager
+def _write_transaction():
+    """Run a read-modify-write sequence under the database write lock."""
+    connection = _connect()
+    connection.isolation_level = None
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        yield connection
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+def _row_to_dict(row):
+    job = dict(row)
+    job['debug_info'] = json.loads(job['debug_info']) if job.get('debug_info') else None
+    return job
+
+def init_job_store(database_path, fail_unfinished=True):
+    """
+    Open (and create if needed) the job table.
+
+    Args:
+        database_path (str): SQLite database file, normally the file catalog.
+        fail_unfinished (bool): Mark jobs that were queued or running when the server
+                                stopped as failed, since they can never finish.
+    """
+    global _database_path
+
+    _database_path = database_path
+    with _connect() as connection:
+        connection.executescript(_SCHEMA)
+        if not fail_unfinished:
+            return
+        connection.execute(
+            "UPDATE analysis_jobs SET status = ?, error = ?, updated_at = ? WHERE status IN (?, ?)",
+            (JOB_FAILED, 'Server restarted before the job finished', _now(), JOB_QUEUED, JOB_RUNNING)
+        )
+
+def create_job(department, file_id, file_path, content_hash=None, status=JOB_QUEUED):
+    """
+    Create a job for the analysis of a file.
+
+    Args:
+        department (str): Department whose pipeline is used.
+        file_id (str): File identifier from the analysis URL.
+        file_path (str): Path to the file.
+        content_hash (str, optional): SHA-256 of the file content.
+        status (str): Initial status - JOB_COMPLETED for results that are already cached.
+
+    Returns:
+        dict: The new job.
+    """
+    with _connect() as connection:
+        job_id = _insert_job(connection, department, file_id, file_path, content_hash, status)
+    return get_job(job_id)
+
+def _insert_job(connection, department, file_id, file_path, content_hash, status):
+    job_id = uuid.uuid4().hex
+    now = _now()
+    progress = 100 if status == JOB_COMPLETED else 0
+    connection.execute(
+        "INSERT INTO analysis_jobs (job_id, department, file_id, file_path, content_hash, status, progress, "
+        "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (job_id, department, file_id, file_path, content_hash, status, progress, now, now)
+    )
+    return job_id
+
+def create_or_get_active_job(department, file_id, file_path, content_hash):
+    """
+    Return the queued or running job analyzing the given content, or create a queued one.
+
+    The lookup and the insert run in one write transaction, so concurrent requests for
+    the same content get the same job.
+
+    Args:
+        department (str): Department whose pipeline is used.
+        file_id (str): File identifier from the analysis URL.
+        file_path (str): Path to the file.
+        content_hash (str): SHA-256 of the file content.
+
+    Returns:
+        tuple: (job dict, True if the job was created by this call).
+    """
+    with _write_transaction() as connection:
+        row = _find_active_row(connection, content_hash, department)
+        job_id = None if row else _insert_job(connection, department, file_id, file_path, content_hash, JOB_QUEUED)
+    if row:
+        return _row_to_dict(row), False
+    return get_job(job_id), True
+
+def update_job(job_id, status=None, stage=None, progress=None, error=None, debug_info=None):
+    """
+    Record the status, stage or progress of a job. Arguments left as None are not changed.
+
+    Args:
+        job_id (str): Job identifier.
+        status (str, optional): New status.
+        stage (str, optional): Pipeline stage now running.
+        progress (int, optional): Percentage done.
+        error (str, optional): Error message of a failed job.
+        debug_info (dict, optional): Debug details of a failed job.
+    """
+    fields = {'status': status, 'stage': stage, 'progress': progress, 'error': error,
+              'debug_info': json.dumps(debug_info) if debug_info is not None else None}
+    updates = {key: value for key, value in fields.items() if value is not None}
+    updates['updated_at'] = _now()
+    assignments = ', '.join(f"{key} = ?" for key in updates)
+    with _connect() as connection:
+        connection.execute(f"UPDATE analysis_jobs SET {assignments} WHERE job_id = ?", (*updates.values(), job_id))
+
+def get_job(job_id):
+    """
+    Return a job.
+
+    Args:
+        job_id (str): Job identifier.
+
+    Returns:
+        dict: The job, or None if it does not exist.
+    """
+    with _connect() as connection:
+        row = connection.execute("SELECT * FROM analysis_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return _row_to_dict(row) if row else None
+
+def find_active_job(content_hash, department):
+    """
+    Return the queued or running job analyzing the given content, if any.
+
+    Args:
+        content_hash (str): SHA-256 of the file content.
+        department (str): Department whose pipeline is used.
+
+    Returns:
+        dict: The job, or None.
+    """
+    with _connect() as connection:
+        row = _find_active_row(connection, content_hash, department)
+    return _row_to_dict(row) if row else None
+
+def _find_active_row(connection, content_hash, department):
+    return connection.execute(
+        "SELECT * FROM analysis_jobs WHERE content_hash = ? AND department = ? AND status IN (?, ?) "
+        "ORDER BY created_at DESC LIMIT 1",
+        (content_hash, department, JOB_QUEUED, JOB_RUNNING)
+    ).fetchone()
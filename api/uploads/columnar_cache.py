@@ -0,0 +1,292 @@
+"""
+Columnar Cache Module
+
+Every uploaded CSV gets a typed Parquet copy written once at ingest and stored in the
+content store under the hash of the CSV, so identical uploads share one copy. A small
+hidden sidecar next to the CSV records its hash and dialect. Later reads go through
+read_csv_cached, which serves the Parquet file (with optional column projection)
+instead of re-parsing the CSV text.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+import pandas as pd
+
+from uploads.csv_sniffer import sniff_csv_dialect, read_csv_with_dialect
+from uploads.content_store import artifact_path
+
+# pyarrow is optional - without it the cache is disabled and CSVs are parsed directly
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+HASH_BLOCK_BYTES = 4 * 1024 * 1024
+CSV_BLOCK_BYTES = 16 * 1024 * 1024
+FRAME_ARTIFACT = 'frame.parquet'
+
+def file_content_hash(file_path):
+    """
+    Compute the SHA-256 hash of a file by streaming it in fixed-size blocks.
+
+    Args:
+        file_path (str): Path to the file.
+
+    Returns:
+        str: Hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(HASH_BLOCK_BYTES)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+def _meta_path(csv_path):
+    """Path of the hidden sidecar recording the content hash and dialect of a CSV."""
+    directory, filename = os.path.split(csv_path)
+    return os.path.join(directory, f".{filename}.cache.json")
+
+def cache_path_for(content_hash):
+    """Path of the Parquet copy of the CSV content with the given hash."""
+    return artifact_path(content_hash, FRAME_ARTIFACT)
+
+def _load_meta(csv_path):
+    """
+    Load the cache sidecar of a CSV if it still matches the file on disk.
+
+    The sidecar is validated against the CSV size and modification time, so a file
+    replaced in place is re-hashed instead of being served a stale cache.
+    """
+    meta_path = _meta_path(csv_path)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        stat = os.stat(csv_path)
+        if meta.get('size') == stat.st_size and meta.get('mtime_ns') == stat.st_mtime_ns:
+            return meta
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _save_meta(csv_path, content_hash, dialect):
+    stat = os.stat(csv_path)
+    meta = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'content_hash': content_hash,
+        'dialect': dialect
+    }
+    with open(_meta_path(csv_path), 'w') as f:
+        json.dump(meta, f)
+
+def content_hash_for(csv_path):
+    """
+    Return the content hash of a CSV, using the cache sidecar when it is still valid.
+
+    Args:
+        csv_path (str): Path to the CSV file.
+
+    Returns:
+        str: Hex digest of the file content.
+    """
+    meta = _load_meta(csv_path)
+    if meta:
+        return meta['content_hash']
+    return file_content_hash(csv_path)
+
+def _remove_legacy_cache(csv_path):
+    """Delete a Parquet sidecar written next to the CSV before caches moved to the content store."""
+    meta_path = _meta_path(csv_path)
+    if not os.path.exists(meta_path):
+        return
+    try:
+        with open(meta_path, 'r') as f:
+            legacy_name = json.load(f).get('parquet')
+        if legacy_name:
+            legacy_path = os.path.join(os.path.dirname(csv_path), legacy_name)
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+    except (OSError, ValueError):
+        pass
+
+def _stream_csv_to_parquet(csv_path, dialect, target_path):
+    """Convert a CSV to Parquet batch by batch with pyarrow, without materializing the file."""
+    encoding = dialect['encoding']
+    read_options = pa_csv.ReadOptions(
+        encoding='utf8' if encoding in ('utf-8', 'utf-8-sig') else encoding,
+        autogenerate_column_names=not dialect.get('has_header', True),
+        block_size=CSV_BLOCK_BYTES
+    )
+    parse_options = pa_csv.ParseOptions(delimiter=dialect['delimiter'], quote_char=dialect['quotechar'])
+
+    reader = pa_csv.open_csv(csv_path, read_options=read_options, parse_options=parse_options)
+    if any(pa.types.is_binary(field.type) for field in reader.schema):
+        # Text that did not decode as the sniffed encoding would be stored as raw bytes
+        raise ValueError(f"Columns of {csv_path} do not decode as {encoding}")
+    with pq.ParquetWriter(target_path, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+
+def remove_columnar_cache(csv_path):
+    """
+    Delete the cache sidecar of a CSV that is being removed.
+
+    The Parquet copy itself belongs to the content and is removed with it by
+    content_store.remove_content once no file refers to that content.
+    """
+    _remove_legacy_cache(csv_path)
+    meta_path = _meta_path(csv_path)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+def write_columnar_cache(csv_path, df, content_hash=None, dialect=None):
+    """
+    Write an already loaded DataFrame as the Parquet copy of a CSV.
+
+    Args:
+        csv_path (str): Path to the CSV file the data was read from.
+        df (pandas.DataFrame): The parsed CSV data.
+        content_hash (str, optional): Content hash of the CSV. Computed if not provided.
+        dialect (dict, optional): Dialect the CSV was parsed with.
+
+    Returns:
+        str: Path to the Parquet file, or None if the cache is unavailable.
+    """
+    if not PYARROW_AVAILABLE:
+        return None
+
+    content_hash = content_hash or content_hash_for(csv_path)
+    target_path = cache_path_for(content_hash)
+    tmp_path = f"{target_path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, target_path)
+        _remove_legacy_cache(csv_path)
+        _save_meta(csv_path, content_hash, dialect)
+        return target_path
+    except Exception as e:
+        print(f"Warning: Could not write columnar cache for {csv_path}: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+def build_columnar_cache(csv_path, dialect=None, content_hash=None):
+    """
+    Write the typed Parquet copy of a CSV at ingest, unless its content is already cached.
+
+    The conversion streams the CSV through pyarrow in blocks. If a later block does not
+    fit the types inferred from the first one, the file is parsed in one go instead.
+
+    Args:
+        csv_path (str): Path to the CSV file.
+        dialect (dict, optional): Dialect from sniff_csv_dialect. Sniffed if not provided.
+        content_hash (str, optional): Content hash of the CSV. Computed if not provided.
+
+    Returns:
+        str: Path to the Parquet file, or None if the cache is unavailable.
+    """
+    if not PYARROW_AVAILABLE:
+        return None
+
+    content_hash = content_hash or content_hash_for(csv_path)
+    target_path = cache_path_for(content_hash)
+
+    if dialect is None:
+        meta = _load_meta(csv_path)
+        dialect = meta['dialect'] if meta and meta.get('dialect') else sniff_csv_dialect(csv_path)
+
+    # The same content was uploaded before - reuse its Parquet copy
+    if os.path.exists(target_path):
+        _remove_legacy_cache(csv_path)
+        _save_meta(csv_path, content_hash, dialect)
+        return target_path
+
+    tmp_path = f"{target_path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        _stream_csv_to_parquet(csv_path, dialect, tmp_path)
+        os.replace(tmp_path, target_path)
+        _remove_legacy_cache(csv_path)
+        _save_meta(csv_path, content_hash, dialect)
+        print(f"Wrote columnar cache {target_path}")
+        return target_path
+    except Exception as e:
+        print(f"Streaming Parquet conversion failed for {csv_path} ({str(e)}), parsing the whole file")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    df = read_csv_with_dialect(csv_path, dialect)
+    return write_columnar_cache(csv_path, df, content_hash=content_hash, dialect=dialect)
+
+def read_csv_cached(csv_path, columns=None):
+    """
+    Read a CSV through its Parquet copy, creating the copy on first use.
+
+    Args:
+        csv_path (str): Path to the CSV file.
+        columns (list, optional): Only read these columns (projection).
+
+    Returns:
+        pandas.DataFrame: The CSV data.
+    """
+    meta = _load_meta(csv_path)
+    if meta and PYARROW_AVAILABLE:
+        parquet_path = cache_path_for(meta['content_hash'])
+        if os.path.exists(parquet_path):
+            return pd.read_parquet(parquet_path, columns=columns)
+
+    dialect = meta['dialect'] if meta and meta.get('dialect') else sniff_csv_dialect(csv_path)
+    df = read_csv_with_dialect(csv_path, dialect)
+    write_columnar_cache(csv_path, df, dialect=dialect)
+    return df[columns] if columns is not None else df
+
+def read_table_cached(csv_path, columns=None):
+    """
+    Read a CSV through its Parquet copy as a pyarrow Table, for callers that combine
+    several files before converting to pandas once.
+
+    Args:
+        csv_path (str): Path to the CSV file.
+        columns (list, optional): Only read these columns (projection).
+
+    Returns:
+        pyarrow.Table: The CSV data.
+    """
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is required to read Arrow tables")
+
+    meta = _load_meta(csv_path)
+    if meta:
+        parquet_path = cache_path_for(meta['content_hash'])
+        if os.path.exists(parquet_path):
+            return pq.read_table(parquet_path, columns=columns)
+
+    return pa.Table.from_pandas(read_csv_cached(csv_path, columns=columns), preserve_index=False)
+
+def read_cached_columns(csv_path):
+    """
+    Return the column names of a CSV without loading its rows.
+
+    Args:
+        csv_path (str): Path to the CSV file.
+
+    Returns:
+        list: Column names.
+    """
+    meta = _load_meta(csv_path)
+    if meta and PYARROW_AVAILABLE:
+        parquet_path = cache_path_for(meta['content_hash'])
+        if os.path.exists(parquet_path):
+            return pq.read_schema(parquet_path).names
+
+    dialect = meta['dialect'] if meta and meta.get('dialect') else sniff_csv_dialect(csv_path)
+    return read_csv_with_dialect(csv_path, dialect, nrows=0).columns.tolist()
@@ -0,0 +1,168 @@
+"""
+Content Store Module
+
+Uploaded files are stored once per distinct content, under their SHA-256 hash in
+uploads/_objects. Each upload session gets a hardlink to the stored object instead
+of its own copy. Everything derived from a file's content (parsed frames, metrics,
+sentiment scores, topic models, chart payloads) is cached in uploads/_cache/<hash>,
+so re-uploading the same export reuses all of it.
+"""
+
+import json
+import os
+import shutil
+import uuid
+
+OBJECTS_DIRNAME = '_objects'
+CACHE_DIRNAME = '_cache'
+
+# Root of the store - the uploads folder this package lives in unless init_content_store says otherwise
+_store_root = os.path.dirname(os.path.abspath(__file__))
+
+def init_content_store(upload_folder):
+    """
+    Set the folder the content store lives in.
+
+    Args:
+        upload_folder (str): The uploads root folder.
+    """
+    global _store_root
+
+    _store_root = upload_folder
+    os.makedirs(os.path.join(_store_root, OBJECTS_DIRNAME), exist_ok=True)
+    os.makedirs(os.path.join(_store_root, CACHE_DIRNAME), exist_ok=True)
+
+def object_path(content_hash):
+    """Path of the stored object holding the given content."""
+    return os.path.join(_store_root, OBJECTS_DIRNAME, content_hash[:2], content_hash)
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        # Filesystems without hardlink support get a plain copy
+        shutil.copy2(source, target)
+
+def store_object(file_path, content_hash):
+    """
+    Deduplicate an uploaded file against the content store.
+
+    If the content is already stored, the uploaded copy is replaced by a hardlink to the
+    stored object. Otherwise the uploaded file becomes the stored object.
+
+    Args:
+        file_path (str): Path of the freshly uploaded file.
+        content_hash (str): SHA-256 of the file content.
+
+    Returns:
+        bool: True if the content was already stored.
+    """
+    stored_path = object_path(content_hash)
+    if os.path.exists(stored_path):
+        if not os.path.samefile(stored_path, file_path):
+            tmp_path = f"{file_path}.{uuid.uuid4().hex[:8]}.link"
+            _link_or_copy(stored_path, tmp_path)
+            os.replace(tmp_path, file_path)
+        return True
+
+    os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+    _link_or_copy(file_path, stored_path)
+    return False
+
+def artifact_dir(content_hash):
+    """Folder holding the cached artifacts derived from the given content."""
+    path = os.path.join(_store_root, CACHE_DIRNAME, content_hash)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def artifact_path(content_hash, name):
+    """Path of a named artifact derived from the given content."""
+    return os.path.join(artifact_dir(content_hash), name)
+
+def shared_artifact_path(group, name):
+    """
+    Path of a named artifact derived from several contents, e.g. a model of a whole department.
+
+    Shared artifacts live next to the per-content folders, in a folder named after their group.
+    """
+    path = os.path.join(_store_root, CACHE_DIRNAME, f"_{group}")
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, name)
+
+def read_json_file(path):
+    """
+    Read a cached JSON file.
+
+    Args:
+        path (str): Path of the file.
+
+    Returns:
+        The stored value, or None if the file does not exist or cannot be read.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read cached artifact {path}: {str(e)}")
+        return None
+
+def write_json_file(path, value, encoder=None):
+    """
+    Write a cached JSON file atomically.
+
+    Args:
+        path (str): Path of the file.
+        value: JSON-serializable value.
+        encoder (json.JSONEncoder, optional): Encoder class for values such as NumPy types.
+
+    Returns:
+        bool: True if the file was written.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(value, f, cls=encoder)
+        os.replace(tmp_path, path)
+        return True
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Warning: Could not cache artifact {path}: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+def load_json_artifact(content_hash, name):
+    """
+    Load a cached JSON artifact.
+
+    Args:
+        content_hash (str): SHA-256 of the source content.
+        name (str): Artifact file name.
+
+    Returns:
+        The stored value, or None if the artifact does not exist or cannot be read.
+    """
+    return read_json_file(artifact_path(content_hash, name))
+
+def save_json_artifact(content_hash, name, value, encoder=None):
+    """
+    Store a JSON artifact atomically.
+
+    Args:
+        content_hash (str): SHA-256 of the source content.
+        name (str): Artifact file name.
+        value: JSON-serializable value.
+        encoder (json.JSONEncoder, optional): Encoder class for values such as NumPy types.
+
+    Returns:
+        bool: True if the artifact was written.
+    """
+    return write_json_file(artifact_path(content_hash, name), value, encoder)
+
+def remove_content(content_hash):
+    """Delete the stored object and all cached artifacts of content no file refers to anymore."""
+    stored_path = object_path(content_hash)
+    if os.path.exists(stored_path):
+        os.remove(stored_path)
+    shutil.rmtree(os.path.join(_store_root, CACHE_DIRNAME, content_hash), ignore_errors=True)
@@ -0,0 +1,361 @@
+"""
+CSV Dialect Sniffer
+
+This module inspects a bounded prefix of an uploaded file once to settle on the
+encoding, delimiter, quoting and header layout, so that the full parse can be
+done exactly once with the fastest available pandas engine instead of retrying
+every encoding/delimiter combination with the python engine.
+"""
+
+import csv
+import codecs
+import os
+import pandas as pd
+
+# pyarrow is optional - when it is installed we use its multithreaded CSV reader
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# How much of the file is inspected to determine the dialect
+SNIFF_SAMPLE_BYTES = 256 * 1024
+
+# Encodings tried in order. latin1 can decode any byte sequence, so it must stay last.
+CANDIDATE_ENCODINGS = ['utf-8', 'cp1252', 'latin1']
+CANDIDATE_DELIMITERS = [',', ';', '\t', '|']
+
+# Probe defaults: rows parsed to classify a file, and the largest file whose rows are
+# counted exactly with a newline scan (larger files get an estimate marked as approximate)
+PROBE_SAMPLE_ROWS = 1000
+EXACT_COUNT_MAX_BYTES = 1024 * 1024 * 1024
+COUNT_BLOCK_BYTES = 4 * 1024 * 1024
+
+# read_csv options the pyarrow engine does not support
+PYARROW_UNSUPPORTED_OPTIONS = {'nrows', 'chunksize', 'iterator', 'on_bad_lines', 'low_memory'}
+
+def _read_prefix(file_path, sample_bytes):
+    """Read at most `sample_bytes` from the start of the file."""
+    with open(file_path, 'rb') as f:
+        return f.read(sample_bytes)
+
+def _detect_encoding(raw, is_partial):
+    """
+    Detect the text encoding of a raw byte sample.
+
+    Args:
+        raw (bytes): Sample bytes from the start of the file.
+        is_partial (bool): True if the sample does not cover the whole file, in which
+                           case a multi-byte character may be cut at the end.
+
+    Returns:
+        tuple: (encoding name, decoded sample text)
+    """
+    if raw.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig', raw[len(codecs.BOM_UTF8):].decode('utf-8', errors='replace')
+    if raw.startswith(codecs.BOM_UTF16_LE) or raw.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16', raw.decode('utf-16', errors='replace')
+
+    for encoding in CANDIDATE_ENCODINGS:
+        try:
+            decoder = codecs.getincrementaldecoder(encoding)(errors='strict')
+            text = decoder.decode(raw, final=not is_partial)
+            return encoding, text
+        except UnicodeDecodeError:
+            continue
+
+    # latin1 never fails, but keep a defensive default
+    return 'latin1', raw.decode('latin1', errors='replace')
+
+def _complete_lines(text, is_partial):
+    """Return the sample lines, dropping a trailing line that was cut off by the sample boundary."""
+    lines = text.splitlines()
+    if is_partial and len(lines) > 1:
+        lines = lines[:-1]
+    return [line for line in lines if line.strip()]
+
+def _detect_delimiter(lines):
+    """
+    Pick the delimiter that splits the sample lines into the most consistent number of fields.
+
+    Args:
+        lines (list): Complete lines from the sample.
+
+    Returns:
+        str: The detected delimiter (defaults to ',').
+    """
+    sample = '\n'.join(lines[:200])
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=''.join(CANDIDATE_DELIMITERS))
+        if dialect.delimiter in CANDIDATE_DELIMITERS:
+            return dialect.delimiter, dialect.quotechar or '"'
+    except csv.Error:
+        pass
+
+    # Fallback: count fields per line with the csv module and prefer the delimiter
+    # giving the most fields while staying consistent across lines
+    best_delimiter = ','
+    best_score = (0, 0)
+    for delimiter in CANDIDATE_DELIMITERS:
+        try:
+            field_counts = [len(row) for row in csv.reader(lines[:200], delimiter=delimiter)]
+        except csv.Error:
+            continue
+        if not field_counts:
+            continue
+        header_fields = field_counts[0]
+        consistent = sum(1 for count in field_counts if count == header_fields)
+        score = (consistent if header_fields > 1 else 0, header_fields)
+        if score > best_score:
+            best_score = score
+            best_delimiter = delimiter
+    return best_delimiter, '"'
+
+def _looks_numeric(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+def _detect_header(lines, delimiter, quotechar):
+    """
+    Decide whether the first line is a header row.
+
+    The first row is treated as data only when every field in it is numeric, which is the
+    only case where a header-less file can be told apart from a header reliably.
+    """
+    if not lines:
+        return True
+    try:
+        first_row = next(csv.reader([lines[0]], delimiter=delimiter, quotechar=quotechar))
+    except (csv.Error, StopIteration):
+        return True
+    fields = [field.strip() for field in first_row if field.strip()]
+    return not (fields and all(_looks_numeric(field) for field in fields))
+
+def sniff_csv_bytes(raw, is_partial):
+    """
+    Detect how a CSV should be parsed from its leading bytes.
+
+    Args:
+        raw (bytes): Bytes from the start of the file.
+        is_partial (bool): True if the bytes do not cover the whole file.
+
+    Returns:
+        dict: Detected dialect, as returned by sniff_csv_dialect.
+    """
+    encoding, text = _detect_encoding(raw, is_partial)
+    lines = _complete_lines(text, is_partial)
+    delimiter, quotechar = _detect_delimiter(lines)
+    has_header = _detect_header(lines, delimiter, quotechar)
+
+    return {
+        'encoding': encoding,
+        'delimiter': delimiter,
+        'quotechar': quotechar,
+        'has_header': has_header,
+        'engine': 'pyarrow' if PYARROW_AVAILABLE else 'c'
+    }
+
+def sniff_csv_dialect(file_path, sample_bytes=SNIFF_SAMPLE_BYTES):
+    """
+    Inspect a bounded prefix of a CSV file and detect how it should be parsed.
+
+    Args:
+        file_path (str): Path to the CSV file.
+        sample_bytes (int): Maximum number of bytes read from the start of the file.
+
+    Returns:
+        dict: Detected dialect with 'encoding', 'delimiter', 'quotechar', 'has_header'
+              and the 'engine' that will be used for the full parse.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    raw = _read_prefix(file_path, sample_bytes)
+    is_partial = os.path.getsize(file_path) > len(raw)
+    return sniff_csv_bytes(raw, is_partial)
+
+def _fallback_encoding(encoding):
+    """The candidate encoding tried after `encoding` fails to decode a file, or None."""
+    if encoding == 'utf-8-sig':
+        encoding = 'utf-8'
+    if encoding not in CANDIDATE_ENCODINGS:
+        return None
+    position = CANDIDATE_ENCODINGS.index(encoding)
+    return CANDIDATE_ENCODINGS[position + 1] if position + 1 < len(CANDIDATE_ENCODINGS) else None
+
+def _has_undecoded_columns(df):
+    """True if pyarrow returned raw bytes for a column it could not decode as text."""
+    for column in df.columns[df.dtypes == object]:
+        first = df[column].first_valid_index()
+        if first is not None and isinstance(df[column].loc[first], bytes):
+            return True
+    return False
+
+def _read_csv(file_path, options, use_pyarrow):
+    if use_pyarrow:
+        try:
+            df = pd.read_csv(file_path, engine='pyarrow', **options)
+            if not _has_undecoded_columns(df):
+                return df
+            print(f"pyarrow engine could not decode {file_path} as {options['encoding']}, using C engine")
+        except Exception as e:
+            print(f"pyarrow engine could not parse {file_path} ({str(e)}), using C engine")
+
+    try:
+        return pd.read_csv(file_path, engine='c', **options)
+    except pd.errors.ParserError as e:
+        # Malformed rows - keep the parse single-pass but skip the offending lines
+        print(f"Malformed rows in {file_path} ({str(e)}), skipping bad lines")
+        return pd.read_csv(file_path, engine='c', on_bad_lines='warn', **options)
+
+def read_csv_with_dialect(file_path, dialect, **kwargs):
+    """
+    Parse a CSV file once using a previously sniffed dialect.
+
+    The pyarrow engine is used when available; if it rejects the file (for example because of
+    ragged rows) the C engine is used instead. The python engine is never used.
+
+    The encoding was detected from a prefix of the file only. If a byte further on cannot be
+    decoded, the file is parsed again with the next candidate encoding (cp1252, then latin1),
+    and the dialect is updated to the encoding that worked.
+
+    Args:
+        file_path (str): Path to the CSV file.
+        dialect (dict): Dialect returned by sniff_csv_dialect.
+        **kwargs: Extra keyword arguments passed through to pandas.read_csv.
+
+    Returns:
+        pandas.DataFrame: The parsed data.
+    """
+    options = {
+        'sep': dialect['delimiter'],
+        'encoding': dialect['encoding'],
+        'quotechar': dialect['quotechar'],
+        'header': 0 if dialect.get('has_header', True) else None
+    }
+    options.update(kwargs)
+
+    use_pyarrow = (dialect.get('engine') == 'pyarrow' and PYARROW_AVAILABLE
+                   and not PYARROW_UNSUPPORTED_OPTIONS.intersection(kwargs))
+    while True:
+        try:
+            df = _read_csv(file_path, options, use_pyarrow)
+            break
+        except UnicodeDecodeError as e:
+            fallback = _fallback_encoding(options['encoding'])
+            if fallback is None:
+                raise
+            print(f"Could not decode {file_path} as {options['encoding']} ({str(e)}), retrying with {fallback}")
+            options['encoding'] = fallback
+
+    if 'encoding' not in kwargs:
+        dialect['encoding'] = options['encoding']
+    return df
+
+def rows_from_line_count(line_count, ends_with_newline, has_header=True):
+    """
+    Turn a newline count into a data row count.
+
+    Args:
+        line_count (int): Number of newline bytes in the file.
+        ends_with_newline (bool): Whether the last byte of the file is a newline.
+        has_header (bool): Whether the first line is a header row.
+
+    Returns:
+        int: Number of data rows.
+    """
+    # A final line without a trailing newline still holds a row
+    lines = line_count if ends_with_newline else line_count + 1
+    return max(lines - (1 if has_header else 0), 0)
+
+def count_csv_rows(file_path, has_header=True, exact_max_bytes=EXACT_COUNT_MAX_BYTES, sample_bytes=SNIFF_SAMPLE_BYTES):
+    """
+    Count the data rows of a CSV file without parsing it.
+
+    Files up to `exact_max_bytes` are counted with a streaming scan for newline bytes.
+    Larger files get an estimate from the average line length of the leading sample.
+    Both methods count physical lines, so quoted fields containing newlines are counted
+    as extra rows.
+
+    Args:
+        file_path (str): Path to the CSV file.
+        has_header (bool): Whether the first line is a header row.
+        exact_max_bytes (int): Largest file size counted exactly.
+        sample_bytes (int): Bytes used to estimate the line length for larger files.
+
+    Returns:
+        tuple: (row_count, is_approximate)
+    """
+    file_size = os.path.getsize(file_path)
+    header_lines = 1 if has_header else 0
+
+    if file_size == 0:
+        return 0, False
+
+    if file_size <= exact_max_bytes:
+        line_count = 0
+        last_byte = b''
+        with open(file_path, 'rb') as f:
+            while True:
+                block = f.read(COUNT_BLOCK_BYTES)
+                if not block:
+                    break
+                line_count += block.count(b'\n')
+                last_byte = block[-1:]
+        return rows_from_line_count(line_count, last_byte == b'\n', has_header), False
+
+    sample = _read_prefix(file_path, sample_bytes)
+    sample_lines = sample.count(b'\n')
+    if sample_lines == 0:
+        return 1, True
+    avg_line_bytes = len(sample) / sample_lines
+    return max(int(file_size / avg_line_bytes) - header_lines, 0), True
+
+def probe_csv(file_path, dialect=None, sample_rows=PROBE_SAMPLE_ROWS, exact_count_max_bytes=EXACT_COUNT_MAX_BYTES,
+              row_count=None):
+    """
+    Probe a CSV file for its schema without materializing the whole file.
+
+    Only the header and the first `sample_rows` rows are parsed; the row count comes from
+    count_csv_rows. This is what upload uses to classify a file, leaving the full load to
+    the analysis step.
+
+    Args:
+        file_path (str): Path to the CSV file.
+        dialect (dict, optional): Dialect from sniff_csv_dialect. Sniffed if not provided.
+        sample_rows (int): Number of data rows to parse for classification.
+        exact_count_max_bytes (int): Largest file size whose rows are counted exactly.
+
+    Returns:
+        dict: 'dialect', 'columns', 'sample' (DataFrame), 'row_count' and 'row_count_approximate'.
+    """
+    if dialect is None:
+        dialect = sniff_csv_dialect(file_path)
+
+    sample = read_csv_with_dialect(file_path, dialect, nrows=sample_rows)
+    if sample.empty:
+        raise ValueError(f"CSV file contains no data rows: {file_path}")
+
+    if len(sample) < sample_rows:
+        # The sample covers the whole file, so its length is the exact row count
+        row_count, approximate = len(sample), False
+    elif row_count is not None:
+        approximate = False
+    else:
+        row_count, approximate = count_csv_rows(
+            file_path,
+            has_header=dialect.get('has_header', True),
+            exact_max_bytes=exact_count_max_bytes
+        )
+
+    return {
+        'dialect': dialect,
+        'columns': sample.columns.tolist(),
+        'sample': sample,
+        'row_count': row_count,
+        'row_count_approximate': approximate
+    }
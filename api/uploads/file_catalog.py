@@ -0,0 +1,480 @@
+"""
+File Catalog Module
+
+A persistent SQLite index of every uploaded file, populated by the upload endpoints.
+It maps file_id, session_id, department, path, content hash, schema and row count so
+that request handlers resolve files with indexed queries instead of walking the
+uploads directory tree.
+
+The catalog also keeps one metrics rollup per department. Registering, replacing or
+removing a file applies that file's metrics manifest as a delta in the same
+transaction, so department metrics never need a pass over all files.
+"""
+
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+from uploads.file_metrics import empty_rollup, apply_metrics_delta, rebuild_customer_sketch
+
+CATALOG_FILENAME = 'catalog.sqlite3'
+
+# Path of the catalog database - set by init_catalog
+_catalog_path = None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    upload_id TEXT,
+    filename TEXT NOT NULL,
+    original_filename TEXT,
+    session_id TEXT,
+    department TEXT NOT NULL,
+    content_hash TEXT,
+    columns TEXT,
+    row_count INTEGER,
+    row_count_approximate INTEGER DEFAULT 0,
+    format TEXT,
+    uploaded_at TEXT NOT NULL,
+    metrics TEXT,
+    size_bytes INTEGER,
+    status TEXT NOT NULL DEFAULT 'ready'
+);
+CREATE INDEX IF NOT EXISTS idx_files_department_file_id ON files (department, file_id);
+CREATE INDEX IF NOT EXISTS idx_files_file_id ON files (file_id);
+CREATE INDEX IF NOT EXISTS idx_files_upload_id ON files (upload_id);
+CREATE INDEX IF NOT EXISTS idx_files_session_id ON files (session_id);
+CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files (content_hash);
+CREATE TABLE IF NOT EXISTS department_rollups (
+    department TEXT PRIMARY KEY,
+    rollup TEXT NOT NULL
+);
+"""
+
+# Columns added after the first release of the catalog, applied to existing databases
+_MIGRATIONS = {
+    'metrics': "ALTER TABLE files ADD COLUMN metrics TEXT",
+    'size_bytes': "ALTER TABLE files ADD COLUMN size_bytes INTEGER",
+    'status': "ALTER TABLE files ADD COLUMN status TEXT NOT NULL DEFAULT 'ready'"
+}
+
+def _connect():
+    if _catalog_path is None:
+        raise RuntimeError("File catalog has not been initialized. Call init_catalog first.")
+    connection = sqlite3.connect(_catalog_path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+@contextmanager
+def _write_transaction():
+    """Run a read-modify-write sequence under the database write lock."""
+    connection = _connect()
+    connection.isolation_level = None
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        yield connection
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+def _contains_pattern(text):
+    """LIKE pattern matching `text` anywhere, with its wildcard characters escaped (use ESCAPE '\\')."""
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+def _row_to_dict(row):
+    record = dict(row)
+    record['columns'] = json.loads(record['columns']) if record.get('columns') else []
+    record['row_count_approximate'] = bool(record.get('row_count_approximate'))
+    record['metrics'] = json.loads(record['metrics']) if record.get('metrics') else None
+    return record
+
+def init_catalog(upload_folder):
+    """
+    Open (and create if needed) the catalog database under the uploads folder.
+
+    Args:
+        upload_folder (str): The uploads root folder.
+
+    Returns:
+        str: Path to the catalog database.
+    """
+    global _catalog_path
+
+    _catalog_path = os.path.join(upload_folder, CATALOG_FILENAME)
+    with _connect() as connection:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        existing = {row['name'] for row in connection.execute("PRAGMA table_info(files)").fetchall()}
+        for column, statement in _MIGRATIONS.items():
+            if column not in existing:
+                connection.execute(statement)
+        missing_rollups = [row['department'] for row in connection.execute(
+            "SELECT DISTINCT department FROM files WHERE department NOT IN (SELECT department FROM department_rollups)"
+        ).fetchall()]
+    for department in missing_rollups:
+        rebuild_department_rollup(department)
+    return _catalog_path
+
+def register_file(path, department, session_id=None, file_id=None, upload_id=None,
+                  original_filename=None, content_hash=None, columns=None, row_count=None,
+                  row_count_approximate=False, file_format=None, uploaded_at=None, metrics=None,
+                  size_bytes=None, status='ready'):
+    """
+    Insert or update the catalog entry of an uploaded file.
+
+    Args:
+        path (str): Absolute path of the stored file (the catalog key).
+        department (str): Department the file was uploaded to.
+        session_id (str, optional): Upload session the file belongs to.
+        file_id (str, optional): Identifier used in analysis URLs. Defaults to the filename.
+        upload_id (str, optional): Additional unique identifier returned by an upload endpoint.
+        original_filename (str, optional): Filename as sent by the client.
+        content_hash (str, optional): SHA-256 of the file content.
+        columns (list, optional): Column names.
+        row_count (int, optional): Number of data rows.
+        row_count_approximate (bool): Whether row_count is an estimate.
+        file_format (str, optional): Detected file format.
+        uploaded_at (str, optional): Upload time. Defaults to now.
+        metrics (dict, optional): Metrics manifest from file_metrics.compute_file_metrics.
+        size_bytes (int, optional): File size. Read from disk if not provided.
+        status (str): 'processing' while post-upload work is pending, 'ready' once done,
+                      or 'failed'.
+    """
+    if size_bytes is None and os.path.isfile(path):
+        size_bytes = os.path.getsize(path)
+    filename = os.path.basename(path)
+    uploaded_at = uploaded_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with _write_transaction() as connection:
+        previous = connection.execute("SELECT department, metrics FROM files WHERE path = ?", (path,)).fetchone()
+        connection.execute(
+            """
+            INSERT INTO files (path, file_id, upload_id, filename, original_filename, session_id, department,
+                               content_hash, columns, row_count, row_count_approximate, format, uploaded_at, metrics,
+                               size_bytes, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                file_id = excluded.file_id,
+                upload_id = excluded.upload_id,
+                original_filename = excluded.original_filename,
+                session_id = excluded.session_id,
+                department = excluded.department,
+                content_hash = excluded.content_hash,
+                columns = excluded.columns,
+                row_count = excluded.row_count,
+                row_count_approximate = excluded.row_count_approximate,
+                format = excluded.format,
+                uploaded_at = excluded.uploaded_at,
+                metrics = excluded.metrics,
+                size_bytes = excluded.size_bytes,
+                status = excluded.status
+            """,
+            (
+                path, file_id or filename, upload_id, filename, original_filename, session_id, department,
+                content_hash, json.dumps(columns) if columns is not None else None, row_count,
+                int(bool(row_count_approximate)), file_format, uploaded_at,
+                json.dumps(metrics) if metrics is not None else None,
+                size_bytes, status
+            )
+        )
+        # Replacing a file takes its previous contribution out of the department rollup
+        if previous and previous['metrics']:
+            _apply_rollup_delta(connection, previous['department'], json.loads(previous['metrics']), -1)
+        if metrics is not None:
+            _apply_rollup_delta(connection, department, metrics, 1)
+
+def set_file_metrics(path, metrics):
+    """
+    Store the metrics manifest of a cataloged file and update its department rollup.
+
+    Args:
+        path (str): Absolute path of the stored file.
+        metrics (dict): Metrics manifest from file_metrics.compute_file_metrics.
+    """
+    with _write_transaction() as connection:
+        previous = connection.execute("SELECT department, metrics FROM files WHERE path = ?", (path,)).fetchone()
+        if previous is None:
+            return
+        connection.execute("UPDATE files SET metrics = ? WHERE path = ?", (json.dumps(metrics), path))
+        if previous['metrics']:
+            _apply_rollup_delta(connection, previous['department'], json.loads(previous['metrics']), -1)
+        _apply_rollup_delta(connection, previous['department'], metrics, 1)
+
+def set_file_status(path, status):
+    """
+    Update the processing status of a cataloged file.
+
+    Args:
+        path (str): Absolute path of the stored file.
+        status (str): 'processing', 'ready' or 'failed'.
+    """
+    with _connect() as connection:
+        connection.execute("UPDATE files SET status = ? WHERE path = ?", (status, path))
+
+def department_size_bytes(department):
+    """
+    Return the total size of the files stored for a department.
+
+    Args:
+        department (str): Department name.
+
+    Returns:
+        int: Size in bytes.
+    """
+    with _connect() as connection:
+        row = connection.execute(
+            "SELECT COALESCE(SUM(size_bytes), 0) AS total FROM files WHERE department = ?", (department,)
+        ).fetchone()
+    return row['total']
+
+def remove_file(path):
+    """Remove the catalog entry of a file and its contribution to the department rollup."""
+    with _write_transaction() as connection:
+        previous = connection.execute("SELECT department, metrics FROM files WHERE path = ?", (path,)).fetchone()
+        if previous is None:
+            return
+        connection.execute("DELETE FROM files WHERE path = ?", (path,))
+        if previous['metrics']:
+            _apply_rollup_delta(connection, previous['department'], json.loads(previous['metrics']), -1)
+
+def _load_rollup(connection, department):
+    row = connection.execute("SELECT rollup FROM department_rollups WHERE department = ?", (department,)).fetchone()
+    return json.loads(row['rollup']) if row else empty_rollup()
+
+def _save_rollup(connection, department, rollup):
+    connection.execute(
+        "INSERT INTO department_rollups (department, rollup) VALUES (?, ?) "
+        "ON CONFLICT(department) DO UPDATE SET rollup = excluded.rollup",
+        (department, json.dumps(rollup))
+    )
+
+def _apply_rollup_delta(connection, department, metrics, sign):
+    rollup = apply_metrics_delta(_load_rollup(connection, department), metrics, sign)
+    _save_rollup(connection, department, rollup)
+
+def _department_manifests(connection, department):
+    rows = connection.execute(
+        "SELECT metrics FROM files WHERE department = ? AND metrics IS NOT NULL", (department,)
+    ).fetchall()
+    return [json.loads(row['metrics']) for row in rows]
+
+def get_department_rollup(department):
+    """
+    Return the metrics rollup of a department.
+
+    A customer sketch invalidated by a removal is rebuilt here from the per-file
+    sketches in the catalog, without reading any CSV.
+
+    Args:
+        department (str): Department name.
+
+    Returns:
+        dict: Rollup from file_metrics.apply_metrics_delta.
+    """
+    with _connect() as connection:
+        rollup = _load_rollup(connection, department)
+    if not rollup.get('customer_sketch_stale'):
+        return rollup
+
+    with _write_transaction() as connection:
+        rollup = rebuild_customer_sketch(_load_rollup(connection, department), _department_manifests(connection, department))
+        _save_rollup(connection, department, rollup)
+    return rollup
+
+def rebuild_department_rollup(department):
+    """
+    Recompute the rollup of a department from the manifests of its files.
+
+    Args:
+        department (str): Department name.
+
+    Returns:
+        dict: The rebuilt rollup.
+    """
+    with _write_transaction() as connection:
+        rollup = empty_rollup()
+        manifests = _department_manifests(connection, department)
+        for metrics in manifests:
+            apply_metrics_delta(rollup, metrics)
+        rebuild_customer_sketch(rollup, manifests)
+        _save_rollup(connection, department, rollup)
+    return rollup
+
+def _first_existing(rows):
+    """Return the first row whose file still exists, dropping stale entries on the way."""
+    for row in rows:
+        if os.path.isfile(row['path']):
+            return _row_to_dict(row)
+        print(f"Removing stale catalog entry: {row['path']}")
+        remove_file(row['path'])
+    return None
+
+def find_file(department, file_id):
+    """
+    Resolve a file_id to its catalog entry.
+
+    Lookups are tried in order: exact file_id (or upload_id) in the department, exact
+    file_id anywhere, a session folder named like the file_id within the department,
+    and finally a partial filename match.
+
+    Args:
+        department (str): Department the file is expected in.
+        file_id (str): Filename or upload identifier from the analysis URL.
+
+    Returns:
+        dict: Catalog entry, or None if no matching file exists.
+    """
+    stem = file_id[:-4] if file_id.endswith('.csv') else file_id
+    queries = [
+        ("SELECT * FROM files WHERE department = ? AND (file_id = ? OR upload_id = ?) ORDER BY uploaded_at DESC",
+         (department, file_id, file_id)),
+        ("SELECT * FROM files WHERE file_id = ? OR upload_id = ? ORDER BY uploaded_at DESC",
+         (file_id, file_id)),
+        ("SELECT * FROM files WHERE department = ? AND session_id LIKE ? ESCAPE '\\' ORDER BY uploaded_at DESC",
+         (department, _contains_pattern(file_id))),
+        ("SELECT * FROM files WHERE filename LIKE ? ESCAPE '\\' ORDER BY uploaded_at DESC",
+         (f"{_contains_pattern(stem)}.csv",))
+    ]
+    with _connect() as connection:
+        for query, params in queries:
+            rows = connection.execute(query, params).fetchall()
+            record = _first_existing(rows)
+            if record:
+                return record
+    return None
+
+def get_file(path):
+    """
+    Return the catalog entry of a stored file.
+
+    Args:
+        path (str): Absolute path of the stored file.
+
+    Returns:
+        dict: Catalog entry, or None if the file is not cataloged.
+    """
+    with _connect() as connection:
+        row = connection.execute("SELECT * FROM files WHERE path = ?", (path,)).fetchone()
+    return _row_to_dict(row) if row else None
+
+def find_metrics_by_hash(content_hash):
+    """
+    Return the metrics manifest of any file with the given content.
+
+    Args:
+        content_hash (str): SHA-256 of the file content.
+
+    Returns:
+        dict: Metrics manifest, or None if no file with this content has one yet.
+    """
+    with _connect() as connection:
+        row = connection.execute(
+            "SELECT metrics FROM files WHERE content_hash = ? AND metrics IS NOT NULL LIMIT 1", (content_hash,)
+        ).fetchone()
+    return json.loads(row['metrics']) if row else None
+
+def content_in_use(content_hash):
+    """Return True if any cataloged file has the given content."""
+    with _connect() as connection:
+        return connection.execute(
+            "SELECT 1 FROM files WHERE content_hash = ? LIMIT 1", (content_hash,)
+        ).fetchone() is not None
+
+def find_session_files(session_id):
+    """
+    List the catalog entries of an upload session.
+
+    Args:
+        session_id (str): Full or partial session identifier.
+
+    Returns:
+        list: Catalog entries, newest first.
+    """
+    with _connect() as connection:
+        rows = connection.execute(
+            "SELECT * FROM files WHERE session_id = ? ORDER BY uploaded_at DESC", (session_id,)
+        ).fetchall()
+        if not rows:
+            rows = connection.execute(
+                "SELECT * FROM files WHERE session_id LIKE ? ESCAPE '\\' ORDER BY uploaded_at DESC",
+                (_contains_pattern(session_id),)
+            ).fetchall()
+    return [_row_to_dict(row) for row in rows]
+
+def list_department_files(department):
+    """
+    List the catalog entries of a department.
+
+    Args:
+        department (str): Department name.
+
+    Returns:
+        list: Catalog entries, newest first.
+    """
+    with _connect() as connection:
+        rows = connection.execute(
+            "SELECT * FROM files WHERE department = ? ORDER BY uploaded_at DESC", (department,)
+        ).fetchall()
+    return [_row_to_dict(row) for row in rows]
+
+def list_departments():
+    """
+    List the departments that have at least one cataloged file.
+
+    Returns:
+        list: Department names in alphabetical order.
+    """
+    with _connect() as connection:
+        rows = connection.execute("SELECT DISTINCT department FROM files ORDER BY department").fetchall()
+    return [row['department'] for row in rows]
+
+def is_empty():
+    """Return True if the catalog has no entries."""
+    with _connect() as connection:
+        return connection.execute("SELECT 1 FROM files LIMIT 1").fetchone() is None
+
+def sync_catalog_from_disk(upload_folder, exclude=()):
+    """
+    Register CSV files that exist on disk but not in the catalog.
+
+    This is a one-time walk used to adopt files uploaded before the catalog existed.
+    Only file metadata is recorded; no file is parsed.
+
+    Args:
+        upload_folder (str): The uploads root folder.
+        exclude (tuple): Folder names under the uploads folder that are not departments.
+
+    Returns:
+        int: Number of files registered.
+    """
+    with _connect() as connection:
+        known = {row['path'] for row in connection.execute("SELECT path FROM files").fetchall()}
+
+    registered = 0
+    for department in os.listdir(upload_folder):
+        department_path = os.path.join(upload_folder, department)
+        if not os.path.isdir(department_path) or department.startswith(('_', '.')) or department in exclude:
+            continue
+        for root, dirs, files in os.walk(department_path):
+            dirs[:] = [d for d in dirs if not d.startswith(('_', '.'))]
+            for filename in files:
+                if not filename.endswith('.csv'):
+                    continue
+                path = os.path.join(root, filename)
+                if path in known:
+                    continue
+                session_id = os.path.basename(root) if root != department_path else None
+                register_file(
+                    path,
+                    department,
+                    session_id=session_id,
+                    uploaded_at=datetime.fromtimestamp(os.path.getctime(path)).strftime('%Y-%m-%d %H:%M:%S')
+                )
+                registered += 1
+    return registered
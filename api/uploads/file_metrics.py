@@ -0,0 +1,290 @@
+"""
+File Metrics Module
+
+Per-file aggregates computed once when a file is uploaded and stored in the file
+catalog as its metrics manifest. Every aggregate is mergeable (sums, counts and
+histograms), so each department keeps a rollup that is updated with the delta of
+a single file when it is uploaded, replaced or removed, instead of re-reading and
+concatenating every CSV on each request.
+"""
+
+import json
+import pandas as pd
+
+from uploads.hyperloglog import new_sketch, sketch_values, merge_sketches, estimate_count, encode_sketch, decode_sketch
+
+# Candidate columns, in the order the dashboard has always picked them
+SALES_COLUMNS = ['total_amount', 'sales', 'revenue', 'amount']
+INVENTORY_COLUMNS = ['inventory', 'stock', 'quantity']
+RATING_COLUMNS = ['overall', 'rating']
+TOP_ITEM_COLUMNS = ['product_name', 'product_id', 'product_category']
+
+# Largest number of groups kept per file for the top-items ranking
+MAX_TOP_ITEMS = 1000
+
+METRIC_SOURCE_COLUMNS = list(dict.fromkeys(
+    SALES_COLUMNS + INVENTORY_COLUMNS + RATING_COLUMNS + TOP_ITEM_COLUMNS + ['timestamp', 'customer_id']
+))
+
+def metric_columns(columns):
+    """
+    Return the columns of a file that feed its metrics, for a projected read.
+
+    Args:
+        columns (list): All column names of the file.
+
+    Returns:
+        list: The subset of columns used by compute_file_metrics.
+    """
+    return [col for col in columns if col in METRIC_SOURCE_COLUMNS]
+
+def _numeric_sum(df, candidates):
+    """Sum the first candidate column that converts to numbers, as (column, sum)."""
+    for col in candidates:
+        if col in df.columns:
+            try:
+                return col, float(df[col].astype(float).sum())
+            except (TypeError, ValueError):
+                pass
+    return None, None
+
+def compute_file_metrics(df, columns=None):
+    """
+    Compute the mergeable aggregates of one file.
+
+    Args:
+        df (pandas.DataFrame): The file data. It may be projected to metric_columns.
+        columns (list, optional): All column names of the file. Defaults to df.columns.
+
+    Returns:
+        dict: JSON-serializable metrics manifest of the file.
+    """
+    columns = list(columns) if columns is not None else df.columns.tolist()
+    metrics = {
+        'row_count': int(len(df)),
+        'column_count': len(columns),
+        'columns': columns
+    }
+
+    sales_column, sales_sum = _numeric_sum(df, SALES_COLUMNS)
+    if sales_column:
+        metrics['total_sales'] = sales_sum
+
+    inventory_column, inventory_sum = _numeric_sum(df, INVENTORY_COLUMNS)
+    if inventory_column:
+        metrics['total_inventory'] = inventory_sum
+
+    if 'quantity' in df.columns:
+        try:
+            metrics['total_quantity'] = float(df['quantity'].astype(float).sum())
+        except (TypeError, ValueError):
+            pass
+
+    if 'total_amount' in df.columns:
+        try:
+            amounts = df['total_amount'].astype(float)
+            metrics['amount_sum'] = float(amounts.sum())
+            metrics['amount_count'] = int(amounts.count())
+
+            for col in TOP_ITEM_COLUMNS:
+                if col in df.columns:
+                    item_sums = amounts.groupby(df[col]).sum().sort_values(ascending=False)
+                    metrics['top_items'] = {
+                        'column': col,
+                        'sums': {str(item): float(value) for item, value in item_sums.head(MAX_TOP_ITEMS).items()}
+                    }
+                    break
+
+            if 'timestamp' in df.columns:
+                dates = pd.to_datetime(df['timestamp'], errors='coerce')
+                monthly = amounts.groupby(dates.dt.month_name()).sum()
+                metrics['monthly_sales'] = {str(month): float(value) for month, value in monthly.items()}
+        except (TypeError, ValueError) as e:
+            print(f"Error computing sales metrics: {e}")
+
+    if 'customer_id' in df.columns:
+        metrics['customer_sketch'] = encode_sketch(sketch_values(df['customer_id']))
+
+    rating_column = next((col for col in RATING_COLUMNS if col in df.columns), None)
+    if rating_column:
+        try:
+            ratings = df[rating_column].astype(float)
+            stars = ratings.dropna().round().astype(int).value_counts()
+            metrics['rating_column'] = rating_column
+            metrics['rating_sum'] = float(ratings.sum())
+            metrics['rating_count'] = int(ratings.count())
+            metrics['star_counts'] = {str(i): int(stars.get(i, 0)) for i in range(1, 6)}
+        except (TypeError, ValueError) as e:
+            print(f"Error computing rating metrics: {e}")
+
+    return metrics
+
+# Additive scalar aggregates of a manifest
+_SUMMED_KEYS = ('row_count', 'total_sales', 'total_inventory', 'total_quantity', 'amount_sum', 'amount_count',
+                'rating_sum', 'rating_count')
+
+# Additive keyed aggregates of a manifest
+_SUMMED_MAPS = ('monthly_sales', 'star_counts')
+
+def _add_counts(target, source, sign=1):
+    for key, value in source.items():
+        total = target.get(key, 0) + sign * value
+        # Drop keys whose last contribution was removed, allowing for float rounding
+        if sign < 0 and abs(total) < 1e-6:
+            target.pop(key, None)
+        else:
+            target[key] = total
+
+def empty_rollup():
+    """Return the rollup of a department without files."""
+    return {'file_count': 0, 'column_sets': {}}
+
+def apply_metrics_delta(rollup, metrics, sign=1):
+    """
+    Add a file's manifest to a department rollup, or remove it with sign=-1.
+
+    Every aggregate is inverted exactly except the customer sketch: a maximum cannot
+    be undone, so removing a file that contributed one marks the sketch stale and it
+    has to be rebuilt from the remaining files' sketches.
+
+    Args:
+        rollup (dict): Rollup to update in place.
+        metrics (dict): Manifest from compute_file_metrics.
+        sign (int): 1 to add the file, -1 to remove it.
+
+    Returns:
+        dict: The updated rollup.
+    """
+    rollup['file_count'] = rollup.get('file_count', 0) + sign
+    _add_counts(rollup.setdefault('column_sets', {}), {json.dumps(metrics.get('columns', [])): 1}, sign)
+
+    for key in _SUMMED_KEYS:
+        if key in metrics:
+            rollup[key] = rollup.get(key, 0) + sign * metrics[key]
+    for key in _SUMMED_MAPS:
+        if key in metrics:
+            _add_counts(rollup.setdefault(key, {}), metrics[key], sign)
+
+    if 'top_items' in metrics:
+        top_items = rollup.setdefault('top_items', {})
+        item_sums = top_items.setdefault(metrics['top_items']['column'], {})
+        _add_counts(item_sums, metrics['top_items']['sums'], sign)
+
+    if 'customer_sketch' in metrics:
+        if sign > 0:
+            sketch = decode_sketch(rollup['customer_sketch']) if 'customer_sketch' in rollup else new_sketch()
+            rollup['customer_sketch'] = encode_sketch(merge_sketches(sketch, decode_sketch(metrics['customer_sketch'])))
+        else:
+            rollup['customer_sketch_stale'] = True
+
+    return rollup
+
+def rebuild_customer_sketch(rollup, manifests):
+    """
+    Recompute the customer sketch of a rollup from the manifests of its files.
+
+    Args:
+        rollup (dict): Rollup to update in place.
+        manifests (list): Manifests of all files still in the department.
+
+    Returns:
+        dict: The updated rollup.
+    """
+    sketch = None
+    for metrics in manifests:
+        if 'customer_sketch' in metrics:
+            file_sketch = decode_sketch(metrics['customer_sketch'])
+            sketch = file_sketch if sketch is None else merge_sketches(sketch, file_sketch)
+    rollup.pop('customer_sketch', None)
+    rollup.pop('customer_sketch_stale', None)
+    if sketch is not None:
+        rollup['customer_sketch'] = encode_sketch(sketch)
+    return rollup
+
+def finalize_rollup(rollup):
+    """
+    Turn a department rollup into the merged metrics used by the dashboard.
+
+    Averages are recomputed from the merged sums and counts, so every file is weighted
+    by its number of rows.
+
+    Args:
+        rollup (dict): Department rollup.
+
+    Returns:
+        dict: Merged metrics.
+    """
+    merged = {key: value for key, value in rollup.items() if key not in ('top_items', 'customer_sketch')}
+    merged.setdefault('row_count', 0)
+    merged['uniform_columns'] = len(rollup.get('column_sets', {})) == 1
+    if merged['uniform_columns']:
+        merged['column_count'] = len(json.loads(next(iter(rollup['column_sets']))))
+
+    # The ranking uses the first item column in the dashboard's order of preference
+    for col in TOP_ITEM_COLUMNS:
+        if rollup.get('top_items', {}).get(col):
+            merged['top_items'] = {'column': col, 'sums': rollup['top_items'][col]}
+            break
+
+    if merged.get('amount_count'):
+        merged['avg_order'] = merged['amount_sum'] / merged['amount_count']
+    if merged.get('rating_count'):
+        merged['avg_rating'] = merged['rating_sum'] / merged['rating_count']
+    if 'customer_sketch' in rollup:
+        merged['customer_count'] = estimate_count(decode_sketch(rollup['customer_sketch']))
+    return merged
+
+def summarize_metrics(merged, department):
+    """
+    Build the quick analysis summary of a department from merged metrics.
+
+    Args:
+        merged (dict): Metrics from finalize_rollup.
+        department (str): Department name.
+
+    Returns:
+        str: Summary text.
+    """
+    if department == 'sales' and 'amount_sum' in merged:
+        sales_insights = []
+
+        if 'top_items' in merged:
+            item_sums = merged['top_items']['sums']
+            top_items = sorted(item_sums, key=item_sums.get, reverse=True)[:3]
+            item_label = merged['top_items']['column'].replace('_', ' ').title()
+            sales_insights.append(f"Top {item_label}s: {', '.join(top_items)}.")
+
+        monthly_sales = merged.get('monthly_sales', {})
+        if len(monthly_sales) > 1:
+            best_month = max(monthly_sales, key=monthly_sales.get)
+            worst_month = min(monthly_sales, key=monthly_sales.get)
+            sales_insights.append(f"Best sales month: {best_month}. Worst sales month: {worst_month}.")
+
+        if 'customer_count' in merged:
+            sales_insights.append(f"Total unique customers: {merged['customer_count']}.")
+
+        summary = f"Total sales: ${merged['amount_sum']:.2f}. Average order value: ${merged.get('avg_order', 0):.2f}."
+        if sales_insights:
+            summary += " " + " ".join(sales_insights)
+        return summary
+
+    if department == 'inventory' and 'total_quantity' in merged:
+        return f"Total inventory: {merged['total_quantity']} items across all categories."
+
+    if department == 'reviews' and 'avg_rating' in merged:
+        return f"Average rating: {merged['avg_rating']:.1f}/5 based on {merged['rating_count']} reviews."
+
+    return f"Analysis contains {merged['row_count']} records with {merged.get('column_count', 0)} attributes."
+
+def star_distribution(merged):
+    """
+    Return the star rating distribution of merged metrics in the dashboard format.
+
+    Args:
+        merged (dict): Metrics from finalize_rollup.
+
+    Returns:
+        dict: Counts keyed '1_star' to '5_star'.
+    """
+    star_counts = merged.get('star_counts', {})
+    return {f"{i}_star": int(star_counts.get(str(i), 0)) for i in range(1, 6)}
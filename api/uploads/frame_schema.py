@@ -0,0 +1,205 @@
+"""
+Frame Schema Module
+
+Declared column types for the sales data, applied while files are loaded so the
+frame used by the sales agent is compact: low-cardinality strings become
+categoricals (groupbys then run on integer codes), counts are downcast to the
+smallest integer type that holds them and timestamps are parsed once at read time.
+
+The Arrow step runs on the combined table before it is converted to pandas, so the
+categorical columns never exist as Python string objects. The pandas step finishes
+the conversion and covers frames that did not come through the Arrow path.
+
+Buckets the analyses group by (month, weekday, age group, discounted or not) are
+derived once by add_derived_columns as compact categorical or integer columns, so
+the analysis functions read them instead of recomputing and formatting them per call.
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+CATEGORY = 'category'
+INTEGER = 'integer'
+FLOAT32 = 'float32'
+FLOAT64 = 'float64'
+DATETIME = 'datetime'
+
+# Expected sales columns and their types. Money columns stay float64 so department
+# totals keep cent precision; the discount is a small ratio and fits float32.
+# transaction_id and customer_id are (nearly) unique per row and are left as read.
+SALES_COLUMN_TYPES = {
+    'transaction_id': None,
+    'product_id': CATEGORY,
+    'product_category': CATEGORY,
+    'product_name': CATEGORY,
+    'quantity': INTEGER,
+    'price': FLOAT64,
+    'discount': FLOAT32,
+    'total_amount': FLOAT64,
+    'timestamp': DATETIME,
+    'customer_id': None,
+    'customer_age': INTEGER,
+    'customer_gender': CATEGORY,
+    'location': CATEGORY,
+    'payment_method': CATEGORY
+}
+
+EXPECTED_SALES_COLUMNS = list(SALES_COLUMN_TYPES)
+
+# A string column is stored as a categorical only when at most this share of its values are distinct
+MAX_CATEGORY_RATIO = 0.5
+
+_INTEGER_DTYPES = ('int8', 'int16', 'int32', 'int64')
+
+# Buckets of the derived columns
+AGE_BINS = [0, 18, 25, 35, 50, 65, 120]
+AGE_LABELS = ['Under 18', '18-24', '25-34', '35-49', '50-64', '65+']
+DAY_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+DERIVED_COLUMNS = ['month_year', 'month_num', 'day_of_week', 'age_group', 'has_discount']
+
+def _is_low_cardinality(distinct, total):
+    return total > 0 and distinct <= total * MAX_CATEGORY_RATIO
+
+def _arrow_column(column, kind):
+    """Convert one Arrow column to its declared type, or return None to keep it as is."""
+    if kind == CATEGORY:
+        if not (pa.types.is_string(column.type) or pa.types.is_large_string(column.type)):
+            return None
+        encoded = pc.dictionary_encode(column.combine_chunks())
+        return encoded if _is_low_cardinality(len(encoded.dictionary), len(encoded)) else None
+
+    if kind == INTEGER and pa.types.is_integer(column.type):
+        bounds = pc.min_max(column)
+        low, high = bounds['min'].as_py(), bounds['max'].as_py()
+        if low is None:
+            return None
+        for dtype in _INTEGER_DTYPES:
+            limits = np.iinfo(dtype)
+            if limits.min <= low and high <= limits.max:
+                target = pa.from_numpy_dtype(np.dtype(dtype))
+                return column.cast(target) if target.bit_width < column.type.bit_width else None
+        return None
+
+    if kind == FLOAT32 and pa.types.is_floating(column.type):
+        return column.cast(pa.float32())
+
+    return None
+
+def apply_arrow_column_types(table, column_types=SALES_COLUMN_TYPES):
+    """
+    Apply declared column types to an Arrow table before it is converted to pandas.
+
+    Columns whose values do not fit their declared type are left unchanged.
+
+    Args:
+        table (pyarrow.Table): Table of the loaded files.
+        column_types (dict): Column name to declared type.
+
+    Returns:
+        pyarrow.Table: The converted table.
+    """
+    for name, kind in column_types.items():
+        if kind is None or name not in table.column_names:
+            continue
+        try:
+            converted = _arrow_column(table.column(name), kind)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, TypeError, ValueError) as e:
+            print(f"Warning: Could not convert column {name} to {kind}: {str(e)}")
+            continue
+        if converted is not None:
+            table = table.set_column(table.column_names.index(name), name, converted)
+    return table
+
+def apply_column_types(df, column_types=SALES_COLUMN_TYPES):
+    """
+    Apply declared column types to a DataFrame in place and report the memory saved.
+
+    Args:
+        df (pd.DataFrame): Frame to convert.
+        column_types (dict): Column name to declared type.
+
+    Returns:
+        tuple: (the converted DataFrame, bytes before, bytes after).
+    """
+    bytes_before = int(df.memory_usage(deep=True).sum())
+
+    for name, kind in column_types.items():
+        if kind is None or name not in df.columns:
+            continue
+        column = df[name]
+        try:
+            if kind == CATEGORY:
+                if not isinstance(column.dtype, pd.CategoricalDtype) and _is_low_cardinality(column.nunique(), len(column)):
+                    df[name] = column.astype('category')
+            elif kind == INTEGER:
+                df[name] = pd.to_numeric(column, downcast='integer')
+            elif kind == FLOAT32:
+                df[name] = pd.to_numeric(column).astype('float32')
+            elif kind == FLOAT64:
+                df[name] = pd.to_numeric(column).astype('float64')
+            elif kind == DATETIME and not pd.api.types.is_datetime64_any_dtype(column):
+                df[name] = pd.to_datetime(column, errors='coerce')
+        except (TypeError, ValueError) as e:
+            print(f"Warning: Could not convert column {name} to {kind}: {str(e)}")
+
+    bytes_after = int(df.memory_usage(deep=True).sum())
+    return df, bytes_before, bytes_after
+
+def month_year_column(timestamps):
+    """
+    Bucket timestamps by month as an ordered categorical labelled 'YYYY-MM'.
+
+    Months are computed as integer period codes and only the distinct periods are
+    formatted, instead of formatting every row with strftime.
+
+    Args:
+        timestamps (pd.Series): Datetime values.
+
+    Returns:
+        pd.Categorical: Month of each value, missing for missing timestamps.
+    """
+    periods = timestamps.dt.year * 12 + timestamps.dt.month - 1
+    valid = periods.notna()
+    if not valid.any():
+        return pd.Categorical([None] * len(periods), categories=[], ordered=True)
+    first, last = int(periods[valid].min()), int(periods[valid].max())
+    labels = [f"{period // 12:04d}-{period % 12 + 1:02d}" for period in range(first, last + 1)]
+    codes = (periods - first).fillna(-1).astype('int32')
+    return pd.Categorical.from_codes(codes, categories=labels, ordered=True)
+
+def add_derived_columns(df, time_col='timestamp'):
+    """
+    Add the bucket columns the sales analyses group by to a DataFrame in place.
+
+    Adds 'month_year' (ordered categorical 'YYYY-MM'), 'month_num' (month 1-12) and
+    'day_of_week' (ordered categorical Monday-Sunday) from the time column, 'age_group'
+    from 'customer_age' and 'has_discount' from 'discount', for the source columns present.
+
+    Args:
+        df (pd.DataFrame): Sales data with the time column already parsed to datetimes.
+        time_col (str): Name of the time column.
+
+    Returns:
+        pd.DataFrame: The same DataFrame.
+    """
+    if time_col in df.columns and pd.api.types.is_datetime64_any_dtype(df[time_col]):
+        timestamps = df[time_col]
+        df['month_year'] = month_year_column(timestamps)
+        df['month_num'] = timestamps.dt.month.astype('Int8')
+        weekdays = timestamps.dt.dayofweek.fillna(-1).astype('int8')
+        df['day_of_week'] = pd.Categorical.from_codes(weekdays, categories=DAY_ORDER, ordered=True)
+
+    if 'customer_age' in df.columns:
+        df['age_group'] = pd.cut(df['customer_age'], bins=AGE_BINS, labels=AGE_LABELS)
+
+    if 'discount' in df.columns:
+        df['has_discount'] = df['discount'] > 0
+
+    return df
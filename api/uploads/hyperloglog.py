@@ -0,0 +1,85 @@
+"""
+HyperLogLog Sketches
+
+Fixed-size, mergeable distinct-count sketches used to count unique customers across
+files without keeping the customer ids. Sketches of two files merge with an
+element-wise maximum, so a department count is updated from the new file alone.
+Sketches are stored as base64 strings inside the JSON metrics manifests.
+"""
+
+import base64
+import numpy as np
+import pandas as pd
+
+# 2**14 registers - about 0.8% standard error in 16 KB per sketch
+HLL_PRECISION = 14
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+def _leading_zeros(values):
+    """Count the leading zero bits of each uint64 value."""
+    zeros = np.zeros(len(values), dtype=np.uint8)
+    shifted = values.copy()
+    for bits in (32, 16, 8, 4, 2, 1):
+        empty = (shifted >> np.uint64(64 - bits)) == 0
+        zeros[empty] += bits
+        shifted[empty] <<= np.uint64(bits)
+    zeros[values == 0] = 64
+    return zeros
+
+def new_sketch():
+    """Return an empty sketch."""
+    return np.zeros(HLL_REGISTERS, dtype=np.uint8)
+
+def sketch_values(values):
+    """
+    Build a sketch of the distinct values of a column.
+
+    Args:
+        values (pandas.Series): Values to count. Missing values are ignored.
+
+    Returns:
+        numpy.ndarray: The sketch registers.
+    """
+    values = values.dropna()
+    registers = new_sketch()
+    if values.empty:
+        return registers
+
+    hashes = pd.util.hash_pandas_object(values.astype(str), index=False).to_numpy(dtype=np.uint64)
+    index = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    remainder = hashes << np.uint64(HLL_PRECISION)
+    rank = np.minimum(_leading_zeros(remainder) + 1, 64 - HLL_PRECISION + 1).astype(np.uint8)
+    np.maximum.at(registers, index, rank)
+    return registers
+
+def merge_sketches(left, right):
+    """Merge two sketches into a sketch of the union of their values."""
+    return np.maximum(left, right)
+
+def estimate_count(registers):
+    """
+    Estimate the number of distinct values in a sketch.
+
+    Args:
+        registers (numpy.ndarray): The sketch registers.
+
+    Returns:
+        int: Estimated distinct count.
+    """
+    m = float(len(registers))
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.power(2.0, -registers.astype(np.float64)))
+
+    # Small cardinalities are estimated more accurately by linear counting
+    empty_registers = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and empty_registers > 0:
+        estimate = m * np.log(m / empty_registers)
+    return int(round(estimate))
+
+def encode_sketch(registers):
+    """Serialize a sketch to a base64 string."""
+    return base64.b64encode(registers.astype(np.uint8).tobytes()).decode('ascii')
+
+def decode_sketch(encoded):
+    """Deserialize a sketch from a base64 string."""
+    return np.frombuffer(base64.b64decode(encoded), dtype=np.uint8).copy()
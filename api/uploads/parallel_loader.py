@@ -0,0 +1,106 @@
+"""
+Parallel CSV Loader
+
+Reads the files of a department concurrently and combines them in a single step.
+Each file is read through the columnar cache on a thread pool (Parquet decoding and
+CSV parsing both release the GIL), the resulting Arrow tables are concatenated once
+with their schemas unified, and the result is converted to pandas once, instead of
+parsing the files one after another and concatenating DataFrames.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+from uploads.columnar_cache import read_csv_cached, read_table_cached, PYARROW_AVAILABLE
+from uploads.frame_schema import apply_arrow_column_types
+
+if PYARROW_AVAILABLE:
+    import pyarrow as pa
+
+# Upper bound on concurrent file reads - more threads only contend for disk bandwidth
+LOADER_MAX_WORKERS = 8
+
+def _read_one(file_path):
+    """Read one file, returning (data, stats). data is an Arrow table when pyarrow is available."""
+    start = time.perf_counter()
+    stats = {'path': file_path, 'rows': 0, 'bytes': 0, 'seconds': 0.0, 'mb_per_second': 0.0, 'error': None}
+    try:
+        stats['bytes'] = os.path.getsize(file_path)
+        data = read_table_cached(file_path) if PYARROW_AVAILABLE else read_csv_cached(file_path)
+        stats['rows'] = data.num_rows if PYARROW_AVAILABLE else len(data)
+    except Exception as e:
+        data = None
+        stats['error'] = str(e)
+
+    stats['seconds'] = time.perf_counter() - start
+    if stats['seconds'] > 0:
+        stats['mb_per_second'] = stats['bytes'] / (1024 * 1024) / stats['seconds']
+    return data, stats
+
+def _concat_tables(tables, column_types=None):
+    """Concatenate Arrow tables into one DataFrame, unifying differing schemas."""
+    try:
+        # Missing columns are filled with nulls and compatible types are widened
+        table = pa.concat_tables(tables, promote_options='permissive')
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        print(f"Warning: Could not unify file schemas ({str(e)}), combining with pandas")
+        return pd.concat([table.to_pandas() for table in tables], ignore_index=True)
+
+    if column_types:
+        # Applied to the combined table so categories are shared by all files
+        table_bytes = table.nbytes
+        table = apply_arrow_column_types(table, column_types)
+        print(f"Applied column types: {table_bytes / (1024 * 1024):.1f} MB -> {table.nbytes / (1024 * 1024):.1f} MB")
+    return table.to_pandas()
+
+def read_csv_files(file_paths, max_workers=None, column_types=None):
+    """
+    Read several CSV files concurrently and concatenate them into one DataFrame.
+
+    Files that cannot be read are reported and skipped. Rows keep the order of file_paths.
+
+    Args:
+        file_paths (list): Paths of the CSV files.
+        max_workers (int, optional): Number of reader threads. Defaults to the number of
+                                     CPUs, capped at LOADER_MAX_WORKERS.
+        column_types (dict, optional): Declared column types (see frame_schema) applied to
+                                       the combined data before it is converted to pandas.
+
+    Returns:
+        tuple: (DataFrame or None if no file could be read, list of per-file stats with
+               'path', 'rows', 'bytes', 'seconds', 'mb_per_second' and 'error').
+    """
+    if not file_paths:
+        return None, []
+
+    workers = max_workers or min(len(file_paths), os.cpu_count() or 1, LOADER_MAX_WORKERS)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = list(executor.map(_read_one, file_paths))
+
+    loaded = []
+    file_stats = []
+    for data, stats in results:
+        file_stats.append(stats)
+        if stats['error']:
+            print(f"Error reading file {stats['path']}: {stats['error']}")
+            continue
+        print(f"Loaded {stats['path']}: {stats['rows']} rows in {stats['seconds']:.2f}s "
+              f"({stats['mb_per_second']:.1f} MB/s)")
+        loaded.append(data)
+
+    if not loaded:
+        return None, file_stats
+
+    if PYARROW_AVAILABLE:
+        df = _concat_tables(loaded, column_types)
+    else:
+        df = pd.concat(loaded, ignore_index=True)
+
+    elapsed = time.perf_counter() - start
+    total_mb = sum(stats['bytes'] for stats in file_stats if not stats['error']) / (1024 * 1024)
+    print(f"Loaded {len(loaded)} of {len(file_paths)} files ({len(df)} rows, {total_mb:.1f} MB) "
+          f"in {elapsed:.2f}s with {workers} threads")
+    return df, file_stats
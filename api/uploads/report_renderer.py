@@ -0,0 +1,185 @@
+"""
+Report Renderer Module
+
+Analysis reports are assembled from blocks (headings, paragraphs, lists and tables)
+instead of growing a markdown string row by row. Lists and tables take the aggregate
+frame a section computed: table columns are formatted one column at a time and
+joined into rows with vectorized string operations, list items are filled from a
+template per record. The same blocks render to markdown for the chat and text views
+and to JSON for the frontend, which can read the structure and the raw values
+without parsing markdown.
+
+An AnalysisResult pairs a report with the series its charts are drawn from, taken
+from the same aggregates, so charts never have to be scraped back out of the text.
+"""
+
+HEADING = 'heading'
+PARAGRAPH = 'paragraph'
+LIST = 'list'
+TABLE = 'table'
+MARKDOWN = 'markdown'
+
+def _records(frame):
+    """Rows of a frame as JSON-safe dicts, with missing values as None."""
+    frame = frame.astype(object)
+    return frame.where(frame.notna(), None).to_dict('records')
+
+def _format_column(series, pattern):
+    """Format every value of a column with a str.format pattern such as '${:,.2f}'."""
+    return series.astype(object).map(pattern.format if pattern else str)
+
+class Report:
+    """A report being assembled, renderable as markdown or JSON."""
+
+    def __init__(self):
+        self.blocks = []
+
+    def heading(self, text, level=2):
+        """Add a heading. Level 2 is a report section, 3 and 4 are subsections."""
+        self.blocks.append({'type': HEADING, 'level': level, 'text': text})
+
+    def paragraph(self, text):
+        """Add a paragraph of (inline markdown) text."""
+        self.blocks.append({'type': PARAGRAPH, 'text': text})
+
+    def items(self, items, ordered=False):
+        """Add a bullet list, or a numbered list if ordered is True."""
+        self.blocks.append({'type': LIST, 'ordered': ordered, 'items': list(items), 'data': None})
+
+    def rows(self, frame, template, ordered=False):
+        """
+        Add a list with one item per row of a frame.
+
+        Args:
+            frame (pd.DataFrame): Values of the items, one row each.
+            template (str): str.format template filled with the columns of each row,
+                            e.g. '**{product_category}**: ${sum:,.2f}'.
+            ordered (bool): Number the items.
+        """
+        data = _records(frame)
+        items = [template.format_map(record) for record in frame.to_dict('records')]
+        self.blocks.append({'type': LIST, 'ordered': ordered, 'items': items, 'data': data})
+
+    def table(self, frame, columns):
+        """
+        Add a table with one line per row of a frame.
+
+        Args:
+            frame (pd.DataFrame): Values of the table.
+            columns (list): (header, column name, format pattern) tuples. The pattern is a
+                            str.format pattern such as '${:,.2f}', or None for str().
+        """
+        self.blocks.append({'type': TABLE, 'frame': frame, 'columns': list(columns)})
+
+    def markdown(self, text):
+        """Add text that is already markdown, e.g. an LLM response."""
+        self.blocks.append({'type': MARKDOWN, 'text': text})
+
+    def _table_markdown(self, block):
+        frame, columns = block['frame'], block['columns']
+        header = '| ' + ' | '.join(label for label, _, _ in columns) + ' |'
+        separator = '|' + '|'.join('-' * (len(label) + 2) for label, _, _ in columns) + '|'
+        lines = [header, separator]
+        if len(frame):
+            cells = [_format_column(frame[key], pattern) for _, key, pattern in columns]
+            lines.extend(('| ' + cells[0].str.cat(cells[1:], sep=' | ') + ' |').tolist())
+        return '\n'.join(lines)
+
+    def to_markdown(self):
+        """
+        Render the report as markdown.
+
+        Returns:
+            str: The markdown text.
+        """
+        parts = []
+        for block in self.blocks:
+            if block['type'] == HEADING:
+                parts.append('#' * block['level'] + ' ' + block['text'])
+            elif block['type'] == LIST:
+                if block['ordered']:
+                    parts.append('\n'.join(f"{number}. {item}" for number, item in enumerate(block['items'], 1)))
+                else:
+                    parts.append('\n'.join(f"- {item}" for item in block['items']))
+            elif block['type'] == TABLE:
+                parts.append(self._table_markdown(block))
+            else:
+                parts.append(block['text'])
+        return '\n\n'.join(part for part in parts if part) + '\n'
+
+    def to_dict(self):
+        """
+        Render the report as JSON-serializable blocks.
+
+        Headings, paragraphs and markdown blocks carry their 'text'. Lists carry their
+        'items' and, when built from a frame, the raw values as 'data'. Tables carry
+        'columns' ({'key', 'label'}) and 'rows' of raw values keyed by column.
+
+        Returns:
+            dict: {'blocks': [...]}.
+        """
+        blocks = []
+        for block in self.blocks:
+            if block['type'] == TABLE:
+                keys = [key for _, key, _ in block['columns']]
+                blocks.append({
+                    'type': TABLE,
+                    'columns': [{'key': key, 'label': label} for label, key, _ in block['columns']],
+                    'rows': _records(block['frame'][keys]) if len(block['frame']) else []
+                })
+            else:
+                blocks.append(dict(block))
+        return {'blocks': blocks}
+
+def chart_series(values, title, description=None, chart_type=None):
+    """
+    Build a chart entry in the format the frontend expects.
+
+    Labels and values come from the same Series, so they always have the same length.
+
+    Args:
+        values (pd.Series): Values indexed by their labels.
+        title (str): Chart title.
+        description (str, optional): Chart description.
+        chart_type (str, optional): Chart type, e.g. 'bar' or 'pie'.
+
+    Returns:
+        dict: 'labels', 'values', 'title' and the optional 'description' and 'type'.
+    """
+    entry = {'labels': [str(label) for label in values.index], 'values': values.tolist(), 'title': title}
+    if description:
+        entry['description'] = description
+    if chart_type:
+        entry['type'] = chart_type
+    return entry
+
+class AnalysisResult:
+    """The report of an analysis together with the numeric series behind it."""
+
+    def __init__(self, report, series=None):
+        """
+        Args:
+            report (Report): The analysis report.
+            series (dict, optional): Chart key to chart entry (see chart_series).
+        """
+        self.report = report
+        self.series = dict(series or {})
+
+    @property
+    def markdown(self):
+        """The report as markdown."""
+        return self.report.to_markdown()
+
+    def chart_data(self):
+        """
+        Returns:
+            dict: Chart key to chart entry, ready to send to the frontend.
+        """
+        return {name: dict(entry) for name, entry in self.series.items()}
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: 'summary' (markdown), 'report' (blocks) and 'series' (chart data).
+        """
+        return {'summary': self.markdown, 'report': self.report.to_dict(), 'series': self.chart_data()}
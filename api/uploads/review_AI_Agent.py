@@ -11,16 +11,20 @@ import json
 from llama_index.core.tools import FunctionTool
 from llama_index.llms.ollama import Ollama
 from llama_index.core.agent import ReActAgent
-from wordcloud import WordCloud, STOPWORDS
+from wordcloud import STOPWORDS
 from nltk.sentiment.vader import SentimentIntensityAnalyzer
 from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
 import nltk
-from sklearn.decomposition import LatentDirichletAllocation
-from sklearn.feature_extraction.text import CountVectorizer
-import re
-from collections import Counter
 import traceback
+from functools import partial
+from uploads.parallel_loader import read_csv_files
+from uploads.columnar_cache import content_hash_for
+from uploads.sentiment_store import ensure_sentiment_scores
+from uploads.topic_store import get_topic_model
+from uploads.text_index import get_text_index, dataset_key
+from uploads.wordcloud_cache import get_wordcloud
+from uploads.analysis_context import AnalysisContext
+from uploads.report_renderer import Report, AnalysisResult, chart_series
 
 # Download NLTK resources if not already available
 try:
@@ -32,23 +36,24 @@ except LookupError:
     nltk.download('stopwords')
     nltk.download('vader_lexicon')
 
-# Global variable to store DataFrame
-df = None
+# Context used when a caller does not pass its own, e.g. by the default dataset endpoints
+default_context = AnalysisContext(department='reviews')
 DEFAULT_DATASET_PATH = r"D:\OneDrive - Higher Education Commission\FYP-Dataset\Sentiment Analysis"
 
+def _resolve_context(context):
+    return context if context is not None else default_context
+
 # Function to load and concatenate data from multiple CSV files
-def load_user_data(file_paths=None):
+def load_context(file_paths=None):
     """
-    Loads data from file paths or default dataset directory and concatenates them into a single DataFrame.
+    Loads data from file paths or default dataset directory into a new analysis context.
 
     Args:
         file_paths (list, optional): List of file paths to load. If None, loads from default dataset path.
 
     Returns:
-        pd.DataFrame: Concatenated DataFrame of all CSV data.
+        AnalysisContext: Context holding the concatenated DataFrame of all CSV data.
     """
-    global df
-    
     if file_paths is None:
         # Use default dataset path if no file paths provided
         directory = DEFAULT_DATASET_PATH
@@ -68,31 +73,20 @@ def load_user_data(file_paths=None):
     if not csv_files:
         raise ValueError("No CSV files found in the specified location.")
     
-    # Process files in chunks to handle large datasets
-    all_dfs = []
+    existing_files = []
     for file_path in csv_files:
-        try:
-            # Check if file exists
-            if not os.path.exists(file_path):
-                print(f"Warning: File does not exist: {file_path}")
-                continue
-                
-            print(f"Attempting to load file: {file_path}")
-            # Use chunking for large files
-            chunks = []
-            for chunk in pd.read_csv(file_path, chunksize=10000):
-                chunks.append(chunk)
-            file_df = pd.concat(chunks, ignore_index=True)
-            all_dfs.append(file_df)
-            print(f"Successfully loaded {file_path} with {len(file_df)} rows and {len(file_df.columns)} columns")
-        except Exception as e:
-            print(f"Error loading {file_path}: {str(e)}")
+        if not os.path.exists(file_path):
+            print(f"Warning: File does not exist: {file_path}")
             continue
+        existing_files.append(file_path)
     
-    if not all_dfs:
+    # Read the files concurrently through the columnar cache and concatenate them once
+    df, file_stats = read_csv_files(existing_files)
+    if df is None:
         raise ValueError("Failed to load any valid CSV files.")
     
-    df = pd.concat(all_dfs, ignore_index=True)
+    # Row ranges of the loaded files, so per-file results such as sentiment scores can be cached
+    segments = [(content_hash_for(stats['path']), stats['rows']) for stats in file_stats if not stats['error']]
     
     # Print available columns for debugging
     print(f"Available columns: {df.columns.tolist()}")
@@ -114,26 +108,58 @@ def load_user_data(file_paths=None):
     # NO SAMPLING - We work with the complete dataset
     # Previously: if len(df) > 100000: df = df.sample(n=100000)
     
-    return df
+    source = segments[0][0] if len(segments) == 1 else None
+    return AnalysisContext(df, department='reviews', source=source, segments=segments)
+
+def load_user_data(file_paths=None):
+    """
+    Loads data from file paths or default dataset directory into the default context.
+
+    Args:
+        file_paths (list, optional): List of file paths to load. If None, loads from default dataset path.
+
+    Returns:
+        pd.DataFrame: Concatenated DataFrame of all CSV data.
+    """
+    global default_context
+    
+    default_context = load_context(file_paths)
+    return default_context.df
 
 # Alias for compatibility with existing code
 load_data = load_user_data
 
-# Function to set the dataframe directly
+# Function to build a context from a dataframe
+def create_context(dataframe):
+    """
+    Wraps a dataframe in a new analysis context, without loading from files.
+
+    Columns added by the analysis functions (sentiment scores, categories) belong to the
+    context. Only a shallow copy is made, so the caller's dataframe is not modified and
+    the existing columns are not duplicated.
+
+    Args:
+        dataframe (pd.DataFrame): The dataframe to use for analysis.
+
+    Returns:
+        AnalysisContext: Context holding the dataframe.
+    """
+    return AnalysisContext(dataframe.copy(deep=False), department='reviews')
+
 def set_dataframe(dataframe):
     """
-    Sets the dataframe directly instead of loading from files.
+    Sets the dataframe of the default context.
 
     Args:
         dataframe (pd.DataFrame): The dataframe to use for analysis.
 
     Returns:
-        pd.DataFrame: The processed dataframe.
+        pd.DataFrame: The dataframe.
     """
-    global df
+    global default_context
     
-    df = dataframe.copy()
-    return df
+    default_context = create_context(dataframe)
+    return dataframe
 
 # Check if Ollama is running
 def is_ollama_running():
@@ -149,15 +175,19 @@ def is_ollama_running():
     except requests.RequestException:
         return False
 
-# Define analysis tools - these functions will use the global dataframe
-def summary_statistics():
+# Define analysis tools - these functions use the given context, or the default context
+def summary_statistics(context=None):
     """
     Calculates summary statistics for the review dataset.
 
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
         dict: Dictionary containing summary statistics suitable for JSON serialization.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload a valid dataset for analysis.")
@@ -201,15 +231,19 @@ def convert_numpy_types(obj):
         return str(obj)
     return obj
 
-def get_asin_summary():
+def get_asin_summary(context=None):
     """
     Calculates summary statistics (review count, average rating) for each ASIN.
 
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
         list: A list of dictionaries, each containing 'asin', 'review_count', and 'average_rating'.
               Returns an empty list if data is not available or columns are missing.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         print("Warning: DataFrame is empty or not loaded in get_asin_summary.")
@@ -244,18 +278,21 @@ def get_asin_summary():
         traceback.print_exc()
         return []
 
-def analyze_sentiment(text=None, method='vader'):
+def analyze_sentiment(text=None, method='vader', context=None):
     """
     Analyzes sentiment of reviews using VADER sentiment analysis or custom text.
 
     Args:
         text (str, optional): Specific text to analyze. If None, analyzes all reviews.
-        method (str): Sentiment analysis method to use ('vader' by default).
+        method (str): Method scoring the reviews, 'vader' (NLTK, the default) or 'vader_vectorized'
+                      (same scores, array-based). A single text is always scored with NLTK.
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
 
     Returns:
         dict: Dictionary with sentiment analysis results.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload a valid dataset for analysis.")
@@ -277,19 +314,8 @@ def analyze_sentiment(text=None, method='vader'):
             'scores': sentiment
         }
     
-    # Using the full dataset instead of sampling
-    # Process in chunks if needed for very large datasets 
-    analyzer = SentimentIntensityAnalyzer()
-    
-    df['sentiment_score'] = df['reviewText'].apply(
-        lambda text: analyzer.polarity_scores(str(text))['compound'] 
-        if isinstance(text, str) and text else 0
-    )
-    
-    # Get sentiment categories
-    df['sentiment_category'] = df['sentiment_score'].apply(
-        lambda score: 'positive' if score >= 0.05 else ('negative' if score <= -0.05 else 'neutral')
-    )
+    # Scores are computed once per dataset and cached per file
+    ensure_sentiment_scores(context, method)
     
     # Calculate sentiment distribution
     sentiment_dist = df['sentiment_category'].value_counts().to_dict()
@@ -318,86 +344,51 @@ def analyze_sentiment(text=None, method='vader'):
         "examples_negative": neg_examples
     }
 
-def perform_topic_modeling(num_topics=5, num_words=10):
+def perform_topic_modeling(num_topics=5, num_words=10, context=None):
     """
     Performs topic modeling on review texts using LDA.
 
+    The fitted model is stored per dataset (see topic_store), so repeated queries and
+    reloads of the same files only read the topics, and files added to a department
+    update the stored model instead of refitting it.
+
     Args:
         num_topics (int): Number of topics to extract.
         num_words (int): Number of words per topic to return.
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
 
     Returns:
         dict: Dictionary with topics and related words.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload a valid dataset for analysis.")
-        
-    # Process the entire dataset without sampling
-    # For extremely large datasets (10M+ reviews), implement chunking
-    print(f"Performing topic modeling on dataset with {len(df)} reviews")
-        
-    # Clean and prepare text data
-    # Use only non-empty review texts
-    texts = df['reviewText'].dropna().astype(str).tolist()
-    
-    # Create document-term matrix
-    stop_words = set(stopwords.words('english'))
-    vectorizer = CountVectorizer(
-        max_df=0.95, 
-        min_df=2,
-        stop_words=stop_words,
-        max_features=10000  # Limit features for memory efficiency
-    )
     
     try:
-        dtm = vectorizer.fit_transform(texts)
-        feature_names = vectorizer.get_feature_names_out()
-    except Exception as e:
-        print(f"Error creating document-term matrix: {str(e)}")
-        return {"error": f"Failed to create document-term matrix: {str(e)}"}
-    
-    # Apply LDA
-    try:
-        lda = LatentDirichletAllocation(
-            n_components=num_topics,
-            random_state=42,
-            n_jobs=-1  # Use all available cores
-        )
-        lda.fit(dtm)
+        model = get_topic_model(context, num_topics)
     except Exception as e:
         print(f"Error in LDA modeling: {str(e)}")
         return {"error": f"Topic modeling failed: {str(e)}"}
     
-    # Extract topics
-    topics = []
-    for topic_idx, topic in enumerate(lda.components_):
-        top_words_idx = topic.argsort()[:-num_words-1:-1]
-        top_words = [feature_names[i] for i in top_words_idx]
-        topics.append({
-            "id": topic_idx,
-            "words": top_words,
-            "weight": float(topic.sum() / lda.components_.sum())  # Topic importance
-        })
-    
-    return {
-        "num_topics": num_topics,
-        "topics": topics
-    }
+    return model.topics(num_words)
 
-def extract_common_words(sentiment='all', max_words=50):
+def extract_common_words(sentiment='all', max_words=50, asin=None, context=None):
     """
-    Extracts most common words from review texts, optionally filtered by sentiment.
+    Extracts most common words from review texts, optionally filtered by sentiment and product.
 
     Args:
         sentiment (str): Filter by sentiment ('all', 'positive', 'negative', 'neutral').
         max_words (int): Maximum number of words to return.
+        asin (str or list, optional): Only count reviews of this product (or these products).
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
 
     Returns:
         dict: Dictionary with word frequencies.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload a valid dataset for analysis.")
@@ -406,67 +397,62 @@ def extract_common_words(sentiment='all', max_words=50):
     print(f"Extracting common words from dataset with {len(df)} reviews")
     
     # If needed, calculate sentiment scores first
-    if sentiment != 'all' and 'sentiment_score' not in df.columns:
-        analyzer = SentimentIntensityAnalyzer()
-        df['sentiment_score'] = df['reviewText'].apply(
-            lambda text: analyzer.polarity_scores(str(text))['compound'] 
-            if isinstance(text, str) and text else 0
-        )
+    if sentiment != 'all':
+        ensure_sentiment_scores(context)
     
     # Filter by sentiment if requested
     if sentiment == 'positive':
-        filtered_df = df[df['sentiment_score'] >= 0.05]
+        rows = (df['sentiment_score'] >= 0.05).to_numpy()
     elif sentiment == 'negative':
-        filtered_df = df[df['sentiment_score'] <= -0.05]
+        rows = (df['sentiment_score'] <= -0.05).to_numpy()
     elif sentiment == 'neutral':
-        filtered_df = df[(df['sentiment_score'] > -0.05) & (df['sentiment_score'] < 0.05)]
+        rows = ((df['sentiment_score'] > -0.05) & (df['sentiment_score'] < 0.05)).to_numpy()
     else:
-        filtered_df = df
+        rows = None
     
-    if len(filtered_df) == 0:
+    if rows is not None and not rows.any():
         return {"error": f"No reviews found with sentiment: {sentiment}"}
     
-    # Combine all review texts
-    text = ' '.join(filtered_df['reviewText'].dropna().astype(str))
+    # Filter by product if requested
+    if asin is not None:
+        product_rows = df['asin'].isin([asin] if isinstance(asin, str) else list(asin)).to_numpy()
+        rows = product_rows if rows is None else rows & product_rows
+        if not rows.any():
+            return {"error": f"No reviews found for product {asin} with sentiment: {sentiment}"}
     
-    # Tokenize and clean
     stop_words = set(stopwords.words('english'))
     custom_stopwords = {'product', 'item', 'amazon', 'one', 'buy', 'purchase', 'use', 'get', 'would', 'could', 'will'}
     stop_words = stop_words.union(custom_stopwords)
     
-    # Remove special characters and convert to lowercase
-    text = re.sub(r'[^\w\s]', ' ', text.lower())
-    words = word_tokenize(text)
-    
-    # Filter words
-    filtered_words = [word for word in words 
-                      if word.isalpha() and len(word) > 2 
-                      and word not in stop_words]
-    
-    # Get word frequency
-    word_freq = Counter(filtered_words)
-    top_words = word_freq.most_common(max_words)
+    # Count words over the text index of the dataset instead of tokenizing the texts again
+    text_index = get_text_index(context)
+    keep = text_index.term_mask(stop_words, min_length=3, alpha_only=True)
+    top_words = text_index.top_terms(text_index.term_counts(rows), max_words, keep)
     
     # Format for return
     result = {
         "sentiment_filter": sentiment,
         "word_count": {word: count for word, count in top_words}
     }
+    if asin is not None:
+        result["asin_filter"] = asin
     
     return result
 
-def summarize_reviews(asin=None, use_llm=True):
+def summarize_reviews(asin=None, use_llm=True, context=None):
     """
     Generates a summary of review insights.
     
     Args:
         asin (str, optional): Product ID to filter by
         use_llm (bool): Whether to use an LLM for summary generation
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
         
     Returns:
         dict: Summary of review insights
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload a valid dataset for analysis.")
@@ -531,7 +517,7 @@ def summarize_reviews(asin=None, use_llm=True):
                    "negative" if sentiment_scores["average_sentiment"] < -0.05 else "neutral"
         
         # Get common words
-        common_words = extract_common_words(sentiment='all', max_words=20)
+        common_words = extract_common_words(sentiment='all', max_words=20, context=context)
         
         # Create a statistical summary
         top_words = list(common_words['word_count'].keys())[:10]
@@ -562,14 +548,18 @@ def summarize_reviews(asin=None, use_llm=True):
     except Exception as e:
         return {"error": f"Failed to generate summary: {str(e)}"}
 
-def analyze_rating_distribution():
+def analyze_rating_distribution(context=None):
     """
     Analyzes the distribution of ratings across the dataset.
     
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
         dict: Rating distribution data for visualization.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload a valid dataset for analysis.")
@@ -587,14 +577,18 @@ def analyze_rating_distribution():
     
     return data
 
-def analyze_category_distribution():
+def analyze_category_distribution(context=None):
     """
     Analyzes the distribution of reviews across product categories.
     
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
         dict: Category distribution data for visualization.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload a valid dataset for analysis.")
@@ -618,80 +612,84 @@ def analyze_category_distribution():
     
     return data
 
-def generate_wordcloud_image(sentiment='all'):
+def _rating_rows(df, sentiment):
+    """Boolean mask of the reviews whose rating matches a sentiment, or None for 'all'."""
+    if sentiment == 'positive':
+        return (df['overall'] >= 4).to_numpy()
+    if sentiment == 'negative':
+        return (df['overall'] <= 2).to_numpy()
+    if sentiment == 'neutral':
+        return ((df['overall'] > 2) & (df['overall'] < 4)).to_numpy()
+    return None
+
+def review_word_frequencies(sentiment='all', max_words=100, stop_words=(), min_length=2, context=None):
     """
-    Generates a word cloud for reviews with specified sentiment.
-    
+    Counts the most frequent words of the reviews with a rating-based sentiment.
+
     Args:
-        sentiment (str): Filter by sentiment ('all', 'positive', 'negative', 'neutral')
-        
+        sentiment (str): Filter by rating ('all', 'positive' 4-5, 'negative' 1-2, 'neutral' 3)
+        max_words (int): Number of words to return
+        stop_words (iterable): Words to leave out
+        min_length (int): Shortest word to count
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+
     Returns:
-        str: Base64-encoded image of the word cloud.
+        dict: Word to count, most frequent first.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload a valid dataset for analysis.")
     
-    # Filter by sentiment if specified
-    if sentiment != 'all':
-        if sentiment == 'positive':
-            filtered_df = df[df['overall'] >= 4]
-        elif sentiment == 'negative':
-            filtered_df = df[df['overall'] <= 2]
-        elif sentiment == 'neutral':
-            filtered_df = df[(df['overall'] > 2) & (df['overall'] < 4)]
-        else:
-            filtered_df = df
-    else:
-        filtered_df = df
+    text_index = get_text_index(context)
+    keep = text_index.term_mask(stop_words, min_length=min_length, alpha_only=True)
+    return dict(text_index.top_terms(text_index.term_counts(_rating_rows(df, sentiment)), max_words, keep))
+
+def generate_wordcloud_image(sentiment='all', max_words=100, context=None):
+    """
+    Generates a word cloud for reviews with specified sentiment.
     
-    # Sample data if needed
-    sample_size = min(5000, len(filtered_df))
-    sample_df = filtered_df.sample(n=sample_size, random_state=42) if len(filtered_df) > sample_size else filtered_df
+    The cloud is drawn from the word frequencies of the text index and cached as an
+    image file, so it is only drawn once per dataset, sentiment and number of words.
     
-    # Combine all review text
-    text = ' '.join(sample_df['reviewText'].dropna().astype(str))
+    Args:
+        sentiment (str): Filter by sentiment ('all', 'positive', 'negative', 'neutral')
+        max_words (int): Number of words in the cloud
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+        
+    Returns:
+        dict: The sentiment and the URL of the word cloud image.
+    """
+    context = _resolve_context(context)
     
     # Configure stop words
     stop_words = set(STOPWORDS)
     stop_words.update(['product', 'amazon', 'review', 'star', 'item'])
     
-    # Generate word cloud
-    wordcloud = WordCloud(
-        width=800, 
-        height=400, 
-        background_color='white', 
-        stopwords=stop_words, 
-        max_words=100,
-        collocations=False
-    ).generate(text)
-    
-    # Convert to image
-    plt.figure(figsize=(10, 5))
-    plt.imshow(wordcloud, interpolation='bilinear')
-    plt.axis('off')
-    
-    # Save to bytesIO and convert to base64
-    img_data = BytesIO()
-    plt.savefig(img_data, format='png')
-    img_data.seek(0)
-    base64_img = base64.b64encode(img_data.read()).decode('utf-8')
-    plt.close()
+    cloud = get_wordcloud(
+        dataset_key(context), 'agent', sentiment, max_words,
+        lambda: review_word_frequencies(sentiment, max_words=max_words, stop_words=stop_words, context=context)
+    )
     
     return {
         "sentiment": sentiment,
-        "image": f"data:image/png;base64,{base64_img}"
+        "image": cloud['image_url'],
+        "image_url": cloud['image_url']
     }
 
-def generate_sentiment_pie_chart():
+def generate_sentiment_pie_chart(context=None):
     """
     Generates a pie chart showing the distribution of sentiments.
     
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
         dict: Pie chart data and base64-encoded image.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload a valid dataset for analysis.")
@@ -737,7 +735,7 @@ def generate_sentiment_pie_chart():
     
     return data
 
-def group_by_feature(feature, aggregate_col, aggregate_func='mean'):
+def group_by_feature(feature, aggregate_col, aggregate_func='mean', context=None):
     """
     Groups the data by a specified feature and calculates an aggregate on another column.
 
@@ -745,11 +743,13 @@ def group_by_feature(feature, aggregate_col, aggregate_func='mean'):
         feature (str): Column name to group by (e.g., 'category', 'asin').
         aggregate_col (str): Column name to aggregate (e.g., 'overall').
         aggregate_func (str): Aggregation function (e.g., 'mean', 'count').
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
 
     Returns:
         pandas.Series: Grouped data as a pandas Series.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload a valid dataset for analysis.")
@@ -761,15 +761,20 @@ def group_by_feature(feature, aggregate_col, aggregate_func='mean'):
     grouped = df.groupby(feature)[aggregate_col].agg(aggregate_func)
     return grouped  # Return the actual pandas Series object
 
-def analyze_comprehensive_reviews():
+def build_review_report(context=None):
     """
-    Performs a comprehensive analysis of the reviews data using LLM where available.
+    Builds a comprehensive analysis of the reviews data using LLM where available.
     Generates both textual and data-driven insights dynamically.
 
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
-        str: Detailed markdown-formatted analysis of the review data.
+        Report: The analysis, renderable as markdown or JSON. An LLM analysis is a single
+                markdown block.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload a valid dataset for analysis.")
@@ -788,7 +793,7 @@ def analyze_comprehensive_reviews():
     # Calculate sentiment distribution
     sentiment_data = {}
     try:
-        sentiment_results = analyze_sentiment()
+        sentiment_results = analyze_sentiment(context=context)
         sentiment_data = sentiment_results.get('distribution', {})
     except Exception as e:
         print(f"Error analyzing sentiment: {str(e)}")
@@ -796,8 +801,8 @@ def analyze_comprehensive_reviews():
     # Try to use LLM for comprehensive analysis
     if is_ollama_running():
         try:
-            # Create rich context for the LLM
-            context = f"""
+            # Create a rich description of the dataset for the LLM
+            dataset_prompt = f"""
             You're an expert in analyzing customer reviews data. You are analyzing a real dataset of Amazon product reviews with:
             - {num_reviews:,} reviews
             - {num_products:,} unique products
@@ -828,105 +833,167 @@ def analyze_comprehensive_reviews():
             
             # Get the LLM to analyze the data
             llm = Ollama(model="llama3", request_timeout=60.0)
-            response = llm.complete(f"{context}{reviews_text}")
+            response = llm.complete(f"{dataset_prompt}{reviews_text}")
             
             # If we got a meaningful response, return it
             if response and response.text and len(response.text.strip()) > 100:
-                return response.text.strip()
+                report = Report()
+                report.markdown(response.text.strip())
+                return report
         except Exception as e:
             print(f"LLM analysis failed: {str(e)}")
             # Fall back to template-based analysis
     
     # If LLM failed or is not available, use template-based analysis
-    analysis = "## Review Data Analysis\n\n"
-    analysis += f"Total number of reviews: {num_reviews:,}\n"
-    analysis += f"Number of unique products: {num_products:,}\n"
-    analysis += f"Average overall rating: {avg_rating:.2f}/5\n\n"
+    report = Report()
+    report.heading("Review Data Analysis")
+    report.paragraph(f"Total number of reviews: {num_reviews:,}\n"
+                     f"Number of unique products: {num_products:,}\n"
+                     f"Average overall rating: {avg_rating:.2f}/5")
     
     # Rating distribution
-    analysis += "### Rating Distribution\n\n"
-    for rating, count in rating_dist.items():
-        percentage = (count / num_reviews) * 100
-        analysis += f"- {rating} stars: {count:,} reviews ({percentage:.1f}%)\n"
-    analysis += "\n"
+    report.heading("Rating Distribution", 3)
+    ratings = df['overall'].value_counts().sort_index().rename_axis('rating').reset_index(name='count')
+    ratings['percent'] = ratings['count'] / num_reviews * 100
+    report.rows(ratings, "{rating} stars: {count:,} reviews ({percent:.1f}%)")
     
     # Add insights based on rating distribution
     if avg_rating >= 4.0:
-        analysis += "The products in this dataset have very positive reviews overall, indicating high customer satisfaction.\n\n"
+        report.paragraph("The products in this dataset have very positive reviews overall, indicating high customer satisfaction.")
     elif avg_rating >= 3.0:
-        analysis += "The products in this dataset have moderately positive reviews, suggesting room for improvement.\n\n"
+        report.paragraph("The products in this dataset have moderately positive reviews, suggesting room for improvement.")
     else:
-        analysis += "The products in this dataset have relatively low ratings, indicating significant customer dissatisfaction.\n\n"
+        report.paragraph("The products in this dataset have relatively low ratings, indicating significant customer dissatisfaction.")
     
     # Top categories by number of reviews
     if 'category' in df.columns:
-        category_counts = df['category'].value_counts().head(5)
-        analysis += "### Top 5 Categories by Number of Reviews\n\n"
-        for category, count in category_counts.items():
-            percentage = (count / num_reviews) * 100
-            analysis += f"- {category}: {count:,} reviews ({percentage:.1f}%)\n"
-        analysis += "\n"
+        category_counts = df['category'].value_counts().head(5).rename_axis('category').reset_index(name='count')
+        category_counts['percent'] = category_counts['count'] / num_reviews * 100
+        report.heading("Top 5 Categories by Number of Reviews", 3)
+        report.rows(category_counts, "{category}: {count:,} reviews ({percent:.1f}%)")
     
     # Sentiment analysis
     if sentiment_data:
-        analysis += "### Sentiment Distribution\n\n"
-        analysis += f"- Positive: {sentiment_data.get('positive', 0)*100:.1f}%\n"
-        analysis += f"- Neutral: {sentiment_data.get('neutral', 0)*100:.1f}%\n"
-        analysis += f"- Negative: {sentiment_data.get('negative', 0)*100:.1f}%\n\n"
+        report.heading("Sentiment Distribution", 3)
+        report.items([
+            f"Positive: {sentiment_data.get('positive', 0)*100:.1f}%",
+            f"Neutral: {sentiment_data.get('neutral', 0)*100:.1f}%",
+            f"Negative: {sentiment_data.get('negative', 0)*100:.1f}%"
+        ])
         
         # Add insights based on sentiment
         pos_pct = sentiment_data.get('positive', 0)*100
         neg_pct = sentiment_data.get('negative', 0)*100
         
         if pos_pct > 70:
-            analysis += "The sentiment is predominantly positive, indicating strong customer satisfaction.\n\n"
+            report.paragraph("The sentiment is predominantly positive, indicating strong customer satisfaction.")
         elif pos_pct > neg_pct:
-            analysis += "The sentiment is more positive than negative, but there's room for improvement.\n\n"
+            report.paragraph("The sentiment is more positive than negative, but there's room for improvement.")
         elif neg_pct > pos_pct:
-            analysis += "The sentiment is more negative than positive, suggesting significant issues to address.\n\n"
+            report.paragraph("The sentiment is more negative than positive, suggesting significant issues to address.")
     
     # Topic modeling
     try:
-        topics = perform_topic_modeling(num_topics=3, num_words=5)
-        analysis += "### Key Topics in Reviews\n\n"
-        for topic in topics['topics']:
-            analysis += f"- Topic {topic['id']+1}: {', '.join(topic['words'])}\n"
-        analysis += "\n"
+        topics = perform_topic_modeling(num_topics=3, num_words=5, context=context)
+        report.heading("Key Topics in Reviews", 3)
+        report.items([f"Topic {topic['id']+1}: {', '.join(topic['words'])}" for topic in topics['topics']])
     except Exception as e:
         print(f"Topic modeling failed: {str(e)}")
     
     # Sample reviews
-    analysis += "### Sample Reviews\n\n"
-    sample_reviews = df.sample(min(3, len(df)))
-    for _, review in sample_reviews.iterrows():
-        analysis += f"- **Product {review['asin']}**: {review['summary']} (Rating: {review['overall']})\n"
+    report.heading("Sample Reviews", 3)
+    sample_reviews = df.sample(min(3, len(df)))[['asin', 'summary', 'overall']]
+    report.rows(sample_reviews, "**Product {asin}**: {summary} (Rating: {overall})")
     
     # Add recommendations
-    analysis += "\n### Recommendations\n\n"
+    report.heading("Recommendations", 3)
+    recommendations = []
     
     # Generate data-driven recommendations
     if avg_rating < 3.5:
-        analysis += "- Focus on product quality improvement based on negative review themes\n"
-        analysis += "- Address common customer complaints highlighted in low-rated reviews\n"
+        recommendations.append("Focus on product quality improvement based on negative review themes")
+        recommendations.append("Address common customer complaints highlighted in low-rated reviews")
     
     if 'category' in df.columns:
         low_rated_categories = df.groupby('category')['overall'].mean().sort_values().head(2)
         if not low_rated_categories.empty:
-            analysis += f"- Investigate quality issues in the {', '.join(low_rated_categories.index.tolist())} categories\n"
+            recommendations.append(f"Investigate quality issues in the {', '.join(low_rated_categories.index.tolist())} categories")
     
     if sentiment_data and sentiment_data.get('negative', 0) > 0.2:
-        analysis += "- Implement a customer feedback program to address the high proportion of negative sentiment\n"
+        recommendations.append("Implement a customer feedback program to address the high proportion of negative sentiment")
+    report.items(recommendations)
+    
+    return report
+
+def review_chart_series(context=None):
+    """
+    Computes the series of the review charts (rating and category distribution).
+
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
+    Returns:
+        dict: Chart key to chart entry ('labels', 'values', 'title', 'type').
+    """
+    context = _resolve_context(context)
+    df = context.df
+    series = {}
+    
+    if df is None or len(df) == 0:
+        return series
+    
+    if 'overall' in df.columns:
+        rating_counts = df['overall'].value_counts().sort_index()
+        if len(rating_counts) > 0:
+            rating_counts.index = [f"{int(float(r)) if float(r).is_integer() else float(r)} Stars" for r in rating_counts.index]
+            series['rating_distribution'] = chart_series(rating_counts, 'Rating Distribution', chart_type='bar')
+    
+    if 'category' in df.columns:
+        category_counts = df['category'].value_counts().head(10)
+        if len(category_counts) > 0:
+            series['category_distribution'] = chart_series(category_counts, 'Top Categories by Number of Reviews',
+                                                           chart_type='bar')
+    
+    return series
+
+def analyze_reviews(context=None):
+    """
+    Performs a comprehensive analysis of the reviews data, returning the report together
+    with the series of the review charts.
+
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
+    Returns:
+        AnalysisResult: The report and the chart series.
+    """
+    report = build_review_report(context=context)
+    return AnalysisResult(report, review_chart_series(context=context))
+
+def analyze_comprehensive_reviews(context=None):
+    """
+    Performs a comprehensive analysis of the reviews data using LLM where available.
+
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
     
-    return analysis
+    Returns:
+        str: Detailed markdown-formatted analysis of the review data.
+    """
+    return build_review_report(context=context).to_markdown()
 
-def get_product_info():
+def get_product_info(context=None):
     """
     Extracts product information including average ratings and sample summaries.
 
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
         dict: Dictionary with product information suitable for JSON serialization.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload a valid dataset for analysis.")
@@ -942,17 +1009,19 @@ def get_product_info():
     return {"products": products}
 
 # Enhance process_query_directly to handle review-related queries
-def process_query_directly(query):
+def process_query_directly(query, context=None):
     """
     Process a natural language query directly without using an LLM.
 
     Args:
         query (str): The query to process.
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
 
     Returns:
         str: The response to the query.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         return "No data is available. Please upload a valid dataset for analysis."
@@ -960,7 +1029,7 @@ def process_query_directly(query):
     query = query.lower()
     
     if "overview" in query or "summary" in query or "analysis" in query:
-        return analyze_comprehensive_reviews()
+        return analyze_comprehensive_reviews(context=context)
     
     elif "average rating" in query and "category" in query:
         categories = df['category'].unique()
@@ -971,7 +1040,7 @@ def process_query_directly(query):
         return "Please specify a valid category."
     
     elif "product info" in query or "products" in query or "top products" in query:
-        product_info = get_product_info()
+        product_info = get_product_info(context=context)
         products = sorted(product_info["products"], key=lambda x: x['review_count'], reverse=True)[:5]
         result = "Top 5 products by number of reviews:\n\n"
         for product in products:
@@ -979,25 +1048,25 @@ def process_query_directly(query):
         return result
     
     elif "average rating by category" in query:
-        avg_ratings = group_by_feature('category', 'overall', 'mean')
+        avg_ratings = group_by_feature('category', 'overall', 'mean', context=context)
         result = "Average ratings by category:\n\n"
         for cat, rating in avg_ratings.items():
             result += f"- {cat}: {rating:.2f}\n"
         return result
     
     elif "statistics" in query:
-        stats = summary_statistics()
+        stats = summary_statistics(context=context)
         return json.dumps(stats, indent=2)
     
     elif "topics" in query or "themes" in query:
-        topics = perform_topic_modeling()
+        topics = perform_topic_modeling(context=context)
         result = "Main topics in reviews:\n\n"
         for topic in topics['topics']:
             result += f"- Topic {topic['id']+1}: {', '.join(topic['words'])}\n"
         return result
     
     elif "sentiment" in query:
-        sentiment_data = analyze_sentiment()
+        sentiment_data = analyze_sentiment(context=context)
         result = "Sentiment analysis results:\n\n"
         result += f"- Positive: {sentiment_data['distribution']['positive']*100:.1f}%\n"
         result += f"- Neutral: {sentiment_data['distribution']['neutral']*100:.1f}%\n"
@@ -1008,8 +1077,8 @@ def process_query_directly(query):
         # Try to use LLM if available
         if is_ollama_running():
             try:
-                # First provide context summary about the data
-                context = f"""
+                # First provide a summary of the data
+                dataset_prompt = f"""
                 Dataset information:
                 - {len(df)} reviews
                 - {df['asin'].nunique()} unique products
@@ -1018,7 +1087,7 @@ def process_query_directly(query):
                 
                 llm = Ollama(model="llama3", request_timeout=30.0)
                 response = llm.complete(
-                    f"{context}\n\nPlease answer this query about the Amazon product reviews dataset: {query}"
+                    f"{dataset_prompt}\n\nPlease answer this query about the Amazon product reviews dataset: {query}"
                 )
                 return response.text.strip()
             except Exception as e:
@@ -1027,47 +1096,59 @@ def process_query_directly(query):
         return "Sorry, I don't understand that query. Try asking for an overview, product info, sentiment analysis, or topics."
 
 # Create tools for the ReAct agent
-summary_tool = FunctionTool.from_defaults(
-    fn=summary_statistics,
-    name="summary_statistics",
-    description="Calculates summary statistics for the review dataset including total reviews, average rating, and review count per category"
-)
-
-sentiment_tool = FunctionTool.from_defaults(
-    fn=analyze_sentiment,
-    name="analyze_sentiment",
-    description="Analyzes the sentiment of the review text using VADER sentiment analysis"
-)
-
-topic_tool = FunctionTool.from_defaults(
-    fn=perform_topic_modeling,
-    name="perform_topic_modeling",
-    description="Performs topic modeling on review text to identify common themes"
-)
-
-wordcloud_tool = FunctionTool.from_defaults(
-    fn=generate_wordcloud_image,
-    name="generate_wordcloud",
-    description="Generates a word cloud visualization from review text"
-)
-
-keywords_tool = FunctionTool.from_defaults(
-    fn=extract_common_words,
-    name="extract_common_words",
-    description="Extracts common words and key phrases from review text"
-)
-
-summarize_tool = FunctionTool.from_defaults(
-    fn=summarize_reviews,
-    name="summarize_reviews",
-    description="Summarizes reviews for a product or all reviews using statistical methods or LLM"
-)
+def create_review_tools(context=None):
+    """
+    Creates the ReAct agent tools, bound to a dataset.
+    
+    Args:
+        context (AnalysisContext, optional): Dataset the tools analyze. Defaults to the default context.
+        
+    Returns:
+        list: The FunctionTool objects.
+    """
+    context = _resolve_context(context)
+    
+    return [
+        FunctionTool.from_defaults(
+            fn=partial(summary_statistics, context=context),
+            name="summary_statistics",
+            description="Calculates summary statistics for the review dataset including total reviews, average rating, and review count per category"
+        ),
+        FunctionTool.from_defaults(
+            fn=partial(analyze_sentiment, context=context),
+            name="analyze_sentiment",
+            description="Analyzes the sentiment of the review text using VADER sentiment analysis"
+        ),
+        FunctionTool.from_defaults(
+            fn=partial(perform_topic_modeling, context=context),
+            name="perform_topic_modeling",
+            description="Performs topic modeling on review text to identify common themes"
+        ),
+        FunctionTool.from_defaults(
+            fn=partial(generate_wordcloud_image, context=context),
+            name="generate_wordcloud",
+            description="Generates a word cloud visualization from review text"
+        ),
+        FunctionTool.from_defaults(
+            fn=partial(extract_common_words, context=context),
+            name="extract_common_words",
+            description="Extracts common words and key phrases from review text"
+        ),
+        FunctionTool.from_defaults(
+            fn=partial(summarize_reviews, context=context),
+            name="summarize_reviews",
+            description="Summarizes reviews for a product or all reviews using statistical methods or LLM"
+        )
+    ]
 
 # Create the ReAct agent for more complex queries
-def create_review_agent():
+def create_review_agent(context=None):
     """
     Creates a ReAct agent with tools for analyzing reviews.
     
+    Args:
+        context (AnalysisContext, optional): Dataset the agent analyzes. Defaults to the default context.
+    
     Returns:
         ReActAgent: Configured agent if Ollama is running, None otherwise.
     """
@@ -1077,14 +1158,7 @@ def create_review_agent():
     try:
         llm = Ollama(model="llama2:13b", request_timeout=30.0)
         
-        tools = [
-            summary_tool,
-            sentiment_tool,
-            topic_tool,
-            wordcloud_tool,
-            keywords_tool,
-            summarize_tool
-        ]
+        tools = create_review_tools(context)
         
         agent = ReActAgent.from_tools(
             tools,
@@ -1098,18 +1172,20 @@ def create_review_agent():
         return None
 
 # Function to handle review agent queries with a more complex approach
-def review_agent_query(query):
+def review_agent_query(query, context=None):
     """
     Process a query using the ReAct agent if available, fall back to process_query_directly.
     Provides real-time analysis of review data using LLM.
     
     Args:
         query (str): The query to process.
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
         
     Returns:
         str: The response to the query.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         return "No data is available. Please upload a valid dataset for analysis."
@@ -1126,12 +1202,12 @@ def review_agent_query(query):
         categories = df['category'].value_counts().head(5).to_dict()
     
     # Try to use the ReAct agent first for complex reasoning
-    agent = create_review_agent()
+    agent = create_review_agent(context)
     
     if agent:
         try:
-            # Create rich context about the dataset for the agent
-            context = f"""
+            # Create a rich description of the dataset for the agent
+            dataset_prompt = f"""
             You are analyzing an Amazon product reviews dataset with {num_reviews:,} reviews across {num_products:,} products.
             The average rating is {avg_rating:.2f}/5 stars.
             
@@ -1148,7 +1224,7 @@ def review_agent_query(query):
             """
             
             # Use the agent to process the query with rich context
-            response = agent.query(context)
+            response = agent.query(dataset_prompt)
             return response.response
         except Exception as e:
             print(f"Agent query failed: {str(e)}")
@@ -1178,17 +1254,17 @@ def review_agent_query(query):
                     return response.text.strip()
                 else:
                     # Fall back to direct processing as last resort
-                    return process_query_directly(query)
+                    return process_query_directly(query, context=context)
             except Exception as llm_error:
                 print(f"LLM direct query failed: {str(llm_error)}")
                 # Final fallback to direct processing
-                return process_query_directly(query)
+                return process_query_directly(query, context=context)
     else:
         # Try direct LLM if ReAct agent isn't available
         try:
             if is_ollama_running():
-                # Create context for LLM query
-                context = f"""
+                # Describe the dataset for the LLM query
+                dataset_prompt = f"""
                 You are an AI review analyst assistant analyzing a dataset of {num_reviews:,} Amazon product reviews across {num_products:,} products.
                 The average rating is {avg_rating:.2f}/5 stars.
                 Rating distribution: {', '.join([f"{rating} stars: {count:,}" for rating, count in rating_dist.items()])}
@@ -1205,25 +1281,27 @@ def review_agent_query(query):
                         reviews_text += f"- \"{review['summary']}\" (Rating: {review['overall']})\n"
                 
                 llm = Ollama(model="llama3", request_timeout=30.0)
-                response = llm.complete(f"{context}{reviews_text}\n\nUser query: {query}")
+                response = llm.complete(f"{dataset_prompt}{reviews_text}\n\nUser query: {query}")
                 return response.text.strip()
         except Exception as e:
             print(f"LLM query failed: {str(e)}")
         
         # Use direct processing if all else fails
-        return process_query_directly(query)
+        return process_query_directly(query, context=context)
 
-def analyze_review_sentiments(product_id=None):
+def analyze_review_sentiments(product_id=None, context=None):
     """
     Analyzes sentiment distribution across reviews for a product or all products
     
     Args:
         product_id (str, optional): Product ID to filter by
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
         
     Returns:
         dict: Sentiment analysis results
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No review data available. Please load data first.")
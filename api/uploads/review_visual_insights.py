@@ -7,19 +7,18 @@ It works with the review_AI_Agent to generate meaningful visual insights from re
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import seaborn as sns
-from io import BytesIO
-import base64
 import traceback
-from wordcloud import WordCloud, STOPWORDS
-from sklearn.feature_extraction.text import CountVectorizer
+from wordcloud import STOPWORDS
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
 from nltk.sentiment.vader import SentimentIntensityAnalyzer
-import re
-from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords
 from collections import Counter
 import nltk
+from uploads.analysis_context import AnalysisContext
+from uploads.text_index import get_text_index, dataset_key
+from uploads.wordcloud_cache import get_wordcloud
+from uploads.term_frequency import count_ngrams, top_counts
 
 # Ensure NLTK resources are available
 try:
@@ -29,8 +28,14 @@ except LookupError:
     nltk.download('punkt')
     nltk.download('stopwords')
 
-# Reference to the dataframe - will be set by the review_AI_Agent
-df = None
+# Context used when a caller does not pass its own
+default_context = AnalysisContext(department='reviews')
+
+# Context cache key of the phrase counts of the topic distribution, by phrase length
+PHRASE_COUNTS_KEY = 'topic_phrase_counts'
+
+def _resolve_context(context):
+    return context if context is not None else default_context
 
 def convert_numpy_types(obj):
     """
@@ -62,19 +67,23 @@ def convert_numpy_types(obj):
         return obj
 
 def set_dataframe(dataframe):
-    """Set the dataframe for this module"""
-    global df
-    df = dataframe.copy()
-    return df
+    """Set the dataframe of the default context of this module"""
+    global default_context
+    default_context = AnalysisContext(dataframe, department='reviews')
+    return dataframe
 
-def get_sentiment_distribution():
+def get_sentiment_distribution(context=None):
     """
     Calculate sentiment distribution using star ratings and return data for visualization
     
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
         dict: Chart data with labels, values, and metadata
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data available for analysis")
@@ -108,14 +117,18 @@ def get_sentiment_distribution():
     
     return chart_data
 
-def get_rating_distribution():
+def get_rating_distribution(context=None):
     """
     Calculate rating distribution and return data for visualization
     
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
         dict: Chart data with labels, values, and metadata
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data available for analysis")
@@ -138,17 +151,24 @@ def get_rating_distribution():
     
     return chart_data
 
-def get_topic_distribution(num_topics=5):
+def get_topic_distribution(num_topics=5, max_ngram=2, context=None):
     """
     Calculate topic distribution using NLP and return data for visualization
     
+    Topics are the most frequent words and phrases of up to max_ngram words over all
+    reviews. Word counts come from the text index; phrase counts are streamed over the
+    texts once per dataset and kept on the context.
+    
     Args:
         num_topics (int): Number of topics to extract
+        max_ngram (int): Longest phrase to consider, in words (1 for single words only)
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
         
     Returns:
         dict: Chart data with labels, values, and metadata
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data available for analysis")
@@ -156,39 +176,25 @@ def get_topic_distribution(num_topics=5):
     if 'reviewText' not in df.columns:
         raise ValueError("Review text column 'reviewText' not found")
     
-    # Get a sample of reviews for analysis
-    sample_size = min(10000, len(df))
-    reviews_sample = df.sample(n=sample_size, random_state=42)
-    
-    # Preprocess review text
-    stop_words = set(stopwords.words('english'))
+    # Stop words of NLTK and sklearn, and words every review uses
+    stop_words = set(stopwords.words('english')) | set(ENGLISH_STOP_WORDS)
     stop_words.update(['product', 'amazon', 'review', 'star', 'item'])
     
-    processed_reviews = []
-    for text in reviews_sample['reviewText']:
-        if isinstance(text, str):
-            # Convert to lowercase and remove special characters
-            text = re.sub(r'[^\w\s]', '', text.lower())
-            # Tokenize
-            tokens = word_tokenize(text)
-            # Remove stopwords
-            tokens = [word for word in tokens if word not in stop_words and len(word) > 2]
-            processed_reviews.append(' '.join(tokens))
-    
-    # Extract top terms using CountVectorizer
-    vectorizer = CountVectorizer(max_features=100, stop_words='english', ngram_range=(1, 2))
-    X = vectorizer.fit_transform(processed_reviews)
+    # Term frequencies over all reviews are column sums of the dataset's text index
+    text_index = get_text_index(context)
+    keep = text_index.term_mask(stop_words, min_length=3)
+    candidates = dict(text_index.top_terms(text_index.term_counts(), num_topics, keep))
     
-    # Get feature names
-    feature_names = vectorizer.get_feature_names_out()
+    # Phrases, with stop words and short words removed before the words are paired
+    phrase_counts = context.cache.setdefault(PHRASE_COUNTS_KEY, {})
+    for ngram in range(2, max_ngram + 1):
+        if ngram not in phrase_counts:
+            phrase_counts[ngram], _ = count_ngrams(df['reviewText'], ngram, stop_words, min_length=3)
+        candidates.update(top_counts(phrase_counts[ngram], num_topics))
     
-    # Calculate term frequencies
-    term_freq = np.sum(X.toarray(), axis=0)
-    
-    # Get top terms
-    top_indices = term_freq.argsort()[-num_topics:][::-1]
-    top_terms = [feature_names[i] for i in top_indices]
-    top_freqs = [int(term_freq[i]) for i in top_indices]  # Convert np.int64 to Python int
+    top_words = top_counts(candidates, num_topics)
+    top_terms = [term for term, _ in top_words]
+    top_freqs = [count for _, count in top_words]
     
     # Create visualization data
     chart_data = {
@@ -202,14 +208,18 @@ def get_topic_distribution(num_topics=5):
     
     return chart_data
 
-def get_sentiment_by_category():
+def get_sentiment_by_category(context=None):
     """
     Calculate sentiment breakdown by category and return data for visualization
     
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
         dict: Chart data with labels, values, and metadata
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data available for analysis")
@@ -259,17 +269,20 @@ def get_sentiment_by_category():
     
     return result
 
-def get_word_cloud(sentiment='positive'):
+def get_word_cloud(sentiment='positive', max_words=100, context=None):
     """
     Generate word cloud data for specified sentiment
     
     Args:
         sentiment (str): 'positive', 'negative', or 'neutral'
+        max_words (int): Number of words in the cloud
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
         
     Returns:
-        dict: Base64 encoded image data and metadata
+        dict: URL of the cached word cloud image and metadata
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data available for analysis")
@@ -281,27 +294,25 @@ def get_word_cloud(sentiment='positive'):
         raise ValueError("Review rating column 'overall' not found")
     
     # Filter by sentiment
-    df_copy = df.copy()
     if sentiment == 'positive':
-        filtered_df = df_copy[df_copy['overall'] >= 4]
+        rows = (df['overall'] >= 4).to_numpy()
     elif sentiment == 'negative':
-        filtered_df = df_copy[df_copy['overall'] <= 2]
+        rows = (df['overall'] <= 2).to_numpy()
     elif sentiment == 'neutral':
-        filtered_df = df_copy[(df_copy['overall'] > 2) & (df_copy['overall'] < 4)]
+        rows = ((df['overall'] > 2) & (df['overall'] < 4)).to_numpy()
     else:
-        filtered_df = df_copy  # All reviews
-    
-    # Get sample for processing
-    sample_size = min(5000, len(filtered_df))
-    sample_df = filtered_df.sample(n=sample_size, random_state=42) if len(filtered_df) > sample_size else filtered_df
-    
-    # Combine all review text
-    text = ' '.join(sample_df['reviewText'].dropna().astype(str))
+        rows = None  # All reviews
     
     # Configure stop words
     stop_words = set(STOPWORDS)
     stop_words.update(['product', 'amazon', 'review', 'star', 'item', 'one', 'would', 'could', 'also'])
     
+    # Word frequencies of all matching reviews, from the text index
+    def frequencies():
+        text_index = get_text_index(context)
+        keep = text_index.term_mask(stop_words, alpha_only=True)
+        return dict(text_index.top_terms(text_index.term_counts(rows), max_words, keep))
+    
     # Generate word cloud with appropriate colors
     if sentiment == 'positive':
         colormap = 'Greens'
@@ -310,44 +321,29 @@ def get_word_cloud(sentiment='positive'):
     else:
         colormap = 'Blues'
     
-    wordcloud = WordCloud(
-        width=800, 
-        height=400, 
-        background_color='white', 
-        stopwords=stop_words, 
-        max_words=100,
-        colormap=colormap,
-        collocations=False
-    ).generate(text)
-    
-    # Convert to image
-    plt.figure(figsize=(10, 5))
-    plt.imshow(wordcloud, interpolation='bilinear')
-    plt.axis('off')
-    plt.title(f'{sentiment.capitalize()} Review Word Cloud', fontsize=16)
-    
-    # Save to bytesIO and convert to base64
-    img_data = BytesIO()
-    plt.savefig(img_data, format='png', dpi=150, bbox_inches='tight')
-    img_data.seek(0)
-    base64_img = base64.b64encode(img_data.read()).decode('utf-8')
-    plt.close()
+    # Rendered once per dataset, sentiment and number of words, then served from the cache
+    cloud = get_wordcloud(dataset_key(context), 'insights', sentiment, max_words, frequencies, colormap=colormap)
     
     return {
-        'image': f"data:image/png;base64,{base64_img}",
+        'image': cloud['image_url'],
+        'image_url': cloud['image_url'],
         'sentiment': sentiment,
         'title': f'{sentiment.capitalize()} Review Word Cloud',
         'description': f'Most common words in {sentiment} reviews'
     }
 
-def get_rating_trend():
+def get_rating_trend(context=None):
     """
     Calculate rating trend over time and return data for visualization
     
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
         dict: Chart data with labels, values, and metadata
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data available for analysis")
@@ -400,70 +396,77 @@ def get_rating_trend():
     
     return chart_data
 
-def get_all_visual_insights():
+def get_all_visual_insights(context=None):
     """
     Generate a complete set of visual insights for review data
     
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
         dict: All visualization data
     """
     insights = {}
     
     try:
-        insights['sentiment_distribution'] = get_sentiment_distribution()
+        insights['sentiment_distribution'] = get_sentiment_distribution(context=context)
     except Exception as e:
         print(f"Error generating sentiment distribution: {str(e)}")
     
     try:
-        insights['rating_distribution'] = get_rating_distribution()
+        insights['rating_distribution'] = get_rating_distribution(context=context)
     except Exception as e:
         print(f"Error generating rating distribution: {str(e)}")
     
     try:
-        insights['topic_distribution'] = get_topic_distribution()
+        insights['topic_distribution'] = get_topic_distribution(context=context)
     except Exception as e:
         print(f"Error generating topic distribution: {str(e)}")
         
     try:
-        insights['sentiment_by_category'] = get_sentiment_by_category()
+        insights['sentiment_by_category'] = get_sentiment_by_category(context=context)
     except Exception as e:
         print(f"Error generating sentiment by category: {str(e)}")
     
     try:
-        insights['positive_wordcloud'] = get_word_cloud('positive')
+        insights['positive_wordcloud'] = get_word_cloud('positive', context=context)
     except Exception as e:
         print(f"Error generating positive word cloud: {str(e)}")
     
     try:
-        insights['negative_wordcloud'] = get_word_cloud('negative')
+        insights['negative_wordcloud'] = get_word_cloud('negative', context=context)
     except Exception as e:
         print(f"Error generating negative word cloud: {str(e)}")
     
     try:
-        insights['rating_trend'] = get_rating_trend()
+        insights['rating_trend'] = get_rating_trend(context=context)
     except Exception as e:
         print(f"Error generating rating trend: {str(e)}")
     
     # Add ASIN summary for scatter plot
     try:
-        insights['asin_summary'] = get_asin_summary_viz()
+        insights['asin_summary'] = get_asin_summary_viz(context=context)
     except Exception as e:
         print(f"Error generating ASIN summary: {str(e)}")
 
     # Convert any remaining NumPy types to Python native types for JSON serialization
     return convert_numpy_types(insights)
 
-def get_asin_summary_viz():
+def get_asin_summary_viz(context=None):
     """
     Calculates summary statistics (review count, average rating) for each ASIN 
     and formats it for visualization.
 
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
         dict: A dictionary containing the ASIN summary data list under the 'data' key,
               along with title, description, and type for visualization.
               Returns an empty dict if data is not available or columns are missing.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         print("Warning: DataFrame is empty or not loaded in get_asin_summary_viz.")
@@ -1,22 +1,47 @@
 import pandas as pd
 import os
 import sys
+import hashlib
 import requests
+from statistics import NormalDist
+from collections import OrderedDict
 from llama_index.core.tools import FunctionTool
 from llama_index.llms.ollama import Ollama
 from llama_index.core.agent import ReActAgent
 from sklearn.linear_model import LinearRegression
 from sklearn.model_selection import train_test_split
 import numpy as np
+from uploads.parallel_loader import read_csv_files
+from uploads.frame_schema import SALES_COLUMN_TYPES, DAY_ORDER, AGE_LABELS, DERIVED_COLUMNS, apply_column_types, add_derived_columns, month_year_column
+from uploads.analysis_context import AnalysisContext
+from uploads.columnar_cache import content_hash_for
+from uploads.content_store import load_json_artifact, save_json_artifact
+from uploads.sales_cube import build_sales_cube, load_sales_cube, save_sales_cube, rollup
+from uploads.report_renderer import Report, AnalysisResult, chart_series
 
-# Global variable to store DataFrame
-df = None
-model = None
+# Context used when a caller does not pass its own, e.g. by the LLM tools
+default_context = AnalysisContext(department='sales')
+
+# Prediction model inputs, and the artifact its fitted coefficients are stored in
+MODEL_FEATURES = ['quantity', 'price', 'discount']
+MODEL_TARGET = 'total_amount'
+MODEL_ARTIFACT = 'sales_model.json'
+MODEL_PARAMS_KEY = 'model_params'
+
+# Context cache key of the aggregate cube the sales report is built from
+SALES_CUBE_KEY = 'sales_cube'
+
+# Models of datasets that are not a single stored file, by data fingerprint
+MODEL_CACHE_SIZE = 16
+_model_cache = OrderedDict()
+
+def _resolve_context(context):
+    return context if context is not None else default_context
 
 # Function to load and concatenate data from multiple CSV files
-def load_data(directory_or_files):
+def load_context(directory_or_files):
     """
-    Loads CSV data from either:
+    Loads CSV data into a new analysis context from either:
     1. A directory containing CSV files
     2. A list of specific CSV file paths
     
@@ -25,12 +50,8 @@ def load_data(directory_or_files):
                                          or a list of specific CSV file paths.
     
     Returns:
-        pd.DataFrame: Concatenated DataFrame of all CSV data.
+        AnalysisContext: Context holding the concatenated DataFrame of all CSV data.
     """
-    global df, model
-    
-    dfs = []
-    
     # Check if input is a list of file paths or a directory
     if isinstance(directory_or_files, list):
         # It's a list of file paths
@@ -39,33 +60,20 @@ def load_data(directory_or_files):
             raise ValueError("No CSV files found in the provided file list.")
         
         print(f"Loading {len(csv_files)} CSV files directly from provided paths")
-        for file_path in csv_files:
-            try:
-                file_df = pd.read_csv(file_path)
-                dfs.append(file_df)
-            except Exception as e:
-                print(f"Error reading file {file_path}: {str(e)}")
     else:
         # It's a directory path
         if not os.path.isdir(directory_or_files):
             raise ValueError(f"The provided path '{directory_or_files}' is not a valid directory.")
             
-        csv_files = [f for f in os.listdir(directory_or_files) if f.endswith('.csv')]
+        csv_files = [os.path.join(directory_or_files, f) for f in os.listdir(directory_or_files) if f.endswith('.csv')]
         if not csv_files:
             raise ValueError("No CSV files found in the specified directory.")
-        
-        for file_name in csv_files:
-            try:
-                file_path = os.path.join(directory_or_files, file_name)
-                file_df = pd.read_csv(file_path)
-                dfs.append(file_df)
-            except Exception as e:
-                print(f"Error reading file {file_name}: {str(e)}")
-    
-    if not dfs:
+    
+    # Files are read concurrently and concatenated once, with the sales column types applied while reading
+    df, _ = read_csv_files(csv_files, column_types=SALES_COLUMN_TYPES)
+    if df is None:
         raise ValueError("Failed to load any valid CSV data.")
-        
-    df = pd.concat(dfs, ignore_index=True)
+    df = compact_dataframe(df)
     
     # Print available columns for debugging
     print(f"Available columns: {df.columns.tolist()}")
@@ -95,53 +103,106 @@ def load_data(directory_or_files):
     # Parse timestamp and extract year
     process_dataframe(df)
     
-    # Train model
-    train_prediction_model()
+    # A single file is identified by its content hash, under which its model is stored
+    source = content_hash_for(csv_files[0]) if len(csv_files) == 1 else None
     
-    return df
+    # The prediction model is trained on first use by predict_total
+    return AnalysisContext(df, department='sales', source=source)
 
-# Function to set the dataframe directly
-def set_dataframe(dataframe):
+def load_data(directory_or_files):
     """
-    Sets the dataframe directly instead of loading from files.
+    Loads CSV data into the default context used by the LLM tools.
     
     Args:
-        dataframe (pd.DataFrame): The dataframe to use for analysis.
+        directory_or_files (str or list): A directory containing CSV files or a list of CSV file paths.
     
     Returns:
-        pd.DataFrame: The processed dataframe.
+        pd.DataFrame: Concatenated DataFrame of all CSV data.
+    """
+    global default_context
+    
+    default_context = load_context(directory_or_files)
+    return default_context.df
+
+# Function to build a context from a dataframe
+def create_context(dataframe, source=None):
     """
-    global df, model
+    Prepares a dataframe for analysis in a new context, without loading from files.
+    
+    The caller's dataframe is not modified. Only a shallow copy is made: the converted
+    and added columns belong to the context, the other columns share their data.
+    
+    Args:
+        dataframe (pd.DataFrame): The dataframe to use for analysis.
+        source (str, optional): Content hash of the file the dataframe was read from.
     
-    df = dataframe.copy()
+    Returns:
+        AnalysisContext: Context holding the processed dataframe.
+    """
+    df = compact_dataframe(dataframe.copy(deep=False))
     
     # Process the dataframe
     process_dataframe(df)
     
-    # Train model
-    train_prediction_model()
+    # The prediction model is trained on first use by predict_total
+    return AnalysisContext(df, department='sales', source=source)
+
+def set_dataframe(dataframe):
+    """
+    Sets the dataframe of the default context used by the LLM tools.
+    
+    Args:
+        dataframe (pd.DataFrame): The dataframe to use for analysis.
     
-    return df
+    Returns:
+        pd.DataFrame: The processed dataframe.
+    """
+    global default_context
+    
+    default_context = create_context(dataframe)
+    return default_context.df
+
+# Apply the declared sales column types
+def compact_dataframe(dataframe):
+    """
+    Convert a sales dataframe to its declared compact column types and report the memory saved.
+    
+    Args:
+        dataframe (pd.DataFrame): The dataframe to convert.
+    
+    Returns:
+        pd.DataFrame: The converted dataframe.
+    """
+    dataframe, bytes_before, bytes_after = apply_column_types(dataframe, SALES_COLUMN_TYPES)
+    print(f"Sales data uses {bytes_after / (1024 * 1024):.1f} MB after applying column types "
+          f"({(bytes_before - bytes_after) / (1024 * 1024):.1f} MB saved)")
+    return dataframe
 
 # Process the dataframe (timestamp conversion, etc.)
 def process_dataframe(dataframe):
     """
     Process a dataframe to prepare it for analysis.
     
+    Parses the time column and derives the bucket columns the analyses group by
+    (month_year, month_num, day_of_week, age_group, has_discount) once, so the analysis
+    functions only read them.
+    
     Args:
         dataframe (pd.DataFrame): The dataframe to process.
     """
-    global df
-    
     # Parse timestamp and extract year - handle with more flexibility
+    time_col = None
     if 'transaction_timestamp' in dataframe.columns:
         # Case: Combined column
-        dataframe['transaction_timestamp'] = pd.to_datetime(dataframe['transaction_timestamp'], errors='coerce')
-        dataframe['year'] = dataframe['transaction_timestamp'].dt.year
+        time_col = 'transaction_timestamp'
     elif 'timestamp' in dataframe.columns:
         # Case: Only timestamp column
-        dataframe['timestamp'] = pd.to_datetime(dataframe['timestamp'], errors='coerce')
-        dataframe['year'] = dataframe['timestamp'].dt.year
+        time_col = 'timestamp'
+    
+    if time_col:
+        if not pd.api.types.is_datetime64_any_dtype(dataframe[time_col]):
+            dataframe[time_col] = pd.to_datetime(dataframe[time_col], errors='coerce')
+        dataframe['year'] = dataframe[time_col].dt.year
     else:
         # Fallback: No time column available
         dataframe['year'] = 2023  # Default year
@@ -154,29 +215,39 @@ def process_dataframe(dataframe):
     
     if existing_cols:
         dataframe.dropna(subset=existing_cols, inplace=True)
+    
+    # Time, age and discount buckets
+    add_derived_columns(dataframe, time_col or 'timestamp')
 
 # Train the prediction model
-def train_prediction_model():
+def train_prediction_model(context=None):
     """
-    Train the prediction model based on the current dataframe.
+    Train the prediction model based on the dataframe of a context.
+    
+    Args:
+        context (AnalysisContext, optional): Context to train on. Defaults to the default context.
+    
+    Returns:
+        LinearRegression: The fitted model, or None if the data cannot be used for training.
     """
-    global df, model
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         print("Warning: No data available for training model")
-        return
+        return None
         
     # Check if necessary columns exist
-    required_cols = ['quantity', 'price', 'discount', 'total_amount']
+    required_cols = MODEL_FEATURES + [MODEL_TARGET]
     missing_cols = [col for col in required_cols if col not in df.columns]
     
     if missing_cols:
         print(f"Warning: Cannot train prediction model, missing columns: {missing_cols}")
-        return
+        return None
     
     # Train a prediction model using numerical features to predict 'total_amount'
-    X = df[['quantity', 'price', 'discount']]  # Features for prediction
-    y = df['total_amount']  # Target variable
+    X = df[MODEL_FEATURES]  # Features for prediction
+    y = df[MODEL_TARGET]  # Target variable
     
     # Split data for training
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
@@ -184,8 +255,118 @@ def train_prediction_model():
     # Create and train the model
     model = LinearRegression()
     model.fit(X_train, y_train)
+    context.cache[MODEL_PARAMS_KEY] = _model_params(model, X_train, y_train)
     
     print("Prediction model trained successfully")
+    return model
+
+def _model_params(model, X_train, y_train):
+    """
+    Return the fitted coefficients of a model and the statistics needed for prediction
+    intervals as JSON-serializable values.
+    """
+    design = np.column_stack([np.ones(len(X_train)), X_train.to_numpy(dtype=float)])
+    weights = np.concatenate([[model.intercept_], model.coef_])
+    residuals = y_train.to_numpy(dtype=float) - design @ weights
+    dof = max(len(design) - design.shape[1], 1)
+    return {
+        'features': MODEL_FEATURES,
+        'coef': [float(value) for value in model.coef_],
+        'intercept': float(model.intercept_),
+        'residual_variance': float(residuals @ residuals / dof),
+        # (X'X)^-1 of the training design matrix, intercept first
+        'covariance': np.linalg.pinv(design.T @ design).tolist(),
+        'dof': int(dof)
+    }
+
+def _params_valid(params):
+    return bool(params) and params.get('features') == MODEL_FEATURES and 'covariance' in params
+
+def _model_from_params(params):
+    """Rebuild a fitted model from stored coefficients."""
+    model = LinearRegression()
+    model.coef_ = np.array(params['coef'], dtype=float)
+    model.intercept_ = float(params['intercept'])
+    model.n_features_in_ = len(MODEL_FEATURES)
+    model.feature_names_in_ = np.array(MODEL_FEATURES, dtype=object)
+    return model
+
+def dataset_fingerprint(df):
+    """
+    Hash the model inputs of a dataframe, to recognize a dataset that was already trained on.
+    
+    Args:
+        df (pd.DataFrame): Processed sales data.
+    
+    Returns:
+        str: Hex digest of the model feature and target columns.
+    """
+    row_hashes = pd.util.hash_pandas_object(df[MODEL_FEATURES + [MODEL_TARGET]], index=False)
+    return hashlib.sha256(row_hashes.to_numpy().tobytes()).hexdigest()
+
+def _train_model_params(context):
+    train_prediction_model(context)
+    return context.cache.get(MODEL_PARAMS_KEY)
+
+def get_model_params(context=None):
+    """
+    Return the fitted coefficients of a dataset's prediction model, training it only if
+    no fitted model is known.
+    
+    Coefficients of a single stored file are kept in the content store under the file's
+    content hash, so loading the same file again never retrains. Other datasets are
+    matched by a fingerprint of their model inputs within this process.
+    
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
+    Returns:
+        dict: 'features', 'coef', 'intercept', 'residual_variance', 'covariance' and 'dof',
+              or None if the data cannot be used for training.
+    """
+    context = _resolve_context(context)
+    params = context.cache.get(MODEL_PARAMS_KEY)
+    if params is not None:
+        return params
+    df = context.df
+    if df is None or len(df) == 0 or any(col not in df.columns for col in MODEL_FEATURES + [MODEL_TARGET]):
+        return _train_model_params(context)
+    
+    if context.source:
+        params = load_json_artifact(context.source, MODEL_ARTIFACT)
+        if not _params_valid(params):
+            params = _train_model_params(context)
+            save_json_artifact(context.source, MODEL_ARTIFACT, params)
+    else:
+        fingerprint = dataset_fingerprint(df)
+        params = _model_cache.get(fingerprint)
+        if params is None:
+            params = _train_model_params(context)
+            _model_cache[fingerprint] = params
+            if len(_model_cache) > MODEL_CACHE_SIZE:
+                _model_cache.popitem(last=False)
+        else:
+            _model_cache.move_to_end(fingerprint)
+    
+    context.cache[MODEL_PARAMS_KEY] = params
+    return params
+
+def get_prediction_model(context=None):
+    """
+    Return the prediction model of a dataset, training it only if no fitted model is known.
+    
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
+    Returns:
+        LinearRegression: The fitted model, or None if the data cannot be used for training.
+    """
+    context = _resolve_context(context)
+    if context.model is None:
+        params = get_model_params(context)
+        if params is not None:
+            context.model = _model_from_params(params)
+    return context.model
 
 # Check if Ollama is running
 def is_ollama_running():
@@ -202,30 +383,34 @@ def initialize_with_sample_data():
     This function will always raise an error as synthetic data is not allowed per company policy.
     All analyses must use actual customer data that has been properly uploaded.
     """
-    global df, model
-    
-    if df is None:
+    if default_context.df is None:
         print("ERROR: No data loaded and synthetic data generation is disabled")
         raise ValueError("No data is available. Please upload real data for analysis. Synthetic data generation is not allowed per company policy.")
 
-# Define analysis tools - these functions will use the global dataframe
-def summary_statistics():
+# Define analysis tools - these functions use the given context, or the default context
+def summary_statistics(context=None):
     """
     Calculates summary statistics for numerical columns in the DataFrame.
     
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
         pandas.DataFrame: Summary statistics as a DataFrame.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload real data for analysis.")
         
-    numerical_cols = df.select_dtypes(include=['float64', 'int64']).columns
+    # Any numeric width - the schema downcasts columns such as quantity to int8 - but not
+    # the date and bucket columns added on load
+    numerical_cols = [col for col in df.select_dtypes('number').columns if col not in ('year', *DERIVED_COLUMNS)]
     stats = df[numerical_cols].describe()
     return stats  # Return the actual DataFrame
 
-def group_by_feature(feature, aggregate_col, aggregate_func='mean'):
+def group_by_feature(feature, aggregate_col, aggregate_func='mean', context=None):
     """
     Groups the data by a specified feature and calculates an aggregate on another column.
     
@@ -233,11 +418,13 @@ def group_by_feature(feature, aggregate_col, aggregate_func='mean'):
         feature (str): Column name to group by.
         aggregate_col (str): Column name to aggregate.
         aggregate_func (str): Aggregation function (e.g., 'mean', 'sum').
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
     
     Returns:
         pandas.Series: Grouped data as a pandas Series.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload real data for analysis.")
@@ -247,10 +434,10 @@ def group_by_feature(feature, aggregate_col, aggregate_func='mean'):
         # Return an empty Series if the columns don't exist
         return pd.Series()
         
-    grouped = df.groupby(feature)[aggregate_col].agg(aggregate_func)
+    grouped = df.groupby(feature, observed=True)[aggregate_col].agg(aggregate_func)
     return grouped  # Return the actual pandas Series object
 
-def predict_total(c_quantity, price, discount):
+def predict_total(c_quantity, price, discount, context=None):
     """
     Predicts the total sales amount based on quantity, price, and discount.
     
@@ -258,34 +445,122 @@ def predict_total(c_quantity, price, discount):
         c_quantity (int): Quantity of items.
         price (float): Price per item.
         discount (float): Discount percentage as a decimal.
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
     
     Returns:
         float: Predicted total sales amount.
     """
-    global model, df
+    context = _resolve_context(context)
+    df = context.df
     
-    if model is None:
-        if df is None or len(df) == 0:
-            raise ValueError("No data is available. Please upload real data for analysis.")
-        else:
-            train_prediction_model()
-            
-    if model is None:
+    if df is None or len(df) == 0:
+        raise ValueError("No data is available. Please upload real data for analysis.")
+    
+    # Trained on first use, or restored from the stored coefficients of the same data
+    if get_model_params(context) is None:
         return "Prediction model not available"
         
-    input_data = pd.DataFrame([[float(c_quantity), float(price), float(discount)]], 
-                             columns=['quantity', 'price', 'discount'])
-    prediction = model.predict(input_data)
-    return float(prediction[0])
+    result = predict_totals([c_quantity], [price], [discount], context=context)
+    return float(result['predictions'][0])
+
+def predict_totals(quantities, prices, discounts, context=None, confidence=0.95, interval='confidence'):
+    """
+    Predicts the total sales amount for many (quantity, price, discount) rows at once.
+    
+    All rows are predicted with one matrix product against the fitted coefficients.
+    Scalars are broadcast against the arrays, so a price sweep at a fixed quantity and
+    discount only needs the prices as an array.
+    
+    Args:
+        quantities (array-like or float): Quantity of items per row.
+        prices (array-like or float): Price per item per row.
+        discounts (array-like or float): Discount percentage as a decimal per row.
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+        confidence (float): Confidence level of the interval bounds.
+        interval (str): 'confidence' for the interval of the expected total, or 'prediction'
+                        for the wider interval of a single transaction's total.
+    
+    Returns:
+        dict: 'quantity', 'price', 'discount', 'predictions', 'lower' and 'upper' as NumPy
+              arrays, plus 'confidence' and 'interval'.
+    """
+    context = _resolve_context(context)
+    
+    if context.df is None or len(context.df) == 0:
+        raise ValueError("No data is available. Please upload real data for analysis.")
+    if interval not in ('confidence', 'prediction'):
+        raise ValueError(f"Unknown interval type: {interval}")
+    if not 0 < confidence < 1:
+        raise ValueError("Confidence must be between 0 and 1")
+    
+    params = get_model_params(context)
+    if params is None:
+        raise ValueError("Prediction model not available")
+    
+    quantities, prices, discounts = np.broadcast_arrays(
+        np.asarray(quantities, dtype=float), np.asarray(prices, dtype=float), np.asarray(discounts, dtype=float)
+    )
+    quantities, prices, discounts = quantities.ravel(), prices.ravel(), discounts.ravel()
+    design = np.column_stack([np.ones(len(quantities)), quantities, prices, discounts])
+    weights = np.concatenate([[params['intercept']], params['coef']])
+    predictions = design @ weights
+    
+    # Standard error of each row: sqrt(s^2 * x'(X'X)^-1 x), plus s^2 for a single transaction
+    covariance = np.asarray(params['covariance'], dtype=float)
+    variance = params['residual_variance'] * np.einsum('ij,jk,ik->i', design, covariance, design)
+    if interval == 'prediction':
+        variance = variance + params['residual_variance']
+    margin = NormalDist().inv_cdf(0.5 + confidence / 2) * np.sqrt(np.maximum(variance, 0))
+    
+    return {
+        'quantity': quantities,
+        'price': prices,
+        'discount': discounts,
+        'predictions': predictions,
+        'lower': predictions - margin,
+        'upper': predictions + margin,
+        'confidence': confidence,
+        'interval': interval
+    }
+
+def _grid_axis(spec):
+    """Values of one grid axis: a number, a list of values, or {'start', 'stop', 'num'} for a linear range."""
+    if isinstance(spec, dict):
+        return np.linspace(float(spec['start']), float(spec['stop']), int(spec.get('num', 10)))
+    return np.atleast_1d(np.asarray(spec, dtype=float))
+
+def predict_total_grid(quantity, price, discount, context=None, confidence=0.95, interval='confidence'):
+    """
+    Predicts the total sales amount for every combination of the given quantities, prices
+    and discounts, e.g. a price range crossed with a discount range.
+    
+    Args:
+        quantity: Grid axis - a number, a list of values, or a dict with 'start', 'stop'
+                  and optionally 'num' (default 10) for evenly spaced values.
+        price: Grid axis, as for quantity.
+        discount: Grid axis, as for quantity.
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+        confidence (float): Confidence level of the interval bounds.
+        interval (str): 'confidence' or 'prediction', see predict_totals.
+    
+    Returns:
+        dict: The predict_totals result with one row per combination, quantity varying slowest.
+    """
+    axes = np.meshgrid(_grid_axis(quantity), _grid_axis(price), _grid_axis(discount), indexing='ij')
+    return predict_totals(*axes, context=context, confidence=confidence, interval=interval)
 
-def analyze_sales_trend():
+def analyze_sales_trend(context=None):
     """
     Analyzes the sales trend over time based on the timestamp column.
     
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
     Returns:
         dict: Dictionary with 'labels' and 'values' for chart visualization.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload real data for analysis.")
@@ -307,291 +582,274 @@ def analyze_sales_trend():
     if not time_col:
         return result
     
-    # Convert to datetime
-    df[time_col] = pd.to_datetime(df[time_col], errors='coerce')
-    
-    # Group by month-year and sum total_amount
-    df['month_year'] = df[time_col].dt.strftime('%Y-%m')
-    monthly_sales = df.groupby('month_year')['total_amount'].sum().reset_index()
+    # Month buckets are derived by process_dataframe; frames set up otherwise get them here
+    if 'month_year' in df.columns:
+        month_year = df['month_year']
+    else:
+        month_year = month_year_column(pd.to_datetime(df[time_col], errors='coerce'))
     
-    # Sort by month-year
-    monthly_sales = monthly_sales.sort_values('month_year')
+    # Group by month-year and sum total_amount, in chronological order
+    monthly_sales = df['total_amount'].groupby(month_year, observed=True).sum()
     
     # Extract labels and values for chart visualization
-    result['labels'] = monthly_sales['month_year'].tolist()
-    result['values'] = monthly_sales['total_amount'].tolist()
+    result['labels'] = [str(label) for label in monthly_sales.index]
+    result['values'] = monthly_sales.tolist()
     
     return result
 
-def analyze_comprehensive_sales(query_type='overview'):
+def get_sales_cube(context=None):
     """
-    Performs a comprehensive analysis of sales data based on the query type.
+    Return the aggregate cube of a dataset, building it on first use.
+    
+    Cubes of a single stored file are cached in the content store under the file's
+    content hash, so later requests for the same file skip the pass over the rows.
+    
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
+    Returns:
+        pd.DataFrame: The cube (see sales_cube.build_sales_cube).
+    """
+    context = _resolve_context(context)
+    cube = context.cache.get(SALES_CUBE_KEY)
+    if cube is None:
+        cube = load_sales_cube(context.source) if context.source else None
+        if cube is None:
+            cube = build_sales_cube(context.df)
+            if context.source:
+                save_sales_cube(context.source, cube)
+        context.cache[SALES_CUBE_KEY] = cube
+    return cube
+
+def build_sales_report(query_type='overview', context=None):
+    """
+    Builds a comprehensive analysis of sales data based on the query type.
+    
+    All sections are rolled up from the dataset's aggregate cube, so follow-up queries
+    do not group the raw rows again.
     
     Args:
         query_type (str): Type of analysis to perform ('overview', 'categories', 'trends', 
                          'demographics', 'recommendations', etc.)
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
     
     Returns:
-        str: Detailed markdown-formatted analysis
+        Report: The analysis, renderable as markdown or JSON.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         raise ValueError("No data is available. Please upload real data for analysis.")
     
+    cube = get_sales_cube(context)
+    
     # Extract key metrics
-    total_sales = df['total_amount'].sum()
-    avg_order_value = df['total_amount'].mean()
+    total_sales = cube['sum'].sum()
     transaction_count = len(df)
+    avg_order_value = total_sales / cube['count'].sum()
     
     # Initialize response
-    analysis = ""
+    report = Report()
     
     # Perform different analyses based on query type
     if query_type == 'overview' or query_type == 'complete':
         # General overview with all key metrics
-        analysis += f"## Sales Data Overview\n\n"
-        analysis += f"The dataset contains **{transaction_count:,}** transactions with a total sales value of **${total_sales:,.2f}**. "
-        analysis += f"The average order value is **${avg_order_value:.2f}**.\n\n"
+        report.heading("Sales Data Overview")
+        report.paragraph(f"The dataset contains **{transaction_count:,}** transactions with a total sales value of **${total_sales:,.2f}**. "
+                         f"The average order value is **${avg_order_value:.2f}**.")
         
         # Add category analysis
         if 'product_category' in df.columns:
-            analysis += "## Product Category Analysis\n\n"
-            cat_sales = df.groupby('product_category')['total_amount'].agg(['sum', 'count']).reset_index()
-            cat_sales = cat_sales.sort_values('sum', ascending=False)
+            report.heading("Product Category Analysis")
+            cat_sales = rollup(cube, 'product_category').sort_values('sum', ascending=False).reset_index()
             
             # Calculate percentages
             cat_sales['percent'] = (cat_sales['sum'] / total_sales * 100)
             
             # Top categories
-            top_cats = cat_sales.head(3)
-            analysis += "### Top Categories by Revenue\n\n"
-            for _, row in top_cats.iterrows():
-                analysis += f"- **{row['product_category']}**: ${row['sum']:,.2f} ({row['percent']:.1f}% of total revenue) from {row['count']:,} transactions\n"
-            
-            analysis += "\n"
+            report.heading("Top Categories by Revenue", 3)
+            report.rows(cat_sales.head(3), "**{product_category}**: ${sum:,.2f} ({percent:.1f}% of total revenue) from {count:,} transactions")
         
         # Add time-based analysis
         if 'timestamp' in df.columns:
-            analysis += "## Sales Trends\n\n"
-            
-            # Convert to datetime to ensure proper analysis
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
+            report.heading("Sales Trends")
             
             # Monthly trend
-            df['month_year'] = df['timestamp'].dt.strftime('%Y-%m')
-            monthly_sales = df.groupby('month_year')['total_amount'].sum().reset_index()
+            monthly_sales = rollup(cube, 'month_year')['sum']
             
             # Calculate month-over-month growth
             if len(monthly_sales) > 1:
-                current = monthly_sales.iloc[-1]['total_amount']
-                previous = monthly_sales.iloc[-2]['total_amount']
+                current = monthly_sales.iloc[-1]
+                previous = monthly_sales.iloc[-2]
                 growth = ((current - previous) / previous) * 100 if previous > 0 else 0
                 
                 growth_text = "increased" if growth > 0 else "decreased"
-                analysis += f"Month-over-month sales have **{growth_text} by {abs(growth):.1f}%** "
-                analysis += f"(${current:,.2f} vs ${previous:,.2f}).\n\n"
+                report.paragraph(f"Month-over-month sales have **{growth_text} by {abs(growth):.1f}%** "
+                                 f"(${current:,.2f} vs ${previous:,.2f}).")
             
             # Day of week analysis
-            df['day_of_week'] = df['timestamp'].dt.day_name()
-            dow_sales = df.groupby('day_of_week')['total_amount'].sum().reindex([
-                'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'
-            ])
+            dow_sales = rollup(cube, 'day_of_week')['sum'].reindex(DAY_ORDER)
             best_day = dow_sales.idxmax()
             worst_day = dow_sales.idxmin()
             
-            analysis += f"Best performing day is **{best_day}** (${dow_sales[best_day]:,.2f}), while "
-            analysis += f"**{worst_day}** (${dow_sales[worst_day]:,.2f}) has the lowest sales.\n\n"
+            report.paragraph(f"Best performing day is **{best_day}** (${dow_sales[best_day]:,.2f}), while "
+                             f"**{worst_day}** (${dow_sales[worst_day]:,.2f}) has the lowest sales.")
         
         # Customer demographics
         if 'customer_age' in df.columns and 'customer_gender' in df.columns:
-            analysis += "## Customer Demographics\n\n"
+            report.heading("Customer Demographics")
             
             # Age group analysis
-            df['age_group'] = pd.cut(
-                df['customer_age'], 
-                bins=[0, 18, 25, 35, 50, 65, 120],
-                labels=['Under 18', '18-24', '25-34', '35-49', '50-64', '65+']
-            )
-            age_sales = df.groupby('age_group')['total_amount'].sum().reset_index()
-            top_age = age_sales.loc[age_sales['total_amount'].idxmax()]
+            age_sales = rollup(cube, 'age_group')['sum']
+            top_age = age_sales.idxmax()
             
-            analysis += f"The **{top_age['age_group']}** age group drives the most revenue "
-            analysis += f"(${top_age['total_amount']:,.2f}).\n\n"
+            report.paragraph(f"The **{top_age}** age group drives the most revenue "
+                             f"(${age_sales[top_age]:,.2f}).")
             
             # Gender analysis
-            gender_sales = df.groupby('customer_gender')['total_amount'].sum().reset_index()
-            gender_sales['percent'] = (gender_sales['total_amount'] / total_sales * 100)
-            
-            analysis += "### Gender Distribution\n\n"
-            for _, row in gender_sales.iterrows():
-                analysis += f"- **{row['customer_gender']}**: ${row['total_amount']:,.2f} ({row['percent']:.1f}%)\n"
+            gender_sales = rollup(cube, 'customer_gender').reset_index()
+            gender_sales['percent'] = (gender_sales['sum'] / total_sales * 100)
             
-            analysis += "\n"
+            report.heading("Gender Distribution", 3)
+            report.rows(gender_sales, "**{customer_gender}**: ${sum:,.2f} ({percent:.1f}%)")
         
         # Add recommendations section
-        analysis += "## Recommendations\n\n"
-        analysis += "Based on the analysis, consider implementing the following strategies:\n\n"
+        report.heading("Recommendations")
+        report.paragraph("Based on the analysis, consider implementing the following strategies:")
+        recommendations = []
         
         if 'product_category' in df.columns:
-            top_cat = cat_sales.iloc[0]['product_category']
-            analysis += f"1. **Focus on {top_cat}**: Invest more marketing budget in your top-performing category\n"
+            top_cat = cat_sales['product_category'].iloc[0]
+            recommendations.append(f"**Focus on {top_cat}**: Invest more marketing budget in your top-performing category")
             
             # If we have subcategories
             if 'product_subcategory' in df.columns:
-                subcat_sales = df.groupby(['product_category', 'product_subcategory'])['total_amount'].sum().reset_index()
-                subcat_sales = subcat_sales.sort_values('total_amount', ascending=False)
-                top_subcat = subcat_sales.iloc[0]
+                subcat_sales = rollup(cube, ['product_category', 'product_subcategory']).sort_values('sum', ascending=False)
+                top_category, top_subcategory = subcat_sales.index[0]
                 
-                analysis += f"2. **Promote {top_subcat['product_subcategory']}**: This subcategory in {top_subcat['product_category']} "
-                analysis += f"generates ${top_subcat['total_amount']:,.2f} in revenue\n"
+                recommendations.append(f"**Promote {top_subcategory}**: This subcategory in {top_category} "
+                                       f"generates ${subcat_sales['sum'].iloc[0]:,.2f} in revenue")
             else:
-                analysis += f"2. **Bundle products**: Create product bundles with items from {top_cat} to increase average order value\n"
+                recommendations.append(f"**Bundle products**: Create product bundles with items from {top_cat} to increase average order value")
         
         if 'customer_age' in df.columns and 'customer_gender' in df.columns:
-            analysis += f"3. **Target {top_age['age_group']} demographic**: This is your highest-value customer segment\n"
+            recommendations.append(f"**Target {top_age} demographic**: This is your highest-value customer segment")
         
         if 'timestamp' in df.columns:
-            analysis += f"4. **Optimize for {best_day}**: Schedule promotions and email campaigns for your highest-performing day\n"
+            recommendations.append(f"**Optimize for {best_day}**: Schedule promotions and email campaigns for your highest-performing day")
         
-        analysis += f"5. **Increase average order value**: Current AOV is ${avg_order_value:.2f} - implement cross-selling strategies to grow this metric\n"
+        recommendations.append(f"**Increase average order value**: Current AOV is ${avg_order_value:.2f} - implement cross-selling strategies to grow this metric")
+        report.items(recommendations, ordered=True)
     
     elif query_type == 'categories':
         # Detailed category analysis
         if 'product_category' in df.columns:
-            analysis += "## Product Category Analysis\n\n"
+            report.heading("Product Category Analysis")
             
             # Basic category stats
-            cat_sales = df.groupby('product_category').agg({
-                'total_amount': ['sum', 'mean'],
-                'transaction_id': 'count'
-            }).reset_index()
-            
-            cat_sales.columns = ['product_category', 'total_revenue', 'avg_order_value', 'transaction_count']
-            cat_sales = cat_sales.sort_values('total_revenue', ascending=False)
+            cat_sales = rollup(cube, 'product_category').sort_values('sum', ascending=False).reset_index()
             
             # Calculate market share
-            cat_sales['market_share'] = cat_sales['total_revenue'] / cat_sales['total_revenue'].sum() * 100
+            cat_sales['market_share'] = cat_sales['sum'] / cat_sales['sum'].sum() * 100
             
             # Create the category breakdown table
-            analysis += "### Category Revenue Breakdown\n\n"
-            analysis += "| Category | Revenue | Market Share | Transactions | Avg Order Value |\n"
-            analysis += "|----------|---------|--------------|--------------|----------------|\n"
-            
-            for _, row in cat_sales.iterrows():
-                analysis += f"| {row['product_category']} | ${row['total_revenue']:,.2f} | {row['market_share']:.1f}% | "
-                analysis += f"{row['transaction_count']:,} | ${row['avg_order_value']:.2f} |\n"
-            
-            analysis += "\n"
+            report.heading("Category Revenue Breakdown", 3)
+            report.table(cat_sales, [
+                ('Category', 'product_category', None),
+                ('Revenue', 'sum', '${:,.2f}'),
+                ('Market Share', 'market_share', '{:.1f}%'),
+                ('Transactions', 'count', '{:,}'),
+                ('Avg Order Value', 'mean', '${:.2f}')
+            ])
             
             # Top-performing category deep dive
-            top_cat = cat_sales.iloc[0]['product_category']
-            top_cat_data = df[df['product_category'] == top_cat]
+            top_cat = cat_sales['product_category'].iloc[0]
             
-            analysis += f"### Deep Dive: {top_cat}\n\n"
+            report.heading(f"Deep Dive: {top_cat}", 3)
             
             # Customer demographics for top category
             if 'customer_age' in df.columns:
-                top_cat_age = pd.cut(
-                    top_cat_data['customer_age'], 
-                    bins=[0, 18, 25, 35, 50, 65, 120],
-                    labels=['Under 18', '18-24', '25-34', '35-49', '50-64', '65+']
-                )
-                age_dist = top_cat_age.value_counts(normalize=True) * 100
+                age_counts = rollup(cube, 'age_group', {'product_category': top_cat})['count']
+                age_counts = age_counts.reindex(AGE_LABELS, fill_value=0).sort_values(ascending=False, kind='stable')
+                age_dist = (age_counts / age_counts.sum() * 100).rename('percent').rename_axis('age_group').reset_index()
                 
-                analysis += "#### Customer Age Distribution\n\n"
-                for age_group, percentage in age_dist.items():
-                    analysis += f"- {age_group}: {percentage:.1f}%\n"
-                
-                analysis += "\n"
+                report.heading("Customer Age Distribution", 4)
+                report.rows(age_dist, "{age_group}: {percent:.1f}%")
             
             # Subcategory analysis if available
             if 'product_subcategory' in df.columns:
-                subcat_sales = top_cat_data.groupby('product_subcategory')['total_amount'].sum().reset_index()
-                subcat_sales = subcat_sales.sort_values('total_amount', ascending=False)
+                subcat_sales = rollup(cube, 'product_subcategory', {'product_category': top_cat})
+                subcat_sales = subcat_sales.sort_values('sum', ascending=False).head(5).reset_index()
+                subcat_sales['percent'] = subcat_sales['sum'] / cat_sales['sum'].iloc[0] * 100
                 
-                analysis += "#### Top Subcategories\n\n"
-                for _, row in subcat_sales.head(5).iterrows():
-                    subcat_percent = row['total_amount'] / top_cat_data['total_amount'].sum() * 100
-                    analysis += f"- {row['product_subcategory']}: ${row['total_amount']:,.2f} ({subcat_percent:.1f}% of category revenue)\n"
+                report.heading("Top Subcategories", 4)
+                report.rows(subcat_sales, "{product_subcategory}: ${sum:,.2f} ({percent:.1f}% of category revenue)")
             
             # Key insights for category improvement
-            analysis += "\n### Category Insights\n\n"
-            analysis += f"1. **{top_cat} dominates sales** with {cat_sales.iloc[0]['market_share']:.1f}% market share\n"
+            report.heading("Category Insights", 3)
+            insights = [f"**{top_cat} dominates sales** with {cat_sales['market_share'].iloc[0]:.1f}% market share"]
             
             if len(cat_sales) > 2:
-                lowest_cat = cat_sales.iloc[-1]['product_category']
-                lowest_share = cat_sales.iloc[-1]['market_share']
-                analysis += f"2. **{lowest_cat} underperforms** with only {lowest_share:.1f}% market share\n"
+                lowest_cat = cat_sales['product_category'].iloc[-1]
+                lowest_share = cat_sales['market_share'].iloc[-1]
+                insights.append(f"**{lowest_cat} underperforms** with only {lowest_share:.1f}% market share")
+            report.items(insights, ordered=True)
             
             # Add category-specific recommendations
-            analysis += "\n### Category Recommendations\n\n"
-            analysis += f"1. Continue to capitalize on {top_cat}'s strong performance\n"
+            report.heading("Category Recommendations", 3)
+            recommendations = [f"Continue to capitalize on {top_cat}'s strong performance"]
             
             if len(cat_sales) > 2:
-                analysis += f"2. Evaluate the product mix and marketing for {lowest_cat}\n"
+                recommendations.append(f"Evaluate the product mix and marketing for {lowest_cat}")
             
-            analysis += f"3. Consider phasing out or revitalizing categories with less than 5% market share\n"
-            analysis += f"4. Explore cross-category promotions to increase exposure for lower-performing categories\n"
+            recommendations.append("Consider phasing out or revitalizing categories with less than 5% market share")
+            recommendations.append("Explore cross-category promotions to increase exposure for lower-performing categories")
+            report.items(recommendations, ordered=True)
     
     elif query_type == 'trends':
         # Time-based trend analysis
         if 'timestamp' in df.columns:
-            # Convert timestamp to datetime
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            
-            analysis += "## Sales Trend Analysis\n\n"
-            
-            # Time-based aggregations
-            df['year'] = df['timestamp'].dt.year
-            df['month'] = df['timestamp'].dt.month
-            df['day'] = df['timestamp'].dt.day
-            df['day_of_week'] = df['timestamp'].dt.day_name()
-            df['hour'] = df['timestamp'].dt.hour
-            df['month_year'] = df['timestamp'].dt.strftime('%Y-%m')
+            report.heading("Sales Trend Analysis")
             
             # Monthly trend
-            monthly_sales = df.groupby('month_year')['total_amount'].sum().reset_index()
-            
-            analysis += "### Monthly Sales Trend\n\n"
-            analysis += "| Month | Revenue | Month-over-Month Change |\n"
-            analysis += "|-------|---------|------------------------|\n"
-            
-            prev_month_sales = None
-            for i, row in monthly_sales.iterrows():
-                if i > 0:
-                    mom_change = ((row['total_amount'] - prev_month_sales) / prev_month_sales) * 100
-                    mom_symbol = "📈" if mom_change > 0 else "📉"
-                    analysis += f"| {row['month_year']} | ${row['total_amount']:,.2f} | {mom_symbol} {mom_change:.1f}% |\n"
-                else:
-                    analysis += f"| {row['month_year']} | ${row['total_amount']:,.2f} | - |\n"
-                
-                prev_month_sales = row['total_amount']
-            
-            analysis += "\n"
+            monthly = rollup(cube, 'month_year')
+            monthly_sales = monthly['sum']
+            
+            # Month-over-month change, marked as rising or falling
+            trend_table = monthly_sales.rename('revenue').rename_axis('month_year').reset_index()
+            mom_change = monthly_sales.pct_change().to_numpy() * 100
+            trend_table['mom_change'] = mom_change
+            change_text = pd.Series(np.where(mom_change > 0, "📈 ", "📉 "), dtype=object) + pd.Series(mom_change).map('{:.1f}%'.format)
+            change_text.iloc[:1] = "-"
+            trend_table['mom_change_text'] = change_text
+            
+            report.heading("Monthly Sales Trend", 3)
+            report.table(trend_table, [
+                ('Month', 'month_year', None),
+                ('Revenue', 'revenue', '${:,.2f}'),
+                ('Month-over-Month Change', 'mom_change_text', None)
+            ])
             
             # Day of week analysis
-            dow_sales = df.groupby('day_of_week')['total_amount'].agg(['sum', 'mean']).reset_index()
-            dow_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-            dow_sales['day_of_week'] = pd.Categorical(dow_sales['day_of_week'], categories=dow_order, ordered=True)
-            dow_sales = dow_sales.sort_values('day_of_week')
-            
-            analysis += "### Day of Week Analysis\n\n"
-            analysis += "| Day | Total Revenue | Average Daily Revenue |\n"
-            analysis += "|-----|---------------|----------------------|\n"
-            
-            for _, row in dow_sales.iterrows():
-                analysis += f"| {row['day_of_week']} | ${row['sum']:,.2f} | ${row['mean']:,.2f} |\n"
-            
-            analysis += "\n"
+            dow_sales = rollup(cube, 'day_of_week')
+            dow_sales = dow_sales.reindex([day for day in DAY_ORDER if day in dow_sales.index])
+            
+            report.heading("Day of Week Analysis", 3)
+            report.table(dow_sales.rename_axis('day_of_week').reset_index(), [
+                ('Day', 'day_of_week', None),
+                ('Total Revenue', 'sum', '${:,.2f}'),
+                ('Average Daily Revenue', 'mean', '${:,.2f}')
+            ])
             
             # Seasonality detection
             if len(monthly_sales) >= 12:  # Need at least a year of data
-                df['month_num'] = df['timestamp'].dt.month
-                monthly_avg = df.groupby('month_num')['total_amount'].mean().reset_index()
+                month_numbers = monthly.index.str[-2:].astype(int)
+                by_month = monthly[['sum', 'count']].groupby(month_numbers).sum()
+                monthly_avg = by_month['sum'] / by_month['count']
                 
-                high_season_months = monthly_avg.nlargest(3, 'total_amount')['month_num'].tolist()
-                low_season_months = monthly_avg.nsmallest(3, 'total_amount')['month_num'].tolist()
+                high_season_months = monthly_avg.nlargest(3).index.tolist()
+                low_season_months = monthly_avg.nsmallest(3).index.tolist()
                 
                 month_names = {
                     1: 'January', 2: 'February', 3: 'March', 4: 'April', 
@@ -602,301 +860,357 @@ def analyze_comprehensive_sales(query_type='overview'):
                 high_season = ', '.join([month_names[m] for m in high_season_months])
                 low_season = ', '.join([month_names[m] for m in low_season_months])
                 
-                analysis += "### Seasonality Patterns\n\n"
-                analysis += f"- **Peak season months**: {high_season}\n"
-                analysis += f"- **Low season months**: {low_season}\n\n"
+                report.heading("Seasonality Patterns", 3)
+                report.items([f"**Peak season months**: {high_season}", f"**Low season months**: {low_season}"])
             
             # Growth analysis and forecasting
             if len(monthly_sales) > 2:
                 # Calculate overall growth rate
-                first_month = monthly_sales.iloc[0]['total_amount']
-                last_month = monthly_sales.iloc[-1]['total_amount']
+                first_month = monthly_sales.iloc[0]
+                last_month = monthly_sales.iloc[-1]
                 num_months = len(monthly_sales) - 1
                 
                 monthly_growth_rate = ((last_month / first_month) ** (1/num_months)) - 1
                 annual_growth_rate = ((1 + monthly_growth_rate) ** 12) - 1
                 
-                analysis += "### Growth Analysis\n\n"
-                analysis += f"- Monthly growth rate: {monthly_growth_rate * 100:.2f}%\n"
-                analysis += f"- Annualized growth rate: {annual_growth_rate * 100:.2f}%\n\n"
+                report.heading("Growth Analysis", 3)
+                report.items([f"Monthly growth rate: {monthly_growth_rate * 100:.2f}%",
+                              f"Annualized growth rate: {annual_growth_rate * 100:.2f}%"])
                 
                 # Simple forecast for next 3 months
                 next_month_forecast = last_month * (1 + monthly_growth_rate)
                 three_month_forecast = last_month * ((1 + monthly_growth_rate) ** 3)
                 
-                analysis += "### Sales Forecast\n\n"
-                analysis += f"- Next month forecast: ${next_month_forecast:,.2f}\n"
-                analysis += f"- Three month forecast: ${three_month_forecast:,.2f}\n\n"
+                report.heading("Sales Forecast", 3)
+                report.items([f"Next month forecast: ${next_month_forecast:,.2f}",
+                              f"Three month forecast: ${three_month_forecast:,.2f}"])
             
             # Trend-based recommendations
-            analysis += "### Trend-Based Recommendations\n\n"
+            report.heading("Trend-Based Recommendations", 3)
+            recommendations = []
             
             if len(monthly_sales) > 2:
                 if monthly_growth_rate > 0:
-                    analysis += f"1. **Capitalize on growth**: Reinvest {(monthly_growth_rate * 100):.1f}% of revenue into marketing to maintain momentum\n"
+                    recommendations.append(f"**Capitalize on growth**: Reinvest {(monthly_growth_rate * 100):.1f}% of revenue into marketing to maintain momentum")
                 else:
-                    analysis += "1. **Address declining sales**: Investigate root causes and implement recovery strategies\n"
+                    recommendations.append("**Address declining sales**: Investigate root causes and implement recovery strategies")
             
-            best_day = dow_sales.loc[dow_sales['sum'].idxmax()]['day_of_week']
-            worst_day = dow_sales.loc[dow_sales['sum'].idxmin()]['day_of_week']
+            best_day = dow_sales['sum'].idxmax()
+            worst_day = dow_sales['sum'].idxmin()
             
-            analysis += f"2. **Optimize for {best_day}**: Schedule key promotional activities on your highest-performing day\n"
-            analysis += f"3. **Boost {worst_day} performance**: Create special offers or loyalty programs specific to your lowest-performing day\n"
+            recommendations.append(f"**Optimize for {best_day}**: Schedule key promotional activities on your highest-performing day")
+            recommendations.append(f"**Boost {worst_day} performance**: Create special offers or loyalty programs specific to your lowest-performing day")
             
             if len(monthly_sales) >= 12:
-                analysis += f"4. **Prepare for seasonality**: Increase inventory and marketing budget before {high_season}\n"
-                analysis += f"5. **Plan for low season**: Develop strategies to boost sales during {low_season}\n"
+                recommendations.append(f"**Prepare for seasonality**: Increase inventory and marketing budget before {high_season}")
+                recommendations.append(f"**Plan for low season**: Develop strategies to boost sales during {low_season}")
+            report.items(recommendations, ordered=True)
         else:
-            analysis += "## Trend Analysis\n\n"
-            analysis += "Unable to perform trend analysis because the timestamp column is missing from the data.\n"
+            report.heading("Trend Analysis")
+            report.paragraph("Unable to perform trend analysis because the timestamp column is missing from the data.")
     
     elif query_type == 'demographics':
         # Customer demographics analysis
         if 'customer_age' in df.columns or 'customer_gender' in df.columns or 'customer_location' in df.columns:
-            analysis += "## Customer Demographics Analysis\n\n"
+            report.heading("Customer Demographics Analysis")
             
             # Age analysis
             if 'customer_age' in df.columns:
-                # Create age groups
-                df['age_group'] = pd.cut(
-                    df['customer_age'], 
-                    bins=[0, 18, 25, 35, 50, 65, 120],
-                    labels=['Under 18', '18-24', '25-34', '35-49', '50-64', '65+']
-                )
-                
                 # Analyze by age group
-                age_metrics = df.groupby('age_group').agg({
-                    'total_amount': ['sum', 'mean'],
-                    'transaction_id': 'count'
-                }).reset_index()
-                
-                age_metrics.columns = ['age_group', 'total_revenue', 'avg_order_value', 'transaction_count']
+                age_metrics = rollup(cube, 'age_group')
                 
                 # Calculate percentage
-                age_metrics['revenue_percent'] = age_metrics['total_revenue'] / age_metrics['total_revenue'].sum() * 100
-                age_metrics['transaction_percent'] = age_metrics['transaction_count'] / age_metrics['transaction_count'].sum() * 100
-                
-                analysis += "### Customer Age Analysis\n\n"
-                analysis += "| Age Group | Revenue | % of Revenue | Transactions | % of Transactions | AOV |\n"
-                analysis += "|-----------|---------|--------------|--------------|-------------------|-----|\n"
+                age_metrics['revenue_percent'] = age_metrics['sum'] / age_metrics['sum'].sum() * 100
+                age_metrics['transaction_percent'] = age_metrics['count'] / age_metrics['count'].sum() * 100
                 
-                for _, row in age_metrics.iterrows():
-                    analysis += f"| {row['age_group']} | ${row['total_revenue']:,.2f} | {row['revenue_percent']:.1f}% | "
-                    analysis += f"{row['transaction_count']:,} | {row['transaction_percent']:.1f}% | ${row['avg_order_value']:.2f} |\n"
+                report.heading("Customer Age Analysis", 3)
+                report.table(age_metrics.reset_index(), [
+                    ('Age Group', 'age_group', None),
+                    ('Revenue', 'sum', '${:,.2f}'),
+                    ('% of Revenue', 'revenue_percent', '{:.1f}%'),
+                    ('Transactions', 'count', '{:,}'),
+                    ('% of Transactions', 'transaction_percent', '{:.1f}%'),
+                    ('AOV', 'mean', '${:.2f}')
+                ])
                 
                 # Identify highest value age group
-                top_revenue_age = age_metrics.loc[age_metrics['total_revenue'].idxmax()]
-                top_aov_age = age_metrics.loc[age_metrics['avg_order_value'].idxmax()]
+                top_revenue_age = age_metrics['sum'].idxmax()
+                top_aov_age = age_metrics['mean'].idxmax()
                 
-                analysis += "\n"
-                analysis += f"- The **{top_revenue_age['age_group']}** group generates the most revenue (${top_revenue_age['total_revenue']:,.2f})\n"
-                analysis += f"- The **{top_aov_age['age_group']}** group has the highest average order value (${top_aov_age['avg_order_value']:.2f})\n\n"
+                report.items([
+                    f"The **{top_revenue_age}** group generates the most revenue (${age_metrics.loc[top_revenue_age, 'sum']:,.2f})",
+                    f"The **{top_aov_age}** group has the highest average order value (${age_metrics.loc[top_aov_age, 'mean']:.2f})"
+                ])
             
             # Gender analysis
             if 'customer_gender' in df.columns:
-                gender_metrics = df.groupby('customer_gender').agg({
-                    'total_amount': ['sum', 'mean'],
-                    'transaction_id': 'count'
-                }).reset_index()
-                
-                gender_metrics.columns = ['gender', 'total_revenue', 'avg_order_value', 'transaction_count']
+                gender_metrics = rollup(cube, 'customer_gender')
                 
                 # Calculate percentages
-                gender_metrics['revenue_percent'] = gender_metrics['total_revenue'] / gender_metrics['total_revenue'].sum() * 100
-                
-                analysis += "### Gender Distribution\n\n"
-                for _, row in gender_metrics.iterrows():
-                    analysis += f"- **{row['gender']}**: ${row['total_revenue']:,.2f} ({row['revenue_percent']:.1f}% of revenue), "
-                    analysis += f"Avg. Order: ${row['avg_order_value']:.2f}, Transactions: {row['transaction_count']:,}\n"
+                gender_metrics['revenue_percent'] = gender_metrics['sum'] / gender_metrics['sum'].sum() * 100
                 
-                analysis += "\n"
+                report.heading("Gender Distribution", 3)
+                report.rows(gender_metrics.reset_index(),
+                            "**{customer_gender}**: ${sum:,.2f} ({revenue_percent:.1f}% of revenue), "
+                            "Avg. Order: ${mean:.2f}, Transactions: {count:,}")
             
             # Location analysis
             if 'customer_location' in df.columns:
-                location_metrics = df.groupby('customer_location').agg({
-                    'total_amount': ['sum', 'mean'],
-                    'transaction_id': 'count'
-                }).reset_index()
-                
-                location_metrics.columns = ['location', 'total_revenue', 'avg_order_value', 'transaction_count']
-                location_metrics = location_metrics.sort_values('total_revenue', ascending=False)
+                location_metrics = rollup(cube, 'customer_location').sort_values('sum', ascending=False)
                 
                 # Calculate percentages
-                location_metrics['revenue_percent'] = location_metrics['total_revenue'] / location_metrics['total_revenue'].sum() * 100
+                location_metrics['revenue_percent'] = location_metrics['sum'] / location_metrics['sum'].sum() * 100
                 
-                analysis += "### Top Customer Locations\n\n"
-                for _, row in location_metrics.head(5).iterrows():
-                    analysis += f"- **{row['location']}**: ${row['total_revenue']:,.2f} ({row['revenue_percent']:.1f}% of revenue)\n"
-                
-                analysis += "\n"
+                report.heading("Top Customer Locations", 3)
+                report.rows(location_metrics.head(5).reset_index(),
+                            "**{customer_location}**: ${sum:,.2f} ({revenue_percent:.1f}% of revenue)")
             
             # Cross-analysis (Age + Gender if available)
             if 'customer_age' in df.columns and 'customer_gender' in df.columns:
                 # Only do this for the top genders to avoid too much data
-                top_genders = gender_metrics.head(2)['gender'].tolist()
-                
-                analysis += "### Age and Gender Segments\n\n"
+                top_genders = gender_metrics.index[:2].tolist()
                 
+                segments = []
                 for gender in top_genders:
-                    gender_df = df[df['customer_gender'] == gender]
-                    
                     # Top age group for this gender
-                    gender_age_revenue = gender_df.groupby('age_group')['total_amount'].sum()
+                    gender_age_revenue = rollup(cube, 'age_group', {'customer_gender': gender})['sum']
                     top_age = gender_age_revenue.idxmax()
                     
-                    analysis += f"- **{gender}**: Highest revenue from **{top_age}** age group (${gender_age_revenue[top_age]:,.2f})\n"
+                    segments.append(f"**{gender}**: Highest revenue from **{top_age}** age group (${gender_age_revenue[top_age]:,.2f})")
                 
-                analysis += "\n"
+                report.heading("Age and Gender Segments", 3)
+                report.items(segments)
             
             # Demographic recommendations
-            analysis += "### Demographic-Based Recommendations\n\n"
+            report.heading("Demographic-Based Recommendations", 3)
+            recommendations = []
             
             if 'customer_age' in df.columns:
-                analysis += f"1. **Target {top_revenue_age['age_group']} customers** with personalized marketing campaigns\n"
-                analysis += f"2. **Increase AOV for {top_revenue_age['age_group']} customers** through targeted upselling\n"
+                recommendations.append(f"**Target {top_revenue_age} customers** with personalized marketing campaigns")
+                recommendations.append(f"**Increase AOV for {top_revenue_age} customers** through targeted upselling")
             
             if 'customer_gender' in df.columns and len(gender_metrics) > 1:
-                lowest_gender = gender_metrics.loc[gender_metrics['total_revenue'].idxmin()]['gender']
-                analysis += f"3. **Develop products/campaigns for {lowest_gender} customers** to balance revenue distribution\n"
+                lowest_gender = gender_metrics['sum'].idxmin()
+                recommendations.append(f"**Develop products/campaigns for {lowest_gender} customers** to balance revenue distribution")
             
             if 'customer_location' in df.columns:
-                top_location = location_metrics.iloc[0]['location']
-                analysis += f"4. **Leverage success in {top_location}** by replicating strategies in similar markets\n"
+                top_location = location_metrics.index[0]
+                recommendations.append(f"**Leverage success in {top_location}** by replicating strategies in similar markets")
                 
                 # If we have more than 5 locations
                 if len(location_metrics) > 5:
                     bottom_locations = location_metrics.tail(len(location_metrics) - 5)
-                    bottom_rev_pct = bottom_locations['total_revenue'].sum() / location_metrics['total_revenue'].sum() * 100
-                    analysis += f"5. **Evaluate underperforming locations** - {len(bottom_locations)} locations only contribute {bottom_rev_pct:.1f}% of revenue\n"
+                    bottom_rev_pct = bottom_locations['sum'].sum() / location_metrics['sum'].sum() * 100
+                    recommendations.append(f"**Evaluate underperforming locations** - {len(bottom_locations)} locations only contribute {bottom_rev_pct:.1f}% of revenue")
+            report.items(recommendations, ordered=True)
         else:
-            analysis += "## Customer Demographics Analysis\n\n"
-            analysis += "Unable to perform demographics analysis because required columns (customer_age, customer_gender, customer_location) are missing from the data.\n"
+            report.heading("Customer Demographics Analysis")
+            report.paragraph("Unable to perform demographics analysis because required columns (customer_age, customer_gender, customer_location) are missing from the data.")
     
     elif query_type == 'recommendations':
         # Actionable recommendations based on data analysis
-        analysis += "## Actionable Recommendations to Improve Sales\n\n"
+        report.heading("Actionable Recommendations to Improve Sales")
         
         # Get some basic metrics for recommendations
         if 'product_category' in df.columns:
-            cat_sales = df.groupby('product_category')['total_amount'].sum().reset_index()
-            cat_sales = cat_sales.sort_values('total_amount', ascending=False)
-            top_category = cat_sales.iloc[0]['product_category']
+            cat_sales = rollup(cube, 'product_category')['sum'].sort_values(ascending=False)
+            top_category = cat_sales.index[0]
             
             if len(cat_sales) > 1:
-                bottom_category = cat_sales.iloc[-1]['product_category']
+                bottom_category = cat_sales.index[-1]
         
         if 'customer_age' in df.columns:
-            df['age_group'] = pd.cut(
-                df['customer_age'], 
-                bins=[0, 18, 25, 35, 50, 65, 120],
-                labels=['Under 18', '18-24', '25-34', '35-49', '50-64', '65+']
-            )
-            age_sales = df.groupby('age_group')['total_amount'].sum().reset_index()
-            top_age = age_sales.loc[age_sales['total_amount'].idxmax()]['age_group']
+            top_age = rollup(cube, 'age_group')['sum'].idxmax()
         
         if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            df['day_of_week'] = df['timestamp'].dt.day_name()
-            dow_sales = df.groupby('day_of_week')['total_amount'].sum()
-            best_day = dow_sales.idxmax()
+            best_day = rollup(cube, 'day_of_week')['sum'].idxmax()
         
         # Product recommendations
-        analysis += "### Product and Category Strategy\n\n"
+        report.heading("Product and Category Strategy", 3)
+        strategy = []
         
         if 'product_category' in df.columns:
-            analysis += f"1. **Expand {top_category} offerings**: Since this is your top-performing category, invest in expanding product lines\n"
+            strategy.append(f"**Expand {top_category} offerings**: Since this is your top-performing category, invest in expanding product lines")
             
             if len(cat_sales) > 1:
-                analysis += f"2. **Revitalize {bottom_category}**: Conduct customer research to understand why this category underperforms\n"
+                strategy.append(f"**Revitalize {bottom_category}**: Conduct customer research to understand why this category underperforms")
             
             # If we have product-level data
             if 'product_id' in df.columns:
-                product_sales = df.groupby('product_id')['total_amount'].sum().reset_index()
-                product_sales = product_sales.sort_values('total_amount', ascending=False)
-                
                 # Check for products that appear frequently together
                 if len(df) > 1000:  # Only do this analysis for larger datasets
-                    analysis += "3. **Implement product bundling**: Bundle your top-selling products with complementary items\n"
-                    analysis += "4. **Optimize product placement**: Ensure your top 20% of products are prominently displayed\n"
+                    strategy.append("**Implement product bundling**: Bundle your top-selling products with complementary items")
+                    strategy.append("**Optimize product placement**: Ensure your top 20% of products are prominently displayed")
+        report.items(strategy, ordered=True)
         
         # Pricing and promotion recommendations
-        analysis += "\n### Pricing and Promotion Strategy\n\n"
+        report.heading("Pricing and Promotion Strategy", 3)
+        pricing = []
         
         if 'discount' in df.columns:
             # Analyze impact of discounts on sales
-            df['has_discount'] = df['discount'] > 0
-            discount_impact = df.groupby('has_discount').agg({
-                'total_amount': ['mean', 'sum'],
-                'transaction_id': 'count'
-            })
+            discount_impact = rollup(cube, 'has_discount')
             
             if True in discount_impact.index:
-                discounted_aov = discount_impact.loc[True, ('total_amount', 'mean')]
-                regular_aov = discount_impact.loc[False, ('total_amount', 'mean')] if False in discount_impact.index else 0
+                discounted_aov = discount_impact.loc[True, 'mean']
+                regular_aov = discount_impact.loc[False, 'mean'] if False in discount_impact.index else 0
                 
                 if regular_aov > 0:
                     discount_effect = ((discounted_aov - regular_aov) / regular_aov) * 100
                     
                     if discount_effect > 0:
-                        analysis += "1. **Continue discount strategy**: Your discounted items have a higher average order value\n"
+                        pricing.append("**Continue discount strategy**: Your discounted items have a higher average order value")
                     else:
-                        analysis += "1. **Rethink discount strategy**: Your discounts may be cannibalizing revenue\n"
+                        pricing.append("**Rethink discount strategy**: Your discounts may be cannibalizing revenue")
         
-        analysis += "2. **Implement dynamic pricing**: Adjust prices based on demand, time of day, or customer segments\n"
-        analysis += "3. **Create loyalty program tiers**: Reward high-value customers with exclusive benefits\n"
+        pricing.append("**Implement dynamic pricing**: Adjust prices based on demand, time of day, or customer segments")
+        pricing.append("**Create loyalty program tiers**: Reward high-value customers with exclusive benefits")
+        report.items(pricing, ordered=True)
         
         # Marketing recommendations
-        analysis += "\n### Marketing and Customer Engagement\n\n"
+        report.heading("Marketing and Customer Engagement", 3)
+        marketing = []
         
         if 'customer_age' in df.columns:
-            analysis += f"1. **Target {top_age} demographic**: Customize marketing campaigns for your highest-value age group\n"
+            marketing.append(f"**Target {top_age} demographic**: Customize marketing campaigns for your highest-value age group")
         
         if 'timestamp' in df.columns:
-            analysis += f"2. **Schedule campaigns on {best_day}**: Align email and social media campaigns with your best-performing day\n"
+            marketing.append(f"**Schedule campaigns on {best_day}**: Align email and social media campaigns with your best-performing day")
         
-        analysis += "3. **Implement a win-back campaign**: Target customers who haven't purchased in 90+ days\n"
-        analysis += "4. **Develop a referral program**: Incentivize existing customers to refer new customers\n"
+        marketing.append("**Implement a win-back campaign**: Target customers who haven't purchased in 90+ days")
+        marketing.append("**Develop a referral program**: Incentivize existing customers to refer new customers")
+        report.items(marketing, ordered=True)
         
         # Operations recommendations
-        analysis += "\n### Operational Improvements\n\n"
-        
-        analysis += "1. **Optimize inventory management**: Ensure top-selling products are always in stock\n"
-        analysis += "2. **Streamline checkout process**: Reduce cart abandonment by simplifying the buying experience\n"
-        analysis += "3. **Improve customer service**: Implement a customer feedback system to identify pain points\n"
-        analysis += "4. **Enhance data analytics**: Set up automatic alerts for sales anomalies and trends\n"
+        report.heading("Operational Improvements", 3)
+        report.items([
+            "**Optimize inventory management**: Ensure top-selling products are always in stock",
+            "**Streamline checkout process**: Reduce cart abandonment by simplifying the buying experience",
+            "**Improve customer service**: Implement a customer feedback system to identify pain points",
+            "**Enhance data analytics**: Set up automatic alerts for sales anomalies and trends"
+        ], ordered=True)
         
         # Implementation roadmap
-        analysis += "\n### Implementation Roadmap\n\n"
+        report.heading("Implementation Roadmap", 3)
         
-        analysis += "**Immediate Actions (Next 30 Days):**\n"
-        analysis += "- Audit current product offerings and identify gaps\n"
-        analysis += "- Analyze customer feedback for quick wins\n"
-        analysis += "- Implement one high-impact promotion\n\n"
+        report.paragraph("**Immediate Actions (Next 30 Days):**")
+        report.items([
+            "Audit current product offerings and identify gaps",
+            "Analyze customer feedback for quick wins",
+            "Implement one high-impact promotion"
+        ])
         
-        analysis += "**Short-Term (60-90 Days):**\n"
-        analysis += "- Launch targeted marketing campaigns for key customer segments\n"
-        analysis += "- Optimize pricing strategy based on data analysis\n"
-        analysis += "- Improve inventory management for top-selling products\n\n"
+        report.paragraph("**Short-Term (60-90 Days):**")
+        report.items([
+            "Launch targeted marketing campaigns for key customer segments",
+            "Optimize pricing strategy based on data analysis",
+            "Improve inventory management for top-selling products"
+        ])
         
-        analysis += "**Long-Term (90+ Days):**\n"
-        analysis += "- Develop and roll out customer loyalty program\n"
-        analysis += "- Implement advanced analytics for predictive sales forecasting\n"
-        analysis += "- Explore new markets or product categories based on customer data\n"
+        report.paragraph("**Long-Term (90+ Days):**")
+        report.items([
+            "Develop and roll out customer loyalty program",
+            "Implement advanced analytics for predictive sales forecasting",
+            "Explore new markets or product categories based on customer data"
+        ])
+    
+    return report
+
+def sales_chart_series(context=None):
+    """
+    Computes the series of the sales charts.
+    
+    Revenue and transaction breakdowns are rolled up from the aggregate cube; the
+    columns that are not cube dimensions are grouped directly.
+    
+    Args:
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
+    Returns:
+        dict: Chart key to chart entry ('labels', 'values', 'title', 'description').
+    """
+    context = _resolve_context(context)
+    df = context.df
+    
+    if df is None or len(df) == 0 or 'total_amount' not in df.columns:
+        return {}
+    
+    cube = get_sales_cube(context)
+    series = {}
+    
+    def add(name, values, title, description):
+        if len(values) > 0:
+            series[name] = chart_series(values, title, description)
     
-    return analysis
+    if 'month_year' in cube.columns:
+        add('sales_over_time', rollup(cube, 'month_year')['sum'],
+            'Sales Trend Over Time', 'Historical revenue performance showing patterns and trends')
+    
+    if 'product_category' in cube.columns:
+        add('sales_by_category', rollup(cube, 'product_category')['sum'],
+            'Sales by Product Category', 'Distribution of revenue across different product categories')
+    
+    if 'customer_age' in df.columns:
+        add('age_distribution', group_by_feature('customer_age', 'total_amount', 'count', context=context),
+            'Customer Age Distribution', 'Number of transactions by customer age')
+    
+    if 'customer_gender' in cube.columns:
+        add('gender_distribution', rollup(cube, 'customer_gender')['count'],
+            'Customer Gender Distribution', 'Number of transactions by customer gender')
+    
+    if 'payment_method' in df.columns:
+        add('payment_methods', group_by_feature('payment_method', 'total_amount', 'count', context=context),
+            'Payment Methods Used', 'Distribution of transactions by payment method')
+    
+    if 'location' in cube.columns:
+        add('regions', rollup(cube, 'location')['sum'],
+            'Sales by Geographic Region', 'Revenue distribution across different geographic regions')
+    
+    return series
+
+def analyze_sales(query_type='overview', context=None):
+    """
+    Performs a comprehensive analysis of sales data, returning the report together with
+    the series of the sales charts, so charts need not be parsed out of the text.
+    
+    Args:
+        query_type (str): Type of analysis to perform (see build_sales_report).
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
+    Returns:
+        AnalysisResult: The report and the chart series.
+    """
+    report = build_sales_report(query_type, context=context)
+    return AnalysisResult(report, sales_chart_series(context=context))
+
+def analyze_comprehensive_sales(query_type='overview', context=None):
+    """
+    Performs a comprehensive analysis of sales data based on the query type.
+    
+    Args:
+        query_type (str): Type of analysis to perform ('overview', 'categories', 'trends', 
+                         'demographics', 'recommendations', etc.)
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
+    
+    Returns:
+        str: Detailed markdown-formatted analysis
+    """
+    return build_sales_report(query_type, context=context).to_markdown()
 
 # Enhance process_query_directly to use the comprehensive analysis function
-def process_query_directly(query):
+def process_query_directly(query, context=None):
     """
     Process a natural language query directly without using an LLM.
     
     Args:
         query (str): The query to process.
+        context (AnalysisContext, optional): Dataset to analyze. Defaults to the default context.
         
     Returns:
         str: The response to the query.
     """
-    global df
+    context = _resolve_context(context)
+    df = context.df
     
     if df is None or len(df) == 0:
         return "No data is available. Please upload real data for analysis. Synthetic data generation is disabled."
@@ -905,26 +1219,26 @@ def process_query_directly(query):
     
     # Map common query types to analysis functions
     if any(term in query for term in ["overview", "complete analysis", "comprehensive", "tell me about", "summary"]):
-        return analyze_comprehensive_sales('overview')
+        return analyze_comprehensive_sales('overview', context=context)
     
     elif any(term in query for term in ["category", "categories", "product", "products", "top-selling", "best seller"]):
-        return analyze_comprehensive_sales('categories')
+        return analyze_comprehensive_sales('categories', context=context)
     
     elif any(term in query for term in ["trend", "overtime", "over time", "pattern", "forecast", "predict"]):
-        return analyze_comprehensive_sales('trends')
+        return analyze_comprehensive_sales('trends', context=context)
     
     elif any(term in query for term in ["demographic", "customer", "age", "gender", "location", "segment"]):
-        return analyze_comprehensive_sales('demographics')
+        return analyze_comprehensive_sales('demographics', context=context)
     
     elif any(term in query for term in ["recommend", "suggestion", "improve", "increase", "boost", "action", "actionable"]):
-        return analyze_comprehensive_sales('recommendations')
+        return analyze_comprehensive_sales('recommendations', context=context)
     
     elif "summary" in query or "statistics" in query:
-        return summary_statistics()
+        return summary_statistics(context=context)
     
     elif "mean" in query or "average" in query:
         if "product" in query and "category" in query:
-            return group_by_feature("product_category", "total_amount", "mean")
+            return group_by_feature("product_category", "total_amount", "mean", context=context)
         else:
             return "Please specify which feature to group by and which column to aggregate."
     
@@ -950,18 +1264,18 @@ def process_query_directly(query):
         if discount_match:
             discount = float(discount_match.group(1))
             
-        prediction = predict_total(qty, price, discount)
+        prediction = predict_total(qty, price, discount, context=context)
         return f"Predicted total sales for quantity {qty}, price {price}, discount {discount}: {prediction}"
     
     elif "trend" in query or "pattern" in query or "high" in query or "low" in query:
-        return analyze_sales_trend()
+        return analyze_sales_trend(context=context)
     
     elif "sales" in query and "category" in query:
-        return group_by_feature("product_category", "total_amount", "sum")
+        return group_by_feature("product_category", "total_amount", "sum", context=context)
     
     else:
         # Fallback to general overview for unknown queries
-        return analyze_comprehensive_sales('overview')
+        return analyze_comprehensive_sales('overview', context=context)
 
 # Create tools for the agent
 summary_tool = FunctionTool.from_defaults(
@@ -1000,7 +1314,7 @@ if __name__ == "__main__":
     
     # Note: Synthetic data generation is disabled per company policy
     # Real data must be loaded before running example queries
-    if df is None or len(df) == 0:
+    if default_context.is_empty:
         print("ERROR: No data available. Please load real data before running example queries.")
         print("Synthetic data generation is disabled per company policy.")
         sys.exit(1)
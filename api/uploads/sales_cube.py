@@ -0,0 +1,148 @@
+"""
+Sales Cube Module
+
+The sales report sections all aggregate total_amount over a few low-cardinality
+dimensions (category, month, weekday, age group, gender, location). Instead of
+grouping the raw rows again for every section and every query, one pass over the
+rows builds a cube holding the sum and count of total_amount for each combination of
+dimension values that occurs. Report sections then roll the cube up to the
+dimensions they need, which only touches the (much smaller) cube.
+
+Means are not stored because they do not roll up; rollup derives them from the
+summed sums and counts. Cubes of stored files are cached in the content store.
+"""
+
+import os
+import uuid
+import pandas as pd
+
+from uploads.content_store import artifact_path
+from uploads.frame_schema import AGE_LABELS, DAY_ORDER, DERIVED_COLUMNS, add_derived_columns
+
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+CUBE_ARTIFACT = 'sales_cube.parquet'
+
+# Cube dimensions, when present in the data
+DIMENSIONS = ['product_category', 'product_subcategory', 'month_year', 'day_of_week', 'age_group',
+              'customer_gender', 'location', 'customer_location', 'has_discount']
+
+def _restore_dimension_types(cube):
+    """
+    Store every dimension as a categorical so rollups group on integer codes, with age
+    groups and weekdays in their natural order (also after a Parquet round trip).
+    """
+    for name in cube.columns:
+        if name == 'age_group':
+            cube[name] = pd.Categorical(cube[name], categories=AGE_LABELS, ordered=True)
+        elif name == 'day_of_week':
+            cube[name] = pd.Categorical(cube[name], categories=DAY_ORDER, ordered=True)
+        elif name not in ('sum', 'count', 'has_discount') and not isinstance(cube[name].dtype, pd.CategoricalDtype):
+            cube[name] = cube[name].astype('category')
+    return cube
+
+def build_sales_cube(df):
+    """
+    Aggregate sales rows into a cube in one pass.
+
+    Dimensions are the columns of DIMENSIONS that exist, including the derived bucket
+    columns (see frame_schema.add_derived_columns). Rows with a missing dimension value
+    are kept, so totals over the cube match totals over the rows.
+
+    Args:
+        df (pd.DataFrame): Processed sales data with a 'total_amount' column. Bucket
+                           columns it lacks are derived without modifying it.
+
+    Returns:
+        pd.DataFrame: One row per occurring combination of dimension values, with
+                      'sum' and 'count' of total_amount.
+    """
+    if not all(name in df.columns for name in DERIVED_COLUMNS):
+        df = df.copy(deep=False)
+        if 'timestamp' in df.columns:
+            df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+        add_derived_columns(df)
+
+    keys = {name: df[name] for name in DIMENSIONS if name in df.columns}
+    frame = pd.DataFrame(keys, index=df.index)
+    frame['total_amount'] = df['total_amount']
+
+    if keys:
+        cube = (frame.groupby(list(keys), observed=True, dropna=False, sort=False)['total_amount']
+                .agg(['sum', 'count']).reset_index())
+    else:
+        cube = pd.DataFrame({'sum': [frame['total_amount'].sum()], 'count': [frame['total_amount'].count()]})
+
+    print(f"Built sales cube: {len(df)} rows -> {len(cube)} cells over {len(keys)} dimensions")
+    return _restore_dimension_types(cube)
+
+def load_sales_cube(content_hash):
+    """
+    Load the cached cube of a stored file.
+
+    Args:
+        content_hash (str): SHA-256 of the file content.
+
+    Returns:
+        pd.DataFrame: The cube, or None if it is not cached.
+    """
+    if not PYARROW_AVAILABLE:
+        return None
+    path = artifact_path(content_hash, CUBE_ARTIFACT)
+    if not os.path.exists(path):
+        return None
+    try:
+        return _restore_dimension_types(pd.read_parquet(path))
+    except Exception as e:
+        print(f"Warning: Could not read cached sales cube {path}: {str(e)}")
+        return None
+
+def save_sales_cube(content_hash, cube):
+    """
+    Cache the cube of a stored file.
+
+    Args:
+        content_hash (str): SHA-256 of the file content.
+        cube (pd.DataFrame): The cube from build_sales_cube.
+    """
+    if not PYARROW_AVAILABLE:
+        return
+    path = artifact_path(content_hash, CUBE_ARTIFACT)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        cube.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Warning: Could not cache sales cube {path}: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def rollup(cube, dimensions, filters=None):
+    """
+    Aggregate the cube to the given dimensions.
+
+    Cells with a missing value in one of the dimensions are left out, as a groupby over
+    the rows would.
+
+    Args:
+        cube (pd.DataFrame): The cube from build_sales_cube.
+        dimensions (str or list): Dimension(s) to keep.
+        filters (dict, optional): Dimension name to the single value to restrict to.
+
+    Returns:
+        pd.DataFrame: 'sum', 'count' and 'mean' of total_amount, indexed by the dimensions
+                      in sorted order.
+    """
+    if filters:
+        mask = pd.Series(True, index=cube.index)
+        for name, value in filters.items():
+            mask &= cube[name] == value
+        cube = cube[mask]
+
+    result = cube.groupby(dimensions, observed=True)[['sum', 'count']].sum()
+    result['mean'] = result['sum'] / result['count']
+    return result
@@ -0,0 +1,337 @@
+"""
+Sentiment Engine Module
+
+A vectorized reimplementation of the VADER compound score. NLTK's VADER walks every
+token of every review in Python. Here a batch of reviews is split into one flat token
+array, each distinct token is looked up in the VADER lexicon once, and the rules that
+look at neighbouring tokens (boosters, ALL CAPS emphasis, negations, 'never so',
+'least', idioms, 'but') are evaluated at once for all words in the lexicon - the only
+ones that carry valence - by gathering the attributes of the words around them.
+
+The lexicon and rule constants are read from NLTK's SentimentIntensityAnalyzer, so both
+scorers use the same data. Compound scores match polarity_scores up to floating point
+summation order, including VADER's habit of scoring a repeated word with the context
+of its first occurrence in the text.
+"""
+
+from itertools import chain
+import numpy as np
+import pandas as pd
+from nltk.sentiment.vader import SentimentIntensityAnalyzer
+
+# pyarrow is optional - with it texts are split and tokens encoded by Arrow kernels
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Texts scored per batch - large enough to amortize the per-batch work, small enough
+# to bound the memory of the token arrays
+BATCH_TEXTS = 20000
+
+# Dampening of a booster two and three words before the scored word
+BOOSTER_DISTANCE_FACTORS = ((1, 1.0), (2, 0.95), (3, 0.9))
+
+# 'but' halves the words before it and raises the words after it
+BUT_BEFORE_FACTOR = 0.5
+BUT_AFTER_FACTOR = 1.5
+
+# Exclamation and question mark emphasis
+EXCLAMATION_WEIGHT = 0.292
+MAX_EXCLAMATIONS = 4
+QUESTION_WEIGHT = 0.18
+MAX_QUESTION_EMPHASIS = 0.96
+
+# Normalization constant of the compound score
+COMPOUND_ALPHA = 15
+
+# Word windows of the idiom check, before and after the scored word
+IDIOM_WINDOWS_BEFORE = ((-1, 0), (-2, -1, 0), (-2, -1), (-3, -2, -1), (-3, -2))
+IDIOM_WINDOWS_AFTER = ((0, 1), (0, 1, 2))
+BOOSTER_PHRASE_WINDOWS = ((-3, -2), (-2, -1))
+
+def _tokenize(texts):
+    """
+    Split texts on whitespace like str.split and encode the tokens.
+
+    Returns:
+        tuple: (token codes, distinct tokens, text index of each token), tokens in text order.
+    """
+    if PYARROW_AVAILABLE:
+        # utf8_split_whitespace splits on exactly the characters str.split does
+        split = pc.utf8_split_whitespace(pa.array(texts, type=pa.string()))
+        counts = pc.list_value_length(split).to_numpy(zero_copy_only=False)
+        encoded = split.flatten().dictionary_encode()
+        codes = encoded.indices.to_numpy(zero_copy_only=False)
+        uniques = encoded.dictionary.to_pylist()
+    else:
+        split = [text.split() for text in texts]
+        counts = np.fromiter(map(len, split), dtype=np.int64, count=len(split))
+        codes, uniques = pd.factorize(np.array(list(chain.from_iterable(split)), dtype=object))
+    return codes, uniques, np.repeat(np.arange(len(texts)), counts)
+
+class VectorizedVader:
+    """VADER compound scorer evaluating a batch of texts with array operations."""
+
+    def __init__(self, analyzer=None):
+        """
+        Args:
+            analyzer (SentimentIntensityAnalyzer, optional): Analyzer whose lexicon and
+                                                             constants to use.
+        """
+        analyzer = analyzer or SentimentIntensityAnalyzer()
+        constants = analyzer.constants
+        self.lexicon = analyzer.lexicon
+        self.negations = set(constants.NEGATE)
+        self.boosters = constants.BOOSTER_DICT
+        self.idioms = constants.SPECIAL_CASE_IDIOMS
+        self.punctuation = constants.PUNC_LIST
+        self.remove_punctuation = constants.REGEX_REMOVE_PUNCTUATION
+        self.caps_increment = constants.C_INCR
+        self.negation_scalar = constants.N_SCALAR
+        self.booster_decrement = constants.B_DECR
+
+        # Idioms and multi-word boosters are compared word by word, case-sensitively like VADER
+        self.booster_phrases = [phrase.split(' ') for phrase in self.boosters if ' ' in phrase]
+        self.idiom_phrases = [(phrase.split(' '), value) for phrase, value in self.idioms.items()]
+        phrase_words = {word for words in self.booster_phrases for word in words}
+        phrase_words.update(word for words, _ in self.idiom_phrases for word in words)
+        self.phrase_ids = {word: number for number, word in enumerate(sorted(phrase_words))}
+
+    def _normalize_token(self, token):
+        """Strip one leading or trailing punctuation mark as VADER does ('good!!' -> 'good')."""
+        for mark in self.punctuation:
+            if token.startswith(mark):
+                word = token[len(mark):]
+            elif token.endswith(mark):
+                word = token[:-len(mark)]
+            else:
+                continue
+            if len(word) > 1 and self.remove_punctuation.sub('', word) == word:
+                return word
+        return token
+
+    def _token_attributes(self, tokens):
+        """Lexicon and rule attributes of each distinct token, as arrays indexed like tokens."""
+        words = [self._normalize_token(token) for token in tokens]
+        lowered = [word.lower() for word in words]
+
+        valence = np.array([self.lexicon.get(word, 0.0) for word in lowered], dtype='float64')
+        in_lexicon = np.array([word in self.lexicon for word in lowered])
+        boost = np.array([self.boosters.get(word, 0.0) for word in lowered], dtype='float64')
+        return {
+            'word_code': pd.factorize(np.array(words, dtype=object))[0],
+            'valence': valence,
+            'in_lexicon': in_lexicon,
+            'boost': boost,
+            'is_booster': np.array([word in self.boosters for word in lowered]),
+            'negated': np.array([word in self.negations or "n't" in word for word in lowered]),
+            'upper': np.array([word.isupper() for word in words]),
+            'least': np.array([word == 'least' for word in lowered]),
+            'at_or_very': np.array([word in ('at', 'very') for word in lowered]),
+            'kind': np.array([word == 'kind' for word in lowered]),
+            'of': np.array([word == 'of' for word in lowered]),
+            'but': np.array([word == 'but' for word in lowered]),
+            'never': np.array([word == 'never' for word in words]),
+            'so_or_this': np.array([word in ('so', 'this') for word in words]),
+            'phrase': np.array([self.phrase_ids.get(word, -1) for word in words], dtype='int64')
+        }
+
+    def _phrase_match(self, phrases, words, offsets):
+        """Whether the words appear at the given offsets, from the phrase ids around each word."""
+        match = np.ones(len(phrases[0]), dtype=bool)
+        for word, offset in zip(words, offsets):
+            match &= phrases[offset] == self.phrase_ids[word]
+        return match
+
+    def _idiom_valence(self, valence, phrases):
+        """Apply VADER's idiom and booster-phrase check, given the phrase ids around each word."""
+        found = np.full(len(valence), np.nan)
+        for offsets in IDIOM_WINDOWS_BEFORE:
+            for words, value in self.idiom_phrases:
+                if len(words) == len(offsets):
+                    found[np.isnan(found) & self._phrase_match(phrases, words, offsets)] = value
+        for offsets in IDIOM_WINDOWS_AFTER:
+            for words, value in self.idiom_phrases:
+                if len(words) == len(offsets):
+                    found[self._phrase_match(phrases, words, offsets)] = value
+
+        valence = np.where(np.isnan(found), valence, found)
+        boosted = np.zeros(len(valence), dtype=bool)
+        for offsets in BOOSTER_PHRASE_WINDOWS:
+            for words in self.booster_phrases:
+                if len(words) == len(offsets):
+                    boosted |= self._phrase_match(phrases, words, offsets)
+        return np.where(boosted, valence + self.booster_decrement, valence)
+
+    def compound_scores(self, texts):
+        """
+        Compute the VADER compound score of each text.
+
+        Args:
+            texts (list): Texts to score. Values that are not strings score 0.
+
+        Returns:
+            np.ndarray: float64 compound scores rounded to 4 decimals, one per text.
+        """
+        texts = [text if isinstance(text, str) else '' for text in texts]
+        codes, uniques, doc = _tokenize(texts)
+
+        # VADER ignores single characters
+        kept = np.array([len(token) > 1 for token in uniques], dtype=bool)[codes]
+        codes, doc = codes[kept], doc[kept]
+        if len(codes) == 0:
+            return np.zeros(len(texts))
+
+        attributes = self._token_attributes(uniques)
+        lengths = np.bincount(doc, minlength=len(texts))
+        pos = np.arange(len(codes)) - (np.cumsum(lengths) - lengths)[doc]
+
+        # Emphasis from words in ALL CAPS counts only when some, but not all, words are
+        uppercase_words = np.bincount(doc, weights=attributes['upper'][codes], minlength=len(texts))
+        caps_differ_in_text = (uppercase_words > 0) & (uppercase_words < lengths)
+
+        # Only words in the lexicon carry valence, so the rules are evaluated at their positions
+        at = np.flatnonzero(attributes['in_lexicon'][codes])
+        word = codes[at]
+        at_doc = doc[at]
+        at_pos = pos[at]
+        at_after = lengths[at_doc] - at_pos - 1
+
+        # Codes of the words around each scored word, and whether they are inside its text
+        around = {0: (word, np.ones(len(at), dtype=bool))}
+        for offset in (-3, -2, -1, 1, 2):
+            inside = (at_pos >= -offset) if offset < 0 else (at_after >= offset)
+            around[offset] = (codes[np.clip(at + offset, 0, len(codes) - 1)], inside)
+
+        def near(name, offset):
+            neighbour, inside = around[offset]
+            return inside & attributes[name][neighbour]
+
+        caps_differ = caps_differ_in_text[at_doc]
+        valence = attributes['valence'][word]
+        emphasized = attributes['upper'][word] & caps_differ
+        valence = np.where(emphasized, np.where(valence > 0, valence + self.caps_increment,
+                                                valence - self.caps_increment), valence)
+
+        for distance, factor in BOOSTER_DISTANCE_FACTORS:
+            neighbour, inside = around[-distance]
+            applies = inside & ~attributes['in_lexicon'][neighbour]
+
+            # Boosters and dampeners before the word, strengthened when in ALL CAPS
+            boost = attributes['boost'][neighbour]
+            scalar = np.where(valence < 0, -boost, boost)
+            caps = near('upper', -distance) & caps_differ
+            scalar += np.where(caps, np.where(valence > 0, self.caps_increment, -self.caps_increment), 0.0)
+            scalar = np.where(near('is_booster', -distance), scalar, 0.0) * factor
+            valence = np.where(applies, valence + scalar, valence)
+
+            # Negations, with 'never so' / 'never this' as intensifiers
+            negated = np.where(near('negated', -distance), self.negation_scalar, 1.0)
+            if distance == 2:
+                never_so = near('never', -2) & near('so_or_this', -1)
+                negated = np.where(never_so, 1.5, negated)
+            elif distance == 3:
+                never_so = (near('never', -3) & near('so_or_this', -2)) | near('so_or_this', -1)
+                negated = np.where(never_so, 1.25, negated)
+            valence = np.where(applies, valence * negated, valence)
+
+            if distance == 3 and applies.any():
+                rows = np.flatnonzero(applies)
+                phrases = {offset: np.where(inside[rows], attributes['phrase'][neighbour[rows]], -1)
+                           for offset, (neighbour, inside) in around.items()}
+                valence[rows] = self._idiom_valence(valence[rows], phrases)
+
+        # 'least' negates the word after it, except in 'at least' and 'very least'
+        least = near('least', -1) & ~near('in_lexicon', -1)
+        least &= (at_pos == 1) | ~near('at_or_very', -2)
+        valence = np.where(least, valence * self.negation_scalar, valence)
+
+        # Boosters and the 'kind' of 'kind of' carry no valence of their own
+        skipped = attributes['is_booster'][word] | (attributes['kind'][word] & near('of', 1))
+        valence = np.where(skipped, 0.0, valence)
+
+        # A repeated word is scored with the context of its first occurrence in the text
+        occurrence = pd.factorize(at_doc * (int(attributes['word_code'].max()) + 1) + attributes['word_code'][word])[0]
+        seen = np.maximum.accumulate(np.concatenate(([-1], occurrence[:-1])))
+        valence = valence[np.flatnonzero(occurrence > seen)[occurrence]]
+
+        # Words before the first 'but' of a text count half, words after it one and a half
+        buts = np.flatnonzero(attributes['but'][codes])
+        but_pos = np.full(len(texts), -1)
+        if len(buts):
+            first_but = np.concatenate(([True], doc[buts][1:] != doc[buts][:-1]))
+            but_pos[doc[buts][first_but]] = pos[buts][first_but]
+        but_at = but_pos[at_doc]
+        factor = np.where(but_at < 0, 1.0, np.where(at_pos < but_at, BUT_BEFORE_FACTOR,
+                                                    np.where(at_pos > but_at, BUT_AFTER_FACTOR, 1.0)))
+        total = np.bincount(at_doc, weights=valence * factor, minlength=len(texts))
+
+        # Exclamation and question mark emphasis, then normalization to [-1, 1]
+        if PYARROW_AVAILABLE:
+            text_array = pa.array(texts, type=pa.string())
+            exclamations = pc.count_substring(text_array, '!').to_numpy(zero_copy_only=False)
+            questions = pc.count_substring(text_array, '?').to_numpy(zero_copy_only=False)
+        else:
+            exclamations = np.fromiter((text.count('!') for text in texts), dtype=np.int64, count=len(texts))
+            questions = np.fromiter((text.count('?') for text in texts), dtype=np.int64, count=len(texts))
+        emphasis = np.minimum(exclamations, MAX_EXCLAMATIONS) * EXCLAMATION_WEIGHT
+        emphasis += np.where(questions > 1, np.where(questions <= 3, questions * QUESTION_WEIGHT, MAX_QUESTION_EMPHASIS), 0.0)
+        total = np.where(total > 0, total + emphasis, np.where(total < 0, total - emphasis, total))
+        return np.round(total / np.sqrt(total * total + COMPOUND_ALPHA), 4)
+
+# Engine of this process, created on first use
+_engine = None
+
+def get_engine():
+    """The VectorizedVader of this process, created on first use."""
+    global _engine
+
+    if _engine is None:
+        _engine = VectorizedVader()
+    return _engine
+
+def vectorized_compound_scores(texts):
+    """
+    Compute VADER compound scores with the vectorized engine, in batches of BATCH_TEXTS.
+
+    Args:
+        texts (list): Texts to score. Missing or empty texts score 0.
+
+    Returns:
+        np.ndarray: float64 compound scores, one per text.
+    """
+    engine = get_engine()
+    texts = list(texts)
+    batches = [engine.compound_scores(texts[start:start + BATCH_TEXTS]) for start in range(0, len(texts), BATCH_TEXTS)]
+    return np.concatenate(batches) if batches else np.zeros(0)
+
+def compare_with_vader(texts):
+    """
+    Compare the vectorized scores of a corpus with NLTK's polarity_scores.
+
+    Args:
+        texts (list): Fixture corpus.
+
+    Returns:
+        dict: 'texts', 'exact' (share of identical compound scores), 'max_difference'
+              and 'category_agreement' (share with the same positive/neutral/negative label).
+    """
+    engine = get_engine()
+    analyzer = SentimentIntensityAnalyzer()
+    vectorized = engine.compound_scores(texts)
+    reference = np.array([analyzer.polarity_scores(text)['compound'] if isinstance(text, str) and text else 0.0
+                          for text in texts])
+
+    def label(scores):
+        return np.where(scores >= 0.05, 1, np.where(scores <= -0.05, -1, 0))
+
+    difference = np.abs(vectorized - reference)
+    return {
+        'texts': len(texts),
+        'exact': float(np.mean(difference == 0)) if len(texts) else 1.0,
+        'max_difference': float(difference.max()) if len(texts) else 0.0,
+        'category_agreement': float(np.mean(label(vectorized) == label(reference))) if len(texts) else 1.0
+    }
@@ -0,0 +1,211 @@
+"""
+Sentiment Store Module
+
+VADER scores reviews one at a time in pure Python, which takes minutes on millions of
+reviews. Scores are therefore computed once per file content: the compound score of
+every row is stored as a Parquet artifact under the content hash of the file the row
+came from, so a dataset loaded from several files reuses the scores of every file seen
+before. Only rows that have no score yet (new files, rows added to a loaded frame) are
+scored, sharded across a process pool when there are enough of them.
+
+Two scoring methods are available: 'vader' runs NLTK's polarity_scores per review,
+'vader_vectorized' the array-based reimplementation in sentiment_engine, which gives
+the same compound scores at a fraction of the cost. Scores of each method are cached
+separately.
+"""
+
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+from nltk.sentiment.vader import SentimentIntensityAnalyzer
+
+from uploads.content_store import artifact_path
+from uploads.sentiment_engine import vectorized_compound_scores
+
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+SCORE_COLUMN = 'sentiment_score'
+CATEGORY_COLUMN = 'sentiment_category'
+
+# Compound scores at or beyond these thresholds are positive / negative, the rest neutral
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+
+SENTIMENT_METHODS = ('vader', 'vader_vectorized')
+DEFAULT_SENTIMENT_METHOD = 'vader'
+
+# Context cache key recording which method the score column was computed with
+SENTIMENT_METHOD_KEY = 'sentiment_method'
+
+# Per method: below this many texts starting a process pool costs more than it saves
+PARALLEL_MIN_TEXTS = {'vader': 20000, 'vader_vectorized': 200000}
+# Per method: texts scored per pool task
+SCORING_CHUNK_TEXTS = {'vader': 5000, 'vader_vectorized': 50000}
+SCORING_MAX_WORKERS = 8
+
+# Analyzer of this process, created on first use (each pool worker builds its own)
+_analyzer = None
+
+def _get_analyzer():
+    global _analyzer
+
+    if _analyzer is None:
+        _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+def _score_chunk(texts, method=DEFAULT_SENTIMENT_METHOD):
+    """Compound scores of a list of texts. Missing or empty texts score 0."""
+    if method == 'vader_vectorized':
+        return vectorized_compound_scores(texts).tolist()
+    analyzer = _get_analyzer()
+    return [analyzer.polarity_scores(text)['compound'] if isinstance(text, str) and text else 0.0
+            for text in texts]
+
+def score_texts(texts, method=DEFAULT_SENTIMENT_METHOD, max_workers=None):
+    """
+    Compute the VADER compound score of each text.
+
+    Large inputs are split into chunks scored on a process pool. If the pool cannot be
+    used the texts are scored in this process.
+
+    Args:
+        texts (list): Review texts. Missing or empty texts score 0.
+        method (str): One of SENTIMENT_METHODS.
+        max_workers (int, optional): Number of worker processes. Defaults to the number
+                                     of CPUs, capped at SCORING_MAX_WORKERS.
+
+    Returns:
+        np.ndarray: float64 compound scores, one per text.
+    """
+    if method not in SENTIMENT_METHODS:
+        raise ValueError(f"Unknown sentiment method '{method}'. Use one of: {', '.join(SENTIMENT_METHODS)}")
+
+    texts = list(texts)
+    workers = max_workers or min(os.cpu_count() or 1, SCORING_MAX_WORKERS)
+
+    if len(texts) < PARALLEL_MIN_TEXTS[method] or workers <= 1:
+        return np.asarray(_score_chunk(texts, method), dtype='float64')
+
+    chunk_texts = SCORING_CHUNK_TEXTS[method]
+    chunks = [texts[start:start + chunk_texts] for start in range(0, len(texts), chunk_texts)]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            scores = [score for chunk in executor.map(partial(_score_chunk, method=method), chunks) for score in chunk]
+    except Exception as e:
+        print(f"Warning: Parallel sentiment scoring failed ({str(e)}), scoring in this process")
+        scores = _score_chunk(texts, method)
+    return np.asarray(scores, dtype='float64')
+
+def sentiment_categories(scores):
+    """
+    Label compound scores as 'positive', 'negative' or 'neutral'.
+
+    Args:
+        scores (np.ndarray): Compound scores.
+
+    Returns:
+        np.ndarray: The label of each score.
+    """
+    return np.where(scores >= POSITIVE_THRESHOLD, 'positive',
+                    np.where(scores <= NEGATIVE_THRESHOLD, 'negative', 'neutral'))
+
+def _artifact_name(method):
+    return f"sentiment_{method}.parquet"
+
+def load_scores(content_hash, rows, method='vader'):
+    """
+    Load the cached scores of a stored file.
+
+    Args:
+        content_hash (str): SHA-256 of the file content.
+        rows (int): Number of rows the file was loaded with.
+        method (str): Scoring method.
+
+    Returns:
+        np.ndarray: The scores, or None if they are not cached for that many rows.
+    """
+    if not PYARROW_AVAILABLE:
+        return None
+    path = artifact_path(content_hash, _artifact_name(method))
+    if not os.path.exists(path):
+        return None
+    try:
+        scores = pd.read_parquet(path)[SCORE_COLUMN].to_numpy(dtype='float64')
+    except Exception as e:
+        print(f"Warning: Could not read cached sentiment scores {path}: {str(e)}")
+        return None
+    return scores if len(scores) == rows else None
+
+def save_scores(content_hash, scores, method='vader'):
+    """
+    Cache the scores of a stored file.
+
+    Args:
+        content_hash (str): SHA-256 of the file content.
+        scores (np.ndarray): Score of every row of the file.
+        method (str): Scoring method.
+    """
+    if not PYARROW_AVAILABLE:
+        return
+    path = artifact_path(content_hash, _artifact_name(method))
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        pd.DataFrame({SCORE_COLUMN: scores}).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Warning: Could not cache sentiment scores {path}: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def ensure_sentiment_scores(context, method=None):
+    """
+    Add the 'sentiment_score' and 'sentiment_category' columns to the frame of a context.
+
+    Scores already on the frame (computed with the same method) and scores cached for
+    the files the frame was loaded from are reused; only the remaining rows are scored,
+    and the scores of those files are cached for the next load.
+
+    Args:
+        context (AnalysisContext): Review dataset with a 'reviewText' column.
+        method (str, optional): One of SENTIMENT_METHODS. Defaults to the method the
+                                context was already scored with, else DEFAULT_SENTIMENT_METHOD.
+
+    Returns:
+        pd.DataFrame: The frame of the context.
+    """
+    df = context.df
+    method = method or context.cache.get(SENTIMENT_METHOD_KEY) or DEFAULT_SENTIMENT_METHOD
+    if method not in SENTIMENT_METHODS:
+        raise ValueError(f"Unknown sentiment method '{method}'. Use one of: {', '.join(SENTIMENT_METHODS)}")
+
+    if SCORE_COLUMN in df.columns and context.cache.get(SENTIMENT_METHOD_KEY) == method:
+        scores = df[SCORE_COLUMN].to_numpy(dtype='float64', copy=True)
+    else:
+        scores = np.full(len(df), np.nan)
+
+    segments = context.segment_ranges()
+    for content_hash, start, stop in segments:
+        if np.isnan(scores[start:stop]).any():
+            cached = load_scores(content_hash, stop - start, method)
+            if cached is not None:
+                scores[start:stop] = cached
+
+    missing = np.flatnonzero(np.isnan(scores))
+    if len(missing):
+        print(f"Scoring sentiment of {len(missing)} of {len(df)} reviews")
+        scores[missing] = score_texts(df['reviewText'].to_numpy()[missing], method)
+        for content_hash, start, stop in segments:
+            if np.any((missing >= start) & (missing < stop)):
+                save_scores(content_hash, scores[start:stop], method)
+
+    df[SCORE_COLUMN] = scores
+    df[CATEGORY_COLUMN] = sentiment_categories(scores)
+    context.cache[SENTIMENT_METHOD_KEY] = method
+    return df
@@ -0,0 +1,79 @@
+"""
+Streaming Upload Ingest
+
+Copies an uploaded file stream to disk in fixed-size chunks. In the same pass it
+hashes the content, counts newlines and keeps the leading bytes for dialect
+sniffing, so nothing has to re-read the stored file before the upload is accepted.
+Size limits are enforced while copying, before the oversized data reaches its target.
+"""
+
+import hashlib
+import os
+import uuid
+
+from uploads.csv_sniffer import SNIFF_SAMPLE_BYTES
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the size it is allowed to take."""
+
+    def __init__(self, limit_bytes, message=None):
+        self.limit_bytes = limit_bytes
+        super().__init__(message or f"Upload exceeds the limit of {limit_bytes} bytes")
+
+def stream_upload_to_disk(stream, target_path, max_bytes=None, chunk_bytes=UPLOAD_CHUNK_BYTES,
+                          head_bytes=SNIFF_SAMPLE_BYTES):
+    """
+    Write an upload stream to disk chunk by chunk.
+
+    The data is written to a temporary file next to the target and moved into place
+    only once the whole stream has been copied, so a rejected or interrupted upload
+    never leaves a partial file behind.
+
+    Args:
+        stream: Readable binary stream of the uploaded file.
+        target_path (str): Where the file is stored.
+        max_bytes (int, optional): Largest accepted size. Unlimited if not provided.
+        chunk_bytes (int): Size of each read and write.
+        head_bytes (int): Number of leading bytes kept for sniffing.
+
+    Returns:
+        dict: 'size', 'content_hash' (SHA-256 hex digest), 'line_count', 'ends_with_newline'
+              and 'head' (the leading bytes).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    line_count = 0
+    last_byte = b''
+    head = bytearray()
+    tmp_path = f"{target_path}.{uuid.uuid4().hex[:8]}.part"
+
+    try:
+        with open(tmp_path, 'wb') as out:
+            while True:
+                chunk = stream.read(chunk_bytes)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                digest.update(chunk)
+                line_count += chunk.count(b'\n')
+                last_byte = chunk[-1:]
+                if len(head) < head_bytes:
+                    head.extend(chunk[:head_bytes - len(head)])
+                out.write(chunk)
+        os.replace(tmp_path, target_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return {
+        'size': size,
+        'content_hash': digest.hexdigest(),
+        'line_count': line_count,
+        'ends_with_newline': last_byte == b'\n',
+        'head': bytes(head)
+    }
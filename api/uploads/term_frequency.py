@@ -0,0 +1,92 @@
+"""
+Term Frequency Module
+
+Counts n-grams (phrases of n adjacent words) over review texts without holding more
+than one chunk of them at a time. Each chunk of texts is vectorized into a sparse
+matrix whose column sums are merged into a running table of counts; when the table
+grows beyond a fixed number of phrases, only the most frequent ones are kept. The
+memory used is therefore bounded by the chunk size and that limit, not by the size
+of the corpus. The top phrases are taken from the table with a heap.
+
+Counts are exact as long as the table was never pruned. When it was, phrases that
+were pruned and seen again start from zero, so their counts are lower bounds; the
+most frequent phrases of a corpus are rarely affected.
+
+Single words are better counted from the text index (see text_index), which has
+them already; this module is for longer phrases, which the index does not keep.
+"""
+
+import heapq
+from collections import Counter
+from operator import itemgetter
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+
+# Texts vectorized at a time
+CHUNK_TEXTS = 20000
+
+# Phrases kept in the running table of counts, pruned to the most frequent beyond that
+MAX_TRACKED_TERMS = 200000
+
+def _chunk_counts(texts, ngram, stop_words, min_length):
+    """Phrase counts of one chunk of texts, as a {phrase: count} dict."""
+    vectorizer = CountVectorizer(
+        token_pattern=rf"(?u)\b\w{{{min_length},}}\b",
+        stop_words=list(stop_words) or None,
+        ngram_range=(ngram, ngram),
+        dtype=np.int64
+    )
+    try:
+        matrix = vectorizer.fit_transform(texts)
+    except ValueError:
+        # No text of the chunk has a phrase of that length
+        return {}
+    # Sparse column sums, without densifying the matrix
+    counts = np.bincount(matrix.indices, weights=matrix.data, minlength=matrix.shape[1])
+    return dict(zip(vectorizer.get_feature_names_out().tolist(), counts.astype('int64').tolist()))
+
+def count_ngrams(texts, ngram=2, stop_words=(), min_length=2, chunk_texts=CHUNK_TEXTS,
+                 max_tracked=MAX_TRACKED_TERMS):
+    """
+    Count the phrases of n words over review texts, one chunk of texts at a time.
+
+    Stop words and words shorter than min_length are removed before phrases are formed,
+    so a phrase joins the remaining words that are next to each other.
+
+    Args:
+        texts (pd.Series): Review texts. Missing texts are skipped.
+        ngram (int): Number of words per phrase.
+        stop_words (iterable): Words to leave out.
+        min_length (int): Shortest word to keep.
+        chunk_texts (int): Texts vectorized at a time.
+        max_tracked (int): Phrases kept in the running table of counts.
+
+    Returns:
+        tuple: (Counter of phrase counts, True if the table was pruned and the counts
+               may be lower bounds).
+    """
+    stop_words = frozenset(stop_words)
+    counts = Counter()
+    pruned = False
+    for start in range(0, len(texts), chunk_texts):
+        chunk = texts.iloc[start:start + chunk_texts].dropna().astype(str)
+        if len(chunk) == 0:
+            continue
+        counts.update(_chunk_counts(chunk, ngram, stop_words, min_length))
+        if len(counts) > max_tracked:
+            counts = Counter(dict(heapq.nlargest(max_tracked, counts.items(), key=itemgetter(1))))
+            pruned = True
+    return counts, pruned
+
+def top_counts(counts, k):
+    """
+    The k largest counts, largest first.
+
+    Args:
+        counts (dict): Term to count.
+        k (int): Number of terms to return.
+
+    Returns:
+        list: (term, count) tuples.
+    """
+    return heapq.nlargest(k, counts.items(), key=itemgetter(1))
@@ -0,0 +1,342 @@
+"""
+Text Index Module
+
+The topic model, common words, topic distribution and word clouds used to tokenize
+the review texts each on their own, with different tokenizers. The text index
+tokenizes them once into a sparse document-term matrix (one CSR row per review, one
+column per distinct token) and a sorted vocabulary. Every consumer derives what it
+needs from that matrix: term counts of a subset of reviews are a sparse row
+selection and a column sum, and stop words or short tokens are a mask over the
+vocabulary, so no consumer tokenizes text again.
+
+Tokens are lowercased runs of two or more word characters, the token pattern of
+sklearn's CountVectorizer. Texts are tokenized in chunks, on a process pool for large
+files, and the chunk indexes are merged, so the corpus is never joined into one
+string or one token list. The index of each stored file is saved as .npy arrays in
+the content store and memory-mapped when it is loaded; a dataset of several files
+combines the indexes of its files over the union of their vocabularies.
+"""
+
+import hashlib
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+from uploads.content_store import artifact_path
+
+TEXT_COLUMN = 'reviewText'
+TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+
+# Changing the tokenization changes INDEX_VERSION, so indexes built before are not reused
+INDEX_VERSION = 1
+INDEX_ARRAYS = ('data', 'indices', 'indptr', 'vocabulary')
+
+# Texts tokenized per chunk, and the fewest texts worth starting a process pool for
+INDEX_CHUNK_TEXTS = 50000
+PARALLEL_MIN_TEXTS = 200000
+INDEX_MAX_WORKERS = 8
+
+# Context cache keys of the text index of a dataset and of the key identifying its texts
+TEXT_INDEX_KEY = 'text_index'
+DATASET_KEY = 'text_dataset_key'
+
+class TextIndex:
+    """Document-term matrix of a set of reviews and the vocabulary of its columns."""
+
+    def __init__(self, matrix, vocabulary):
+        """
+        Args:
+            matrix (scipy.sparse.csr_matrix): Token counts, one row per review.
+            vocabulary (np.ndarray): Sorted token of each column.
+        """
+        self.matrix = matrix
+        self.vocabulary = vocabulary
+        self._masks = {}
+
+    @property
+    def n_rows(self):
+        return self.matrix.shape[0]
+
+    def term_counts(self, rows=None):
+        """
+        Count every term over a subset of the reviews.
+
+        Args:
+            rows (np.ndarray, optional): Boolean mask of the reviews to count. Defaults to all.
+
+        Returns:
+            np.ndarray: Count of each vocabulary term.
+        """
+        if rows is None:
+            return np.bincount(self.matrix.indices, weights=self.matrix.data,
+                               minlength=len(self.vocabulary)).astype('int64')
+        # Transposed matrix-vector product: sums the selected rows without copying them
+        return np.asarray(self.matrix.T @ np.asarray(rows, dtype='int64')).ravel()
+
+    def document_frequencies(self):
+        """
+        Returns:
+            np.ndarray: Number of reviews containing each vocabulary term.
+        """
+        return np.bincount(self.matrix.indices, minlength=len(self.vocabulary))
+
+    def term_mask(self, exclude=(), min_length=2, alpha_only=False):
+        """
+        Select vocabulary terms, e.g. to leave out stop words.
+
+        Masks are computed once per index and set of arguments.
+
+        Args:
+            exclude (iterable): Terms to leave out.
+            min_length (int): Shortest term to keep.
+            alpha_only (bool): Keep only terms made of letters.
+
+        Returns:
+            np.ndarray: Boolean mask over the vocabulary.
+        """
+        exclude = frozenset(exclude)
+        key = (exclude, min_length, alpha_only)
+        if key not in self._masks:
+            self._masks[key] = np.fromiter(
+                (len(term) >= min_length and term not in exclude and (term.isalpha() or not alpha_only)
+                 for term in self.vocabulary.tolist()),
+                dtype=bool, count=len(self.vocabulary))
+        return self._masks[key]
+
+    def top_terms(self, counts, max_terms, mask=None):
+        """
+        The most frequent terms, most frequent first (ties in vocabulary order).
+
+        Args:
+            counts (np.ndarray): Count of each vocabulary term, e.g. from term_counts.
+            max_terms (int): Number of terms to return.
+            mask (np.ndarray, optional): Boolean mask of the terms to consider.
+
+        Returns:
+            list: (term, count) tuples.
+        """
+        if mask is not None:
+            counts = np.where(mask, counts, 0)
+        candidates = np.flatnonzero(counts > 0)
+        if len(candidates) > max_terms:
+            candidates = candidates[np.argpartition(-counts[candidates], max_terms - 1)[:max_terms]]
+        order = candidates[np.lexsort((candidates, -counts[candidates]))]
+        return [(str(self.vocabulary[i]), int(counts[i])) for i in order]
+
+    def select(self, rows, terms):
+        """
+        Term counts of some reviews over a given list of terms.
+
+        Args:
+            rows (np.ndarray): Indices or boolean mask of the reviews.
+            terms (np.ndarray): Terms of the columns, e.g. the vocabulary of a fitted model.
+                                Terms missing from the index get zero counts.
+
+        Returns:
+            scipy.sparse.csr_matrix: One row per selected review, one column per term.
+        """
+        terms = np.asarray(terms, dtype=str)
+        positions = np.minimum(np.searchsorted(self.vocabulary, terms), max(len(self.vocabulary) - 1, 0))
+        found = np.flatnonzero(self.vocabulary[positions] == terms) if len(self.vocabulary) else np.array([], dtype=int)
+        selected = self.matrix[rows][:, positions[found]].tocoo()
+        return sparse.csr_matrix((selected.data, (selected.row, found[selected.col])),
+                                 shape=(selected.shape[0], len(terms)))
+
+def _tokenize_chunk(texts):
+    """Text index of one chunk of texts."""
+    texts = texts.fillna('').astype(str)
+    vectorizer = CountVectorizer(token_pattern=TOKEN_PATTERN, dtype=np.int32)
+    try:
+        matrix = vectorizer.fit_transform(texts).tocsr()
+        vocabulary = vectorizer.get_feature_names_out().astype(str)
+    except ValueError:
+        # No text contains a single token
+        matrix = sparse.csr_matrix((len(texts), 0), dtype=np.int32)
+        vocabulary = np.array([], dtype=str)
+    matrix.sort_indices()
+    return TextIndex(matrix, vocabulary)
+
+def build_text_index(texts, max_workers=None):
+    """
+    Tokenize review texts into a text index.
+
+    Texts are tokenized in chunks of INDEX_CHUNK_TEXTS, on a process pool when there are
+    enough of them, and the chunk indexes are merged. If the pool cannot be used the
+    chunks are tokenized in this process.
+
+    Args:
+        texts (pd.Series): Review texts. Missing texts become empty rows, so row i of
+                           the index is text i.
+        max_workers (int, optional): Number of worker processes. Defaults to the number
+                                     of CPUs, capped at INDEX_MAX_WORKERS.
+
+    Returns:
+        TextIndex: The index.
+    """
+    if len(texts) <= INDEX_CHUNK_TEXTS:
+        return _tokenize_chunk(texts)
+
+    starts = range(0, len(texts), INDEX_CHUNK_TEXTS)
+    workers = max_workers or min(os.cpu_count() or 1, INDEX_MAX_WORKERS)
+    parts = None
+    if len(texts) >= PARALLEL_MIN_TEXTS and workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parts = list(executor.map(_tokenize_chunk, (texts.iloc[start:start + INDEX_CHUNK_TEXTS] for start in starts)))
+        except Exception as e:
+            print(f"Warning: Parallel text indexing failed ({str(e)}), indexing in this process")
+    if parts is None:
+        parts = [_tokenize_chunk(texts.iloc[start:start + INDEX_CHUNK_TEXTS]) for start in starts]
+    return combine_text_indexes(parts)
+
+def _array_path(content_hash, name):
+    return artifact_path(content_hash, f"text_index_v{INDEX_VERSION}_{name}.npy")
+
+def load_text_index(content_hash, rows):
+    """
+    Load the stored index of a file, memory-mapped.
+
+    Args:
+        content_hash (str): SHA-256 of the file content.
+        rows (int): Number of rows the file was loaded with.
+
+    Returns:
+        TextIndex: The index, or None if it is not stored for that many rows.
+    """
+    paths = {name: _array_path(content_hash, name) for name in INDEX_ARRAYS}
+    if not all(os.path.exists(path) for path in paths.values()):
+        return None
+    try:
+        arrays = {name: np.load(path, mmap_mode='r', allow_pickle=False) for name, path in paths.items()}
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read stored text index of {content_hash}: {str(e)}")
+        return None
+    if len(arrays['indptr']) != rows + 1:
+        return None
+    matrix = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                               shape=(rows, len(arrays['vocabulary'])))
+    return TextIndex(matrix, arrays['vocabulary'])
+
+def save_text_index(content_hash, index):
+    """
+    Store the index of a file.
+
+    Args:
+        content_hash (str): SHA-256 of the file content.
+        index (TextIndex): The index from build_text_index.
+    """
+    arrays = {'data': index.matrix.data, 'indices': index.matrix.indices,
+              'indptr': index.matrix.indptr, 'vocabulary': index.vocabulary}
+    # The vocabulary is written last, so an index is only loaded once all its arrays exist
+    for name in INDEX_ARRAYS:
+        path = _array_path(content_hash, name)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.ascontiguousarray(arrays[name]), allow_pickle=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not store text index {path}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+def combine_text_indexes(indexes):
+    """
+    Stack the indexes of several files over the union of their vocabularies.
+
+    Args:
+        indexes (list): TextIndex of each file, in row order.
+
+    Returns:
+        TextIndex: The combined index.
+    """
+    if len(indexes) == 1:
+        return indexes[0]
+    vocabulary = np.unique(np.concatenate([np.asarray(index.vocabulary, dtype=str) for index in indexes]))
+    blocks = []
+    for index in indexes:
+        # Both vocabularies are sorted, so remapped column indices stay sorted within a row
+        columns = np.searchsorted(vocabulary, index.vocabulary)
+        matrix = index.matrix
+        blocks.append(sparse.csr_matrix((matrix.data, columns[matrix.indices], matrix.indptr),
+                                        shape=(matrix.shape[0], len(vocabulary))))
+    return TextIndex(sparse.vstack(blocks, format='csr'), vocabulary)
+
+def get_text_index(context):
+    """
+    Return the text index of a dataset, tokenizing only the reviews not indexed yet.
+
+    Indexes of stored files are kept in the content store under the file's content hash,
+    so each file is tokenized once. Other datasets are indexed in memory.
+
+    Args:
+        context (AnalysisContext): Review dataset with a 'reviewText' column.
+
+    Returns:
+        TextIndex: Index with one row per row of the dataset.
+    """
+    df = context.df
+    index = context.cache.get(TEXT_INDEX_KEY)
+    if index is not None and index.n_rows == len(df):
+        return index
+    if TEXT_COLUMN not in df.columns:
+        raise ValueError(f"Review text column '{TEXT_COLUMN}' not found")
+
+    ranges = context.segment_ranges()
+    if ranges:
+        parts = []
+        for content_hash, start, stop in ranges:
+            part = load_text_index(content_hash, stop - start)
+            if part is None:
+                print(f"Indexing review texts of {stop - start} rows")
+                part = build_text_index(df[TEXT_COLUMN].iloc[start:stop])
+                save_text_index(content_hash, part)
+            parts.append(part)
+        index = combine_text_indexes(parts)
+    else:
+        print(f"Indexing review texts of {len(df)} rows")
+        index = build_text_index(df[TEXT_COLUMN])
+
+    context.cache[TEXT_INDEX_KEY] = index
+    return index
+
+def text_fingerprint(df):
+    """
+    Hash the review texts of a dataframe, to recognize a dataset that was already analyzed.
+
+    Args:
+        df (pd.DataFrame): Review data.
+
+    Returns:
+        str: Hex digest of the review text column.
+    """
+    row_hashes = pd.util.hash_pandas_object(df[TEXT_COLUMN], index=False)
+    return hashlib.sha256(row_hashes.to_numpy().tobytes()).hexdigest()
+
+def dataset_key(context):
+    """
+    Key identifying the review texts of a dataset, for results cached across requests.
+
+    Datasets loaded from stored files are identified by the content hashes of the files,
+    without reading the texts; others by a fingerprint of their texts.
+
+    Args:
+        context (AnalysisContext): Review dataset.
+
+    Returns:
+        str: Hex digest.
+    """
+    key = context.cache.get(DATASET_KEY)
+    if key is None:
+        ranges = context.segment_ranges()
+        if ranges:
+            key = hashlib.sha256(','.join(content_hash for content_hash, _, _ in ranges).encode()).hexdigest()
+        else:
+            key = text_fingerprint(context.df)
+        context.cache[DATASET_KEY] = key
+    return key
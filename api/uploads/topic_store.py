@@ -0,0 +1,387 @@
+"""
+Topic Store Module
+
+Fitting LDA over every review took as long as the rest of the review analysis
+together, and it was repeated on every topic query. Fitted topic models are therefore
+stored: the vocabulary and the LDA topic-word components of each model are saved in
+the content store, keyed by the department, the number of topics and the content
+hashes of the files the model was fitted on. Models are fitted on the columns of the
+dataset's text index (see text_index), so the reviews are not tokenized again.
+
+Loading the same files again reuses the stored model without any fitting. When a
+department gains files, the stored model of its previous files is updated with
+partial_fit on the rows of the new files only, in mini-batches, instead of being
+refitted over all reviews. The vocabulary is fixed by the first fit, so words that
+only appear in later files are not part of the topics until the model is refitted.
+
+Datasets that were not loaded from stored files are matched by a fingerprint of their
+review texts within this process.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from nltk.corpus import stopwords
+from scipy.special import psi
+from sklearn.decomposition import LatentDirichletAllocation
+
+from uploads.content_store import shared_artifact_path
+from uploads.text_index import get_text_index, text_fingerprint
+
+TEXT_COLUMN = 'reviewText'
+
+# Vocabulary limits of a first fit, as CountVectorizer's min_df, max_df and max_features:
+# terms in at least MIN_DF reviews and at most MAX_DF of them, the MAX_FEATURES most
+# frequent of those. Changing them (or the model format) changes TOPIC_MODEL_VERSION
+# so that models fitted with the old settings are not reused.
+MIN_DF = 2
+MAX_DF = 0.95
+MAX_FEATURES = 10000
+TOPIC_MODEL_VERSION = 1
+RANDOM_STATE = 42
+
+# Documents passed to partial_fit at a time when updating a model
+UPDATE_CHUNK_DOCS = 20000
+
+# Folder group of the stored models in the content store
+TOPICS_GROUP = 'topics'
+
+# Stored models kept per department and number of topics, oldest dropped first
+MODELS_PER_INDEX = 20
+
+# Index of the stored models, shared by the analysis worker processes
+INDEX_DATABASE = 'index.sqlite'
+_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS topic_models (
+    model_key TEXT PRIMARY KEY,
+    department TEXT NOT NULL,
+    num_topics INTEGER NOT NULL,
+    entry TEXT NOT NULL,
+    updated TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_topic_models_department ON topic_models (department, num_topics, updated);
+"""
+
+# Context cache key of the fitted models of a dataset, by number of topics
+TOPIC_MODELS_KEY = 'topic_models'
+
+# Models of datasets that are not stored files, by text fingerprint
+MODEL_CACHE_SIZE = 8
+_model_cache = OrderedDict()
+
+class TopicModel:
+    """A fitted vocabulary and LDA model, and the files it was fitted on."""
+
+    def __init__(self, vocabulary, lda, segments=None, documents=0):
+        """
+        Args:
+            vocabulary (np.ndarray): Term of each LDA feature, in feature order.
+            lda (LatentDirichletAllocation): The fitted model.
+            segments (list, optional): (content hash, row count) of each file the model
+                                       was fitted on.
+            documents (int): Number of non-empty reviews the model was fitted on.
+        """
+        self.vocabulary = vocabulary
+        self.lda = lda
+        self.segments = [tuple(segment) for segment in segments or []]
+        self.documents = documents
+
+    @property
+    def num_topics(self):
+        return self.lda.components_.shape[0]
+
+    def topics(self, num_words=10):
+        """
+        The top words of each topic.
+
+        Args:
+            num_words (int): Number of words per topic to return.
+
+        Returns:
+            dict: 'num_topics' and 'topics' ({'id', 'words', 'weight'} per topic).
+        """
+        components = self.lda.components_
+        total = components.sum()
+        top_indices = np.argsort(components, axis=1)[:, :-num_words - 1:-1]
+        return {
+            "num_topics": self.num_topics,
+            "topics": [{
+                "id": topic_idx,
+                "words": self.vocabulary[top_indices[topic_idx]].tolist(),
+                "weight": float(components[topic_idx].sum() / total)  # Topic importance
+            } for topic_idx in range(self.num_topics)]
+        }
+
+def _new_lda(num_topics):
+    return LatentDirichletAllocation(
+        n_components=num_topics,
+        random_state=RANDOM_STATE,
+        n_jobs=-1  # Use all available cores
+    )
+
+def _text_rows(df, start=0, stop=None):
+    """Positions of the rows in [start, stop) that have a review text."""
+    return np.flatnonzero(df[TEXT_COLUMN].iloc[start:stop].notna().to_numpy()) + start
+
+def _model_terms(text_index, documents):
+    """Columns of the text index a first fit uses (see MIN_DF, MAX_DF and MAX_FEATURES)."""
+    doc_freq = text_index.document_frequencies()
+    keep = text_index.term_mask(stopwords.words('english'))
+    keep = keep & (doc_freq >= MIN_DF) & (doc_freq <= MAX_DF * documents)
+    terms = np.flatnonzero(keep)
+    if len(terms) > MAX_FEATURES:
+        counts = text_index.term_counts()[terms]
+        terms = np.sort(terms[np.argsort(-counts, kind='stable')[:MAX_FEATURES]])
+    if len(terms) == 0:
+        raise ValueError("After pruning, no terms remain. Try a dataset with more reviews.")
+    return terms
+
+def fit_topic_model(text_index, rows, num_topics):
+    """
+    Fit a vocabulary and an LDA model from scratch.
+
+    Args:
+        text_index (TextIndex): Text index of the dataset.
+        rows (np.ndarray): Positions of the reviews to fit on.
+        num_topics (int): Number of topics.
+
+    Returns:
+        TopicModel: The fitted model.
+    """
+    terms = _model_terms(text_index, len(rows))
+    lda = _new_lda(num_topics)
+    lda.fit(text_index.matrix[rows][:, terms])
+    return TopicModel(np.asarray(text_index.vocabulary[terms], dtype=str), lda, documents=len(rows))
+
+def update_topic_model(model, dtm):
+    """
+    Update a fitted model with more reviews using online variational Bayes.
+
+    The reviews are passed to partial_fit in chunks of UPDATE_CHUNK_DOCS rows.
+
+    Args:
+        model (TopicModel): The model to update in place.
+        dtm (scipy.sparse.csr_matrix): Term counts of the new reviews over the model's vocabulary.
+
+    Returns:
+        TopicModel: The updated model.
+    """
+    # The sufficient statistics of each mini-batch are scaled to the whole corpus
+    model.lda.total_samples = model.documents + dtm.shape[0]
+    for start in range(0, dtm.shape[0], UPDATE_CHUNK_DOCS):
+        model.lda.partial_fit(dtm[start:start + UPDATE_CHUNK_DOCS])
+    model.documents += dtm.shape[0]
+    return model
+
+def _connect_index():
+    connection = sqlite3.connect(shared_artifact_path(TOPICS_GROUP, INDEX_DATABASE), timeout=30)
+    connection.isolation_level = None
+    connection.executescript(_INDEX_SCHEMA)
+    return connection
+
+@contextmanager
+def _index_transaction():
+    """Run a read-modify-write sequence on the model index under its write lock."""
+    connection = _connect_index()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        yield connection
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+def _read_index(department, num_topics):
+    """Index entries of the stored models of a department and number of topics, by model key."""
+    connection = _connect_index()
+    try:
+        rows = connection.execute(
+            "SELECT model_key, entry FROM topic_models WHERE department = ? AND num_topics = ?",
+            (department or 'default', num_topics)
+        ).fetchall()
+    finally:
+        connection.close()
+    return {key: json.loads(entry) for key, entry in rows}
+
+def _model_path(key):
+    return shared_artifact_path(TOPICS_GROUP, f"{key}.npz")
+
+def _model_key(department, num_topics, segments):
+    hashes = ','.join(content_hash for content_hash, _ in segments)
+    return hashlib.sha256(f"{TOPIC_MODEL_VERSION}|{department}|{num_topics}|{hashes}".encode()).hexdigest()
+
+def _load_model(key, entry):
+    """Rebuild a stored model from its vocabulary, components and LDA state."""
+    path = _model_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as arrays:
+            vocabulary, components = arrays['vocabulary'], arrays['components']
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: Could not read stored topic model {path}: {str(e)}")
+        return None
+
+    lda = _new_lda(components.shape[0])
+    lda.components_ = components
+    # exp(E[log beta]) of the topic-word distributions, as LDA.fit leaves it
+    lda.exp_dirichlet_component_ = np.exp(psi(components) - psi(components.sum(axis=1))[:, np.newaxis])
+    lda.n_features_in_ = components.shape[1]
+    lda.n_batch_iter_ = entry['n_batch_iter']
+    lda.n_iter_ = entry['n_iter']
+    lda.doc_topic_prior_ = entry['doc_topic_prior']
+    lda.topic_word_prior_ = entry['topic_word_prior']
+    lda.random_state_ = np.random.RandomState(RANDOM_STATE)
+    return TopicModel(vocabulary, lda, entry['segments'], entry['documents'])
+
+def _save_model(department, key, model):
+    """
+    Store a model and record it in the index of its department and number of topics.
+
+    The index is updated in one write transaction, so worker processes saving models
+    at the same time do not lose each other's entries. Write failures are raised.
+    """
+    path = _model_path(key)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, vocabulary=np.asarray(model.vocabulary, dtype=str), components=model.lda.components_)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    lda = model.lda
+    entry = {
+        'segments': [list(segment) for segment in model.segments],
+        'documents': int(model.documents),
+        'n_batch_iter': int(lda.n_batch_iter_),
+        'n_iter': int(lda.n_iter_),
+        'doc_topic_prior': float(lda.doc_topic_prior_),
+        'topic_word_prior': float(lda.topic_word_prior_)
+    }
+    department = department or 'default'
+    try:
+        with _index_transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO topic_models (model_key, department, num_topics, entry, updated) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, department, model.num_topics, json.dumps(entry), pd.Timestamp.now().isoformat())
+            )
+            old_keys = [row[0] for row in connection.execute(
+                "SELECT model_key FROM topic_models WHERE department = ? AND num_topics = ? "
+                "ORDER BY updated DESC LIMIT -1 OFFSET ?",
+                (department, model.num_topics, MODELS_PER_INDEX)
+            )]
+            connection.executemany("DELETE FROM topic_models WHERE model_key = ?", [(old_key,) for old_key in old_keys])
+    except sqlite3.Error:
+        # A model file without an index entry would never be used or pruned
+        os.remove(path)
+        raise
+
+    for old_key in old_keys:
+        if os.path.exists(_model_path(old_key)):
+            os.remove(_model_path(old_key))
+
+def _closest_stored_model(index, segments):
+    """
+    Key and index entry of the stored model fitted on the most rows, among the models
+    whose files are all part of the given segments.
+    """
+    wanted = Counter(content_hash for content_hash, _ in segments)
+    best_key, best_rows = None, 0
+    for key, entry in index.items():
+        fitted = Counter(content_hash for content_hash, _ in entry['segments'])
+        rows = sum(row_count for _, row_count in entry['segments'])
+        if not fitted - wanted and rows > best_rows:
+            best_key, best_rows = key, rows
+    return best_key, index.get(best_key)
+
+def _stored_topic_model(context, num_topics):
+    """Load, update or fit the stored model of a dataset loaded from stored files."""
+    df = context.df
+    ranges = context.segment_ranges()
+    segments = [(content_hash, stop - start) for content_hash, start, stop in ranges]
+    key = _model_key(context.department, num_topics, segments)
+    index = _read_index(context.department, num_topics)
+
+    if key in index:
+        model = _load_model(key, index[key])
+        if model is not None:
+            print(f"Using stored topic model ({num_topics} topics, {model.documents} reviews)")
+            return model
+
+    model = None
+    base_key, base_entry = _closest_stored_model(index, segments)
+    if base_key is not None:
+        model = _load_model(base_key, base_entry)
+
+    if model is not None:
+        # Only the rows of files the stored model has not seen are new
+        remaining = Counter(content_hash for content_hash, _ in segments) - Counter(content_hash for content_hash, _ in model.segments)
+        new_rows = []
+        for content_hash, start, stop in ranges:
+            if remaining[content_hash] > 0:
+                remaining[content_hash] -= 1
+                new_rows.append(_text_rows(df, start, stop))
+        rows = np.concatenate(new_rows) if new_rows else np.array([], dtype='int64')
+        print(f"Updating topic model of {model.documents} reviews with {len(rows)} new reviews")
+        update_topic_model(model, get_text_index(context).select(rows, model.vocabulary))
+    else:
+        rows = _text_rows(df)
+        print(f"Fitting topic model ({num_topics} topics) on {len(rows)} reviews")
+        model = fit_topic_model(get_text_index(context), rows, num_topics)
+
+    model.segments = segments
+    try:
+        _save_model(context.department, key, model)
+    except (OSError, sqlite3.Error) as e:
+        # The fitted model is still used; it is fitted again next time
+        print(f"Warning: Could not store topic model {key}: {str(e)}")
+    return model
+
+def get_topic_model(context, num_topics=5):
+    """
+    Return the topic model of a dataset, fitting or updating it only if needed.
+
+    Models of datasets loaded from stored files are kept in the content store: the
+    same files reuse their model, and a model of some of the files is updated with
+    the rows of the others. Other datasets are matched by a fingerprint of their review
+    texts within this process.
+
+    Args:
+        context (AnalysisContext): Review dataset with a 'reviewText' column.
+        num_topics (int): Number of topics.
+
+    Returns:
+        TopicModel: The fitted model.
+    """
+    models = context.cache.setdefault(TOPIC_MODELS_KEY, {})
+    if num_topics in models:
+        return models[num_topics]
+
+    if context.segment_ranges():
+        model = _stored_topic_model(context, num_topics)
+    else:
+        cache_key = (text_fingerprint(context.df), num_topics)
+        model = _model_cache.get(cache_key)
+        if model is None:
+            rows = _text_rows(context.df)
+            print(f"Fitting topic model ({num_topics} topics) on {len(rows)} reviews")
+            model = fit_topic_model(get_text_index(context), rows, num_topics)
+            _model_cache[cache_key] = model
+            if len(_model_cache) > MODEL_CACHE_SIZE:
+                _model_cache.popitem(last=False)
+        else:
+            _model_cache.move_to_end(cache_key)
+
+    models[num_topics] = model
+    return model
@@ -0,0 +1,172 @@
+"""
+Word Cloud Cache Module
+
+Word clouds used to be laid out from a fresh sample of reviews on every request,
+drawn through a matplotlib figure and returned inline as base64, twice per analysis.
+They are now drawn from word frequencies (taken from the text index) and saved as
+PNG files in the content store, named after the dataset, the style of the cloud, the
+sentiment and the number of words. A cloud that was drawn before is never drawn
+again, and clients load it from its URL instead of receiving it inline.
+
+Clouds are rendered by a pluggable renderer that writes a PIL image directly:
+'wordcloud' lays the words out with the wordcloud package, 'pil' draws them in rows
+with PIL alone, which is much faster and needs no other package.
+"""
+
+import os
+import re
+import uuid
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+try:
+    from wordcloud import WordCloud
+    WORDCLOUD_AVAILABLE = True
+except ImportError:
+    WORDCLOUD_AVAILABLE = False
+
+from uploads.content_store import shared_artifact_path
+
+WORDCLOUDS_GROUP = 'wordclouds'
+WORDCLOUD_URL_PREFIX = '/api/wordclouds/'
+IMAGE_EXTENSION = '.png'
+NAME_PART = re.compile(r'^[A-Za-z0-9-]+$')
+
+# Rendered clouds kept on disk, the least recently written removed first
+MAX_CACHED_CLOUDS = 500
+
+# Word colors of the 'pil' renderer, darkest first, by colormap name
+PALETTES = {
+    'Greens': ['#00441b', '#006d2c', '#238b45', '#41ab5d', '#74c476'],
+    'Reds': ['#67000d', '#a50f15', '#cb181d', '#ef3b2c', '#fb6a4a'],
+    'Blues': ['#08306b', '#08519c', '#2171b5', '#4292c6', '#6baed6'],
+    None: ['#440154', '#3b528b', '#21918c', '#5ec962', '#c8a000']
+}
+
+# Font sizes of the least and most frequent word of the 'pil' renderer, per 400 pixels of height
+MIN_FONT_SIZE = 12
+MAX_FONT_SIZE = 64
+
+def _render_wordcloud(frequencies, width, height, colormap):
+    """Lay the words out with the wordcloud package."""
+    return WordCloud(
+        width=width,
+        height=height,
+        background_color='white',
+        max_words=len(frequencies),
+        colormap=colormap,
+        collocations=False
+    ).generate_from_frequencies(frequencies).to_image()
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow before 10.1 has a single bitmap default font
+        return ImageFont.load_default()
+
+def _render_pil(frequencies, width, height, colormap):
+    """Draw the words in rows, largest first, sized by frequency."""
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    palette = PALETTES.get(colormap, PALETTES[None])
+    words = sorted(frequencies.items(), key=lambda item: -item[1])
+    top = words[0][1]
+    scale = height / 400
+    margin = int(10 * scale)
+
+    x, y, row_height = margin, margin, 0
+    for rank, (word, count) in enumerate(words):
+        size = int((MIN_FONT_SIZE + (MAX_FONT_SIZE - MIN_FONT_SIZE) * (count / top) ** 0.5) * scale)
+        font = _font(size)
+        left, upper, right, lower = draw.textbbox((0, 0), word, font=font)
+        word_width, word_height = right - left, lower - upper
+        if x + word_width > width - margin:
+            x, y, row_height = margin, y + row_height + margin, 0
+        if y + word_height > height - margin:
+            break
+        draw.text((x - left, y - upper), word, font=font, fill=palette[min(rank * len(palette) // len(words), len(palette) - 1)])
+        x += word_width + margin
+        row_height = max(row_height, word_height)
+    return image
+
+RENDERERS = {'wordcloud': _render_wordcloud, 'pil': _render_pil}
+DEFAULT_RENDERER = 'wordcloud' if WORDCLOUD_AVAILABLE else 'pil'
+
+def wordcloud_path(name):
+    """
+    Path of a cached cloud image.
+
+    Args:
+        name (str): Image file name, as in the URL of the cloud.
+
+    Returns:
+        str: The path, or None if the name is not one of a cloud image.
+    """
+    if os.path.basename(name) != name or not name.endswith(IMAGE_EXTENSION):
+        return None
+    return shared_artifact_path(WORDCLOUDS_GROUP, name)
+
+def _prune_cache(directory):
+    names = [name for name in os.listdir(directory) if name.endswith(IMAGE_EXTENSION)]
+    if len(names) <= MAX_CACHED_CLOUDS:
+        return
+    paths = sorted((os.path.join(directory, name) for name in names), key=os.path.getmtime)
+    for path in paths[:len(paths) - MAX_CACHED_CLOUDS]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def get_wordcloud(key, style, sentiment, max_words, frequencies, colormap=None,
+                  width=800, height=400, renderer=None):
+    """
+    Return the URL of a word cloud, rendering and caching it only if it is not cached yet.
+
+    Args:
+        key (str): Key of the texts the cloud shows, e.g. text_index.dataset_key.
+        style (str): Name of the caller's cloud settings (stop words, colors), so clouds
+                     of different callers do not share a file.
+        sentiment (str): Sentiment the reviews were filtered by.
+        max_words (int): Number of words in the cloud.
+        frequencies (callable): Returns the word to count dict of the cloud; only called
+                                when the cloud has to be rendered.
+        colormap (str, optional): Color scheme, e.g. 'Greens'.
+        width (int): Image width in pixels.
+        height (int): Image height in pixels.
+        renderer (str, optional): One of RENDERERS. Defaults to DEFAULT_RENDERER.
+
+    Returns:
+        dict: 'image_url' of the cloud and its file 'name'.
+    """
+    renderer = renderer or DEFAULT_RENDERER
+    if renderer not in RENDERERS:
+        raise ValueError(f"Unknown word cloud renderer '{renderer}'. Use one of: {', '.join(RENDERERS)}")
+    if not PIL_AVAILABLE:
+        raise ValueError("Word clouds need the Pillow package")
+    if not (NAME_PART.match(style) and NAME_PART.match(str(sentiment))):
+        raise ValueError(f"Invalid word cloud style or sentiment: {style}, {sentiment}")
+
+    name = f"{key[:32]}_{style}_{sentiment}_{int(max_words)}_{int(width)}x{int(height)}_{renderer}{IMAGE_EXTENSION}"
+    path = wordcloud_path(name)
+    if not os.path.exists(path):
+        words = frequencies()
+        if not words:
+            raise ValueError(f"No words found for a {sentiment} word cloud")
+        image = RENDERERS[renderer](words, width, height, colormap)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            image.save(tmp_path, format='PNG', optimize=True)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise ValueError(f"Could not save word cloud: {str(e)}")
+        _prune_cache(os.path.dirname(path))
+        print(f"Rendered {sentiment} word cloud with the {renderer} renderer")
+
+    return {'image_url': WORDCLOUD_URL_PREFIX + name, 'name': name}